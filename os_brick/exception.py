@@ -110,6 +110,10 @@ class VolumePathNotRemoved(BrickException):
     message = _("Volume path %(volume_path)s was not removed in time.")
 
 
+class SCSIDevicesNotRemoved(BrickException):
+    message = _("Failed to remove SCSI devices %(devices)s.")
+
+
 class ProtocolNotSupported(BrickException):
     message = _("Connect to volume via protocol %(protocol)s not supported.")
 
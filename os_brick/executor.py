@@ -18,10 +18,90 @@
    and root_helper settings, so this provides that hook.
 """
 
+import threading
+
 from oslo_concurrency import processutils as putils
 from oslo_utils import encodeutils
 
+from os_brick import metrics
 from os_brick.privileged import rootwrap as priv_rootwrap
+from os_brick import utils
+
+# The execute used when callers don't provide their own.
+_DEFAULT_EXECUTE = priv_rootwrap.execute
+
+# Subsystem whose state each binary reads or changes.  Cached results of
+# read-only commands are dropped when another command changes their
+# subsystem, commands of binaries not listed here drop all of them.
+_SUBSYSTEMS = {
+    'iscsiadm': 'iscsi',
+    'multipath': 'multipath',
+    'multipathd': 'multipath',
+    'dmsetup': 'multipath',
+    'systool': 'fc',
+}
+for _binary in ('lvs', 'vgs', 'pvs', 'lvdisplay', 'lvcreate', 'lvremove',
+                'lvextend', 'lvchange', 'lvrename', 'lvconvert', 'vgcreate',
+                'pvresize', 'lvm'):
+    _SUBSYSTEMS[_binary] = 'lvm'
+# Changes in a subsystem that are seen in others, ie: logging into an iSCSI
+# target adds multipath devices.
+_AFFECTED_SUBSYSTEMS = {
+    'iscsi': ('iscsi', 'multipath'),
+    'fc': ('fc', 'multipath'),
+}
+_ALL_SUBSYSTEMS = frozenset(_SUBSYSTEMS.values())
+
+# Results of the read-only commands, shared by all the executors so a
+# command run by any of them invalidates the results of the others.  Keys
+# are (subsystem, generation, execute, root helper, command, options).
+_command_cache = utils.TTLCache()
+_generations_lock = threading.Lock()
+# subsystem -> number of times it was changed
+_generations = {}
+
+
+def _get_subsystem(cmd):
+    return _SUBSYSTEMS.get(metrics.get_command_key(cmd)[0])
+
+
+def invalidate_command_cache(subsystems=None):
+    """Drop the cached results of commands of changed subsystems.
+
+    Commands run by an Executor do this themselves, it is for changes made
+    some other way, ie: writing to sysfs or to multipathd's socket.
+
+    :param subsystems: names of the subsystems that changed (lvm, iscsi,
+                       multipath, fc).  All of them if not given.
+    """
+    if subsystems is None:
+        subsystems = _ALL_SUBSYSTEMS
+    else:
+        subsystems = frozenset(affected for subsystem in subsystems
+                               for affected in _AFFECTED_SUBSYSTEMS.get(
+                                   subsystem, (subsystem,)))
+    with _generations_lock:
+        for subsystem in subsystems:
+            _generations[subsystem] = _generations.get(subsystem, 0) + 1
+    # Reads running now use the old generation, so they are not returned
+    # by later calls even if they finish after this.
+    _command_cache.invalidate(lambda key, value: key[0] in subsystems)
+
+
+def _invalidate_command_cache(cmd):
+    """Drop the cached results a command may have made stale."""
+    subsystem = _get_subsystem(cmd)
+    invalidate_command_cache(None if subsystem is None else [subsystem])
+
+
+def is_default_execute(execute):
+    """Check if commands are run with os-brick's own privsep daemon.
+
+    Operations that can be done inside the privsep daemon instead of
+    running a command are only done there in this case, a custom execute
+    (ie: rootwrap) is always used to run the commands.
+    """
+    return execute is _DEFAULT_EXECUTE
 
 
 class Executor(object):
@@ -31,6 +111,8 @@ class Executor(object):
             execute = priv_rootwrap.execute
         self.set_execute(execute)
         self.set_root_helper(root_helper)
+        # Seconds the results of read-only commands are reused for
+        self.command_cache_ttl = kwargs.get('command_cache_ttl', 0)
 
     @staticmethod
     def safe_decode(string):
@@ -45,8 +127,40 @@ class Executor(object):
                 setattr(exc, field, cls.safe_decode(value))
 
     def _execute(self, *args, **kwargs):
+        """Run a command.
+
+        Commands called with read_only=True don't change the host, so with
+        a command_cache_ttl their results are reused by identical calls for
+        that many seconds, and identical calls running at the same time
+        only run the command once.  Any other command drops the cached
+        results of the subsystem it belongs to (LVM, iSCSI, multipath...).
+        """
+        if not kwargs.pop('read_only', False):
+            try:
+                return self._execute_uncached(*args, **kwargs)
+            finally:
+                _invalidate_command_cache(args)
+
+        if self.command_cache_ttl <= 0:
+            return self._execute_uncached(*args, **kwargs)
+        subsystem = _get_subsystem(args)
+        # Executors with different execute functions or root helpers may
+        # not see the same output.
+        key = (subsystem, _generations.get(subsystem, 0), self.__execute,
+               self._root_helper, args,
+               tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+        return _command_cache.get(
+            key, lambda: self._execute_uncached(*args, **kwargs),
+            ttl=self.command_cache_ttl)
+
+    def _execute_uncached(self, *args, **kwargs):
         try:
-            result = self.__execute(*args, **kwargs)
+            if self._is_default_execute():
+                # rootwrap.execute records the metrics itself
+                result = self.__execute(*args, **kwargs)
+            else:
+                with metrics.timed_command(args):
+                    result = self.__execute(*args, **kwargs)
             if result:
                 result = (self.safe_decode(result[0]),
                           self.safe_decode(result[1]))
@@ -55,8 +169,63 @@ class Executor(object):
             self.make_putils_error_safe(e)
             raise
 
+    def _execute_batch(self, commands, stop_on_error=True, **kwargs):
+        """Run several commands in order.
+
+        With the default execute all the commands are sent to the privsep
+        daemon at once, otherwise they are run one by one with our execute.
+
+        :param commands: list of (cmd, kwargs) pairs, where cmd is a tuple
+                         with the command and its arguments and kwargs the
+                         options for this command only, ie: check_exit_code.
+        :param stop_on_error: don't run the commands after a failed one.
+        :param kwargs: options for all the commands, ie: run_as_root and
+                       root_helper.
+        :returns: list with the result of each command, in the same order:
+                  an (stdout, stderr) pair, the ProcessExecutionError it
+                  failed with, or None if it was not run.
+        """
+        run_as_root = kwargs.pop('run_as_root', False)
+        root_helper = kwargs.pop('root_helper', None)
+        commands = [(cmd, dict(kwargs, **cmd_kwargs))
+                    for cmd, cmd_kwargs in commands]
+
+        if not self._is_default_execute():
+            results = []
+            failed = False
+            for cmd, cmd_kwargs in commands:
+                if failed and stop_on_error:
+                    results.append(None)
+                    continue
+                try:
+                    results.append(self._execute(
+                        *cmd, run_as_root=run_as_root,
+                        root_helper=root_helper, **cmd_kwargs))
+                except putils.ProcessExecutionError as exc:
+                    failed = True
+                    results.append(exc)
+            return results
+
+        try:
+            results = priv_rootwrap.execute_batch(
+                commands, stop_on_error=stop_on_error,
+                run_as_root=run_as_root, root_helper=root_helper)
+        finally:
+            for cmd, _cmd_kwargs in commands:
+                _invalidate_command_cache(cmd)
+        for i, result in enumerate(results):
+            if isinstance(result, putils.ProcessExecutionError):
+                self.make_putils_error_safe(result)
+            elif result is not None:
+                results[i] = (self.safe_decode(result[0]),
+                              self.safe_decode(result[1]))
+        return results
+
     def set_execute(self, execute):
         self.__execute = execute
 
+    def _is_default_execute(self):
+        return is_default_execute(self.__execute)
+
     def set_root_helper(self, helper):
         self._root_helper = helper
@@ -0,0 +1,96 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""asyncio flavour of the connectors, for Python 3.4 and later.
+
+AsyncConnector wraps an iSCSI, Fibre Channel or RBD connector and provides
+its main methods as awaitables, so a service can drive many attachments
+from a single event loop::
+
+    connector = aio.get_connector('ISCSI', 'sudo')
+    device_info = yield from connector.connect_volume(connection_properties)
+
+The connectors themselves are still blocking: each operation runs in a
+thread of a bounded pool, and its commands go through the execute function
+of the connector as usual (privsep by default), so the privileged calls and
+the paths that depend on them behave as with the blocking connectors.  When
+all the threads are busy the other operations wait for a free one.
+
+The module doesn't use the async syntax, so it can still be compiled by
+Python 2, where it can't be imported.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+
+from os_brick.i18n import _
+from os_brick import initiator
+from os_brick.initiator import connector as base_connector
+
+# Operations of each connector running at the same time
+MAX_WORKERS = 16
+
+SUPPORTED_PROTOCOLS = (initiator.ISCSI, initiator.ISER,
+                       initiator.FIBRE_CHANNEL, initiator.RBD)
+
+
+class AsyncConnector(object):
+    """Awaitable interface of a connector.
+
+    :param connector: an iSCSI, Fibre Channel or RBD connector.
+    :param max_workers: number of operations that run at the same time, the
+                        others wait for a free thread.
+    """
+
+    def __init__(self, connector, max_workers=MAX_WORKERS):
+        self.connector = connector
+        self._workers = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def _run(self, method, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self._workers,
+                                    functools.partial(method, *args))
+
+    def connect_volume(self, connection_properties):
+        return self._run(self.connector.connect_volume,
+                         connection_properties)
+
+    def disconnect_volume(self, connection_properties, device_info):
+        return self._run(self.connector.disconnect_volume,
+                         connection_properties, device_info)
+
+    def extend_volume(self, connection_properties):
+        return self._run(self.connector.extend_volume,
+                         connection_properties)
+
+    def get_volume_paths(self, connection_properties):
+        return self._run(self.connector.get_volume_paths,
+                         connection_properties)
+
+    def close(self):
+        """Stop the worker threads once the running operations finish."""
+        self._workers.shutdown(wait=False)
+
+
+def get_connector(protocol, root_helper, *args, **kwargs):
+    """Build an AsyncConnector, see InitiatorConnector.factory.
+
+    :param max_workers: see AsyncConnector.
+    """
+    if protocol.upper() not in SUPPORTED_PROTOCOLS:
+        raise ValueError(_('Protocol %s has no asyncio connector.') %
+                         protocol)
+    max_workers = kwargs.pop('max_workers', MAX_WORKERS)
+    connector = base_connector.InitiatorConnector.factory(
+        protocol, root_helper, *args, **kwargs)
+    return AsyncConnector(connector, max_workers)
@@ -16,13 +16,13 @@ import os
 
 from oslo_concurrency import lockutils
 from oslo_log import log as logging
-from oslo_service import loopingcall
 
 from os_brick import exception
 from os_brick import initiator
 
 from os_brick.i18n import _LI
 from os_brick.initiator.connectors import base
+from os_brick.initiator import device_waiter
 from os_brick import utils
 
 DEVICE_SCAN_ATTEMPTS_DEFAULT = 3
@@ -97,10 +97,7 @@ class AoEConnector(base.BaseLinuxConnector):
         waiting_status = {'tries': 0}
 
         # NOTE(jbr_): Device path is not always present immediately
-        def _wait_for_discovery(aoe_path):
-            if os.path.exists(aoe_path):
-                raise loopingcall.LoopingCallDone
-
+        while not os.path.exists(aoe_path):
             if waiting_status['tries'] >= self.device_scan_attempts:
                 raise exception.VolumeDeviceNotFound(device=aoe_path)
 
@@ -110,10 +107,7 @@ class AoEConnector(base.BaseLinuxConnector):
 
             self._aoe_discover()
             waiting_status['tries'] += 1
-
-        timer = loopingcall.FixedIntervalLoopingCall(_wait_for_discovery,
-                                                     aoe_path)
-        timer.start(interval=2).wait()
+            device_waiter.wait_for_any([aoe_path], 2)
 
         if waiting_status['tries']:
             LOG.debug("Found AoE device %(path)s "
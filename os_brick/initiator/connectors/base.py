@@ -22,10 +22,13 @@ from oslo_log import log as logging
 from os_brick import exception
 from os_brick import initiator
 
-from os_brick.i18n import _LE, _LW
+from os_brick.i18n import _LE, _LI, _LW
+from os_brick.initiator import device_waiter
 from os_brick.initiator import host_driver
+from os_brick.initiator import host_inventory
 from os_brick.initiator import initiator_connector
 from os_brick.initiator import linuxscsi
+from os_brick import tracing
 
 LOG = logging.getLogger(__name__)
 
@@ -35,7 +38,11 @@ class BaseLinuxConnector(initiator_connector.InitiatorConnector):
 
     def __init__(self, root_helper, driver=None, execute=None,
                  *args, **kwargs):
-        self._linuxscsi = linuxscsi.LinuxSCSI(root_helper, execute=execute)
+        self._linuxscsi = linuxscsi.LinuxSCSI(
+            root_helper, execute=execute,
+            command_cache_ttl=kwargs.get('command_cache_ttl', 0))
+        # Whether connect_volume returns the time spent in each phase
+        self.return_timings = kwargs.get('return_timings', False)
 
         if not driver:
             driver = host_driver.HostDriver()
@@ -44,6 +51,11 @@ class BaseLinuxConnector(initiator_connector.InitiatorConnector):
         super(BaseLinuxConnector, self).__init__(root_helper, execute=execute,
                                                  *args, **kwargs)
 
+    @property
+    def host_inventory(self):
+        """Inventory of the host's devices, shared by all connectors."""
+        return host_inventory.get_inventory()
+
     @staticmethod
     def get_connector_properties(root_helper, *args, **kwargs):
         """The generic connector properties."""
@@ -87,6 +99,17 @@ class BaseLinuxConnector(initiator_connector.InitiatorConnector):
 
         return volumes
 
+    def _add_timings(self, device_info):
+        """Add the seconds spent in each phase to the device info.
+
+        This is only done for connectors created with return_timings=True,
+        the timings are read from the trace of the running operation.
+        """
+        span = tracing.current_span()
+        if self.return_timings is True and span is not None:
+            device_info['timings'] = span.get_timings()
+        return device_info
+
     def _discover_mpath_device(self, device_wwn, connection_properties,
                                device_name):
         """This method discovers a multipath device.
@@ -96,15 +119,17 @@ class BaseLinuxConnector(initiator_connector.InitiatorConnector):
         enabled device if there is one.
         """
 
-        path = self._linuxscsi.find_multipath_device_path(device_wwn)
+        with tracing.span('multipath'):
+            path = self._linuxscsi.find_multipath_device_path(device_wwn)
         device_path = None
         multipath_id = None
 
         if path is None:
             # find_multipath_device only accept realpath not symbolic path
             device_realpath = os.path.realpath(device_name)
-            mpath_info = self._linuxscsi.find_multipath_device(
-                device_realpath)
+            with tracing.span('multipath'):
+                mpath_info = self._linuxscsi.find_multipath_device(
+                    device_realpath)
             if mpath_info:
                 device_path = mpath_info['device']
                 multipath_id = device_wwn
@@ -122,8 +147,86 @@ class BaseLinuxConnector(initiator_connector.InitiatorConnector):
             try:
                 # Sometimes the multipath devices will show up as read only
                 # initially and need additional time/rescans to get to RW.
-                self._linuxscsi.wait_for_rw(device_wwn, device_path)
+                with tracing.span('rw_check'):
+                    self._linuxscsi.wait_for_rw(device_wwn, device_path)
             except exception.BlockDeviceReadOnly:
                 LOG.warning(_LW('Block device %s is still read-only. '
                                 'Continuing anyway.'), device_path)
         return device_path, multipath_id
+
+    @tracing.traced('device_wait')
+    def _remove_volumes_devices(self, volumes, multipath_path=False):
+        """Remove the SCSI devices of several volumes at the same time.
+
+        :param volumes: dictionary mapping a volume key to the list of its
+                        /dev/sdX devices.
+        :param multipath_path: whether the devices are multipath paths.
+        :returns: dictionary mapping the key of each volume with devices that
+                  couldn't be removed to a SCSIDevicesNotRemoved exception
+                  with their errors.
+        """
+        owners = {}
+        for key, devices in volumes.items():
+            for device in devices:
+                owners[device] = key
+        failed = {}
+        try:
+            self._linuxscsi.remove_scsi_devices(sorted(owners),
+                                                multipath_path=multipath_path)
+        except exception.SCSIDevicesNotRemoved as exc:
+            errors = {}
+            for device, error in exc.kwargs['errors'].items():
+                errors.setdefault(owners[device], {})[device] = error
+            for key, volume_errors in errors.items():
+                failed[key] = exception.SCSIDevicesNotRemoved(
+                    devices=', '.join(sorted(volume_errors)),
+                    errors=volume_errors)
+        return failed
+
+    def _wait_for_devices(self, volumes, rescan, get_interval):
+        """Wait for the devices of several volumes at the same time.
+
+        :param volumes: dictionary mapping a volume key to the list of paths
+                        where its device may show up.  The rescan callback may
+                        update these lists.
+        :param rescan: called with the keys of the volumes that are still
+                       missing before each wait.
+        :param get_interval: called with the try number, returns how long to
+                             wait for the devices after each rescan.
+        :returns: dictionary mapping the key of each volume that was found to
+                  the first of its paths that exists.
+        """
+        def _find(key):
+            return next((path for path in volumes[key]
+                         if os.path.exists(path)), None)
+
+        found = {}
+        tries = 0
+        while True:
+            for key in volumes:
+                if key not in found:
+                    path = _find(key)
+                    if path:
+                        found[key] = path
+
+            missing = [key for key in volumes if key not in found]
+            if not missing or tries >= self.device_scan_attempts:
+                break
+
+            LOG.info(_LI("%(missing)s of %(total)s volumes not yet found. "
+                         "Will rescan & retry.  Try number: %(tries)s."),
+                     {'missing': len(missing), 'total': len(volumes),
+                      'tries': tries})
+            rescan(missing)
+            tries += 1
+            directories = set(os.path.dirname(path) for key in missing
+                              for path in volumes[key])
+            device_waiter.wait_for(lambda: all(_find(key) for key in missing),
+                                   directories, get_interval(tries))
+
+        if tries:
+            LOG.debug("Found %(found)s of %(total)s volumes "
+                      "(after %(tries)s rescans)",
+                      {'found': len(found), 'total': len(volumes),
+                       'tries': tries})
+        return found
@@ -16,14 +16,15 @@ import os
 
 from oslo_concurrency import lockutils
 from oslo_log import log as logging
-from oslo_service import loopingcall
 import six
 
 from os_brick.i18n import _LE, _LI, _LW
 from os_brick import exception
 from os_brick import initiator
 from os_brick.initiator.connectors import base
+from os_brick.initiator import device_waiter
 from os_brick.initiator import linuxfc
+from os_brick import tracing
 from os_brick import utils
 
 synchronized = lockutils.synchronized_with_prefix('os-brick-')
@@ -38,7 +39,9 @@ class FibreChannelConnector(base.BaseLinuxConnector):
                  execute=None, use_multipath=False,
                  device_scan_attempts=initiator.DEVICE_SCAN_ATTEMPTS_DEFAULT,
                  *args, **kwargs):
-        self._linuxfc = linuxfc.LinuxFibreChannel(root_helper, execute)
+        self._linuxfc = linuxfc.LinuxFibreChannel(
+            root_helper, execute,
+            command_cache_ttl=kwargs.get('command_cache_ttl', 0))
         super(FibreChannelConnector, self).__init__(
             root_helper, driver=driver,
             execute=execute,
@@ -110,8 +113,26 @@ class FibreChannelConnector(base.BaseLinuxConnector):
                         {'props': connection_properties})
             raise exception.VolumePathsNotFound()
 
+    def _get_lock_names(self, connection_properties, device_info=None):
+        """Names of the locks of the target ports used by a volume.
+
+        The HBAs are shared by all the Fibre Channel volumes of the host, so
+        we lock the target ports instead.
+        """
+        wwns = connection_properties['target_wwn']
+        if not isinstance(wwns, list):
+            wwns = [wwns]
+        return ['fc-%s' % str(wwn).lower() for wwn in wwns]
+
+    def _get_batch_lock_names(self, connection_properties_list,
+                              device_info_list=None):
+        names = []
+        for connection_properties in connection_properties_list:
+            names.extend(self._get_lock_names(connection_properties))
+        return names
+
     @utils.trace
-    @synchronized('connect_volume')
+    @utils.synchronized_resources('_get_lock_names')
     def connect_volume(self, connection_properties):
         """Attach the volume to instance_name.
 
@@ -125,11 +146,10 @@ class FibreChannelConnector(base.BaseLinuxConnector):
         target_lun - LUN id of the volume
         """
         LOG.debug("execute = %s", self._execute)
-        device_info = {'type': 'block'}
-
-        hbas = self._linuxfc.get_fc_hbas_info()
-        host_devices = self._get_possible_volume_paths(
-            connection_properties, hbas)
+        with tracing.span('discovery'):
+            hbas = self._linuxfc.get_fc_hbas_info()
+            host_devices = self._get_possible_volume_paths(
+                connection_properties, hbas)
 
         if len(host_devices) == 0:
             # this is empty because we don't have any FC HBAs
@@ -140,45 +160,108 @@ class FibreChannelConnector(base.BaseLinuxConnector):
         # The /dev/disk/by-path/... node is not always present immediately
         # We only need to find the first device.  Once we see the first device
         # multipath will have any others.
-        def _wait_for_device_discovery(host_devices):
-            tries = self.tries
-            for device in host_devices:
-                LOG.debug("Looking for Fibre Channel dev %(device)s",
-                          {'device': device})
-                if os.path.exists(device):
-                    self.host_device = device
-                    # get the /dev/sdX device.  This is used
-                    # to find the multipath device.
-                    self.device_name = os.path.realpath(device)
-                    raise loopingcall.LoopingCallDone()
-
-            if self.tries >= self.device_scan_attempts:
-                LOG.error(_LE("Fibre Channel volume device not found."))
-                raise exception.NoFibreChannelVolumeDeviceFound()
+        host_device = None
+        device_name = None
+        with tracing.span('device_wait'):
+            tries = 0
+            while True:
+                for device in host_devices:
+                    LOG.debug("Looking for Fibre Channel dev %(device)s",
+                              {'device': device})
+                    if os.path.exists(device):
+                        host_device = device
+                        # get the /dev/sdX device.  This is used
+                        # to find the multipath device.
+                        device_name = os.path.realpath(device)
+                        break
+                if host_device:
+                    break
+
+                if tries >= self.device_scan_attempts:
+                    LOG.error(_LE("Fibre Channel volume device not found."))
+                    raise exception.NoFibreChannelVolumeDeviceFound()
+
+                LOG.info(_LI("Fibre Channel volume device not yet found. "
+                             "Will rescan & retry.  Try number: %(tries)s."),
+                         {'tries': tries})
+
+                self._linuxfc.rescan_hosts(hbas,
+                                           connection_properties['target_lun'])
+                tries = tries + 1
+                device_waiter.wait_for_any(host_devices, 2)
+
+        if host_device is not None and device_name is not None:
+            LOG.debug("Found Fibre Channel volume %(name)s "
+                      "(after %(tries)s rescans)",
+                      {'name': device_name, 'tries': tries})
+
+        device_info = self._get_device_info(connection_properties,
+                                            host_device, device_name)
+        return self._add_timings(device_info)
 
-            LOG.info(_LI("Fibre Channel volume device not yet found. "
-                         "Will rescan & retry.  Try number: %(tries)s."),
-                     {'tries': tries})
+    @utils.trace
+    @utils.synchronized_resources('_get_batch_lock_names')
+    def connect_volumes(self, connection_properties_list):
+        """Attach several volumes at once.
+
+        The HBAs are looked up once, each of them is scanned once for every
+        LUN of the batch and we wait for all the devices at the same time.
+
+        :param connection_properties_list: list of connection_properties
+                                           dictionaries, see connect_volume.
+        :type connection_properties_list: list
+        :returns: list with the device_info of each volume, in the same order.
+                  If a volume couldn't be connected its device_info is a
+                  dictionary with the exception under the 'error' key.
+        """
+        results = [None] * len(connection_properties_list)
 
-            self._linuxfc.rescan_hosts(hbas,
-                                       connection_properties['target_lun'])
-            self.tries = self.tries + 1
+        hbas = self._linuxfc.get_fc_hbas_info()
+        volumes = {}
+        for i, connection_properties in enumerate(connection_properties_list):
+            host_devices = self._get_possible_volume_paths(
+                connection_properties, hbas)
+            if host_devices:
+                volumes[i] = host_devices
+            else:
+                results[i] = {'error': exception.NoFibreChannelHostsFound()}
+        if not volumes:
+            LOG.warning(
+                _LW("We are unable to locate any Fibre Channel devices"))
 
-        self.host_device = None
-        self.device_name = None
-        self.tries = 0
-        timer = loopingcall.FixedIntervalLoopingCall(
-            _wait_for_device_discovery, host_devices)
-        timer.start(interval=2).wait()
+        def _rescan(missing):
+            luns = set(connection_properties_list[i]['target_lun']
+                       for i in missing)
+            for lun in sorted(luns):
+                self._linuxfc.rescan_hosts(hbas, lun)
 
-        tries = self.tries
-        if self.host_device is not None and self.device_name is not None:
-            LOG.debug("Found Fibre Channel volume %(name)s "
-                      "(after %(tries)s rescans)",
-                      {'name': self.device_name, 'tries': tries})
+        found = self._wait_for_devices(volumes, _rescan, lambda tries: 2)
+
+        for i in sorted(volumes):
+            if i not in found:
+                LOG.error(_LE("Fibre Channel volume device not found."))
+                results[i] = {
+                    'error': exception.NoFibreChannelVolumeDeviceFound()}
+                continue
+            try:
+                results[i] = self._get_device_info(
+                    connection_properties_list[i], found[i],
+                    os.path.realpath(found[i]))
+            except Exception as exc:
+                LOG.warning(_LW("Failed to connect volume %(props)s: "
+                                "%(exc)s"),
+                            {'props': connection_properties_list[i],
+                             'exc': exc})
+                results[i] = {'error': exc}
+
+        return results
+
+    def _get_device_info(self, connection_properties, host_device,
+                         device_name):
+        device_info = {'type': 'block'}
 
         # find out the WWN of the device
-        device_wwn = self._linuxscsi.get_scsi_wwn(self.host_device)
+        device_wwn = self._linuxscsi.get_scsi_wwn(host_device)
         LOG.debug("Device WWN = '%(wwn)s'", {'wwn': device_wwn})
         device_info['scsi_wwn'] = device_wwn
 
@@ -187,13 +270,13 @@ class FibreChannelConnector(base.BaseLinuxConnector):
         if self.use_multipath:
             (device_path, multipath_id) = (super(
                 FibreChannelConnector, self)._discover_mpath_device(
-                device_wwn, connection_properties, self.device_name))
+                device_wwn, connection_properties, device_name))
             if multipath_id:
                 # only set the multipath_id if we found one
                 device_info['multipath_id'] = multipath_id
 
         else:
-            device_path = self.host_device
+            device_path = host_device
 
         device_info['path'] = device_path
         LOG.debug("connect_volume returning %s", device_info)
@@ -244,7 +327,7 @@ class FibreChannelConnector(base.BaseLinuxConnector):
         return raw_devices
 
     @utils.trace
-    @synchronized('connect_volume')
+    @utils.synchronized_resources('_get_lock_names')
     def disconnect_volume(self, connection_properties, device_info):
         """Detach the volume from instance_name.
 
@@ -259,15 +342,7 @@ class FibreChannelConnector(base.BaseLinuxConnector):
         target_lun - LUN id of the volume
         """
 
-        devices = []
-        volume_paths = self.get_volume_paths(connection_properties)
-        wwn = None
-        for path in volume_paths:
-            real_path = self._linuxscsi.get_name_from_path(path)
-            if not wwn:
-                wwn = self._linuxscsi.get_scsi_wwn(path)
-            device_info = self._linuxscsi.get_device_info(real_path)
-            devices.append(device_info)
+        wwn, devices = self._get_volume_devices(connection_properties)
 
         if self.use_multipath:
             # There is a bug in multipath where the flushing
@@ -278,12 +353,75 @@ class FibreChannelConnector(base.BaseLinuxConnector):
         LOG.debug("devices to remove = %s", devices)
         self._remove_devices(connection_properties, devices)
 
+    @utils.trace
+    @utils.synchronized_resources('_get_batch_lock_names')
+    def disconnect_volumes(self, connection_properties_list,
+                           device_info_list):
+        """Detach several volumes at once.
+
+        The locks of the target ports are taken once and the devices of all
+        the volumes are removed together, concurrently.
+
+        :param connection_properties_list: list of connection_properties
+                                           dictionaries, see
+                                           disconnect_volume.
+        :type connection_properties_list: list
+        :param device_info_list: list with the device_info of each volume.
+        :type device_info_list: list
+        :returns: list with the exception raised disconnecting each volume,
+                  or None if it was disconnected.
+        """
+        results = [None] * len(connection_properties_list)
+
+        volumes = {}
+        for i, connection_properties in enumerate(connection_properties_list):
+            try:
+                wwn, devices = self._get_volume_devices(connection_properties)
+                if self.use_multipath:
+                    self._linuxscsi.flush_multipath_device(wwn)
+            except Exception as exc:
+                results[i] = exc
+                continue
+            volumes[i] = [device['device'] for device in devices]
+
+        LOG.debug("devices to remove = %s", volumes)
+        failed = self._remove_volumes_devices(
+            volumes, multipath_path=self.use_multipath)
+        for i, exc in failed.items():
+            results[i] = exc
+
+        for i, exc in enumerate(results):
+            if exc is not None:
+                LOG.warning(_LW("Failed to disconnect volume %(props)s: "
+                                "%(exc)s"),
+                            {'props': connection_properties_list[i],
+                             'exc': exc})
+        return results
+
+    def _get_volume_devices(self, connection_properties):
+        """Find the SCSI devices of an attached volume.
+
+        :returns: tuple with the WWN of the volume and the SCSI address of
+                  each of its devices.
+        """
+        devices = []
+        volume_paths = self.get_volume_paths(connection_properties)
+        wwn = None
+        for path in volume_paths:
+            real_path = self._linuxscsi.get_name_from_path(path)
+            if not wwn:
+                wwn = self._linuxscsi.get_scsi_wwn(path)
+            device_info = self._linuxscsi.get_device_info(real_path)
+            devices.append(device_info)
+        return wwn, devices
+
     def _remove_devices(self, connection_properties, devices):
         # There may have been more than 1 device mounted
         # by the kernel for this volume.  We have to remove
         # all of them
         for device in devices:
-            self._linuxscsi.remove_scsi_device(device["device"])
+            self._linuxscsi.remove_scsi_device(
+                device["device"], multipath_path=self.use_multipath)
 
     def _get_pci_num(self, hba):
         # NOTE(walter-boring)
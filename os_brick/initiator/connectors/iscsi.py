@@ -17,24 +17,77 @@ import copy
 import glob
 import os
 import re
-import time
+import threading
 
 from oslo_concurrency import lockutils
 from oslo_concurrency import processutils as putils
 from oslo_log import log as logging
 from oslo_utils import strutils
+import six
 
 from os_brick.i18n import _, _LE, _LI, _LW
 from os_brick import exception
 from os_brick import initiator
 from os_brick.initiator.connectors import base
 from os_brick.initiator.connectors import base_iscsi
+from os_brick.initiator import device_waiter
+from os_brick.initiator import session_refcount
+from os_brick.initiator import sysfs
+from os_brick import tracing
 from os_brick import utils
 
 synchronized = lockutils.synchronized_with_prefix('os-brick-')
 
 LOG = logging.getLogger(__name__)
 
+# Upper bound on the number of iSCSI logins running at the same time on this
+# host, shared by all the connectors of the process.
+MAX_CONCURRENT_LOGINS = 16
+_login_semaphore = threading.BoundedSemaphore(MAX_CONCURRENT_LOGINS)
+
+# Results of the sendtargets discoveries, shared by all the connectors of
+# the process.
+_discovery_cache = utils.TTLCache()
+
+# Parallel logins still running in the background, by IQN, as (cancelled
+# event, worker threads) pairs.
+_background_logins = {}
+_background_logins_lock = threading.Lock()
+
+
+def _add_background_logins(iqns, batch):
+    with _background_logins_lock:
+        for iqn in iqns:
+            _background_logins.setdefault(iqn, []).append(batch)
+
+
+def _forget_background_logins(iqns, batch):
+    with _background_logins_lock:
+        for iqn in iqns:
+            batches = _background_logins.get(iqn, [])
+            if batch in batches:
+                batches.remove(batch)
+            if not batches:
+                _background_logins.pop(iqn, None)
+
+
+def _stop_background_logins(iqns):
+    """Stop the background logins of some targets and wait for them.
+
+    Logins that haven't started yet are skipped, those already running can't
+    be interrupted so we wait for them to finish.
+    """
+    batches = []
+    with _background_logins_lock:
+        for iqn in iqns:
+            for batch in _background_logins.pop(iqn, []):
+                if batch not in batches:
+                    batches.append(batch)
+    for cancelled, workers in batches:
+        cancelled.set()
+        for worker in workers:
+            worker.join()
+
 
 class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
     """Connector class to attach/detach iSCSI volumes."""
@@ -45,14 +98,25 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
     def __init__(self, root_helper, driver=None,
                  execute=None, use_multipath=False,
                  device_scan_attempts=initiator.DEVICE_SCAN_ATTEMPTS_DEFAULT,
-                 transport='default', *args, **kwargs):
+                 transport='default', parallel_logins=1,
+                 session_state_file=None, discovery_cache_ttl=0,
+                 *args, **kwargs):
         super(ISCSIConnector, self).__init__(
             root_helper, driver=driver,
             execute=execute,
             device_scan_attempts=device_scan_attempts,
             transport=transport, *args, **kwargs)
         self.use_multipath = use_multipath
+        self.parallel_logins = parallel_logins
+        # Seconds the targets found by a discovery are reused for
+        self.discovery_cache_ttl = discovery_cache_ttl
         self.transport = self._validate_iface_transport(transport)
+        # Sessions used by each attachment, all the users of os-brick on
+        # the host must use the same file for the counts to be right.
+        self._session_refcount = None
+        if session_state_file:
+            self._session_refcount = session_refcount.SessionRefcount(
+                session_state_file)
 
     @staticmethod
     def get_connector_properties(root_helper, *args, **kwargs):
@@ -105,31 +169,50 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
 
         return volume_paths
 
-    def _get_iscsi_sessions(self):
-        out, err = self._run_iscsi_session()
+    def _get_iscsi_sessions_full(self):
+        """Get the iSCSI sessions of the host.
 
-        iscsi_sessions = []
+        The sessions are read from sysfs, we only fall back to parsing the
+        output of `iscsiadm -m session` when sysfs can't be used.
 
+        :returns: list of dicts with the sid, transport, portal, tpgt and iqn
+                  of each session.
+        """
+        sessions = sysfs.get_iscsi_sessions()
+        if sessions is not None:
+            return sessions
+
+        out, err = self._run_iscsi_session()
         if err:
             LOG.warning(_LW("Couldn't find iscsi sessions because "
                         "iscsiadm err: %s"),
                         err)
-        else:
-            # parse the output from iscsiadm
-            # lines are in the format of
-            # tcp: [1] 192.168.121.250:3260,1 iqn.2010-10.org.openstack:volume-
-            lines = out.split('\n')
-            for line in lines:
-                if line:
-                    entries = line.split()
-                    portal = entries[2].split(',')
-                    iscsi_sessions.append(portal[0])
-
-        return iscsi_sessions
+            return []
+
+        # parse the output from iscsiadm
+        # lines are in the format of
+        # tcp: [1] 192.168.121.250:3260,1 iqn.2010-10.org.openstack:volume-
+        sessions = []
+        for line in out.splitlines():
+            entries = line.split()
+            if len(entries) < 4 or not entries[1].startswith('['):
+                continue
+            portal, _sep, tpgt = entries[2].partition(',')
+            sessions.append({'sid': int(entries[1][1:-1]),
+                             'transport': entries[0][:-1],
+                             'portal': portal,
+                             'tpgt': int(tpgt) if tpgt.isdigit() else None,
+                             'iqn': entries[3]})
+        return sessions
+
+    def _get_iscsi_sessions(self):
+        return [session['portal']
+                for session in self._get_iscsi_sessions_full()]
 
     def _get_potential_volume_paths(self, connection_properties,
                                     connect_to_portal=True,
-                                    use_rescan=True):
+                                    use_rescan=True, logins=None,
+                                    scan_targets=None):
         """Build a list of potential volume paths that exist.
 
         Given a list of target_portals in the connection_properties,
@@ -156,6 +239,13 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         :param connect_to_portal: bool
         :param use_rescan: Issue iSCSI rescan during discovery?
         :type use_rescan: bool
+        :param logins: results of the logins done so far, by (portal, iqn).
+                       Portals found here are not logged into again.
+        :type logins: dict
+        :param scan_targets: if given, the (portal, iqn, lun) of the volume
+                             are added to this list so they can be scanned
+                             later on.
+        :type scan_targets: list
         :returns: dict
         """
 
@@ -176,32 +266,38 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
                 else:
                     raise
 
-            if not connection_properties.get('target_iqns'):
-                # There are two types of iSCSI multipath devices. One which
-                # shares the same iqn between multiple portals, and the other
-                # which use different iqns on different portals.
-                # Try to identify the type by checking the iscsiadm output
-                # if the iqn is used by multiple portals. If it is, it's
-                # the former, so use the supplied iqn. Otherwise, it's the
-                # latter, so try the ip,iqn combinations to find the targets
-                # which constitutes the multipath device.
-                main_iqn = connection_properties['target_iqn']
-                all_portals = set([ip for ip, iqn in ips_iqns])
-                match_portals = set([ip for ip, iqn in ips_iqns
-                                     if iqn == main_iqn])
-                if len(all_portals) == len(match_portals):
-                    ips_iqns = zip(all_portals, [main_iqn] * len(all_portals))
-
-            for ip, iqn in ips_iqns:
-                props = copy.deepcopy(connection_properties)
-                props['target_portal'] = ip
-                props['target_iqn'] = iqn
-                if connect_to_portal:
-                    if self._connect_to_iscsi_portal(props):
-                        connected_to_portal = True
-
+            ips_iqns = self._select_targets(connection_properties, ips_iqns)
+
+            if connect_to_portal:
+                targets = []
+                for ip, iqn in ips_iqns:
+                    if logins is not None and (ip, iqn) in logins:
+                        connected_to_portal |= logins[(ip, iqn)]
+                        continue
+                    props = copy.deepcopy(connection_properties)
+                    props['target_portal'] = ip
+                    props['target_iqn'] = iqn
+                    targets.append(props)
+
+                if self.parallel_logins > 1 and len(targets) > 1:
+                    connected_to_portal |= (
+                        self._connect_to_iscsi_portals_parallel(
+                            connection_properties, targets, logins))
+                else:
+                    for props in targets:
+                        if self._connect_to_iscsi_portal_once(props, logins):
+                            connected_to_portal = True
+
+            # Look for the LUNs on every session to the targets, the
+            # other paths are there.
+            luns = set(lun for _portal, _iqn, lun in
+                       self._get_all_targets(connection_properties))
+            targets = [(ip, iqn, lun) for ip, iqn in ips_iqns
+                       for lun in sorted(luns)]
+            if scan_targets is not None:
+                scan_targets.extend(targets)
             if use_rescan:
-                self._rescan_iscsi()
+                self._rescan_iscsi(targets)
             host_devices = self._get_device_path(connection_properties)
         else:
             LOG.info(_LI("Multipath discovery for iSCSI not enabled."))
@@ -213,10 +309,12 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
             target_props = connection_properties
             for props in self._iterate_all_targets(connection_properties):
                 if connect_to_portal:
-                    if self._connect_to_iscsi_portal(props):
+                    if self._connect_to_iscsi_portal_once(props, logins):
                         target_props = props
                         connected_to_portal = True
                         host_devices = self._get_device_path(props)
+                        if scan_targets is not None:
+                            scan_targets.extend(self._get_all_targets(props))
                         break
                     else:
                         LOG.warning(_LW(
@@ -237,6 +335,116 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
 
         return host_devices, target_props
 
+    def _connect_to_iscsi_portal_once(self, connection_properties, logins):
+        """Log into a portal unless it has already been tried.
+
+        :param logins: results of the previous logins by (portal, iqn), the
+                       result of this one is added.  If None we always log
+                       in.
+        :type logins: dict
+        """
+        if logins is None:
+            return self._connect_to_iscsi_portal(connection_properties)
+        key = (connection_properties['target_portal'],
+               connection_properties['target_iqn'])
+        if key not in logins:
+            logins[key] = self._connect_to_iscsi_portal(connection_properties)
+        return logins[key]
+
+    @tracing.traced('login')
+    def _connect_to_iscsi_portals_parallel(self, connection_properties,
+                                           targets, logins=None):
+        """Log into several iSCSI portals concurrently.
+
+        Up to parallel_logins portals are logged into at the same time, and
+        no more than MAX_CONCURRENT_LOGINS logins run on the host at once.
+
+        We return as soon as one login has succeeded and a device for the
+        volume exists, or once every login has finished.  Logins that are
+        still running at that point carry on in the background, so the
+        remaining paths get added to the multipath device as they come up,
+        and disconnecting the targets stops and waits for them first.
+
+        :param connection_properties: The dictionary that describes all
+                                      of the target volume attributes.
+        :type connection_properties: dict
+        :param targets: connection properties of each portal to log into.
+        :type targets: list
+        :param logins: results of the logins by (portal, iqn), the results
+                       of these ones are added, even those that finish in
+                       the background.
+        :type logins: dict
+        :returns: bool -- whether at least one login succeeded
+        """
+        pending = six.moves.queue.Queue()
+        for props in targets:
+            pending.put(props)
+        status = {'remaining': len(targets), 'connected': False,
+                  'workers': min(self.parallel_logins, len(targets))}
+        cond = threading.Condition()
+        cancelled = threading.Event()
+        # The discovered targets may not be those the volume was connected
+        # with, its disconnection must find the logins too.
+        iqns = set(props['target_iqn'] for props in targets)
+        iqns.update(iqn for _portal, iqn, _lun in
+                    self._get_all_targets(connection_properties))
+        workers = []
+        # The logins of the workers are part of the trace of this one
+        parent_span = tracing.current_span()
+
+        def _login_worker():
+            try:
+                while not cancelled.is_set():
+                    try:
+                        props = pending.get_nowait()
+                    except six.moves.queue.Empty:
+                        return
+
+                    with tracing.use_span(parent_span), _login_semaphore:
+                        try:
+                            connected = self._connect_to_iscsi_portal(props)
+                        except Exception:
+                            LOG.exception(_LE("Failed to connect to iSCSI "
+                                              "portal %(portal)s."),
+                                          {'portal': props['target_portal']})
+                            connected = False
+
+                    with cond:
+                        if logins is not None:
+                            logins[(props['target_portal'],
+                                    props['target_iqn'])] = connected
+                        status['remaining'] -= 1
+                        status['connected'] = status['connected'] or connected
+                        cond.notify_all()
+            finally:
+                with cond:
+                    status['workers'] -= 1
+                    last = not status['workers']
+                if last:
+                    _forget_background_logins(iqns, (cancelled, workers))
+
+        for i in range(status['workers']):
+            workers.append(threading.Thread(target=_login_worker))
+        # Register the logins before they start so that a disconnect of the
+        # targets always finds them.
+        _add_background_logins(iqns, (cancelled, workers))
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        with cond:
+            while status['remaining']:
+                if status['connected'] and any(
+                        os.path.exists(dev) for dev in
+                        self._get_device_path(connection_properties)):
+                    LOG.debug("Found a usable path with %d iSCSI logins "
+                              "still in progress.", status['remaining'])
+                    break
+                # Logins wake us up when they finish, but device nodes
+                # appearing don't, so check for them periodically.
+                cond.wait(0.5)
+            return status['connected']
+
     def set_execute(self, execute):
         super(ISCSIConnector, self).set_execute(execute)
         self._linuxscsi.set_execute(execute)
@@ -283,6 +491,67 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
     def _get_transport(self):
         return self.transport
 
+    def _select_targets(self, connection_properties, ips_iqns):
+        """Get the discovered targets a volume is connected through.
+
+        :param ips_iqns: (portal, iqn) targets found by discovery.
+        :returns: list of (portal, iqn) targets.
+        """
+        if not connection_properties.get('target_iqns'):
+            # There are two types of iSCSI multipath devices. One which
+            # shares the same iqn between multiple portals, and the other
+            # which use different iqns on different portals.
+            # Try to identify the type by checking the iscsiadm output
+            # if the iqn is used by multiple portals. If it is, it's
+            # the former, so use the supplied iqn. Otherwise, it's the
+            # latter, so try the ip,iqn combinations to find the targets
+            # which constitutes the multipath device.
+            ips_iqns = list(ips_iqns)
+            main_iqn = connection_properties['target_iqn']
+            all_portals = set([ip for ip, iqn in ips_iqns])
+            match_portals = set([ip for ip, iqn in ips_iqns
+                                 if iqn == main_iqn])
+            if len(all_portals) == len(match_portals):
+                ips_iqns = zip(all_portals, [main_iqn] * len(all_portals))
+        return list(ips_iqns)
+
+    def _get_target_iqns(self, connection_properties, ips_iqns=None):
+        """Get the IQNs of the targets a volume is connected through.
+
+        Besides those of the connection properties, in multipath mode they
+        include the other IQNs discovered on the portals of the volume when
+        these report different IQNs, connect_volume logs into them too.
+
+        :param ips_iqns: (portal, iqn) targets found by discovery.  If not
+                         given the sessions recorded when the volume was
+                         connected are used, or the portals are discovered.
+        :returns: list of IQNs.
+        """
+        iqns = [iqn for _portal, iqn, _lun in
+                self._get_all_targets(connection_properties)]
+        if (not self.use_multipath or
+                connection_properties.get('target_iqns')):
+            return iqns
+        if ips_iqns is None:
+            targets = self._get_recorded_sessions(connection_properties)
+            if targets is None:
+                try:
+                    targets = self._select_targets(
+                        connection_properties,
+                        self._discover_iscsi_portals(connection_properties))
+                except Exception as exc:
+                    LOG.debug("Could not discover the targets of "
+                              "%(props)s: %(exc)s",
+                              {'props': connection_properties, 'exc': exc})
+                    targets = []
+        else:
+            targets = self._select_targets(connection_properties, ips_iqns)
+        for _portal, iqn in targets:
+            if iqn not in iqns:
+                iqns.append(iqn)
+        return iqns
+
+    @tracing.traced('discovery')
     def _discover_iscsi_portals(self, connection_properties):
         if all([key in connection_properties for key in ('target_portals',
                                                          'target_iqns')]):
@@ -290,9 +559,22 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
             return zip(connection_properties['target_portals'],
                        connection_properties['target_iqns'])
 
-        out = None
         iscsi_transport = ('iser' if self._get_transport() == 'iser'
                            else 'default')
+        # The targets returned by a portal don't depend on the IQN we are
+        # looking for, so volumes of the same array share the discovery.
+        key = (iscsi_transport, connection_properties['target_portal'],
+               connection_properties.get('discovery_auth_method'),
+               connection_properties.get('discovery_auth_username'),
+               connection_properties.get('discovery_auth_password'))
+        return list(_discovery_cache.get(
+            key,
+            lambda: self._run_iscsi_discovery(connection_properties,
+                                              iscsi_transport),
+            ttl=self.discovery_cache_ttl))
+
+    def _run_iscsi_discovery(self, connection_properties, iscsi_transport):
+        out = None
         if connection_properties.get('discovery_auth_method'):
             try:
                 self._run_iscsiadm_update_discoverydb(connection_properties,
@@ -372,8 +654,24 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
                         {'props': connection_properties})
             raise exception.VolumePathsNotFound()
 
+    def _get_lock_names(self, connection_properties, device_info=None):
+        """Names of the locks of the targets used by a volume.
+
+        We lock whole targets rather than their sessions, in multipath mode
+        we don't know which portals a target has until we discover them.
+        """
+        return ['iscsi-%s' % iqn for iqn in
+                self._get_target_iqns(connection_properties)]
+
+    def _get_batch_lock_names(self, connection_properties_list,
+                              device_info_list=None):
+        names = []
+        for connection_properties in connection_properties_list:
+            names.extend(self._get_lock_names(connection_properties))
+        return names
+
     @utils.trace
-    @synchronized('connect_volume')
+    @utils.synchronized_resources('_get_lock_names')
     def connect_volume(self, connection_properties):
         """Attach the volume to instance_name.
 
@@ -389,40 +687,46 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         Note that plural keys may be used when use_multipath=True
         """
 
-        device_info = {'type': 'block'}
-
         # At this point the host_devices may be an empty list
+        scan_targets = []
         host_devices, target_props = self._get_potential_volume_paths(
-            connection_properties)
+            connection_properties, scan_targets=scan_targets)
 
         # The /dev/disk/by-path/... node is not always present immediately
         # TODO(justinsb): This retry-with-delay is a pattern, move to utils?
-        tries = 0
-        # Loop until at least 1 path becomes available
-        while all(map(lambda x: not os.path.exists(x), host_devices)):
-            if tries >= self.device_scan_attempts:
-                raise exception.VolumeDeviceNotFound(device=host_devices)
-
-            LOG.info(_LI("ISCSI volume not yet found at: %(host_devices)s. "
-                         "Will rescan & retry.  Try number: %(tries)s."),
-                     {'host_devices': host_devices, 'tries': tries})
-
-            # The rescan isn't documented as being necessary(?), but it helps
-            if self.use_multipath:
-                self._rescan_iscsi()
-                # We need to refresh the paths as the devices may be empty
-                host_devices, target_props = (
-                    self._get_potential_volume_paths(connection_properties))
-            else:
-                if (tries):
-                    host_devices = self._get_device_path(target_props)
-                self._run_iscsiadm(target_props, ("--rescan",))
-
-            tries = tries + 1
-            if all(map(lambda x: not os.path.exists(x), host_devices)):
-                time.sleep(tries ** 2)
-            else:
-                break
+        with tracing.span('device_wait'):
+            tries = 0
+            # Loop until at least 1 path becomes available
+            while all(map(lambda x: not os.path.exists(x), host_devices)):
+                if tries >= self.device_scan_attempts:
+                    raise exception.VolumeDeviceNotFound(device=host_devices)
+
+                LOG.info(_LI("ISCSI volume not yet found at: "
+                             "%(host_devices)s. Will rescan & retry.  Try "
+                             "number: %(tries)s."),
+                         {'host_devices': host_devices, 'tries': tries})
+
+                # The rescan isn't documented as being necessary(?), but it
+                # helps
+                if self.use_multipath:
+                    # We need to refresh the paths as the devices may be
+                    # empty, this rescans the targets as well.
+                    host_devices, target_props = (
+                        self._get_potential_volume_paths(
+                            connection_properties,
+                            scan_targets=scan_targets))
+                else:
+                    if (tries):
+                        host_devices = self._get_device_path(target_props)
+                    if not self._scan_iscsi_luns(
+                            self._get_all_targets(target_props)):
+                        self._run_iscsiadm(target_props, ("--rescan",))
+
+                tries = tries + 1
+                # Wake up as soon as one of the devices shows up instead of
+                # always waiting for the whole interval.
+                if device_waiter.wait_for_any(host_devices, tries ** 2):
+                    break
 
         if tries != 0:
             LOG.debug("Found iSCSI node %(host_devices)s "
@@ -432,6 +736,132 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         # Choose an accessible host device
         host_device = next(dev for dev in host_devices if os.path.exists(dev))
 
+        device_info = self._get_device_info(connection_properties, host_device)
+        self._add_session_refs(connection_properties, scan_targets)
+        return self._add_timings(device_info)
+
+    @utils.trace
+    @utils.synchronized_resources('_get_batch_lock_names')
+    def connect_volumes(self, connection_properties_list):
+        """Attach several volumes at once.
+
+        Each portal is logged into only once, the LUNs of all the volumes are
+        scanned together and we wait for all their devices at the same time.
+
+        :param connection_properties_list: list of connection_properties
+                                           dictionaries, see connect_volume.
+        :type connection_properties_list: list
+        :returns: list with the device_info of each volume, in the same order.
+                  If a volume couldn't be connected its device_info is a
+                  dictionary with the exception under the 'error' key.
+        """
+        results = [None] * len(connection_properties_list)
+
+        logins = {}
+        volumes = {}
+        volume_props = {}
+        scan_targets = {}
+        for i, connection_properties in enumerate(connection_properties_list):
+            targets = []
+            try:
+                volumes[i], target_props = self._get_potential_volume_paths(
+                    connection_properties, use_rescan=False, logins=logins,
+                    scan_targets=targets)
+            except Exception as exc:
+                LOG.warning(_LW("Failed to connect volume %(props)s: "
+                                "%(exc)s"),
+                            {'props': connection_properties, 'exc': exc})
+                results[i] = {'error': exc}
+                continue
+            # In multipath mode the paths are those of all the portals
+            volume_props[i] = (connection_properties if self.use_multipath
+                               else target_props)
+            scan_targets[i] = targets
+
+        def _rescan(missing):
+            targets = []
+            for i in missing:
+                targets.extend(target for target in scan_targets[i]
+                               if target not in targets)
+            self._rescan_iscsi(targets)
+            # We need to refresh the paths as the devices may be empty
+            for i in missing:
+                volumes[i] = self._get_device_path(volume_props[i])
+
+        found = self._wait_for_devices(volumes, _rescan,
+                                       lambda tries: tries ** 2)
+
+        for i in sorted(volumes):
+            if i not in found:
+                results[i] = {'error': exception.VolumeDeviceNotFound(
+                    device=volumes[i])}
+                continue
+            try:
+                results[i] = self._get_device_info(
+                    connection_properties_list[i], found[i])
+                self._add_session_refs(connection_properties_list[i],
+                                       scan_targets[i])
+            except Exception as exc:
+                LOG.warning(_LW("Failed to connect volume %(props)s: "
+                                "%(exc)s"),
+                            {'props': connection_properties_list[i],
+                             'exc': exc})
+                results[i] = {'error': exc}
+
+        return results
+
+    def _add_session_refs(self, connection_properties, targets):
+        """Record the sessions used by an attached volume."""
+        if self._session_refcount is None:
+            return
+        sessions = set((portal.split(',')[0], iqn)
+                       for portal, iqn, _lun in targets)
+        self._session_refcount.add(
+            session_refcount.get_attachment_id(
+                self._get_all_targets(connection_properties)),
+            sessions)
+
+    def _get_recorded_sessions(self, connection_properties):
+        """Get the (portal, iqn) sessions recorded for an attached volume.
+
+        :returns: list of sessions, or None if they are not known.
+        """
+        if self._session_refcount is None:
+            return None
+        return self._session_refcount.get_sessions(
+            session_refcount.get_attachment_id(
+                self._get_all_targets(connection_properties)))
+
+    def _get_unused_sessions(self, connection_properties, detached=()):
+        """Get the sessions of a volume no other attached volume uses.
+
+        :param detached: connection_properties of other volumes being
+                         detached along with this one.
+        :returns: list of (portal, iqn) sessions, or None if we don't know
+                  the sessions of the volume.
+        """
+        if self._session_refcount is None:
+            return None
+        unused = self._session_refcount.get_unused(
+            session_refcount.get_attachment_id(
+                self._get_all_targets(connection_properties)),
+            ignore=[session_refcount.get_attachment_id(
+                self._get_all_targets(props)) for props in detached])
+        if unused is None:
+            LOG.debug("No sessions recorded for %s, looking for the sessions "
+                      "in use on the host instead.", connection_properties)
+        return unused
+
+    def _release_session_refs(self, connection_properties):
+        """Forget the sessions used by a volume that has been detached."""
+        if self._session_refcount is not None:
+            self._session_refcount.remove(
+                session_refcount.get_attachment_id(
+                    self._get_all_targets(connection_properties)))
+
+    def _get_device_info(self, connection_properties, host_device):
+        device_info = {'type': 'block'}
+
         # find out the WWN of the device
         device_wwn = self._linuxscsi.get_scsi_wwn(host_device)
         LOG.debug("Device WWN = '%(wwn)s'", {'wwn': device_wwn})
@@ -450,7 +880,7 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         return device_info
 
     @utils.trace
-    @synchronized('connect_volume')
+    @utils.synchronized_resources('_get_lock_names')
     def disconnect_volume(self, connection_properties, device_info):
         """Detach the volume from instance_name.
 
@@ -465,6 +895,24 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         target_iqn(s) - iSCSI Qualified Name
         target_lun(s) - LUN id of the volume
         """
+        # Logins of the volume that carried on in the background after
+        # connecting it would race with the logouts.
+        _stop_background_logins(
+            set(iqn for _portal, iqn, _lun in
+                self._get_all_targets(connection_properties)))
+
+        unused_sessions = self._get_unused_sessions(connection_properties)
+        try:
+            self._disconnect_volume(connection_properties, unused_sessions)
+        except exception.VolumeDeviceNotFound:
+            # There is nothing left of the volume to disconnect
+            self._release_session_refs(connection_properties)
+            raise
+        # The sessions are only released once the volume is gone, a failed
+        # disconnection keeps them for the next attempt.
+        self._release_session_refs(connection_properties)
+
+    def _disconnect_volume(self, connection_properties, unused_sessions):
         if self.use_multipath:
             self._rescan_multipath()
             host_device = multipath_device = None
@@ -487,15 +935,209 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
             if multipath_device:
                 device_realpath = os.path.realpath(host_device)
                 self._linuxscsi.remove_multipath_device(device_realpath)
+                if unused_sessions is not None:
+                    # No need to discover the targets and look at the other
+                    # multipath devices, we know which sessions are unused.
+                    return self._disconnect_unused_sessions(
+                        connection_properties, unused_sessions)
                 return self._disconnect_volume_multipath_iscsi(
                     connection_properties, multipath_device)
 
         # When multiple portals/iqns/luns are specified, we need to remove
         # unused devices created by logging into other LUNs' session.
         for props in self._iterate_all_targets(connection_properties):
-            self._disconnect_volume_iscsi(props)
+            self._disconnect_volume_iscsi(props, unused_sessions)
 
-    def _disconnect_volume_iscsi(self, connection_properties):
+    @utils.trace
+    @utils.synchronized_resources('_get_batch_lock_names')
+    def disconnect_volumes(self, connection_properties_list,
+                           device_info_list):
+        """Detach several volumes at once.
+
+        The locks of all the targets are taken once, the multipath maps are
+        reloaded once, the devices of all the volumes are removed together
+        and each target is logged out of only once, when none of its devices
+        is left.
+
+        :param connection_properties_list: list of connection_properties
+                                           dictionaries, see
+                                           disconnect_volume.
+        :type connection_properties_list: list
+        :param device_info_list: list with the device_info of each volume.
+        :type device_info_list: list
+        :returns: list with the exception raised disconnecting each volume,
+                  or None if it was disconnected.
+        """
+        results = [None] * len(connection_properties_list)
+        _stop_background_logins(
+            set(iqn for connection_properties in connection_properties_list
+                for _portal, iqn, _lun in
+                self._get_all_targets(connection_properties)))
+
+        if self.use_multipath:
+            self._rescan_multipath()
+
+        volumes = {}
+        for i, connection_properties in enumerate(connection_properties_list):
+            try:
+                volumes[i] = self._get_volume_devices(connection_properties)
+            except exception.VolumeDeviceNotFound as exc:
+                # There is nothing left of the volume to disconnect
+                self._release_session_refs(connection_properties)
+                results[i] = exc
+            except Exception as exc:
+                results[i] = exc
+
+        for multipath_id, _devices, _paths in volumes.values():
+            if multipath_id:
+                self._linuxscsi.flush_multipath_device(multipath_id)
+        failed = self._remove_volumes_devices(
+            dict((i, devices) for i, (multipath_id, devices, _paths)
+                 in volumes.items() if multipath_id),
+            multipath_path=True)
+        failed.update(self._remove_volumes_devices(
+            dict((i, devices) for i, (multipath_id, devices, _paths)
+                 in volumes.items() if not multipath_id)))
+        for i in sorted(volumes):
+            try:
+                if i in failed:
+                    raise failed[i]
+                for path in volumes[i][2]:
+                    self._linuxscsi.wait_for_volume_removal(path)
+            except Exception as exc:
+                results[i] = exc
+                del volumes[i]
+
+        # Targets to log out of, with the volumes that used them
+        detached = [connection_properties_list[i] for i in volumes]
+        logouts = {}
+        for i in sorted(volumes):
+            connection_properties = connection_properties_list[i]
+            try:
+                targets = self._get_logout_targets(connection_properties,
+                                                   detached)
+            except Exception as exc:
+                results[i] = exc
+                continue
+            for portal, iqn in targets:
+                key = (portal.split(',')[0], iqn)
+                if key not in logouts:
+                    logouts[key] = (dict(connection_properties,
+                                         target_portal=portal,
+                                         target_iqn=iqn), [])
+                logouts[key][1].append(i)
+
+        for key in sorted(logouts):
+            props, owners = logouts[key]
+            if self._is_target_in_use(props):
+                LOG.debug("Not logging out of %(iqn)s on %(portal)s, it "
+                          "still has devices.",
+                          {'iqn': key[1], 'portal': key[0]})
+                continue
+            try:
+                self._disconnect_from_iscsi_portal(props)
+            except Exception as exc:
+                for i in owners:
+                    results[i] = exc
+        if self.use_multipath and logouts:
+            self._rescan_multipath()
+
+        for i, exc in enumerate(results):
+            if exc is None:
+                self._release_session_refs(connection_properties_list[i])
+            else:
+                LOG.warning(_LW("Failed to disconnect volume %(props)s: "
+                                "%(exc)s"),
+                            {'props': connection_properties_list[i],
+                             'exc': exc})
+        return results
+
+    def _get_volume_devices(self, connection_properties):
+        """Find the SCSI devices of an attached volume.
+
+        :returns: tuple with the id of the multipath device of the volume, or
+                  None if it doesn't have one, its /dev/sdX devices and the
+                  paths to wait for once they are removed.
+        """
+        if self.use_multipath:
+            host_devices = self._get_device_path(connection_properties)
+            existing = [dev for dev in host_devices if os.path.exists(dev)]
+            if not existing:
+                LOG.error(_LE("No accessible volume device: %(host_devices)s"),
+                          {'host_devices': host_devices})
+                raise exception.VolumeDeviceNotFound(device=host_devices)
+            for dev in existing:
+                mpath = self._linuxscsi.find_multipath_device(
+                    os.path.realpath(dev))
+                if mpath:
+                    return (mpath['id'],
+                            [path['device'] for path in mpath['devices']],
+                            [])
+
+        devices = []
+        paths = []
+        for props in self._iterate_all_targets(connection_properties):
+            host_devices = self._get_device_path(props)
+            if not host_devices:
+                continue
+            dev_name = self._linuxscsi.get_name_from_path(host_devices[0])
+            if dev_name:
+                devices.append(dev_name)
+                paths.append(host_devices[0])
+        return None, devices, paths
+
+    def _get_logout_targets(self, connection_properties, detached):
+        """Get the targets of a detached volume that may be logged out of.
+
+        :param detached: connection_properties of all the volumes detached.
+        :returns: list of (portal, iqn) targets.
+        """
+        targets = self._get_unused_sessions(connection_properties, detached)
+        if targets is None:
+            if self.use_multipath:
+                targets = self._discover_iscsi_portals(connection_properties)
+            else:
+                targets = [(portal, iqn) for portal, iqn, _lun in
+                           self._get_all_targets(connection_properties)]
+        return self._get_own_targets(connection_properties, targets)
+
+    def _get_own_targets(self, connection_properties, ips_iqns):
+        """Keep the targets of a volume we hold the locks of.
+
+        The other targets on the same portals may be used by volumes being
+        connected in another thread, without any device yet, so we must not
+        log out of them.
+        """
+        # The same IQNs as _get_lock_names, those connect_volume logged into
+        ips_iqns = list(ips_iqns)
+        iqns = self._get_target_iqns(connection_properties, ips_iqns)
+        own_targets = []
+        for ip, iqn in ips_iqns:
+            if iqn in iqns:
+                own_targets.append((ip, iqn))
+            else:
+                LOG.debug("Not logging out of %(iqn)s on %(portal)s, it is "
+                          "not a target of the volume.",
+                          {'iqn': iqn, 'portal': ip})
+        return own_targets
+
+    def _disconnect_unused_sessions(self, connection_properties, sessions):
+        # Sessions may also be used by volumes attached without the state
+        # file, so we still make sure they have no devices left.
+        ips_iqns = []
+        for portal, iqn in self._get_own_targets(connection_properties,
+                                                 sessions):
+            props = dict(connection_properties, target_portal=portal,
+                         target_iqn=iqn)
+            if self._is_target_in_use(props):
+                LOG.debug("Not logging out of %(iqn)s on %(portal)s, it "
+                          "still has devices.", {'iqn': iqn, 'portal': portal})
+            else:
+                ips_iqns.append((portal, iqn))
+        self._disconnect_mpath(connection_properties, ips_iqns)
+
+    def _disconnect_volume_iscsi(self, connection_properties,
+                                 unused_sessions=None):
         # remove the device from the scsi subsystem
         # this eliminates any stale entries until logout
         host_devices = self._get_device_path(connection_properties)
@@ -516,20 +1158,22 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
             # call to wait addresses that issue.
             self._linuxscsi.wait_for_volume_removal(host_device)
 
+        # Sessions still used by other attached volumes are kept
+        if unused_sessions is not None and (
+                connection_properties['target_portal'].split(',')[0],
+                connection_properties['target_iqn']) not in unused_sessions:
+            return
+
         # NOTE(vish): Only disconnect from the target if no luns from the
         #             target are in use.
-        device_byname = ("ip-%(portal)s-iscsi-%(iqn)s-lun-" %
-                         {'portal': connection_properties['target_portal'],
-                          'iqn': connection_properties['target_iqn']})
-        devices = self.driver.get_all_block_devices()
-        devices = [dev for dev in devices if (device_byname in dev
-                                              and
-                                              dev.startswith(
-                                                  '/dev/disk/by-path/'))
-                   and os.path.exists(dev)]
-        if not devices:
+        if not self._is_target_in_use(connection_properties):
             self._disconnect_from_iscsi_portal(connection_properties)
 
+    def _is_target_in_use(self, connection_properties):
+        return bool(self.driver.get_iscsi_target_devices(
+            connection_properties['target_portal'],
+            connection_properties['target_iqn']))
+
     def _munge_portal(self, target):
         """Remove brackets from portal.
 
@@ -573,15 +1217,19 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
                         file_path)
             return None
 
+    def _get_iscsiadm_node_cmd(self, connection_properties, iscsi_command):
+        return (('iscsiadm', '-m', 'node', '-T',
+                 connection_properties['target_iqn'],
+                 '-p', connection_properties['target_portal']) +
+                tuple(iscsi_command))
+
     def _run_iscsiadm(self, connection_properties, iscsi_command, **kwargs):
         check_exit_code = kwargs.pop('check_exit_code', 0)
         attempts = kwargs.pop('attempts', 1)
         delay_on_retry = kwargs.pop('delay_on_retry', True)
-        (out, err) = self._execute('iscsiadm', '-m', 'node', '-T',
-                                   connection_properties['target_iqn'],
-                                   '-p',
-                                   connection_properties['target_portal'],
-                                   *iscsi_command, run_as_root=True,
+        (out, err) = self._execute(*self._get_iscsiadm_node_cmd(
+                                   connection_properties, iscsi_command),
+                                   run_as_root=True,
                                    root_helper=self._root_helper,
                                    check_exit_code=check_exit_code,
                                    attempts=attempts,
@@ -600,6 +1248,18 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         return self._run_iscsiadm(connection_properties, iscsi_command,
                                   **kwargs)
 
+    def _iscsiadm_update_settings(self, connection_properties, settings,
+                                  **kwargs):
+        """Update several settings of a node record at once.
+
+        :param settings: list of (name, value) pairs.
+        """
+        iscsi_command = ('--op', 'update')
+        for name, value in settings:
+            iscsi_command += ('-n', name, '-v', value)
+        return self._run_iscsiadm(connection_properties, iscsi_command,
+                                  **kwargs)
+
     def _get_target_portals_from_iscsiadm_output(self, output):
         # return both portals and iqns
         #
@@ -638,7 +1298,8 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         ips_iqns = []
         entries = [device.lstrip('ip-').split('-lun-')[0]
                    for device in self._get_iscsi_devices()]
-        for ip, iqn in all_ips_iqns:
+        for ip, iqn in self._get_own_targets(connection_properties,
+                                             all_ips_iqns):
             ip_iqn = "%s-iscsi-%s" % (ip.split(",")[0], iqn)
             if ip_iqn not in entries:
                 ips_iqns.append([ip, iqn])
@@ -671,54 +1332,54 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         # as they are used for other luns
         return
 
-    def _connect_to_iscsi_portal(self, connection_properties):
-        # NOTE(vish): If we are on the same host as nova volume, the
-        #             discovery makes the target so we don't need to
-        #             run --op new. Therefore, we check to see if the
-        #             target exists, and if we get 255 (Not Found), then
-        #             we run --op new. This will also happen if another
-        #             volume is using the same target.
-        LOG.info(_LI("Trying to connect to iSCSI portal %(portal)s"),
-                 {"portal": connection_properties['target_portal']})
+    def _get_node_settings(self, connection_properties):
+        """Settings of the node record of a target we log into."""
+        settings = [('node.startup', 'automatic')]
+        if connection_properties.get('auth_method'):
+            settings.extend([
+                ('node.session.auth.authmethod',
+                 connection_properties['auth_method']),
+                ('node.session.auth.username',
+                 connection_properties['auth_username']),
+                ('node.session.auth.password',
+                 connection_properties['auth_password'])])
+        return settings
+
+    def _set_iscsi_node(self, connection_properties):
+        """Create or update the node record of a target.
+
+        All the settings are written with a single iscsiadm call when the
+        record already exists, which it does if another volume uses the
+        target or the target was discovered.  Otherwise the record is
+        created first.
+        """
+        settings = self._get_node_settings(connection_properties)
         try:
-            self._run_iscsiadm(connection_properties, ())
+            self._iscsiadm_update_settings(connection_properties, settings)
         except putils.ProcessExecutionError as exc:
             # iscsiadm returns 21 for "No records found" after version 2.0-871
-            if exc.exit_code in [21, 255]:
-                self._run_iscsiadm(connection_properties,
-                                   ('--interface', self._get_transport(),
-                                    '--op', 'new'))
-            else:
+            if exc.exit_code not in [21, 255]:
                 raise
+            self._run_iscsiadm(connection_properties,
+                               ('--interface', self._get_transport(),
+                                '--op', 'new'))
+            self._iscsiadm_update_settings(connection_properties, settings)
 
-        if connection_properties.get('auth_method'):
-            self._iscsiadm_update(connection_properties,
-                                  "node.session.auth.authmethod",
-                                  connection_properties['auth_method'])
-            self._iscsiadm_update(connection_properties,
-                                  "node.session.auth.username",
-                                  connection_properties['auth_username'])
-            self._iscsiadm_update(connection_properties,
-                                  "node.session.auth.password",
-                                  connection_properties['auth_password'])
+    @tracing.traced('login')
+    def _connect_to_iscsi_portal(self, connection_properties):
+        LOG.info(_LI("Trying to connect to iSCSI portal %(portal)s"),
+                 {"portal": connection_properties['target_portal']})
+        self._set_iscsi_node(connection_properties)
 
         # Duplicate logins crash iscsiadm after load,
         # so we scan active sessions to see if the node is logged in.
-        out = self._run_iscsiadm_bare(["-m", "session"],
-                                      run_as_root=True,
-                                      check_exit_code=[0, 1, 21])[0] or ""
-
-        portals = [{'portal': p.split(" ")[2], 'iqn': p.split(" ")[3]}
-                   for p in out.splitlines() if p.startswith("tcp:")]
+        sessions = self._get_iscsi_sessions_full()
 
         stripped_portal = connection_properties['target_portal'].split(",")[0]
-        if len(portals) == 0 or len([s for s in portals
-                                     if stripped_portal ==
-                                     s['portal'].split(",")[0]
-                                     and
-                                     s['iqn'] ==
-                                     connection_properties['target_iqn']]
-                                    ) == 0:
+        if not [s for s in sessions
+                if s['transport'] == 'tcp' and
+                stripped_portal == s['portal'] and
+                s['iqn'] == connection_properties['target_iqn']]:
             try:
                 self._run_iscsiadm(connection_properties,
                                    ("--login",),
@@ -727,6 +1388,8 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
                 # exit_code=15 means the session already exists, so it should
                 # be regarded as successful login.
                 if err.exit_code not in [15]:
+                    self._invalidate_discovery(connection_properties)
+                    self._reset_node_startup(connection_properties)
                     LOG.warning(_LW('Failed to login iSCSI target %(iqn)s '
                                     'on portal %(portal)s (exit code '
                                     '%(err)s).'),
@@ -735,21 +1398,61 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
                                      'target_portal'],
                                  'err': err.exit_code})
                     return False
-
-            self._iscsiadm_update(connection_properties,
-                                  "node.startup",
-                                  "automatic")
         return True
 
+    def _reset_node_startup(self, connection_properties):
+        """Don't log into a target at boot after failing to log into it.
+
+        node.startup is set to automatic along with the other settings of the
+        node before logging in, so it has to be reverted like disconnecting
+        from the target does.
+        """
+        try:
+            self._iscsiadm_update(connection_properties, 'node.startup',
+                                  'manual', check_exit_code=[0, 21, 255])
+        except putils.ProcessExecutionError as exc:
+            LOG.warning(_LW('Failed to set node.startup to manual for iSCSI '
+                            'target %(iqn)s on portal %(portal)s (exit code '
+                            '%(err)s).'),
+                        {'iqn': connection_properties['target_iqn'],
+                         'portal': connection_properties['target_portal'],
+                         'err': exc.exit_code})
+
+    def _invalidate_discovery(self, connection_properties):
+        """Forget the discoveries that returned a target we can't log into.
+
+        The target may have been moved or deleted, so it is discovered again
+        on the next attach.
+        """
+        target = [connection_properties['target_portal'].split(',')[0],
+                  connection_properties['target_iqn']]
+        _discovery_cache.invalidate(
+            lambda key, targets: target in [[portal.split(',')[0], iqn]
+                                            for portal, iqn in targets])
+
     def _disconnect_from_iscsi_portal(self, connection_properties):
-        self._iscsiadm_update(connection_properties, "node.startup", "manual",
-                              check_exit_code=[0, 21, 255])
-        self._run_iscsiadm(connection_properties, ("--logout",),
-                           check_exit_code=[0, 21, 255])
-        self._run_iscsiadm(connection_properties, ('--op', 'delete'),
-                           check_exit_code=[0, 21, 255],
-                           attempts=5,
-                           delay_on_retry=True)
+        # The three commands go to the privileged daemon in a single call
+        commands = [
+            (self._get_iscsiadm_node_cmd(
+                connection_properties,
+                ('--op', 'update', '-n', 'node.startup', '-v', 'manual')),
+             {}),
+            (self._get_iscsiadm_node_cmd(connection_properties,
+                                         ('--logout',)),
+             {}),
+            (self._get_iscsiadm_node_cmd(connection_properties,
+                                         ('--op', 'delete')),
+             {'attempts': 5, 'delay_on_retry': True}),
+        ]
+        results = self._execute_batch(commands, run_as_root=True,
+                                      root_helper=self._root_helper,
+                                      check_exit_code=[0, 21, 255])
+        for (cmd, _kwargs), result in zip(commands, results):
+            if isinstance(result, putils.ProcessExecutionError):
+                raise result
+            LOG.debug("%(cmd)s: stdout=%(out)s stderr=%(err)s",
+                      {'cmd': ' '.join(cmd), 'out': result[0],
+                       'err': result[1]})
 
     def _get_iscsi_devices(self):
         try:
@@ -783,7 +1486,12 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
         return iqns
 
     def _get_multipath_device_map(self):
-        out = self._run_multipath(['-ll'], check_exit_code=[0, 1])[0]
+        mpath_map = self.host_inventory.get_multipath_device_map()
+        if mpath_map is not None:
+            return mpath_map
+
+        out = self._run_multipath(['-ll'], check_exit_code=[0, 1],
+                                  read_only=True)[0]
         mpath_line = [line for line in out.splitlines()
                       if not re.match(initiator.MULTIPATH_ERROR_REGEX, line)]
         mpath_dev = None
@@ -804,7 +1512,8 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
 
     def _run_iscsi_session(self):
         (out, err) = self._run_iscsiadm_bare(('-m', 'session'),
-                                             check_exit_code=[0, 1, 21, 255])
+                                             check_exit_code=[0, 1, 21, 255],
+                                             read_only=True)
         LOG.debug("iscsi session list stdout=%(out)s stderr=%(err)s",
                   {'out': out, 'err': err})
         return (out, err)
@@ -815,7 +1524,8 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
                                    *iscsi_command,
                                    run_as_root=True,
                                    root_helper=self._root_helper,
-                                   check_exit_code=check_exit_code)
+                                   check_exit_code=check_exit_code,
+                                   **kwargs)
         LOG.debug("iscsiadm %(iscsi_command)s: stdout=%(out)s stderr=%(err)s",
                   {'iscsi_command': iscsi_command, 'out': out, 'err': err})
         return (out, err)
@@ -826,14 +1536,60 @@ class ISCSIConnector(base.BaseLinuxConnector, base_iscsi.BaseISCSIConnector):
                                    *multipath_command,
                                    run_as_root=True,
                                    root_helper=self._root_helper,
-                                   check_exit_code=check_exit_code)
+                                   check_exit_code=check_exit_code,
+                                   **kwargs)
         LOG.debug("multipath %(multipath_command)s: "
                   "stdout=%(out)s stderr=%(err)s",
                   {'multipath_command': multipath_command,
                    'out': out, 'err': err})
         return (out, err)
 
-    def _rescan_iscsi(self):
+    def _scan_iscsi_luns(self, targets):
+        """Scan only the LUNs we are looking for on their sessions.
+
+        Instead of rescanning every LUN of every session like iscsiadm does,
+        write a "channel target lun" triple to the scan file of the SCSI host
+        of the session of each target.
+
+        :param targets: list of (portal, iqn, lun) tuples.
+        :returns: False if the sessions couldn't be found in sysfs and the
+                  caller has to fall back to a full rescan, True otherwise.
+        """
+        sessions = sysfs.get_iscsi_sessions()
+        if sessions is None:
+            return False
+
+        scans = []
+        for portal, iqn, lun in targets:
+            # Discovered portals have the tpgt, the sessions don't
+            portal = portal.split(',')[0]
+            session = next((s for s in sessions
+                            if s['portal'].split(',')[0] == portal and
+                            s['iqn'] == iqn),
+                           None)
+            if session is None or session['host'] is None:
+                LOG.debug("Could not find the SCSI host of the session to "
+                          "%(portal)s %(iqn)s, doing a full rescan.",
+                          {'portal': portal, 'iqn': iqn})
+                return False
+            if lun in session['luns']:
+                continue
+            # If the session has no targets yet use wildcards, the scan is
+            # still limited to the host of this session.
+            for channel, target_id in session['targets'] or [('-', '-')]:
+                scans.append(('/sys/class/scsi_host/host%s/scan' %
+                              session['host'],
+                              '%s %s %s' % (channel, target_id, lun)))
+
+        for path, content in scans:
+            LOG.debug('Scanning %(path)s for %(content)s',
+                      {'path': path, 'content': content})
+        self._linuxscsi.echo_scsi_commands(scans)
+        return True
+
+    def _rescan_iscsi(self, targets=None):
+        if targets is not None and self._scan_iscsi_luns(targets):
+            return
         self._run_iscsiadm_bare(('-m', 'node', '--rescan'),
                                 check_exit_code=[0, 1, 21, 255])
         self._run_iscsiadm_bare(('-m', 'session', '--rescan'),
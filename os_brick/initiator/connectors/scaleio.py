@@ -25,6 +25,7 @@ from os_brick.i18n import _, _LI, _LW
 from os_brick import exception
 from os_brick import initiator
 from os_brick.initiator.connectors import base
+from os_brick.initiator import device_waiter
 from os_brick import utils
 
 LOG = logging.getLogger(__name__)
@@ -39,6 +40,7 @@ class ScaleIOConnector(base.BaseLinuxConnector):
     VOLUME_NOT_MAPPED_ERROR = 84
     VOLUME_ALREADY_MAPPED_ERROR = 81
     GET_GUID_CMD = ['/opt/emc/scaleio/sdc/bin/drv_cfg', '--query_guid']
+    VOLUME_PATH_TIMEOUT = 15
 
     def __init__(self, root_helper, driver=None,
                  device_scan_attempts=initiator.DEVICE_SCAN_ATTEMPTS_DEFAULT,
@@ -95,23 +97,10 @@ class ScaleIOConnector(base.BaseLinuxConnector):
                  {'full_path': full_disk_name})
         return full_disk_name
 
-    # NOTE: Usually 3 retries is enough to find the volume.
-    # If there are network issues, it could take much longer. Set
-    # the max retries to 15 to make sure we can find the volume.
-    @utils.retry(exceptions=exception.BrickException,
-                 retries=15,
-                 backoff_rate=1)
-    def _wait_for_volume_path(self, path):
+    def _find_volume_filename(self, path):
         if not os.path.isdir(path):
-            msg = (
-                _("ScaleIO volume %(volume_id)s not found at "
-                  "expected path.") % {'volume_id': self.volume_id}
-                )
-
-            LOG.debug(msg)
-            raise exception.BrickException(message=msg)
+            return None
 
-        disk_filename = None
         filenames = os.listdir(path)
         LOG.info(_LI(
             "Files found in %(path)s path: %(files)s "),
@@ -121,12 +110,26 @@ class ScaleIOConnector(base.BaseLinuxConnector):
         for filename in filenames:
             if (filename.startswith("emc-vol") and
                     filename.endswith(self.volume_id)):
-                disk_filename = filename
-                break
+                return filename
+        return None
+
+    def _wait_for_volume_path(self, path):
+        # NOTE: Usually the volume shows up within a few seconds.
+        # If there are network issues, it could take much longer. Wait for
+        # up to 15 seconds to make sure we can find the volume.
+        disk_filename = device_waiter.wait_for(
+            lambda: self._find_volume_filename(path), [path],
+            self.VOLUME_PATH_TIMEOUT)
 
         if not disk_filename:
-            msg = (_("ScaleIO volume %(volume_id)s not found.") %
-                   {'volume_id': self.volume_id})
+            if not os.path.isdir(path):
+                msg = (
+                    _("ScaleIO volume %(volume_id)s not found at "
+                      "expected path.") % {'volume_id': self.volume_id}
+                    )
+            else:
+                msg = (_("ScaleIO volume %(volume_id)s not found.") %
+                       {'volume_id': self.volume_id})
             LOG.debug(msg)
             raise exception.BrickException(message=msg)
 
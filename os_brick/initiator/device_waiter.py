@@ -0,0 +1,286 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Wait for device paths to show up or go away.
+
+Instead of sleeping for a fixed amount of time between checks, we watch the
+directories where udev creates the device links (/dev/disk/by-path,
+/dev/disk/by-id, /dev/mapper...) with inotify and check again as soon as
+something changes in them.  This way the time we wait tracks the time the
+kernel and udev actually take to discover a device.
+
+Changes that don't add or remove any file, like a device becoming
+read-write, are waited for by listening to the kernel's uevents instead.
+
+On systems where inotify or uevents aren't available we fall back to
+polling.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import threading
+import time
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+LOG = logging.getLogger(__name__)
+
+# Even when watching with inotify, check at least this often (in seconds) so
+# we don't depend on getting every single event.
+MAX_WAIT_INTERVAL = 1
+# Interval between checks when inotify is not available.
+POLL_INTERVAL = 0.25
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast groups the kernel and udev (once it has processed the kernel's
+# event, ie: created the /dev links) send their uevents to
+UEVENT_KERNEL_GROUP = 1
+UEVENT_UDEV_GROUP = 2
+
+_libc = None
+_libc_lock = threading.Lock()
+
+
+def _get_libc():
+    """Return libc if it provides inotify, False otherwise."""
+    global _libc
+    with _libc_lock:
+        if _libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or
+                                   'libc.so.6', use_errno=True)
+                # Make sure the inotify functions are there
+                libc.inotify_init1
+                libc.inotify_add_watch
+                _libc = libc
+            except (OSError, AttributeError):
+                LOG.debug("inotify is not available, device waits will "
+                          "poll instead.")
+                _libc = False
+        return _libc
+
+
+class _DirectoryWatcher(object):
+    """Wake up when entries are added to or removed from directories."""
+
+    def __init__(self, libc, directories):
+        self._libc = libc
+        self._directories = directories
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def arm(self):
+        """Watch the directories, or their closest existing ancestor.
+
+        This is called again after every wake up, so directories that didn't
+        exist the first time (ie: /dev/disk/by-path before the first device
+        of that type shows up) are watched once they have been created.
+        Watching a directory twice is a noop.
+        """
+        for directory in self._directories:
+            while directory and not os.path.isdir(directory):
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    break
+                directory = parent
+            if directory:
+                self._libc.inotify_add_watch(
+                    self._fd, directory.encode('utf-8'), WATCH_MASK)
+
+    def wait(self, timeout):
+        readable, _w, _x = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+        # We don't care what changed, only that something did.
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except OSError as exc:
+            if exc.errno != errno.EAGAIN:
+                raise
+        return True
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _UeventWatcher(object):
+    """Wake up when the kernel sends a uevent for any device."""
+
+    def __init__(self, groups):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                   NETLINK_KOBJECT_UEVENT)
+        try:
+            self._sock.bind((0, groups))
+            self._sock.setblocking(False)
+        except Exception:
+            self._sock.close()
+            raise
+
+    def arm(self):
+        pass
+
+    @staticmethod
+    def _parse(message):
+        # Kernel messages are ACTION@DEVPATH followed by KEY=VALUE fields,
+        # udev messages a binary header followed by the same fields.
+        event = {}
+        for field in message.split(b'\0'):
+            key, sep, value = field.partition(b'=')
+            if sep:
+                event[key.decode('utf-8', 'replace')] = value.decode(
+                    'utf-8', 'replace')
+        return event
+
+    def get_events(self, timeout):
+        """Get the uevents received since the last call.
+
+        :returns: list of dictionaries with the properties of every uevent,
+                  ie: ACTION, SUBSYSTEM and DEVNAME, or None if some of them
+                  were lost.
+        """
+        readable, _w, _x = select.select([self._sock], [], [], timeout)
+        if not readable:
+            return []
+        events = []
+        try:
+            while True:
+                message = self._sock.recv(65536)
+                if not message:
+                    break
+                events.append(self._parse(message))
+        except socket.error as exc:
+            if exc.errno == errno.ENOBUFS:
+                return None
+            if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        return events
+
+    def wait(self, timeout):
+        events = self.get_events(timeout)
+        # Lost events still mean that something changed
+        return events is None or bool(events)
+
+    def close(self):
+        self._sock.close()
+
+
+def get_uevent_watcher(groups=UEVENT_KERNEL_GROUP):
+    """Listen to uevents.
+
+    :param groups: bitmask of the multicast groups to listen to.
+    :returns: an object whose wait(timeout) method returns True if any
+              uevent was received since the last call, and whose
+              get_events(timeout) method returns those uevents, or None if
+              uevents are not available.
+    """
+    if not hasattr(socket, 'AF_NETLINK'):
+        return None
+    try:
+        return _UeventWatcher(groups)
+    except (socket.error, OSError) as exc:
+        LOG.debug("Could not listen to uevents, polling instead: %s", exc)
+        return None
+
+
+def _get_watcher(directories):
+    libc = _get_libc()
+    if not libc:
+        return None
+    try:
+        return _DirectoryWatcher(libc, directories)
+    except OSError as exc:
+        LOG.debug("Could not create an inotify watcher, polling instead: "
+                  "%s", exc)
+        return None
+
+
+def wait_for(check, directories, timeout):
+    """Wait until a condition is met or the timeout expires.
+
+    The check is run right away, and then again every time an entry is
+    added to or removed from any of the directories.
+
+    :param check: callable returning a true value once the wait is over.
+    :param directories: directories where the change is expected to happen.
+    :param timeout: maximum time to wait, in seconds.
+    :returns: the last value returned by check.
+    """
+    return _wait(check, _get_watcher(list(directories)), timeout)
+
+
+def wait_for_uevent(check, timeout):
+    """Wait until a condition is met or the timeout expires.
+
+    Like wait_for, but the check is run again every time the kernel sends a
+    uevent (ie: a device changes from read-only to read-write).
+
+    :param check: callable returning a true value once the wait is over.
+    :param timeout: maximum time to wait, in seconds.
+    :returns: the last value returned by check.
+    """
+    return _wait(check, get_uevent_watcher(), timeout)
+
+
+def _wait(check, watcher, timeout):
+    watch = timeutils.StopWatch(duration=timeout)
+    watch.start()
+    try:
+        while True:
+            if watcher:
+                watcher.arm()
+            result = check()
+            if result or watch.expired():
+                return result
+            if watcher:
+                watcher.wait(min(watch.leftover(), MAX_WAIT_INTERVAL))
+            else:
+                time.sleep(min(watch.leftover(), POLL_INTERVAL))
+    finally:
+        if watcher:
+            watcher.close()
+
+
+def wait_for_any(paths, timeout, exist=True):
+    """Wait until any of the paths shows up.
+
+    :param paths: device paths to look for.
+    :param timeout: maximum time to wait, in seconds.
+    :param exist: if False, wait for any of the paths to be gone instead.
+    :returns: the first path found to meet the condition, or None if the
+              timeout expired before that.
+    """
+    paths = list(paths)
+
+    def _check():
+        for path in paths:
+            if os.path.exists(path) == exist:
+                return path
+        return None
+
+    directories = set(os.path.dirname(path) for path in paths)
+    return wait_for(_check, directories, timeout)
@@ -15,10 +15,40 @@
 
 import errno
 import os
+import re
+import threading
+import time
+
+BY_PATH_DIR = '/dev/disk/by-path/'
+# ip-<portal>-iscsi-<iqn>-lun-<lun>, prefixed by the PCI address of the HBA
+# for iSCSI HBAs, ie: pci-0000:00:00.0-ip-...
+ISCSI_BY_PATH_REGEX = re.compile(r'^(?:(?P<pci>pci-[^-]+)-)?ip-(?P<portal>.+?)'
+                                 r'-iscsi-(?P<iqn>.+)-lun-(?P<lun>[^-]+)$')
+# The mtime of the directory is not trusted if it is this recent (in
+# seconds), further changes within the granularity of the timestamp
+# wouldn't change it.
+MTIME_RACE_WINDOW = 1
+
+
+def _get_target_key(portal, iqn):
+    # Udev doesn't use brackets for IPv6 addresses, and portals from
+    # discovery or the connection properties may come with the target
+    # portal group tag, ie: ip:port,1
+    portal = portal.split(',')[0].replace('[', '').replace(']', '')
+    return (portal, iqn)
 
 
 class HostDriver(object):
 
+    def __init__(self):
+        self._index_lock = threading.Lock()
+        # Names in the directory when the index was last updated, and the
+        # directory's mtime then if it can be trusted.
+        self._entries = set()
+        self._mtime = None
+        # (portal, iqn) -> {(transport, lun): path}
+        self._targets = {}
+
     def get_all_block_devices(self):
         """Get the list of all block devices seen in /dev/disk/by-path/."""
         dir = "/dev/disk/by-path/"
@@ -34,3 +64,62 @@ class HostDriver(object):
         for file in files:
             devices.append(dir + file)
         return devices
+
+    def _index_entry(self, name, add):
+        match = ISCSI_BY_PATH_REGEX.match(name)
+        if not match:
+            return
+        key = _get_target_key(match.group('portal'), match.group('iqn'))
+        path_key = (match.group('pci') or 'default', match.group('lun'))
+        if add:
+            self._targets.setdefault(key, {})[path_key] = BY_PATH_DIR + name
+        else:
+            paths = self._targets.get(key, {})
+            paths.pop(path_key, None)
+            if not paths:
+                self._targets.pop(key, None)
+
+    def _update_index(self):
+        """Bring the index of iSCSI devices up to date.
+
+        Nothing is read if the directory hasn't changed since the last time,
+        otherwise only the entries that were added or removed since then are
+        indexed or dropped.
+        """
+        try:
+            stat = os.stat(BY_PATH_DIR)
+            mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+            if mtime == self._mtime:
+                return
+            names = set(os.listdir(BY_PATH_DIR))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            stat = None
+            names = set()
+
+        for name in self._entries - names:
+            self._index_entry(name, add=False)
+        for name in names - self._entries:
+            self._index_entry(name, add=True)
+        self._entries = names
+
+        if stat and time.time() - stat.st_mtime > MTIME_RACE_WINDOW:
+            self._mtime = mtime
+        else:
+            self._mtime = None
+
+    def get_iscsi_target_devices(self, portal, iqn):
+        """Get the /dev/disk/by-path/ entries of the LUNs of an iSCSI target.
+
+        :param portal: portal of the target, ie: 10.0.2.15:3260 or
+                       10.0.2.15:3260,1
+        :param iqn: IQN of the target.
+        :returns: list of paths of the entries that still exist.
+        """
+        key = _get_target_key(portal, iqn)
+        with self._index_lock:
+            self._update_index()
+            paths = list(self._targets.get(key, {}).values())
+        # Links to devices that are gone are not in use
+        return sorted(path for path in paths if os.path.exists(path))
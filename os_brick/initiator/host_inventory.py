@@ -0,0 +1,257 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Process wide inventory of the storage devices of the host.
+
+Instead of every connector listing /dev/disk/by-path, running systool or
+multipath -ll on every call, the inventory reads the iSCSI sessions, Fibre
+Channel remote ports, block devices, multipath maps and /dev/disk links
+once and indexes them, so questions like "which devices does this target
+have" or "is this target still in use" are answered from memory.
+
+Each index is built on the first query that needs it.  The inventory
+listens to the uevents of the kernel and udev, and every uevent drops the
+indexes of its subsystem, which are built again on their next query, so the
+inventory never answers from a view older than the last device change while
+unrelated changes keep the rest of it.  If uevents can't be received the
+indexes are built again on every query.
+"""
+
+import os
+import threading
+
+from oslo_log import log as logging
+
+from os_brick.initiator import device_waiter
+from os_brick.initiator import multipath_topology
+from os_brick.initiator import sysfs
+
+LOG = logging.getLogger(__name__)
+
+DISK_BY_PATH = '/dev/disk/by-path'
+DISK_BY_ID = '/dev/disk/by-id'
+
+
+def _read_links(directory):
+    """Map the links in a directory to the devices they point to."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return {}
+    links = {}
+    for name in names:
+        path = os.path.join(directory, name)
+        links[path] = os.path.realpath(path)
+    return links
+
+
+def _strip_portal(portal):
+    # Portals may come with the target portal group tag, ie: ip:port,1
+    return portal.split(',')[0]
+
+
+def _build_iscsi():
+    sessions = sysfs.get_iscsi_sessions()
+    # (portal, iqn) -> {lun: /dev/sdX}
+    target_devices = {}
+    for session in sessions or []:
+        devices = target_devices.setdefault(
+            (session['portal'], session['iqn']), {})
+        for lun, name in session['luns'].items():
+            devices[lun] = '/dev/' + name
+    return sessions, target_devices
+
+
+def _build_multipath():
+    mpaths = multipath_topology.get_multipath_devices()
+    # wwid -> multipath device, and path -> multipath device
+    by_wwn = {}
+    mpath_map = {}
+    if mpaths is not None:
+        for mpath in mpaths:
+            by_wwn[mpath['id']] = mpath
+        mpath_map = multipath_topology.get_multipath_device_map(mpaths)
+    return mpaths, by_wwn, mpath_map
+
+
+def _build_block():
+    if os.path.isdir(sysfs.get_path('block')):
+        return sorted(sysfs.listdir(sysfs.get_path('block')))
+    return None
+
+
+ISCSI = 'iscsi'
+MULTIPATH = 'multipath'
+FC = 'fc'
+BLOCK = 'block'
+BY_PATH = 'by-path'
+BY_ID = 'by-id'
+
+_BUILDERS = {
+    ISCSI: _build_iscsi,
+    MULTIPATH: _build_multipath,
+    FC: lambda: sysfs.get_fc_remote_ports(),
+    BLOCK: _build_block,
+    BY_PATH: lambda: _read_links(DISK_BY_PATH),
+    BY_ID: lambda: _read_links(DISK_BY_ID),
+}
+
+# Indexes that depend on the devices of each subsystem, the uevents of other
+# subsystems (ie: net, usb) don't change any of them.
+_SUBSYSTEM_INDEXES = {
+    'iscsi_session': (ISCSI,),
+    'iscsi_connection': (ISCSI,),
+    'iscsi_host': (ISCSI,),
+    'scsi': (ISCSI, FC),
+    'scsi_device': (ISCSI,),
+    'scsi_disk': (ISCSI,),
+    'scsi_host': (ISCSI, FC),
+    'fc_host': (FC,),
+    'fc_remote_ports': (FC,),
+    'fc_transport': (FC,),
+}
+
+
+def _get_affected_indexes(event):
+    subsystem = event.get('SUBSYSTEM')
+    if subsystem == 'block':
+        # udev manages the /dev/disk links of block devices, and dm devices
+        # don't belong to any iSCSI session.
+        if event.get('DEVNAME', '').startswith(('dm-', '/dev/dm-')):
+            return (MULTIPATH, BLOCK, BY_PATH, BY_ID)
+        return (ISCSI, MULTIPATH, BLOCK, BY_PATH, BY_ID)
+    return _SUBSYSTEM_INDEXES.get(subsystem, ())
+
+
+class HostInventory(object):
+    """Inventory of the SCSI hosts and devices of the host.
+
+    Query methods return None when the information they need is not
+    available in sysfs, in which case callers are expected to fall back to
+    the command line tools.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._watcher = device_waiter.get_uevent_watcher(
+            device_waiter.UEVENT_KERNEL_GROUP |
+            device_waiter.UEVENT_UDEV_GROUP)
+        if self._watcher is None:
+            LOG.debug("Can't listen to uevents, the host inventory will be "
+                      "rebuilt on every query.")
+
+    def _process_events(self):
+        if self._watcher is None:
+            self._indexes.clear()
+            return
+        events = self._watcher.get_events(0)
+        if events is None:
+            # Some events were lost, anything may have changed.
+            self._indexes.clear()
+            return
+        for event in events:
+            for name in _get_affected_indexes(event):
+                self._indexes.pop(name, None)
+
+    def _get_index(self, name):
+        with self._lock:
+            # Pending events are processed before reading the devices, so an
+            # event that arrives while we read them drops the index again
+            # next time.
+            self._process_events()
+            if name not in self._indexes:
+                self._indexes[name] = _BUILDERS[name]()
+            return self._indexes[name]
+
+    def refresh(self):
+        """Rebuild the inventory on the next query."""
+        with self._lock:
+            self._indexes.clear()
+
+    def get_iscsi_sessions(self):
+        """Get the iSCSI sessions, as sysfs.get_iscsi_sessions does."""
+        sessions, _devices = self._get_index(ISCSI)
+        return None if sessions is None else list(sessions)
+
+    def get_target_devices(self, portal, iqn):
+        """Get the devices of an iSCSI target.
+
+        :returns: dictionary mapping LUNs to /dev/sdX devices.
+        """
+        sessions, target_devices = self._get_index(ISCSI)
+        if sessions is None:
+            return None
+        return dict(target_devices.get((_strip_portal(portal), iqn), {}))
+
+    def is_target_in_use(self, portal, iqn):
+        """Check if any LUN of an iSCSI target still has a device."""
+        devices = self.get_target_devices(portal, iqn)
+        if devices is None:
+            return None
+        return bool(devices)
+
+    def get_multipath_device(self, wwn):
+        """Get the multipath device of a WWN.
+
+        :returns: the device, as multipath_topology returns it, or an empty
+                  dictionary if there is no multipath device for the WWN.
+        """
+        mpaths, by_wwn, _map = self._get_index(MULTIPATH)
+        if mpaths is None:
+            return None
+        return by_wwn.get(wwn, {})
+
+    def get_multipath_paths(self, wwn):
+        """Get the /dev/sdX paths of the multipath device of a WWN."""
+        mpath = self.get_multipath_device(wwn)
+        if mpath is None:
+            return None
+        return [path['device'] for path in mpath['devices']] if mpath else []
+
+    def get_multipath_device_map(self):
+        """Map /dev/sdX paths to their /dev/mapper multipath device."""
+        mpaths, _by_wwn, mpath_map = self._get_index(MULTIPATH)
+        if mpaths is None:
+            return None
+        return dict(mpath_map)
+
+    def get_fc_remote_ports(self):
+        """Get the Fibre Channel remote ports seen by the host."""
+        rports = self._get_index(FC)
+        return None if rports is None else list(rports)
+
+    def get_block_devices(self):
+        """Get the names of the block devices of the host, ie: sdb."""
+        devices = self._get_index(BLOCK)
+        return None if devices is None else list(devices)
+
+    def get_by_path_links(self):
+        """Map the /dev/disk/by-path links to the devices they point to."""
+        return dict(self._get_index(BY_PATH))
+
+    def get_by_id_links(self):
+        """Map the /dev/disk/by-id links to the devices they point to."""
+        return dict(self._get_index(BY_ID))
+
+
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def get_inventory():
+    """Get the inventory shared by all the connectors of the process."""
+    global _inventory
+    with _inventory_lock:
+        if _inventory is None:
+            _inventory = HostInventory()
+        return _inventory
@@ -15,12 +15,16 @@
 
 import abc
 
+from oslo_log import log as logging
 import six
 
 from os_brick import exception
 from os_brick import executor
+from os_brick.i18n import _LW
 from os_brick import initiator
 
+LOG = logging.getLogger(__name__)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class InitiatorConnector(executor.Executor):
@@ -126,6 +130,58 @@ class InitiatorConnector(executor.Executor):
         """
         pass
 
+    def connect_volumes(self, connection_properties_list):
+        """Connect to several volumes.
+
+        Connectors that can share work between volumes (discovery, logins,
+        rescans...) override this, by default volumes are connected one
+        after the other.
+
+        :param connection_properties_list: list of connection_properties
+                                           dictionaries like the ones
+                                           connect_volume takes.
+        :type connection_properties_list: list
+        :returns: list with the device_info of each volume, in the same order.
+                  If a volume couldn't be connected its device_info is a
+                  dictionary with the exception under the 'error' key.
+        """
+        results = []
+        for connection_properties in connection_properties_list:
+            try:
+                results.append(self.connect_volume(connection_properties))
+            except Exception as exc:
+                LOG.warning(_LW("Failed to connect volume %(props)s: "
+                                "%(exc)s"),
+                            {'props': connection_properties, 'exc': exc})
+                results.append({'error': exc})
+        return results
+
+    def disconnect_volumes(self, connection_properties_list,
+                           device_info_list):
+        """Disconnect several volumes from the local host.
+
+        :param connection_properties_list: list of connection_properties
+                                           dictionaries like the ones
+                                           disconnect_volume takes.
+        :type connection_properties_list: list
+        :param device_info_list: list with the device_info of each volume.
+        :type device_info_list: list
+        :returns: list with the exception raised disconnecting each volume,
+                  or None if it was disconnected.
+        """
+        results = []
+        for connection_properties, device_info in zip(
+                connection_properties_list, device_info_list):
+            try:
+                self.disconnect_volume(connection_properties, device_info)
+                results.append(None)
+            except Exception as exc:
+                LOG.warning(_LW("Failed to disconnect volume %(props)s: "
+                                "%(exc)s"),
+                            {'props': connection_properties, 'exc': exc})
+                results.append(exc)
+        return results
+
     @abc.abstractmethod
     def get_volume_paths(self, connection_properties):
         """Return the list of existing paths for a volume.
@@ -52,6 +52,7 @@ class LinuxFibreChannel(linuxscsi.LinuxSCSI):
             return None
 
     def rescan_hosts(self, hbas, target_lun):
+        scans = []
         for hba in hbas:
             # Try to get HBA channel and SCSI target to use as filters
             cts = self._get_hba_channel_scsi_target(hba)
@@ -64,11 +65,12 @@ class LinuxFibreChannel(linuxscsi.LinuxSCSI):
                           {'host': hba['host_device'],
                            'wwnn': hba['node_name'], 'channel': hba_channel,
                            'target': target_id, 'lun': target_lun})
-                self.echo_scsi_command(
+                scans.append((
                     "/sys/class/scsi_host/%s/scan" % hba['host_device'],
                     "%(c)s %(t)s %(l)s" % {'c': hba_channel,
                                            't': target_id,
-                                           'l': target_lun})
+                                           'l': target_lun}))
+        self.echo_scsi_commands(scans)
 
     def get_fc_hbas(self):
         """Get the Fibre Channel HBA information."""
@@ -76,7 +78,8 @@ class LinuxFibreChannel(linuxscsi.LinuxSCSI):
         try:
             out, _err = self._execute('systool', '-c', 'fc_host', '-v',
                                       run_as_root=True,
-                                      root_helper=self._root_helper)
+                                      root_helper=self._root_helper,
+                                      read_only=True)
         except putils.ProcessExecutionError as exc:
             # This handles the case where rootwrap is used
             # and systool is not installed
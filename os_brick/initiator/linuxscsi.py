@@ -19,16 +19,23 @@
 import os
 import re
 import six
+import threading
 
 from oslo_concurrency import processutils as putils
 from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from os_brick import exception
 from os_brick import executor
 from os_brick.i18n import _LE
 from os_brick.i18n import _LI
 from os_brick.i18n import _LW
+from os_brick.initiator import device_waiter
+from os_brick.initiator import multipath_topology
+from os_brick.initiator import sysfs
+from os_brick.privileged import multipathd as priv_multipathd
 from os_brick.privileged import rootwrap as priv_rootwrap
+from os_brick.privileged import sysfs as priv_sysfs
 from os_brick import utils
 
 LOG = logging.getLogger(__name__)
@@ -39,16 +46,50 @@ MULTIPATH_DEVICE_ACTIONS = ['unchanged:', 'reject:', 'reload:',
                             'switchpg:', 'rename:', 'create:',
                             'resize:']
 
+# How long (in seconds) to wait for a multipath device to be read-write, and
+# how many times to reload its map in that time.
+RW_TIMEOUT = 30
+MAX_RW_RELOADS = 5
+# Seconds a reloaded multipath map is given to become read-write before it
+# is reloaded again, doubled after every reload.
+RW_RELOAD_INTERVAL = 1
+# How long (in seconds) to wait for device paths to show up or go away
+PATH_WAIT_TIMEOUT = 7
+# Maximum number of paths of a multipath device removed at the same time
+MAX_REMOVE_WORKERS = 8
+
 
 class LinuxSCSI(executor.Executor):
     def echo_scsi_command(self, path, content):
         """Used to echo strings to scsi subsystem."""
+        self.echo_scsi_commands([(path, content)])
 
-        args = ["-a", path]
-        kwargs = dict(process_input=content,
-                      run_as_root=True,
-                      root_helper=self._root_helper)
-        self._execute('tee', *args, **kwargs)
+    def echo_scsi_commands(self, writes):
+        """Echo a batch of strings to the scsi subsystem.
+
+        When we run commands with our own privsep daemon all the writes are
+        done by the daemon in one call, otherwise tee is run for each one.
+
+        :param writes: list of (path, content) pairs.
+        :raises: putils.ProcessExecutionError for the first failed write.
+        """
+        if self._is_default_execute():
+            try:
+                results = priv_sysfs.write(writes)
+            finally:
+                # Adding or removing devices changes what every subsystem
+                # reports, like running tee does.
+                executor.invalidate_command_cache()
+            for (path, content), error in zip(writes, results):
+                if error:
+                    raise putils.ProcessExecutionError(
+                        exit_code=error[0], stderr=error[1],
+                        cmd='tee -a %s' % path)
+            return
+
+        for path, content in writes:
+            self._execute('tee', '-a', path, process_input=content,
+                          run_as_root=True, root_helper=self._root_helper)
 
     def get_name_from_path(self, path):
         """Translates /dev/disk/by-path/ entry to /dev/sdX."""
@@ -59,25 +100,33 @@ class LinuxSCSI(executor.Executor):
         else:
             return None
 
-    def remove_scsi_device(self, device):
-        """Removes a scsi device based upon /dev/sdX name."""
+    def remove_scsi_device(self, device, multipath_path=False):
+        """Removes a scsi device based upon /dev/sdX name.
+
+        :param multipath_path: whether the device is a path of a multipath
+                               device, in which case it is removed from
+                               multipathd first.
+        """
 
         path = "/sys/block/%s/device/delete" % device.replace("/dev/", "")
         if os.path.exists(path):
             # flush any outstanding IO first
             self.flush_device_io(device)
 
+            if multipath_path:
+                # Let multipathd stop using the path before it goes away
+                self.multipath_del_path(device)
+
             LOG.debug("Remove SCSI device %(device)s with %(path)s",
                       {'device': device, 'path': path})
             self.echo_scsi_command(path, "1")
 
-    @utils.retry(exceptions=exception.VolumePathNotRemoved, retries=3,
-                 backoff_rate=2)
     def wait_for_volume_removal(self, volume_path):
         """This is used to ensure that volumes are gone."""
         LOG.debug("Checking to see if SCSI volume %s has been removed.",
                   volume_path)
-        if os.path.exists(volume_path):
+        if not device_waiter.wait_for_any([volume_path], PATH_WAIT_TIMEOUT,
+                                          exist=False):
             LOG.debug("%(path)s still exists.", {'path': volume_path})
             raise exception.VolumePathNotRemoved(
                 volume_path=volume_path)
@@ -85,6 +134,18 @@ class LinuxSCSI(executor.Executor):
             LOG.debug("SCSI volume %s has been removed.", volume_path)
 
     def get_device_info(self, device):
+        """Get the SCSI address of a device.
+
+        The address is read from sysfs, sg_scan is only run when it is not
+        available there.
+        """
+        name = os.path.basename(os.path.realpath(device))
+        hctl = sysfs.get_block_device_hctl(name)
+        if hctl:
+            host, channel, target_id, lun = hctl
+            return {'device': device, 'host': host, 'channel': channel,
+                    'id': target_id, 'lun': lun}
+
         (out, _err) = self._execute('sg_scan', device, run_as_root=True,
                                     root_helper=self._root_helper)
         dev_info = {'device': device, 'host': None,
@@ -104,7 +165,15 @@ class LinuxSCSI(executor.Executor):
         return dev_info
 
     def get_scsi_wwn(self, path):
-        """Read the WWN from page 0x83 value for a SCSI device."""
+        """Read the WWN from page 0x83 value for a SCSI device.
+
+        The page is read from sysfs, scsi_id is only run when it is not
+        available there.
+        """
+        name = os.path.basename(os.path.realpath(path))
+        wwn = sysfs.get_scsi_wwn(name)
+        if wwn:
+            return wwn
 
         (out, _err) = self._execute('/lib/udev/scsi_id', '--page', '0x83',
                                     '--whitelisted', path,
@@ -114,9 +183,16 @@ class LinuxSCSI(executor.Executor):
 
     @staticmethod
     def is_multipath_running(enforce_multipath, root_helper, execute=None):
+        if execute is None:
+            execute = priv_rootwrap.execute
+        if executor.is_default_execute(execute):
+            try:
+                priv_multipathd.execute('show', 'status')
+                return True
+            except Exception as exc:
+                LOG.debug("Could not reach multipathd through its socket, "
+                          "using the command line tool: %s", exc)
         try:
-            if execute is None:
-                execute = priv_rootwrap.execute
             execute('multipathd', 'show', 'status',
                     run_as_root=True, root_helper=root_helper)
         except putils.ProcessExecutionError as err:
@@ -139,8 +215,70 @@ class LinuxSCSI(executor.Executor):
             self.flush_multipath_device(mpath_dev['id'])
             devices = mpath_dev['devices']
             LOG.debug("multipath LUNs to remove %s", devices)
+            self.remove_scsi_devices(
+                [device['device'] for device in devices], multipath_path=True)
+
+    def remove_scsi_devices(self, devices, multipath_path=False):
+        """Removes several scsi devices at the same time.
+
+        Each device is flushed and deleted by one of up to
+        MAX_REMOVE_WORKERS threads, so a device that is slow to drain its
+        I/O doesn't hold back the removal of the others.
+
+        :param devices: list of /dev/sdX names.
+        :param multipath_path: whether the devices are paths of multipath
+                               devices, see remove_scsi_device.
+        :raises: SCSIDevicesNotRemoved once all the devices have been tried
+                 if any of them couldn't be removed, its errors kwarg maps
+                 those devices to the exception that prevented their
+                 removal.
+        """
+        results = {}
+        if len(devices) < 2:
             for device in devices:
-                self.remove_scsi_device(device['device'])
+                results[device] = self._remove_scsi_device_safe(
+                    device, multipath_path)
+            return self._check_removals(results)
+
+        pending = six.moves.queue.Queue()
+        for device in devices:
+            pending.put(device)
+
+        def _remove_worker():
+            while True:
+                try:
+                    device = pending.get_nowait()
+                except six.moves.queue.Empty:
+                    return
+                results[device] = self._remove_scsi_device_safe(
+                    device, multipath_path)
+
+        workers = []
+        for i in range(min(MAX_REMOVE_WORKERS, len(devices))):
+            worker = threading.Thread(target=_remove_worker)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+        return self._check_removals(results)
+
+    @staticmethod
+    def _check_removals(results):
+        errors = dict((device, error) for device, error in results.items()
+                      if error is not None)
+        if errors:
+            raise exception.SCSIDevicesNotRemoved(
+                devices=', '.join(sorted(errors)), errors=errors)
+
+    def _remove_scsi_device_safe(self, device, multipath_path):
+        try:
+            self.remove_scsi_device(device, multipath_path=multipath_path)
+        except Exception as exc:
+            LOG.warning(_LW("Failed to remove SCSI device %(device)s: "
+                            "%(exc)s"), {'device': device, 'exc': exc})
+            return exc
+        return None
 
     def flush_device_io(self, device):
         """This is used to flush any remaining IO in the buffers."""
@@ -169,21 +307,79 @@ class LinuxSCSI(executor.Executor):
             LOG.warning(_LW("multipath call failed exit %(code)s"),
                         {'code': exc.exit_code})
 
-    @utils.retry(exceptions=exception.VolumeDeviceNotFound)
     def wait_for_path(self, volume_path):
         """Wait for a path to show up."""
-        LOG.debug("Checking to see if %s exists yet.",
-                  volume_path)
-        if not os.path.exists(volume_path):
-            LOG.debug("%(path)s doesn't exists yet.", {'path': volume_path})
+        self.wait_for_any_path([volume_path])
+
+    def wait_for_any_path(self, paths):
+        """Wait for any of several paths to show up.
+
+        All the paths are watched at the same time, so we don't wait for
+        each one in turn.
+
+        :param paths: paths in order of preference.
+        :returns: the first of the paths that exists.
+        :raises: VolumeDeviceNotFound if none of them showed up.
+        """
+        LOG.debug("Checking to see if any of %s exists yet.", paths)
+        path = device_waiter.wait_for_any(paths, PATH_WAIT_TIMEOUT)
+        if not path:
+            LOG.debug("%(paths)s don't exist yet.", {'paths': paths})
             raise exception.VolumeDeviceNotFound(
-                device=volume_path)
-        else:
-            LOG.debug("%s has shown up.", volume_path)
+                device=', '.join(paths))
+        LOG.debug("%s has shown up.", path)
+        return path
 
-    @utils.retry(exceptions=exception.BlockDeviceReadOnly, retries=5)
     def wait_for_rw(self, wwn, device_path):
-        """Wait for block device to be Read-Write."""
+        """Wait for block device to be Read-Write.
+
+        The multipath device of the volume and its paths are found in sysfs
+        and only that map is reloaded when it is read-only.  If the topology
+        is not available in sysfs we look for the device in lsblk's output.
+        """
+        mpaths = multipath_topology.get_multipath_devices()
+        if mpaths is None:
+            return self._wait_for_rw_lsblk(wwn, device_path)
+
+        mpath = next((m for m in mpaths if m['id'] == wwn), None)
+        if mpath is None:
+            LOG.debug("No multipath device for %s, not checking if it is "
+                      "read-only.", device_path)
+            return
+
+        paths = [os.path.basename(path['device'])
+                 for path in mpath['devices']]
+        reloads = []
+
+        def _is_rw():
+            if not sysfs.is_block_device_read_only(mpath['dm']):
+                return True
+            ro_paths = [path for path in paths
+                        if sysfs.is_block_device_read_only(path)]
+            if ro_paths:
+                # Reloading the map won't help until the paths are
+                # read-write.
+                LOG.debug("Block device %(device)s is read-only, waiting "
+                          "for paths %(paths)s.",
+                          {'device': device_path, 'paths': ro_paths})
+            elif len(reloads) < MAX_RW_RELOADS and (not reloads or
+                                                    reloads[-1].expired()):
+                # Each reload sends a change uevent of its own that wakes us
+                # up right away, the map is only reloaded again once it had
+                # some time to become read-write.
+                LOG.debug("Block device %s is read-only, reloading its "
+                          "multipath map.", device_path)
+                self.multipath_reload_map(mpath['name'])
+                reloads.append(timeutils.StopWatch(
+                    duration=RW_RELOAD_INTERVAL * 2 ** len(reloads)).start())
+            return False
+
+        if not device_waiter.wait_for_uevent(_is_rw, RW_TIMEOUT):
+            raise exception.BlockDeviceReadOnly(device=device_path)
+        LOG.debug("Block device %s is not read-only.", device_path)
+
+    @utils.retry(exceptions=exception.BlockDeviceReadOnly, retries=5)
+    def _wait_for_rw_lsblk(self, wwn, device_path):
         LOG.debug("Checking to see if %s is read-only.",
                   device_path)
         out, info = self._execute('lsblk', '-o', 'NAME,RO', '-l', '-n')
@@ -236,21 +432,13 @@ class LinuxSCSI(executor.Executor):
         """
         LOG.info(_LI("Find Multipath device file for volume WWN %(wwn)s"),
                  {'wwn': wwn})
-        # First look for the common path
+        # Prefer the common path, but if for some reason it doesn't show
+        # up use the dev mapper path.
         wwn_dict = {'wwn': wwn}
-        path = "/dev/disk/by-id/dm-uuid-mpath-%(wwn)s" % wwn_dict
+        paths = ["/dev/disk/by-id/dm-uuid-mpath-%(wwn)s" % wwn_dict,
+                 "/dev/mapper/%(wwn)s" % wwn_dict]
         try:
-            self.wait_for_path(path)
-            return path
-        except exception.VolumeDeviceNotFound:
-            pass
-
-        # for some reason the common path wasn't found
-        # lets try the dev mapper path
-        path = "/dev/mapper/%(wwn)s" % wwn_dict
-        try:
-            self.wait_for_path(path)
-            return path
+            return self.wait_for_any_path(paths)
         except exception.VolumeDeviceNotFound:
             pass
 
@@ -262,12 +450,28 @@ class LinuxSCSI(executor.Executor):
     def find_multipath_device(self, device):
         """Discover multipath devices for a mpath device.
 
-           This uses the slow multipath -l command to find a
+           The multipath devices are read from sysfs.  If that is not
+           possible this uses the slow multipath -l command to find a
            multipath device description, then screen scrapes
            the output to discover the multipath device name
            and it's devices.
 
         """
+        mpaths = multipath_topology.get_multipath_devices()
+        if mpaths is not None:
+            mpath = multipath_topology.find_multipath_device(device, mpaths)
+            if mpath is None:
+                return None
+            if not os.path.exists(mpath['device']):
+                LOG.warning(_LW("Couldn't find multipath device %s"),
+                            mpath['device'])
+                return None
+            LOG.debug("Found multipath device = %(mdev)s",
+                      {'mdev': mpath['device']})
+            return {'device': mpath['device'],
+                    'id': mpath['id'],
+                    'name': mpath['name'],
+                    'devices': mpath['devices']}
 
         mdev = None
         devices = []
@@ -338,6 +542,11 @@ class LinuxSCSI(executor.Executor):
 
     def get_device_size(self, device):
         """Get the size in bytes of a volume."""
+        name = os.path.basename(os.path.realpath(device))
+        size = sysfs.get_block_device_size(name)
+        if size is not None:
+            return size
+
         (out, _err) = self._execute('blockdev', '--getsize64',
                                     device, run_as_root=True,
                                     root_helper=self._root_helper)
@@ -347,18 +556,40 @@ class LinuxSCSI(executor.Executor):
         else:
             return None
 
+    def _run_multipathd(self, *args):
+        """Run a multipathd command and return its output.
+
+        When we run commands with our own privsep daemon the command is sent
+        to multipathd's control socket from there, the multipathd command
+        line tool is only used if that fails.
+        """
+        if self._is_default_execute():
+            try:
+                return priv_multipathd.execute(*args)
+            except Exception as exc:
+                LOG.debug("Could not run multipathd %(cmd)s through its "
+                          "socket, using the command line tool: %(exc)s",
+                          {'cmd': ' '.join(args), 'exc': exc})
+            finally:
+                if args[0] != 'show':
+                    executor.invalidate_command_cache(['multipath'])
+        (out, _err) = self._execute('multipathd', *args,
+                                    run_as_root=True,
+                                    root_helper=self._root_helper)
+        return out
+
     def multipath_reconfigure(self):
         """Issue a multipathd reconfigure.
 
         When attachments come and go, the multipathd seems
         to get lost and not see the maps.  This causes
-        resize map to fail 100%.  To overcome this we have
-        to issue a reconfigure prior to resize map.
+        resize map to fail.  To overcome this we have
+        to issue a reconfigure when resize map fails.
+
+        This makes multipathd reload all its maps, so it stalls path
+        checking on the whole host while it runs.
         """
-        (out, _err) = self._execute('multipathd', 'reconfigure',
-                                    run_as_root=True,
-                                    root_helper=self._root_helper)
-        return out
+        return self._run_multipathd('reconfigure')
 
     def multipath_resize_map(self, mpath_id):
         """Issue a multipath resize map on device.
@@ -366,10 +597,39 @@ class LinuxSCSI(executor.Executor):
         This forces the multipath daemon to update it's
         size information a particular multipath device.
         """
-        (out, _err) = self._execute('multipathd', 'resize', 'map', mpath_id,
-                                    run_as_root=True,
-                                    root_helper=self._root_helper)
-        return out
+        return self._run_multipathd('resize', 'map', mpath_id)
+
+    def multipath_reload_map(self, map_name):
+        """Reload a single multipath map.
+
+        Unlike `multipath -r` on its own, this doesn't reload every map on
+        the host.
+        """
+        self._execute('multipath', '-r', map_name,
+                      check_exit_code=[0, 1, 21], run_as_root=True,
+                      root_helper=self._root_helper)
+
+    def multipath_del_path(self, device):
+        """Remove a path from multipathd.
+
+        This is only done when multipathd's control socket can be used,
+        otherwise multipathd will notice the path is gone once the device is
+        removed anyway and it isn't worth running a command for it.
+
+        :returns: whether multipathd removed the path.
+        """
+        if not self._is_default_execute():
+            return False
+        name = device.replace('/dev/', '')
+        try:
+            out = priv_multipathd.execute('del', 'path', name)
+        except Exception as exc:
+            LOG.debug("Could not remove path %(path)s from multipathd: "
+                      "%(exc)s", {'path': name, 'exc': exc})
+            return False
+        finally:
+            executor.invalidate_command_cache(['multipath'])
+        return out.strip() == 'ok'
 
     def extend_volume(self, volume_path):
         """Signal the SCSI subsystem to test for volume resize.
@@ -402,13 +662,18 @@ class LinuxSCSI(executor.Executor):
         scsi_wwn = self.get_scsi_wwn(volume_path)
         mpath_device = self.find_multipath_device_path(scsi_wwn)
         if mpath_device:
-            # Force a reconfigure so that resize works
-            self.multipath_reconfigure()
-
             size = self.get_device_size(mpath_device)
             LOG.info(_LI("mpath(%(device)s) current size %(size)s"),
                      {'device': mpath_device, 'size': size})
             result = self.multipath_resize_map(scsi_wwn)
+            if 'fail' in result:
+                # Only force a reconfigure when needed, it affects all the
+                # multipath devices of the host.
+                LOG.debug("Resizing multipath device %s failed, "
+                          "reconfiguring multipathd and trying again.",
+                          scsi_wwn)
+                self.multipath_reconfigure()
+                result = self.multipath_resize_map(scsi_wwn)
             if 'fail' in result:
                 msg = (_LI("Multipathd failed to update the size mapping of "
                            "multipath device %(scsi_wwn)s volume %(volume)s") %
@@ -0,0 +1,108 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read the multipath devices of the host from sysfs.
+
+The kernel already knows which device-mapper devices are multipath maps,
+their WWID and the SCSI devices behind them, so there is no need to run and
+screen scrape `multipath -ll`:
+
+  /sys/block/dm-3/dm/uuid   mpath-<WWID>
+  /sys/block/dm-3/dm/name   name of the map in /dev/mapper
+  /sys/block/dm-3/slaves/   one entry per path, ie: sdb, sdc
+  /sys/block/sdb/device     link to the SCSI device, ie: .../3:0:0:1
+"""
+
+import os
+
+from oslo_log import log as logging
+
+from os_brick.initiator import sysfs
+
+LOG = logging.getLogger(__name__)
+
+MULTIPATH_UUID_PREFIX = 'mpath-'
+
+
+def _get_multipath_device(dm):
+    dm_path = sysfs.get_path('block', dm, 'dm')
+    uuid = sysfs.read_attr(os.path.join(dm_path, 'uuid'), '')
+    if not uuid.startswith(MULTIPATH_UUID_PREFIX):
+        return None
+    name = sysfs.read_attr(os.path.join(dm_path, 'name'))
+    if not name:
+        return None
+
+    devices = []
+    for slave in sorted(sysfs.listdir(sysfs.get_path('block', dm,
+                                                     'slaves'))):
+        hctl = sysfs.get_block_device_hctl(slave)
+        if not hctl:
+            continue
+        host, channel, target_id, lun = hctl
+        devices.append({'device': '/dev/%s' % slave, 'host': host,
+                        'channel': channel, 'id': target_id, 'lun': lun})
+
+    return {'device': '/dev/mapper/%s' % name,
+            'id': uuid[len(MULTIPATH_UUID_PREFIX):],
+            'name': name,
+            'dm': dm,
+            'devices': devices}
+
+
+def get_multipath_devices():
+    """Get all the multipath devices of the host.
+
+    :returns: list of dicts with the /dev/mapper device, WWID, map name,
+              dm-N name and the SCSI devices of each multipath device, like
+              LinuxSCSI.find_multipath_device returns them, or None if sysfs
+              can't be used.
+    """
+    if not os.path.isdir(sysfs.get_path('block')):
+        return None
+
+    mpaths = []
+    for entry in sorted(sysfs.listdir(sysfs.get_path('block'))):
+        if entry.startswith('dm-'):
+            mpath = _get_multipath_device(entry)
+            if mpath:
+                mpaths.append(mpath)
+    return mpaths
+
+
+def find_multipath_device(device, mpaths):
+    """Find the multipath device a device belongs to.
+
+    :param device: path of one of the SCSI devices of the multipath device,
+                   path of the multipath device itself, its map name or its
+                   WWID.
+    :param mpaths: multipath devices, as returned by get_multipath_devices.
+    :returns: the multipath device or None if there is none.
+    """
+    realpath = os.path.realpath(device) if device.startswith('/') else device
+    for mpath in mpaths:
+        if (device in (mpath['device'], mpath['name'], mpath['id']) or
+                realpath == '/dev/%s' % mpath['dm'] or
+                any(path['device'] == realpath
+                    for path in mpath['devices'])):
+            return mpath
+    return None
+
+
+def get_multipath_device_map(mpaths):
+    """Map each SCSI device path to the multipath device it belongs to.
+
+    :param mpaths: multipath devices, as returned by get_multipath_devices.
+    :returns: dict like {'/dev/sdb': '/dev/mapper/<name>'}
+    """
+    return dict((path['device'], mpath['device'])
+                for mpath in mpaths for path in mpath['devices'])
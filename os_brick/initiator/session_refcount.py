@@ -0,0 +1,162 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Count the attachments that use each iSCSI session.
+
+The iSCSI connector can record which sessions (portal, iqn) every attached
+volume uses in a small state file, so on detach it knows right away which
+sessions are no longer used by any volume and can be logged out, without
+looking at the devices of the host or running a discovery.
+
+The file is shared by all the processes of the host that use it, updates
+are serialized with a lock on a companion .lock file.  The counts are only
+accurate if every attachment on the host is done with the same state file.
+"""
+
+import contextlib
+import errno
+import json
+import os
+
+from oslo_log import log as logging
+from oslo_utils import fileutils
+
+from os_brick.i18n import _LW
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG = logging.getLogger(__name__)
+
+
+def get_attachment_id(targets):
+    """Build the key of an attachment from its (portal, iqn, lun) targets."""
+    return ';'.join('%s|%s|%s' % tuple(target) for target in sorted(targets))
+
+
+class SessionRefcount(object):
+    """iSCSI sessions used by each attachment, stored in a state file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (IOError, OSError) as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            state = {}
+        except ValueError:
+            LOG.warning(_LW("Ignoring corrupted iSCSI session state file "
+                            "%s."), self.path)
+            state = {}
+        state.setdefault('attachments', {})
+        return state
+
+    def _write(self, state):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+
+    @contextlib.contextmanager
+    def _locked_state(self, read_only=False):
+        """Get the state, and write it back unless read_only.
+
+        Read-only queries share the lock with each other, updates have it
+        to themselves.
+        """
+        fileutils.ensure_tree(os.path.dirname(os.path.abspath(self.path)))
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file,
+                            fcntl.LOCK_SH if read_only else fcntl.LOCK_EX)
+            try:
+                state = self._read()
+                yield state
+                if not read_only:
+                    self._write(state)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _count(state, session, ignore=()):
+        return sum(1 for attachment_id, sessions in
+                   state['attachments'].items()
+                   if attachment_id not in ignore and session in sessions)
+
+    def add(self, attachment_id, sessions):
+        """Record the sessions used by an attachment.
+
+        Recording the same attachment again replaces its sessions, so an
+        attachment is never counted twice.
+
+        :param sessions: list of (portal, iqn) pairs.
+        """
+        with self._locked_state() as state:
+            state['attachments'][attachment_id] = [
+                list(session) for session in sorted(set(
+                    (portal, iqn) for portal, iqn in sessions))]
+
+    def remove(self, attachment_id):
+        """Forget an attachment.
+
+        :returns: the (portal, iqn) sessions of the attachment no other
+                  attachment uses, or None if the attachment is unknown.
+        """
+        with self._locked_state() as state:
+            sessions = state['attachments'].pop(attachment_id, None)
+            if sessions is None:
+                return None
+            return [tuple(session) for session in sessions
+                    if not self._count(state, session)]
+
+    def get_sessions(self, attachment_id):
+        """Get the sessions recorded for an attachment.
+
+        :returns: list of (portal, iqn) sessions, or None if the attachment
+                  is unknown.
+        """
+        with self._locked_state(read_only=True) as state:
+            sessions = state['attachments'].get(attachment_id)
+            if sessions is None:
+                return None
+            return [tuple(session) for session in sessions]
+
+    def get_unused(self, attachment_id, ignore=()):
+        """Get the sessions only used by an attachment.
+
+        :param ignore: ids of other attachments that are not counted, ie:
+                       those being detached along with this one.
+        :returns: the (portal, iqn) sessions of the attachment no other
+                  attachment uses, or None if the attachment is unknown.
+        """
+        ignore = set(ignore)
+        ignore.add(attachment_id)
+        with self._locked_state(read_only=True) as state:
+            sessions = state['attachments'].get(attachment_id)
+            if sessions is None:
+                return None
+            return [tuple(session) for session in sessions
+                    if not self._count(state, session, ignore)]
+
+    def get_count(self, portal, iqn):
+        """Get the number of attachments that use a session."""
+        with self._locked_state(read_only=True) as state:
+            return self._count(state, [portal, iqn])
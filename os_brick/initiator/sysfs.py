@@ -0,0 +1,346 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Helpers to read the storage topology of the host from sysfs.
+
+Everything in here runs unprivileged and without forking, so it is a lot
+cheaper than the command line tools it stands in for.  Functions return None
+when the information is not available in sysfs, in which case callers are
+expected to fall back to the corresponding tool.
+"""
+
+import os
+import re
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Mount point of sysfs, tests point this to a fake tree.
+SYSFS_ROOT = '/sys'
+
+SESSION_REGEX = re.compile(r'^session(\d+)$')
+HCTL_REGEX = re.compile(r'^(\d+):(\d+):(\d+):(\d+)$')
+TARGET_REGEX = re.compile(r'^target(\d+):(\d+):(\d+)$')
+RPORT_REGEX = re.compile(r'^rport-(\d+):(\d+)-(\d+)$')
+
+
+def get_path(*parts):
+    """Build the path of a sysfs entry."""
+    return os.path.join(SYSFS_ROOT, *parts)
+
+
+def read_attr(path, default=None):
+    """Read a sysfs attribute, returning default if it can't be read."""
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return default
+
+
+def read_binary_attr(path):
+    """Read a binary sysfs attribute, returning None if it can't be read."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def listdir(path):
+    """List a sysfs directory, returning [] if it can't be read."""
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+def get_block_device_hctl(name):
+    """Get the SCSI address of a block device.
+
+    :param name: name of the block device, ie: sdb
+    :returns: (host, channel, target id, lun) tuple of strings, or None if
+              the device is not a SCSI device.
+    """
+    # /sys/block/sdb/device links to the SCSI device, ie:
+    # ../../../3:0:0:1
+    device = os.path.realpath(get_path('block', name, 'device'))
+    match = HCTL_REGEX.match(os.path.basename(device))
+    if not match:
+        return None
+    return match.groups()
+
+
+def get_block_device_size(name):
+    """Get the size in bytes of a block device.
+
+    :param name: name of the block device, ie: sdb or dm-3
+    :returns: the size, or None if it is not available in sysfs.
+    """
+    # The size is always in 512 byte sectors, whatever the block size of the
+    # device is.
+    sectors = read_attr(get_path('class', 'block', name, 'size'))
+    if sectors is None or not sectors.isdigit():
+        return None
+    return int(sectors) * 512
+
+
+def is_block_device_read_only(name):
+    """Check if a block device is read-only.
+
+    :param name: name of the block device, ie: sdb or dm-3
+    :returns: True or False, or None if it is not available in sysfs.
+    """
+    ro = read_attr(get_path('class', 'block', name, 'ro'))
+    if ro not in ('0', '1'):
+        return None
+    return ro == '1'
+
+
+# Designator types and code sets of the identification descriptors of VPD
+# page 0x83.
+SCSI_ID_VENDOR_SPECIFIC = 0
+SCSI_ID_T10_VENDOR = 1
+SCSI_ID_EUI_64 = 2
+SCSI_ID_NAA = 3
+CODE_SET_BINARY = 1
+CODE_SET_ASCII = 2
+NAA_IEEE_REG = 5
+NAA_IEEE_REG_EXTENDED = 6
+
+# The descriptors scsi_id looks for, in its order of preference:
+# (designator type, NAA type or None for any, code set)
+PAGE_83_SEARCH_ORDER = (
+    (SCSI_ID_NAA, NAA_IEEE_REG_EXTENDED, CODE_SET_BINARY),
+    (SCSI_ID_NAA, NAA_IEEE_REG_EXTENDED, CODE_SET_ASCII),
+    (SCSI_ID_NAA, NAA_IEEE_REG, CODE_SET_BINARY),
+    (SCSI_ID_NAA, NAA_IEEE_REG, CODE_SET_ASCII),
+    (SCSI_ID_NAA, None, CODE_SET_BINARY),
+    (SCSI_ID_NAA, None, CODE_SET_ASCII),
+    (SCSI_ID_EUI_64, None, CODE_SET_BINARY),
+    (SCSI_ID_EUI_64, None, CODE_SET_ASCII),
+    (SCSI_ID_T10_VENDOR, None, CODE_SET_BINARY),
+    (SCSI_ID_T10_VENDOR, None, CODE_SET_ASCII),
+)
+
+# Prefixes of the wwid attribute and the designator type they come from
+WWID_PREFIXES = (('naa.', SCSI_ID_NAA),
+                 ('eui.', SCSI_ID_EUI_64),
+                 ('t10.', SCSI_ID_T10_VENDOR))
+
+
+def decode_vpd_page83(data):
+    """Get the identifier of a SCSI device from its VPD page 0x83.
+
+    Returns the same string as `scsi_id --page 0x83`: the designator type
+    followed by the identifier, in hex if it is binary, of the first
+    descriptor found in scsi_id's order of preference.
+
+    :param data: contents of the page.
+    :returns: the identifier, or None if the page has none scsi_id would use
+              here (ie: only vendor specific identifiers, which scsi_id
+              combines with the vendor and model of the device).
+    """
+    page = bytearray(data)
+    if len(page) < 4 or page[1] != 0x83:
+        return None
+    # A non zero reserved byte means a SCSI-2 style page, scsi_id reads
+    # those differently.
+    if len(page) > 6 and page[6] != 0:
+        return None
+    end = min(len(page), 4 + ((page[2] << 8) | page[3]))
+
+    descriptors = []
+    offset = 4
+    while offset + 4 <= end:
+        length = page[offset + 3]
+        descriptor = page[offset:offset + 4 + length]
+        if len(descriptor) < 4 + length:
+            break
+        # Only descriptors about the logical unit itself
+        if descriptor[1] & 0x30 == 0:
+            descriptors.append(descriptor)
+        offset += 4 + length
+
+    for id_type, naa_type, code_set in PAGE_83_SEARCH_ORDER:
+        for descriptor in descriptors:
+            if (descriptor[1] & 0x0f != id_type or
+                    descriptor[0] & 0x0f != code_set):
+                continue
+            if naa_type is not None and (len(descriptor) < 5 or
+                                         descriptor[4] >> 4 != naa_type):
+                continue
+            identifier = descriptor[4:]
+            if code_set == CODE_SET_ASCII:
+                value = identifier.decode('ascii', 'replace')
+            else:
+                value = ''.join('%02x' % byte for byte in identifier)
+            return '%x%s' % (id_type, value)
+    return None
+
+
+def get_scsi_wwn(name):
+    """Get the identifier of a SCSI device like `scsi_id --page 0x83`.
+
+    The VPD page 0x83 the kernel keeps in sysfs is decoded, or the wwid
+    attribute is used if that's not there.
+
+    :param name: name of the block device, ie: sdb
+    :returns: the identifier, or None if it is not available in sysfs.
+    """
+    device = get_path('block', name, 'device')
+    page = read_binary_attr(os.path.join(device, 'vpd_pg83'))
+    if page:
+        wwn = decode_vpd_page83(page)
+        if wwn:
+            return wwn
+
+    wwid = read_attr(os.path.join(device, 'wwid'))
+    if wwid:
+        for prefix, id_type in WWID_PREFIXES:
+            if wwid.startswith(prefix):
+                return '%x%s' % (id_type, wwid[len(prefix):])
+    return None
+
+
+def _get_session_transport(host):
+    # Like iscsiadm does, we work out the transport from the driver of the
+    # SCSI host: iscsi_tcp -> tcp, ib_iser -> iser, bnx2i -> bnx2i...
+    proc_name = read_attr(get_path('class', 'scsi_host', 'host%s' % host,
+                                   'proc_name'), '')
+    if proc_name.startswith('iscsi_'):
+        return proc_name[len('iscsi_'):]
+    if proc_name == 'ib_iser':
+        return 'iser'
+    return proc_name or None
+
+
+def _get_session_targets(session_device):
+    """Get the (channel, target id) of the SCSI targets of a session."""
+    targets = []
+    for target in listdir(session_device):
+        match = TARGET_REGEX.match(target)
+        if match:
+            targets.append((int(match.group(2)), int(match.group(3))))
+    return sorted(targets)
+
+
+def _get_session_luns(session_device):
+    """Map the LUNs of a session to their block device names."""
+    luns = {}
+    for target in listdir(session_device):
+        if not TARGET_REGEX.match(target):
+            continue
+        target_path = os.path.join(session_device, target)
+        for hctl in listdir(target_path):
+            match = HCTL_REGEX.match(hctl)
+            if not match:
+                continue
+            block = listdir(os.path.join(target_path, hctl, 'block'))
+            if block:
+                luns[int(match.group(4))] = block[0]
+    return luns
+
+
+def _get_iscsi_session(sid):
+    session_path = get_path('class', 'iscsi_session', 'session%s' % sid)
+    iqn = read_attr(os.path.join(session_path, 'targetname'))
+    if not iqn:
+        return None
+
+    conn_path = None
+    for conn in listdir(get_path('class', 'iscsi_connection')):
+        if conn.startswith('connection%s:' % sid):
+            conn_path = get_path('class', 'iscsi_connection', conn)
+            break
+    if conn_path is None:
+        return None
+
+    address = (read_attr(os.path.join(conn_path, 'persistent_address')) or
+               read_attr(os.path.join(conn_path, 'address')))
+    port = (read_attr(os.path.join(conn_path, 'persistent_port')) or
+            read_attr(os.path.join(conn_path, 'port')))
+    if not address or not port:
+        return None
+    if ':' in address:
+        address = '[%s]' % address
+
+    # The session device lives under its SCSI host, ie:
+    # /sys/devices/platform/host3/session1
+    session_device = os.path.realpath(os.path.join(session_path, 'device'))
+    host = os.path.basename(os.path.dirname(session_device))
+    host = host[len('host'):] if host.startswith('host') else None
+
+    tpgt = read_attr(os.path.join(session_path, 'tpgt'))
+    return {'sid': sid,
+            'transport': _get_session_transport(host) if host else None,
+            'portal': '%s:%s' % (address, port),
+            'tpgt': int(tpgt) if tpgt and tpgt.isdigit() else None,
+            'iqn': iqn,
+            'host': int(host) if host and host.isdigit() else None,
+            'targets': _get_session_targets(session_device),
+            'luns': _get_session_luns(session_device)}
+
+
+def get_iscsi_sessions():
+    """Get the iSCSI sessions of the host.
+
+    Builds the same information as `iscsiadm -m session` without running it.
+
+    :returns: list of dicts with the sid, transport, portal, tpgt, iqn, SCSI
+              host number, (channel, target id) of its SCSI targets and a LUN
+              to block device name mapping of each session, or None if sysfs
+              can't be used.
+    """
+    if not os.path.isdir(get_path('class')):
+        return None
+
+    sessions = []
+    for entry in listdir(get_path('class', 'iscsi_session')):
+        match = SESSION_REGEX.match(entry)
+        if not match:
+            continue
+        # Sessions can go away while we look at them, those are skipped.
+        session = _get_iscsi_session(int(match.group(1)))
+        if session:
+            sessions.append(session)
+        else:
+            LOG.debug("Skipping incomplete iSCSI session %s.", entry)
+
+    return sorted(sessions, key=lambda session: session['sid'])
+
+
+def get_fc_remote_ports():
+    """Get the Fibre Channel remote ports (target ports) seen by the host.
+
+    :returns: list of dicts with the SCSI host number, port name, node name
+              (without the 0x prefix) and state of each remote port, or None
+              if sysfs can't be used.
+    """
+    if not os.path.isdir(get_path('class')):
+        return None
+
+    rports = []
+    for entry in sorted(listdir(get_path('class', 'fc_remote_ports'))):
+        match = RPORT_REGEX.match(entry)
+        if not match:
+            continue
+        path = get_path('class', 'fc_remote_ports', entry)
+        port_name = read_attr(os.path.join(path, 'port_name'), '')
+        node_name = read_attr(os.path.join(path, 'node_name'), '')
+        rports.append({'host': int(match.group(1)),
+                       'port_name': port_name.replace('0x', ''),
+                       'node_name': node_name.replace('0x', ''),
+                       'port_state': read_attr(os.path.join(path,
+                                                            'port_state'))})
+    return rports
@@ -24,7 +24,6 @@ import re
 from os_brick import exception
 from os_brick import executor
 from os_brick.i18n import _LE, _LI
-from os_brick.privileged import rootwrap as priv_rootwrap
 from os_brick import utils
 from oslo_concurrency import processutils as putils
 from oslo_log import log as logging
@@ -34,6 +33,10 @@ from six import moves
 
 LOG = logging.getLogger(__name__)
 
+# Seconds the static methods reuse the output of their read-only commands
+# for, the changes made through any Executor drop it right away.
+STATIC_COMMAND_CACHE_TTL = 5
+
 
 class LVM(executor.Executor):
     """LVM object to enable various LVM related operations."""
@@ -42,7 +45,7 @@ class LVM(executor.Executor):
 
     def __init__(self, vg_name, root_helper, create_vg=False,
                  physical_volumes=None, lvm_type='default',
-                 executor=None, lvm_conf=None):
+                 executor=None, lvm_conf=None, command_cache_ttl=0):
 
         """Initialize the LVM object.
 
@@ -57,9 +60,12 @@ class LVM(executor.Executor):
         :param lvm_type: VG and Volume type (default, or thin)
         :param executor: Execute method to use, None uses
                          oslo_concurrency.processutils
+        :param command_cache_ttl: Seconds the output of vgs, lvs and
+                                  lvdisplay is reused for
 
         """
-        super(LVM, self).__init__(execute=executor, root_helper=root_helper)
+        super(LVM, self).__init__(execute=executor, root_helper=root_helper,
+                                  command_cache_ttl=command_cache_ttl)
         self.vg_name = vg_name
         self.pv_list = []
         self.vg_size = 0.0
@@ -127,7 +133,8 @@ class LVM(executor.Executor):
                                     '-o', 'name', self.vg_name]
         (out, _err) = self._execute(*cmd,
                                     root_helper=self._root_helper,
-                                    run_as_root=True)
+                                    run_as_root=True,
+                                    read_only=True)
 
         if out is not None:
             volume_groups = out.split()
@@ -145,7 +152,8 @@ class LVM(executor.Executor):
                                     '-o', 'uuid', self.vg_name]
         (out, _err) = self._execute(*cmd,
                                     root_helper=self._root_helper,
-                                    run_as_root=True)
+                                    run_as_root=True,
+                                    read_only=True)
         if out is not None:
             return out.split()
         else:
@@ -171,7 +179,8 @@ class LVM(executor.Executor):
         try:
             (out, err) = self._execute(*cmd,
                                        root_helper=self._root_helper,
-                                       run_as_root=True)
+                                       run_as_root=True,
+                                       read_only=True)
             if out is not None:
                 out = out.strip()
                 data = out.split(':')
@@ -188,6 +197,19 @@ class LVM(executor.Executor):
 
         return free_space
 
+    @staticmethod
+    def _execute_static(root_helper, *cmd):
+        """Run a read-only LVM command for the static methods.
+
+        It goes through an Executor like the commands of the instances, so
+        identical calls made within STATIC_COMMAND_CACHE_TTL seconds, and
+        not separated by a change, only run the command once.
+        """
+        return executor.Executor(
+            root_helper, command_cache_ttl=STATIC_COMMAND_CACHE_TTL)._execute(
+                *cmd, root_helper=root_helper, run_as_root=True,
+                read_only=True)
+
     @staticmethod
     def get_lvm_version(root_helper):
         """Static method to get LVM version from system.
@@ -198,9 +220,7 @@ class LVM(executor.Executor):
         """
 
         cmd = LVM.LVM_CMD_PREFIX + ['vgs', '--version']
-        (out, _err) = priv_rootwrap.execute(*cmd,
-                                            root_helper=root_helper,
-                                            run_as_root=True)
+        (out, _err) = LVM._execute_static(root_helper, *cmd)
         lines = out.split('\n')
 
         for line in lines:
@@ -291,9 +311,7 @@ class LVM(executor.Executor):
             cmd.append(vg_name)
 
         try:
-            (out, _err) = priv_rootwrap.execute(*cmd,
-                                                root_helper=root_helper,
-                                                run_as_root=True)
+            (out, _err) = LVM._execute_static(root_helper, *cmd)
         except putils.ProcessExecutionError as err:
             with excutils.save_and_reraise_exception(reraise=True) as ctx:
                 if "not found" in err.stderr or "Failed to find" in err.stderr:
@@ -349,9 +367,7 @@ class LVM(executor.Executor):
                                     '-o', 'vg_name,name,size,free',
                                     '--separator', field_sep,
                                     '--nosuffix']
-        (out, _err) = priv_rootwrap.execute(*cmd,
-                                            root_helper=root_helper,
-                                            run_as_root=True)
+        (out, _err) = LVM._execute_static(root_helper, *cmd)
 
         pvs = out.split()
         if vg_name is not None:
@@ -393,9 +409,7 @@ class LVM(executor.Executor):
         if vg_name is not None:
             cmd.append(vg_name)
 
-        (out, _err) = priv_rootwrap.execute(*cmd,
-                                            root_helper=root_helper,
-                                            run_as_root=True)
+        (out, _err) = LVM._execute_static(root_helper, *cmd)
         vg_list = []
         if out is not None:
             vgs = out.split()
@@ -764,7 +778,8 @@ class LVM(executor.Executor):
                                     'Attr', '%s/%s' % (self.vg_name, name)]
         out, _err = self._execute(*cmd,
                                   root_helper=self._root_helper,
-                                  run_as_root=True)
+                                  run_as_root=True,
+                                  read_only=True)
         if out:
             out = out.strip()
             if (out[0] == 'o') or (out[0] == 'O'):
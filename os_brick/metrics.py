@@ -0,0 +1,186 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Metrics of the commands run by os-brick.
+
+Every command run through rootwrap.execute, a batch or a custom execute
+given to the connectors is counted by binary and subcommand, ie: iscsiadm
+"node --login" or multipath "-f", with the number of errors and a histogram
+of how long it took.
+
+The metrics of the process can be read with get_snapshot, and hooks can be
+registered with register_hook to send every command to StatsD, Prometheus
+or any other monitoring system as it finishes::
+
+    def send_to_statsd(binary, subcommand, duration, error):
+        statsd.timing('os_brick.%s' % binary, duration * 1000)
+
+    metrics.register_hook(send_to_statsd)
+"""
+
+import bisect
+import os
+import re
+import threading
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from os_brick.i18n import _LE
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets of the latency histograms.  The
+# last bucket has no upper bound.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Only arguments that look like a subcommand or an option are used as the
+# subcommand, so paths, WWNs, IQNs... don't create new metrics.
+_SUBCOMMAND_REGEX = re.compile(r'^-{0,2}[A-Za-z][A-Za-z0-9_-]*$')
+_ISCSIADM_ACTIONS = ('--login', '--logout', '--rescan', '--discover')
+
+_lock = threading.Lock()
+# (binary, subcommand) -> _CommandStats
+_stats = {}
+_hooks = []
+
+
+class _CommandStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, duration, error):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total_time += duration
+        self.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+
+
+def get_command_key(cmd):
+    """Get the (binary, subcommand) a command is counted under."""
+    args = [str(arg) for arg in cmd]
+    # LVM commands are run through env to set the locale
+    if args and os.path.basename(args[0]) == 'env':
+        args = args[1:]
+        while args and '=' in args[0]:
+            args.pop(0)
+    if not args:
+        return '', ''
+    binary = os.path.basename(args.pop(0))
+
+    if binary == 'iscsiadm':
+        # The mode and the action on it, ie: node --op update
+        subcommand = []
+        for i, arg in enumerate(args):
+            if arg in ('-m', '--mode') and i + 1 < len(args):
+                subcommand.append(args[i + 1])
+            elif arg == '--op' and i + 1 < len(args):
+                subcommand.extend((arg, args[i + 1]))
+            elif arg in _ISCSIADM_ACTIONS:
+                subcommand.append(arg)
+        return binary, ' '.join(subcommand)
+
+    if args and _SUBCOMMAND_REGEX.match(args[0]):
+        return binary, args[0]
+    return binary, ''
+
+
+def record_command(cmd, duration, error=False):
+    """Add a finished command to the metrics.
+
+    :param cmd: the command and its arguments.
+    :param duration: seconds the command took.
+    :param error: whether the command failed.
+    """
+    binary, subcommand = get_command_key(cmd)
+    with _lock:
+        stats = _stats.get((binary, subcommand))
+        if stats is None:
+            stats = _stats[(binary, subcommand)] = _CommandStats()
+        stats.add(duration, error)
+        hooks = list(_hooks)
+
+    for hook in hooks:
+        try:
+            hook(binary, subcommand, duration, error)
+        except Exception:
+            LOG.exception(_LE("Metrics hook %s failed."), hook)
+
+
+class timed_command(object):
+    """Context manager recording the command run inside it.
+
+    The command counts as failed if an exception is raised.
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+
+    def __enter__(self):
+        self.start = timeutils.now()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record_command(self.cmd, timeutils.now() - self.start,
+                       exc_type is not None)
+
+
+def get_snapshot():
+    """Get the metrics of the commands run so far.
+
+    :returns: list of dictionaries with the binary, subcommand, count,
+              errors, total_time (seconds) and buckets of each command.
+              buckets is a list of (upper bound, count) pairs, cumulative
+              like Prometheus histograms, the last bound is None.
+    """
+    with _lock:
+        snapshot = []
+        for (binary, subcommand), stats in sorted(_stats.items()):
+            buckets = []
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (None,), stats.buckets):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            snapshot.append({'binary': binary,
+                             'subcommand': subcommand,
+                             'count': stats.count,
+                             'errors': stats.errors,
+                             'total_time': stats.total_time,
+                             'buckets': buckets})
+        return snapshot
+
+
+def reset():
+    """Forget the metrics of the commands run so far."""
+    with _lock:
+        _stats.clear()
+
+
+def register_hook(hook):
+    """Call a function after every command.
+
+    :param hook: function called with the binary, subcommand, duration in
+                 seconds and whether the command failed.  It runs in the
+                 thread that ran the command, so it should be quick.
+    """
+    with _lock:
+        _hooks.append(hook)
+
+
+def unregister_hook(hook):
+    with _lock:
+        _hooks.remove(hook)
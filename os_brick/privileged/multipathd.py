@@ -0,0 +1,140 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Talk to multipathd over its control socket.
+
+This is what the `multipathd` command line tool does, but without forking a
+new process for every command.  The privileged daemon keeps the connection
+open between commands.
+
+multipathd listens on an abstract unix socket.  Each message is sent as its
+length, a native size_t, followed by the message itself, NUL terminated.
+Replies come back the same way.
+"""
+
+import socket
+import struct
+import threading
+
+from oslo_log import log as logging
+
+from os_brick import privileged
+
+LOG = logging.getLogger(__name__)
+
+SOCKET_ADDRESS = '\0/org/kernel/linux/storage/multipathd'
+# Time to wait for a reply, resizing a map can take a while.
+SOCKET_TIMEOUT = 60
+
+# Only these commands can be run through the privileged entrypoint.
+ALLOWED_COMMANDS = (
+    ('show', 'status'),
+    ('show', 'maps'),
+    ('show', 'paths'),
+    ('resize', 'map'),
+    ('add', 'path'),
+    ('del', 'path'),
+    ('reconfigure',),
+)
+
+_LENGTH = struct.Struct('@N')
+
+
+class MultipathdClient(object):
+    """Client for multipathd's control socket."""
+
+    def __init__(self, address=None, timeout=SOCKET_TIMEOUT):
+        self.address = address or SOCKET_ADDRESS
+        self.timeout = timeout
+        self._sock = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _recv_all(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise socket.error('multipathd closed the connection')
+            data += chunk
+        return data
+
+    def _send_command(self, command):
+        message = command.encode('utf-8') + b'\0'
+        self._sock.sendall(_LENGTH.pack(len(message)) + message)
+        size = _LENGTH.unpack(self._recv_all(_LENGTH.size))[0]
+        return self._recv_all(size).rstrip(b'\0').decode('utf-8', 'replace')
+
+    def execute(self, command):
+        """Run a command and return multipathd's reply.
+
+        If the connection we kept from a previous command is no longer
+        usable (ie: multipathd was restarted) we reconnect and try again
+        once.
+        """
+        reused = self._sock is not None
+        if not reused:
+            self._sock = self._connect()
+        try:
+            return self._send_command(command)
+        except (socket.error, socket.timeout):
+            self.close()
+            if not reused:
+                raise
+        LOG.debug("Reconnecting to multipathd.")
+        self._sock = self._connect()
+        try:
+            return self._send_command(command)
+        except (socket.error, socket.timeout):
+            self.close()
+            raise
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+
+_client = MultipathdClient()
+_client_lock = threading.Lock()
+
+
+def _check_command(args):
+    for allowed in ALLOWED_COMMANDS:
+        if tuple(args[:len(allowed)]) == allowed:
+            return
+    raise ValueError('multipathd command not allowed: %s' % ' '.join(args))
+
+
+@privileged.default.entrypoint
+def execute(*args):
+    """Run a multipathd command and return its reply.
+
+    Raises socket.error (an OSError) if multipathd can't be reached, callers
+    can then fall back to the multipathd command line tool.
+
+    :param args: the command, like the arguments to the multipathd tool,
+                 ie: ('resize', 'map', '<wwid>').
+    """
+    _check_command(args)
+    with _client_lock:
+        return _client.execute(' '.join(args))
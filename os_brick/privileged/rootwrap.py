@@ -40,7 +40,9 @@ import six
 
 from oslo_concurrency import processutils as putils
 from oslo_utils import strutils
+from oslo_utils import timeutils
 
+from os_brick import metrics
 from os_brick import privileged
 
 
@@ -53,10 +55,11 @@ def execute(*cmd, **kwargs):
     kwargs.pop('root_helper', None)
 
     try:
-        if run_as_root:
-            return execute_root(*cmd, **kwargs)
-        else:
-            return putils.execute(*cmd, **kwargs)
+        with metrics.timed_command(cmd):
+            if run_as_root:
+                return execute_root(*cmd, **kwargs)
+            else:
+                return putils.execute(*cmd, **kwargs)
     except OSError as e:
         # Note:
         #  putils.execute('bogus', run_as_root=True)
@@ -80,3 +83,79 @@ def execute(*cmd, **kwargs):
 def execute_root(*cmd, **kwargs):
     """NB: Raises processutils.ProcessExecutionError/OSError on failure."""
     return putils.execute(*cmd, shell=False, run_as_root=False, **kwargs)
+
+
+def _run_batch(commands, stop_on_error):
+    # Errors can't cross the daemon boundary in a list, so each result is
+    # an ('ok', stdout, stderr, duration) or an ('error', exit code, stdout,
+    # stderr, cmd, description, duration) tuple, or None if the command was
+    # not run.  The metrics of the commands are recorded by the caller from
+    # the durations, since the daemon is a different process.
+    results = []
+    failed = False
+    for cmd, kwargs in commands:
+        if failed and stop_on_error:
+            results.append(None)
+            continue
+        start = timeutils.now()
+        try:
+            stdout, stderr = putils.execute(*cmd, shell=False,
+                                            run_as_root=False, **kwargs)
+            results.append(('ok', stdout, stderr, timeutils.now() - start))
+        except putils.ProcessExecutionError as e:
+            failed = True
+            results.append(('error', e.exit_code, e.stdout, e.stderr, e.cmd,
+                            e.description, timeutils.now() - start))
+        except OSError as e:
+            # See comment on `execute`
+            failed = True
+            sanitized_cmd = strutils.mask_password(' '.join(cmd))
+            results.append(('error', None, None, None, sanitized_cmd,
+                            six.text_type(e), timeutils.now() - start))
+    return results
+
+
+def execute_batch(commands, stop_on_error=True, run_as_root=False,
+                  root_helper=None):
+    """Run several commands, as root in a single call to the daemon.
+
+    :param commands: list of (cmd, kwargs) pairs, where cmd is the command
+                     and its arguments and kwargs the keyword arguments for
+                     processutils.execute, ie: check_exit_code.
+    :param stop_on_error: don't run the commands after a failed one.
+    :returns: list with the result of each command, in the same order: an
+              (stdout, stderr) pair, the ProcessExecutionError it failed
+              with, or None if it was not run.
+    """
+    if run_as_root:
+        raw_results = execute_batch_root(commands, stop_on_error)
+    else:
+        raw_results = _run_batch(commands, stop_on_error)
+
+    results = []
+    for (cmd, _kwargs), result in zip(commands, raw_results):
+        if result is None:
+            results.append(None)
+            continue
+        metrics.record_command(cmd, result[-1], result[0] != 'ok')
+        if result[0] == 'ok':
+            results.append((result[1], result[2]))
+        else:
+            (_status, exit_code, stdout, stderr, cmd, description,
+             _duration) = result
+            results.append(putils.ProcessExecutionError(
+                exit_code=exit_code, stdout=stdout, stderr=stderr, cmd=cmd,
+                description=description))
+    return results
+
+
+@privileged.default.entrypoint
+def execute_batch_root(commands, stop_on_error):
+    """Run several commands as root, see execute_batch."""
+    for _cmd, kwargs in commands:
+        # Like execute_root, commands can't be run through a shell or
+        # another root helper.
+        for key in ('shell', 'run_as_root', 'root_helper'):
+            if key in kwargs:
+                raise TypeError('%s is not allowed in a batch' % key)
+    return _run_batch(commands, stop_on_error)
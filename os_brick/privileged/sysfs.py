@@ -0,0 +1,74 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Write to sysfs attributes from the privileged daemon.
+
+This replaces running `tee -a <attribute>` as root for every write (SCSI
+device deletes, host scans, zfcp unit adds...), a batch of writes is done
+with a single call to the daemon.
+"""
+
+import os
+
+from oslo_log import log as logging
+
+from os_brick import privileged
+
+LOG = logging.getLogger(__name__)
+
+# Only attributes under these directories can be written.
+ALLOWED_PREFIXES = (
+    '/sys/block/',
+    '/sys/bus/ccw/drivers/zfcp/',
+    '/sys/bus/scsi/devices/',
+    '/sys/bus/scsi/drivers/sd/',
+    '/sys/class/scsi_device/',
+    '/sys/class/scsi_host/',
+)
+
+
+def _check_path(path):
+    # Paths are checked as given, so they can't escape the allowed
+    # directories with '..'.
+    if (not path.startswith('/') or '..' in path.split('/') or
+            os.path.normpath(path) != path):
+        raise ValueError('Invalid sysfs path: %s' % path)
+    if not path.startswith(ALLOWED_PREFIXES):
+        raise ValueError('Writing to %s is not allowed' % path)
+
+
+@privileged.default.entrypoint
+def write(writes):
+    """Write contents to sysfs attributes.
+
+    All the writes are attempted, even if some of them fail, in the order
+    they are given.
+
+    :param writes: list of (path, content) pairs.
+    :returns: list with None for each successful write and an
+              (errno, error message) pair for each failed one.
+    """
+    for path, _content in writes:
+        _check_path(path)
+
+    results = []
+    for path, content in writes:
+        try:
+            with open(path, 'w') as f:
+                f.write(content)
+        except (IOError, OSError) as exc:
+            LOG.debug('Writing %(content)s to %(path)s failed: %(exc)s',
+                      {'content': content, 'path': path, 'exc': exc})
+            results.append((exc.errno, exc.strerror))
+        else:
+            results.append(None)
+    return results
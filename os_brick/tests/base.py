@@ -23,6 +23,10 @@ import fixtures
 import mock
 from oslo_utils import strutils
 
+from os_brick import executor
+from os_brick.initiator import host_inventory
+from os_brick import utils
+
 
 class TestCase(testtools.TestCase):
     """Test case base class for all unit tests."""
@@ -44,6 +48,11 @@ class TestCase(testtools.TestCase):
         self.useFixture(fixtures.NestedTempfile())
         self.useFixture(fixtures.TempHomeDir())
 
+        # Don't share the view of the host between tests, each one mocks it
+        # differently.
+        self.mock_object(host_inventory, '_inventory', None)
+        self.mock_object(executor, '_command_cache', utils.TTLCache())
+
         environ_enabled = (lambda var_name:
                            strutils.bool_from_string(os.environ.get(var_name)))
         if environ_enabled('OS_STDOUT_CAPTURE'):
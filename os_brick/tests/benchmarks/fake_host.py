@@ -0,0 +1,1506 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A simulated host to run the connectors against, without real storage.
+
+FakeHost keeps an in-memory /dev and /sys tree and a virtual clock, and
+provides an execute function that plays iscsiadm, multipath, multipathd,
+scsi_id, sg_scan, blockdev, tee, systool and the LVM tools on top of them.
+Every command takes a configurable amount of virtual time, devices show up
+a while after a login or a scan and go away a while after being deleted,
+like they do when udev is involved.
+
+Nothing really sleeps: each thread runs in virtual time, a thread that
+sleeps waits until the clock reaches its wake up time, and the clock only
+moves, to the next thing due, once every thread of the simulation sleeps or
+waits for another one.  So threads sleeping at the same time overlap like
+they would on a real host, a run is fast and it always gives the same
+result for the same settings.
+
+Within host.patch() the os.path, os.listdir, os.stat, glob and time
+functions used by the connectors see the fake host for paths under /dev
+and /sys, and the real system for anything else.  The sysfs module reads
+the fake /sys tree, which has the iSCSI sessions, FC remote ports, SCSI
+devices and multipath maps of the host, and the device waits are woken by
+changes to the fake host like inotify and uevents would wake them.
+"""
+
+import contextlib
+import errno
+import fnmatch
+import glob
+import heapq
+import io
+import itertools
+import os
+import posixpath
+import random
+import stat
+import threading
+import time
+
+import mock
+from oslo_concurrency import processutils as putils
+from oslo_utils import timeutils
+import six
+
+from os_brick import executor
+from os_brick.initiator.connectors import iscsi
+from os_brick.initiator import device_waiter
+from os_brick.initiator import host_inventory
+from os_brick.initiator import sysfs
+from os_brick import metrics
+from os_brick.privileged import rootwrap as priv_rootwrap
+from os_brick import utils
+
+# Seconds since the epoch the virtual clock starts at
+EPOCH = 1500000000.0
+
+# Shortest a sleep takes
+MIN_SLEEP = 1e-6
+
+# Virtual seconds each command takes, by "binary subcommand" as metrics
+# names them, or by binary.  A (base, per line) pair makes the latency
+# grow with the size of the output, like listing commands do.
+DEFAULT_LATENCIES = {
+    'iscsiadm': 0.02,
+    'iscsiadm node --login': 0.25,
+    'iscsiadm node --logout': 0.1,
+    'iscsiadm discovery': 0.05,
+    'iscsiadm session': (0.01, 0.0005),
+    'multipath': 0.05,
+    'multipath -ll': (0.05, 0.0005),
+    'multipath -f': 0.1,
+    'multipathd': 0.01,
+    'scsi_id': 0.005,
+    'sg_scan': 0.005,
+    'blockdev': 0.005,
+    'tee': 0.002,
+    'systool': (0.05, 0.002),
+    'lsblk': (0.01, 0.0001),
+    'lvs': (0.05, 0.0002),
+    'vgs': 0.05,
+    'pvs': 0.05,
+    'lvcreate': 0.2,
+    'lvremove': 0.2,
+    'lvextend': 0.15,
+    'lvdisplay': 0.05,
+}
+DEFAULT_LATENCY = 0.005
+
+ROOTS = ('/dev', '/sys')
+# Where the sysfs module finds the fake /sys tree
+SYSFS_ROOT = '/sys'
+
+# Real seconds between the checks of a thread waiting for something the
+# clock doesn't see, ie: a Condition.
+POLL_INTERVAL = 0.005
+# Real seconds without any thread of the simulation doing something with
+# the clock after which the running ones are assumed to be blocked in a
+# way the clock can't see, ie: on a plain lock, and the clock moves on.
+STALL_TIMEOUT = 1
+
+_real_exists = os.path.exists
+_real_isdir = os.path.isdir
+_real_islink = os.path.islink
+_real_realpath = os.path.realpath
+_real_listdir = os.listdir
+_real_stat = os.stat
+_real_walk = os.walk
+_real_glob = glob.glob
+_real_open = open
+_real_time = time.time
+
+# Python 2 only gives access to the class of the conditions by its private
+# name.
+_Condition = getattr(threading, '_Condition', threading.Condition)
+_real_condition_wait = _Condition.wait
+_real_condition_notify = _Condition.notify
+_real_thread_start = threading.Thread.start
+_real_thread_join = threading.Thread.join
+
+
+def _get_condition_waiters(condition):
+    return (getattr(condition, '_waiters', None) or
+            getattr(condition, '_Condition__waiters', None) or ())
+
+
+class _Waiter(object):
+    """A thread waiting on the virtual clock."""
+
+    IDLE, BLOCKED, WOKEN, EXPIRED = range(4)
+
+    def __init__(self):
+        self.state = self.IDLE
+
+
+class VirtualClock(object):
+    """Clock shared by the threads of a simulation.
+
+    The clock knows about the threads started within FakeHost.patch() and
+    counts how many of them are running.  A thread blocks in sleep, or in
+    wait until another thread wakes it, and the clock only moves once none
+    of them is running: to the next event or wake up time, running the
+    callbacks that became due.  Threads also count as blocked while they
+    wait for a Condition, a lock built on one or another thread, through
+    the patches of FakeHost.patch().
+
+    The state of the clock, its callbacks and the fake filesystem are
+    protected by the lock of the clock.
+    """
+
+    def __init__(self):
+        # Kept small so float precision doesn't stall short waits
+        self._now = 0.0
+        self._events = []
+        self._seq = itertools.count()
+        self.lock = threading.RLock()
+        self._changed = threading.Condition(self.lock)
+        self._last_change = _real_time()
+        self._threads = set()
+        self._running = 0
+        # Threads waiting for another thread to finish, by thread
+        self._joiners = {}
+        # Threads of the simulation waiting for each Condition, and how many
+        # of them it woke that didn't resume yet
+        self._waiting = {}
+        self._notified = {}
+        self._local = threading.local()
+
+    def monotonic(self):
+        return self._now
+
+    def time(self):
+        return EPOCH + self._now
+
+    def _push(self, when, callback, *args):
+        heapq.heappush(self._events, (when, next(self._seq), callback, args))
+
+    def call_later(self, delay, callback, *args):
+        with self.lock:
+            self._push(self._now + delay, callback, *args)
+
+    def _notify(self):
+        self._last_change = _real_time()
+        # Not notify_all, that would count the threads of the clock itself
+        # as woken by a Condition.
+        _real_condition_notify(self._changed, len(_get_condition_waiters(
+            self._changed)))
+
+    # Threads
+
+    def add_thread(self, thread):
+        """Count a thread as running, until remove_thread is called."""
+        with self.lock:
+            if thread not in self._threads:
+                self._threads.add(thread)
+                self._running += 1
+                self._notify()
+
+    def remove_thread(self, thread):
+        with self.lock:
+            if thread in self._threads:
+                self._threads.discard(thread)
+                self._running -= 1
+            for waiter in self._joiners.pop(thread, ()):
+                self._wake(waiter)
+            self._notify()
+
+    def _enter(self):
+        # Threads the clock doesn't know about count as running while they
+        # use it.
+        thread = threading.current_thread()
+        if thread in self._threads:
+            return None
+        self.add_thread(thread)
+        return thread
+
+    def _leave(self, thread):
+        if thread is not None:
+            self.remove_thread(thread)
+
+    # Blocking
+
+    def _block(self, waiter, timeout):
+        waiter.state = _Waiter.BLOCKED
+        if timeout is not None:
+            self._push(self._now + max(timeout, MIN_SLEEP), self._expire,
+                       waiter)
+        self._running -= 1
+        self._notify()
+
+    def _wake(self, waiter, state=_Waiter.WOKEN):
+        if waiter.state == _Waiter.BLOCKED:
+            self._running += 1
+            self._notify()
+        if waiter.state in (_Waiter.IDLE, _Waiter.BLOCKED):
+            waiter.state = state
+
+    def _expire(self, waiter):
+        self._wake(waiter, _Waiter.EXPIRED)
+
+    def _advance(self):
+        """Move to the next event and run it, if there is any."""
+        while self._events:
+            when, _seq, callback, args = heapq.heappop(self._events)
+            if callback == self._expire and args[0].state != _Waiter.BLOCKED:
+                # Woken before its timeout
+                continue
+            self._now = max(self._now, when)
+            callback(*args)
+            return True
+        return False
+
+    def _stalled(self):
+        return _real_time() - self._last_change > STALL_TIMEOUT
+
+    def _run_until(self, done):
+        """Drive the clock from a blocked thread until done() is true."""
+        while not done():
+            if self._running <= 0 or self._stalled():
+                if self._advance():
+                    continue
+            _real_condition_wait(self._changed, STALL_TIMEOUT)
+
+    def sleep(self, seconds):
+        """Block the thread for a while of virtual time."""
+        with self.lock:
+            thread = self._enter()
+            waiter = _Waiter()
+            # Like a real sleep, it always takes a little while, otherwise
+            # rounding errors could leave waits with nothing left to wait
+            # for.
+            self._block(waiter, max(seconds, MIN_SLEEP))
+            self._run_until(lambda: waiter.state != _Waiter.BLOCKED)
+            self._leave(thread)
+
+    def wait(self, waiter, timeout=None):
+        """Block the thread until wake is called with waiter.
+
+        :param timeout: virtual seconds to wait for at most.
+        :returns: False if the timeout expired, True otherwise.
+        """
+        with self.lock:
+            if waiter.state == _Waiter.IDLE:
+                thread = self._enter()
+                self._block(waiter, timeout)
+                self._run_until(lambda: waiter.state != _Waiter.BLOCKED)
+                self._leave(thread)
+            expired = waiter.state == _Waiter.EXPIRED
+            waiter.state = _Waiter.IDLE
+            return not expired
+
+    def wake(self, waiter):
+        """Let the thread waiting with waiter run again."""
+        with self.lock:
+            self._wake(waiter)
+
+    def wait_external(self, wait, timeout=None, condition=None,
+                      thread=None):
+        """Block the thread on something the clock doesn't control.
+
+        :param wait: function that waits for up to the real seconds it is
+                     given, returning a true value once the wait is over.
+        :param timeout: virtual seconds to wait for at most.
+        :param condition: Condition being waited for, its notify calls let
+                          the thread run again.
+        :param thread: thread being waited for, it lets the thread run
+                       again when it finishes.
+        :returns: the last value returned by wait.
+        """
+        if getattr(self._local, 'waiting', False):
+            # ie: Thread.join waits for a Condition on Python 2
+            return wait(timeout)
+        self._local.waiting = True
+        result = False
+        with self.lock:
+            me = self._enter()
+            waiter = _Waiter()
+            self._block(waiter, timeout)
+            if thread is not None:
+                self._joiners.setdefault(thread, []).append(waiter)
+            if condition is not None:
+                self._waiting[condition] = self._waiting.get(condition, 0) + 1
+        try:
+            while True:
+                result = wait(POLL_INTERVAL)
+                with self.lock:
+                    if result or waiter.state == _Waiter.EXPIRED:
+                        break
+                    if ((self._running <= 0 or self._stalled()) and
+                            waiter.state == _Waiter.BLOCKED):
+                        self._advance()
+        finally:
+            with self.lock:
+                notified = (condition is not None and result and
+                            self._notified.get(condition))
+                if condition is not None:
+                    self._waiting[condition] -= 1
+                    if not self._waiting[condition]:
+                        del self._waiting[condition]
+                if notified:
+                    self._notified[condition] -= 1
+                    if not self._notified[condition]:
+                        del self._notified[condition]
+                if waiter.state == _Waiter.BLOCKED:
+                    waiter.state = _Waiter.WOKEN
+                    if not notified:
+                        self._running += 1
+                elif notified:
+                    # Counted as running by the notify too
+                    self._running -= 1
+                if thread is not None and waiter in self._joiners.get(
+                        thread, ()):
+                    self._joiners[thread].remove(waiter)
+                self._leave(me)
+                self._notify()
+            self._local.waiting = False
+        return result
+
+    def notified(self, condition, count):
+        """Count the threads a Condition wakes as running."""
+        with self.lock:
+            count = min(count, self._waiting.get(condition, 0) -
+                        self._notified.get(condition, 0))
+            if count > 0:
+                self._notified[condition] = (
+                    self._notified.get(condition, 0) + count)
+                self._running += count
+                self._notify()
+
+
+def _locked(f):
+    def _wrapper(self, *args, **kwargs):
+        with self._clock.lock:
+            return f(self, *args, **kwargs)
+    return _wrapper
+
+
+class FakeFilesystem(object):
+    """In-memory tree of files, directories and symlinks.
+
+    Watchers added to it are called with the path of every entry added or
+    removed, and of every file written, with the lock of the clock held.
+    """
+
+    def __init__(self, clock):
+        self._clock = clock
+        self._dirs = {'/': set()}
+        self._files = {}
+        self._links = {}
+        self._writers = {}
+        self._mtimes = {}
+        self.watchers = set()
+        for root in ROOTS:
+            self.makedirs(root)
+
+    @staticmethod
+    def owns(path):
+        if not isinstance(path, six.string_types):
+            return False
+        return (path in ROOTS or path.startswith('/dev/') or
+                path.startswith('/sys/'))
+
+    def _changed(self, path, entry):
+        for watcher in list(self.watchers):
+            watcher.changed(path, entry)
+
+    def _resolve_parent(self, path):
+        """Normalize a path, following the links of its parents only."""
+        parent, name = posixpath.split(posixpath.normpath(path))
+        return posixpath.join(self.realpath(parent), name)
+
+    def _add(self, path):
+        parent, name = posixpath.split(path)
+        if parent not in self._dirs:
+            self.makedirs(parent)
+        self._dirs[parent].add(name)
+        self._mtimes[parent] = self._clock.time()
+        self._changed(path, True)
+
+    @_locked
+    def makedirs(self, path):
+        path = self._resolve_parent(path)
+        if path in self._dirs:
+            return
+        self._dirs[path] = set()
+        self._add(path)
+
+    @_locked
+    def create_file(self, path, content='', writer=None):
+        """Add a file, writes to it call writer if given."""
+        path = self._resolve_parent(path)
+        if path in self._files:
+            self._files[path] = content
+            self._changed(path, False)
+            return
+        self._files[path] = content
+        if writer:
+            self._writers[path] = writer
+        self._add(path)
+
+    @_locked
+    def create_link(self, path, target):
+        path = self._resolve_parent(path)
+        self._links[path] = target
+        self._add(path)
+
+    @_locked
+    def remove(self, path):
+        """Remove a file, link or directory with everything under it."""
+        path = self._resolve_parent(path)
+        for name in list(self._dirs.get(path, ())):
+            self.remove(posixpath.join(path, name))
+        for entries in (self._files, self._links, self._writers, self._dirs):
+            entries.pop(path, None)
+        parent, name = posixpath.split(path)
+        if name in self._dirs.get(parent, ()):
+            self._dirs[parent].discard(name)
+            self._mtimes[parent] = self._clock.time()
+            self._changed(path, True)
+
+    @_locked
+    def realpath(self, path):
+        parts = [part for part in posixpath.normpath(path).split('/')
+                 if part]
+        resolved = '/'
+        links = 0
+        while parts:
+            resolved = posixpath.join(resolved, parts.pop(0))
+            target = self._links.get(resolved)
+            if target is not None and links < 40:
+                links += 1
+                target = posixpath.normpath(posixpath.join(
+                    posixpath.dirname(resolved), target))
+                parts = [part for part in target.split('/') if part] + parts
+                resolved = '/'
+        return resolved
+
+    @_locked
+    def exists(self, path):
+        path = self.realpath(path)
+        return path in self._files or path in self._dirs
+
+    @_locked
+    def isdir(self, path):
+        return self.realpath(path) in self._dirs
+
+    @_locked
+    def islink(self, path):
+        return self._resolve_parent(path) in self._links
+
+    @_locked
+    def read(self, path):
+        return self._files.get(self.realpath(path))
+
+    @_locked
+    def write(self, path, content):
+        path = self.realpath(path)
+        if path not in self._files:
+            raise IOError(errno.ENOENT, 'No such file or directory', path)
+        writer = self._writers.get(path)
+        if writer:
+            writer(content)
+        else:
+            self._files[path] = content
+            self._changed(path, False)
+
+    @_locked
+    def listdir(self, path):
+        path = self.realpath(path)
+        if path not in self._dirs:
+            raise OSError(errno.ENOENT, 'No such file or directory', path)
+        return sorted(self._dirs[path])
+
+    @_locked
+    def stat(self, path):
+        path = self.realpath(path)
+        if path in self._dirs:
+            mode = stat.S_IFDIR | 0o755
+        elif path in self._files:
+            mode = (stat.S_IFBLK if path.startswith('/dev/') else
+                    stat.S_IFREG) | 0o644
+        else:
+            raise OSError(errno.ENOENT, 'No such file or directory', path)
+        mtime = self._mtimes.get(path, EPOCH)
+        return os.stat_result((mode, 0, 0, 1, 0, 0, 0, mtime, mtime, mtime))
+
+    def walk(self, top):
+        top = self.realpath(top)
+        if not self.isdir(top):
+            return
+        names = self.listdir(top)
+        dirs = [n for n in names if self.isdir(posixpath.join(top, n))]
+        files = [n for n in names if n not in dirs]
+        yield top, dirs, files
+        for name in dirs:
+            for entry in self.walk(posixpath.join(top, name)):
+                yield entry
+
+    @_locked
+    def glob(self, pattern):
+        directory, name = posixpath.split(pattern)
+        if glob.has_magic(directory):
+            parents = [path for path in self.glob(directory)
+                       if self.isdir(path)]
+        else:
+            parents = [directory] if self.isdir(directory) else []
+        return [posixpath.join(parent, entry) for parent in parents
+                for entry in fnmatch.filter(self.listdir(parent), name)]
+
+    def open(self, path, mode='r'):
+        """Open a file to read it, like the builtin open."""
+        content = self.read(path)
+        if content is None:
+            raise IOError(errno.EISDIR if self.isdir(path) else errno.ENOENT,
+                          'Cannot open', path)
+        if 'b' in mode:
+            if isinstance(content, six.text_type):
+                content = content.encode('utf-8')
+            return io.BytesIO(content)
+        return io.StringIO(six.text_type(content))
+
+
+def _get_uevent(path):
+    """Build the uevent a change to a path of the fake host would send.
+
+    :returns: the properties of the uevent, or None if its subsystem is
+              unknown.
+    """
+    parts = path.split('/')
+    if path.startswith('/sys/class/') and len(parts) > 3:
+        event = {'SUBSYSTEM': parts[3]}
+        if len(parts) > 4:
+            event['DEVNAME'] = parts[4]
+        return event
+    if path.startswith('/sys/block/') and len(parts) > 3:
+        return {'SUBSYSTEM': 'block', 'DEVNAME': parts[3]}
+    if path.startswith('/dev/') and len(parts) > 2:
+        if parts[2] in ('disk', 'mapper'):
+            return {'SUBSYSTEM': 'block'}
+        return {'SUBSYSTEM': 'block', 'DEVNAME': parts[2]}
+    if path.startswith(('/sys/devices/', '/sys/bus/scsi/')):
+        return {'SUBSYSTEM': 'scsi'}
+    return None
+
+
+class _FakeWatcher(object):
+    """device_waiter watcher woken by changes to the fake host.
+
+    :param match: function called with the path of every change and
+                  whether it added or removed an entry, that returns True
+                  for the changes the watcher is woken by.
+    """
+
+    def __init__(self, host, match):
+        self._host = host
+        self._match = match
+        self._waiter = _Waiter()
+        self._woken = False
+        self._events = []
+        with host.clock.lock:
+            host.fs.watchers.add(self)
+
+    def arm(self):
+        pass
+
+    def changed(self, path, entry):
+        if self._match(path, entry):
+            self._woken = True
+            if self._events is not None:
+                event = _get_uevent(path)
+                if event is None:
+                    # Like a lost uevent, anything may have changed
+                    self._events = None
+                else:
+                    self._events.append(event)
+            self._host.clock.wake(self._waiter)
+
+    def get_events(self, timeout):
+        clock = self._host.clock
+        with clock.lock:
+            if not self._woken:
+                # Even with no timeout, like select it takes a little
+                # while, otherwise timeouts could never expire.
+                clock.wait(self._waiter, timeout)
+            # Forget the wake ups that came while nobody waited
+            self._waiter.state = _Waiter.IDLE
+            self._woken = False
+            events, self._events = self._events, []
+            return events
+
+    def wait(self, timeout):
+        events = self.get_events(timeout)
+        return events is None or bool(events)
+
+    def close(self):
+        with self._host.clock.lock:
+            self._host.fs.watchers.discard(self)
+
+
+class _FakeDirectoryWatcher(_FakeWatcher):
+    """Wake up when entries are added to or removed from directories."""
+
+    def __init__(self, host, directories):
+        super(_FakeDirectoryWatcher, self).__init__(host, self._is_watched)
+        self._directories = directories
+        self._watched = set()
+
+    def arm(self):
+        # Like inotify, directories that don't exist yet are watched
+        # through their closest existing ancestor.
+        for directory in self._directories:
+            directory = posixpath.normpath(directory)
+            while not self._host.fs.isdir(directory) and directory != '/':
+                directory = posixpath.dirname(directory)
+            self._watched.add(self._host.fs.realpath(directory))
+
+    def _is_watched(self, path, entry):
+        return entry and posixpath.dirname(path) in self._watched
+
+
+class _ScsiDevice(object):
+
+    def __init__(self, name, hctl, wwn, links, path):
+        self.name = name
+        self.hctl = hctl
+        self.wwn = wwn
+        self.links = links
+        # Directory of the SCSI device in /sys/devices
+        self.path = path
+
+
+def _sd_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = chr(ord('a') + rest) + name
+    return 'sd' + name
+
+
+def _by_path_lun(lun):
+    """LUN as udev writes it in the /dev/disk/by-path links."""
+    if lun < 256:
+        return str(lun)
+    return '0x%04x%04x00000000' % (lun & 0xffff, lun >> 16 & 0xffff)
+
+
+def _parse_size(size):
+    """Parse an LVM size like 1g or 512M, in GiB."""
+    units = {'m': 1.0 / 1024, 'g': 1.0, 't': 1024.0}
+    size = size.lower()
+    if size[-1] in units:
+        return float(size[:-1]) * units[size[-1]]
+    return float(size) / 1024
+
+
+def _sectors(size):
+    """Size in 512 byte sectors of a volume of size GiB."""
+    return str(int(size * 1024 ** 3) // 512)
+
+
+class FakeHost(object):
+    """Storage view of a simulated host.
+
+    :param latencies: virtual seconds commands take, updates
+                      DEFAULT_LATENCIES.
+    :param jitter: commands take up to this fraction more or less than
+                   their latency, from random generators seeded with seed
+                   and the command, so the latency of a command doesn't
+                   depend on the order threads run them in.
+    :param device_arrival_delay: seconds from a login or scan to the devices
+                                 showing up.
+    :param udev_delay: seconds from a device change to its /dev/disk links
+                       being updated.
+    :param multipath: whether multipathd builds maps for the devices.
+    """
+
+    def __init__(self, latencies=None, jitter=0.2, seed=0,
+                 device_arrival_delay=0.5, udev_delay=0.05,
+                 multipath=False):
+        self.clock = VirtualClock()
+        self.fs = FakeFilesystem(self.clock)
+        self.latencies = dict(DEFAULT_LATENCIES)
+        self.latencies.update(latencies or {})
+        self.jitter = jitter
+        self.device_arrival_delay = device_arrival_delay
+        self.udev_delay = udev_delay
+        self.multipath = multipath
+        self.seed = seed
+        # Times each command line has been run, for the jitter
+        self._runs = {}
+        # Number of commands run, by "binary subcommand"
+        self.commands = {}
+        # Commands no fake exists for
+        self.unknown_commands = []
+
+        # Backend: volumes by WWN, the LUNs of each iSCSI target and FC port
+        self.volume_sizes = {}
+        self.iscsi_targets = {}
+        self.fc_targets = {}
+        self.fc_hbas = []
+        self.volume_groups = {}
+
+        # Initiator side
+        self.nodes = set()
+        self.sessions = {}
+        self.devices = {}
+        self.maps = {}
+        self._sid = itertools.count(1)
+        self._scsi_host = itertools.count(10)
+        self._sd_index = itertools.count()
+        self._dm_index = itertools.count()
+        # FC remote port number of each target port
+        self._rport_ids = {}
+
+    # Backend
+
+    def add_iscsi_lun(self, portals, iqn, lun, wwn, size=1):
+        """Export a volume of size GiB through an iSCSI target."""
+        self.volume_sizes[wwn] = size
+        for portal in portals:
+            self.iscsi_targets.setdefault((portal, iqn), {})[lun] = wwn
+
+    def add_fc_hba(self, port_name, node_name, pci='0000:05:00.2'):
+        host = next(self._scsi_host)
+        self.fc_hbas.append({'host': host, 'port_name': port_name,
+                             'node_name': node_name, 'pci': pci})
+        self.fs.create_file('/sys/class/scsi_host/host%s/proc_name' % host,
+                            'qla2xxx')
+        self.fs.create_file('/sys/class/scsi_host/host%s/scan' % host,
+                            writer=lambda content: self._fc_scan(host,
+                                                                 content))
+        self._add_rports()
+        return host
+
+    def add_fc_lun(self, target_wwpns, lun, wwn, size=1):
+        """Export a volume of size GiB through Fibre Channel ports."""
+        self.volume_sizes[wwn] = size
+        for wwpn in target_wwpns:
+            self.fc_targets.setdefault(wwpn, {})[lun] = wwn
+        self._add_rports()
+
+    def add_volume_group(self, name, size=1024, pv='/dev/loop0'):
+        self.volume_groups[name] = {'size': float(size), 'pv': pv,
+                                    'lvs': {}}
+
+    def resize_volume(self, wwn, size):
+        """Change the size of a volume on the backend, in GiB."""
+        self.volume_sizes[wwn] = size
+
+    # Devices
+
+    def _add_device(self, hctl, wwn, links, parent):
+        """Add the SCSI device of a LUN under its session or remote port."""
+        if any(device.hctl == hctl for device in self.devices.values()):
+            return
+        name = _sd_name(next(self._sd_index))
+        address = ':'.join(map(str, hctl))
+        path = '%s/target%s:%s:%s/%s' % (parent, hctl[0], hctl[1], hctl[2],
+                                         address)
+        device = _ScsiDevice(name, hctl, wwn, links, path)
+        self.devices[name] = device
+        self.fs.create_file('/dev/%s' % name)
+        self.fs.create_file('%s/delete' % path,
+                            writer=lambda content: self._remove_device(name))
+        self.fs.create_file('%s/rescan' % path,
+                            writer=lambda content: self._rescan_device(name))
+        self.fs.create_file('%s/wwid' % path, 'naa.%s' % wwn[1:])
+        self.fs.makedirs('%s/block/%s' % (path, name))
+        self.fs.create_link('/sys/block/%s/device' % name, path)
+        self.fs.create_file('/sys/block/%s/size' % name,
+                            _sectors(self.volume_sizes[wwn]))
+        self.fs.create_file('/sys/block/%s/ro' % name, '0')
+        self.fs.create_link('/sys/class/block/%s' % name,
+                            '/sys/block/%s' % name)
+        self.fs.create_link('/sys/bus/scsi/drivers/sd/%s' % address, path)
+        self.clock.call_later(self.udev_delay, self._add_links, device)
+        if self.multipath:
+            self.clock.call_later(self.udev_delay, self._add_to_map, device)
+
+    def _rescan_device(self, name):
+        device = self.devices[name]
+        self.fs.create_file('/sys/block/%s/size' % name,
+                            _sectors(self.volume_sizes[device.wwn]))
+
+    def _add_links(self, device):
+        if device.name not in self.devices:
+            return
+        for link in device.links + ['/dev/disk/by-id/scsi-%s' % device.wwn]:
+            self.fs.create_link(link, '../../%s' % device.name)
+
+    def _remove_device(self, name):
+        device = self.devices.pop(name, None)
+        if device is None:
+            return
+        self.fs.remove('/dev/%s' % name)
+        self.fs.remove('/sys/bus/scsi/drivers/sd/%s' %
+                       ':'.join(map(str, device.hctl)))
+        self.fs.remove('/sys/class/block/%s' % name)
+        self.fs.remove('/sys/block/%s' % name)
+        self.fs.remove(device.path)
+        # The kernel removes the targets that are left without devices
+        target = posixpath.dirname(device.path)
+        if not self.fs.listdir(target):
+            self.fs.remove(target)
+        self.clock.call_later(self.udev_delay, self._remove_links, device)
+        mpath = self.maps.get(device.wwn)
+        if mpath and name in mpath['paths']:
+            mpath['paths'].remove(name)
+            self.fs.remove('/sys/block/%s/slaves/%s' % (mpath['dm'], name))
+
+    def _remove_links(self, device):
+        for link in device.links + ['/dev/disk/by-id/scsi-%s' % device.wwn]:
+            if self.fs.realpath(link) == '/dev/%s' % device.name:
+                self.fs.remove(link)
+
+    def _add_to_map(self, device):
+        if device.name not in self.devices:
+            return
+        mpath = self.maps.get(device.wwn)
+        if mpath is None:
+            dm = 'dm-%s' % next(self._dm_index)
+            mpath = self.maps[device.wwn] = {'dm': dm, 'paths': []}
+            self.fs.create_file('/sys/block/%s/dm/uuid' % dm,
+                                'mpath-%s' % device.wwn)
+            self.fs.create_file('/sys/block/%s/dm/name' % dm, device.wwn)
+            self.fs.create_file('/sys/block/%s/size' % dm,
+                                _sectors(self.volume_sizes[device.wwn]))
+            self.fs.create_file('/sys/block/%s/ro' % dm, '0')
+            self.fs.makedirs('/sys/block/%s/slaves' % dm)
+            self.fs.create_link('/sys/class/block/%s' % dm,
+                                '/sys/block/%s' % dm)
+            self.fs.create_file('/dev/%s' % dm)
+            self.fs.create_link('/dev/mapper/%s' % device.wwn, '../%s' % dm)
+            self.fs.create_link('/dev/disk/by-id/dm-uuid-mpath-%s' %
+                                device.wwn, '../../%s' % dm)
+        mpath['paths'].append(device.name)
+        self.fs.create_link('/sys/block/%s/slaves/%s' % (mpath['dm'],
+                                                         device.name),
+                            '/sys/block/%s' % device.name)
+
+    def _remove_map(self, wwn):
+        mpath = self.maps.pop(wwn)
+        self.fs.remove('/dev/%s' % mpath['dm'])
+        self.fs.remove('/dev/mapper/%s' % wwn)
+        self.fs.remove('/dev/disk/by-id/dm-uuid-mpath-%s' % wwn)
+        self.fs.remove('/sys/class/block/%s' % mpath['dm'])
+        self.fs.remove('/sys/block/%s' % mpath['dm'])
+
+    def _find_map(self, device):
+        if device.startswith('/'):
+            device = self.fs.realpath(device)
+        for wwn, mpath in self.maps.items():
+            if device in (wwn, '/dev/mapper/%s' % wwn,
+                          '/dev/%s' % mpath['dm']) or (
+                    device.replace('/dev/', '') in mpath['paths']):
+                return wwn
+        return None
+
+    def _find_device(self, path):
+        return self.devices.get(
+            posixpath.basename(self.fs.realpath(path)))
+
+    @staticmethod
+    def _parse_scan(content):
+        """Parse what is written to a scan file: channel, target and LUN."""
+        return [None if value == '-' else int(value)
+                for value in content.split()]
+
+    # iSCSI
+
+    def _scan_session(self, key, lun=None):
+        session = self.sessions.get(key)
+        if session is None:
+            return
+        portal, iqn = key
+        for lun_id, wwn in sorted(self.iscsi_targets.get(key, {}).items()):
+            if lun not in (None, lun_id):
+                continue
+            link = '/dev/disk/by-path/ip-%s-iscsi-%s-lun-%s' % (
+                portal, iqn, _by_path_lun(lun_id))
+            self._add_device((session['host'], 0, 0, lun_id), wwn, [link],
+                             session['path'])
+
+    def _iscsi_scan(self, key, content):
+        channel, target_id, lun = self._parse_scan(content)
+        if channel in (None, 0) and target_id in (None, 0):
+            self.clock.call_later(self.device_arrival_delay,
+                                  self._scan_session, key, lun)
+
+    def _add_session(self, key):
+        portal, iqn = key
+        sid = next(self._sid)
+        host = next(self._scsi_host)
+        path = '/sys/devices/platform/host%s/session%s' % (host, sid)
+        self.sessions[key] = {'sid': sid, 'host': host, 'path': path}
+        self.fs.makedirs(path)
+        session = '/sys/class/iscsi_session/session%s' % sid
+        self.fs.create_file('%s/targetname' % session, iqn)
+        self.fs.create_file('%s/tpgt' % session, '1')
+        self.fs.create_link('%s/device' % session, path)
+        address, _sep, port = portal.rpartition(':')
+        connection = '/sys/class/iscsi_connection/connection%s:0' % sid
+        self.fs.create_file('%s/persistent_address' % connection,
+                            address.strip('[]'))
+        self.fs.create_file('%s/persistent_port' % connection, port)
+        self.fs.create_file('/sys/class/scsi_host/host%s/proc_name' % host,
+                            'iscsi_tcp')
+        self.fs.create_file('/sys/class/scsi_host/host%s/scan' % host,
+                            writer=lambda content: self._iscsi_scan(key,
+                                                                    content))
+
+    def _remove_session(self, key):
+        session = self.sessions.pop(key)
+        for device in list(self.devices.values()):
+            if device.hctl[0] == session['host']:
+                self._remove_device(device.name)
+        self.fs.remove('/sys/class/iscsi_session/session%s' % session['sid'])
+        self.fs.remove('/sys/class/iscsi_connection/connection%s:0' %
+                       session['sid'])
+        self.fs.remove('/sys/class/scsi_host/host%s' % session['host'])
+        self.fs.remove(posixpath.dirname(session['path']))
+
+    def _iscsiadm(self, args):
+        opts = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ('-m', '-T', '-p', '-t', '-I', '--interface',
+                           '--op', '-o'):
+                opts[args[i]] = args[i + 1]
+                i += 2
+            elif args[i] in ('-n', '-v'):
+                opts.setdefault(args[i], []).append(args[i + 1])
+                i += 2
+            else:
+                flags.add(args[i])
+                i += 1
+        mode = opts.get('-m')
+
+        if mode == 'session':
+            if '--rescan' in flags:
+                for key in list(self.sessions):
+                    self._schedule_scan(key)
+                return ''
+            if not self.sessions:
+                return 21, '', 'iscsiadm: No active sessions.\n'
+            return ''.join('tcp: [%s] %s,1 %s (non-flash)\n' %
+                           (session['sid'], key[0], key[1])
+                           for key, session in sorted(self.sessions.items()))
+
+        if mode in ('discovery', 'discoverydb'):
+            portal = opts.get('-p', '').split(',')[0]
+            return ''.join('%s,1 %s\n' % (p, iqn)
+                           for p, iqn in sorted(self.iscsi_targets)
+                           if p == portal)
+
+        if mode == 'iface':
+            return 'iface.transport_name = tcp\n'
+
+        if mode != 'node':
+            return 1, '', 'iscsiadm: unsupported mode\n'
+
+        if '--rescan' in flags and '-T' not in opts:
+            for key in list(self.sessions):
+                self._schedule_scan(key)
+            return ''
+
+        key = (opts['-p'].split(',')[0], opts['-T'])
+        op = opts.get('--op')
+        if op == 'new':
+            if key not in self.iscsi_targets:
+                return 8, '', 'iscsiadm: Could not connect to target\n'
+            self.nodes.add(key)
+            return 'New iSCSI node [tcp:[hw=,ip=,net_if=,iscsi_if=default] ' \
+                   '%s,-1 %s] added\n' % key
+        if key not in self.nodes:
+            return 21, '', 'iscsiadm: No records found\n'
+        if op == 'update':
+            return ''
+        if op == 'delete':
+            self.nodes.discard(key)
+            return ''
+        if '--login' in flags:
+            if key in self.sessions:
+                return 15, '', 'iscsiadm: session exists\n'
+            self._add_session(key)
+            # The kernel scans the LUNs of new sessions
+            self._schedule_scan(key)
+            return 'Login to [iface: default, target: %s, portal: %s,3260] ' \
+                   'successful.\n' % (key[1], key[0])
+        if '--logout' in flags:
+            if key not in self.sessions:
+                return 21, '', 'iscsiadm: No matching sessions found\n'
+            self._remove_session(key)
+            return ''
+        if '--rescan' in flags:
+            self._schedule_scan(key)
+            return ''
+        return ''
+
+    def _schedule_scan(self, key):
+        self.clock.call_later(self.device_arrival_delay, self._scan_session,
+                              key)
+
+    # Fibre Channel
+
+    def _get_rport(self, hba, wwpn):
+        """Directory of the remote port of a target port on an HBA."""
+        return ('/sys/devices/pci0000:00/0000:00:03.0/%s/host%s/rport-%s:0-%s'
+                % (hba['pci'], hba['host'], hba['host'],
+                   self._rport_ids[wwpn]))
+
+    def _add_rports(self):
+        """Add the remote ports every HBA sees, all the targets."""
+        for wwpn in sorted(self.fc_targets):
+            if wwpn not in self._rport_ids:
+                self._rport_ids[wwpn] = len(self._rport_ids)
+            for hba in self.fc_hbas:
+                self.fs.makedirs(self._get_rport(hba, wwpn))
+                rport = '/sys/class/fc_remote_ports/rport-%s:0-%s' % (
+                    hba['host'], self._rport_ids[wwpn])
+                self.fs.create_file('%s/port_name' % rport, '0x%s' % wwpn)
+                self.fs.create_file('%s/node_name' % rport, '0x%s' % wwpn)
+                self.fs.create_file('%s/port_state' % rport, 'Online')
+
+    def _fc_scan(self, host, content):
+        channel, target_id, lun = self._parse_scan(content)
+        hba = next(hba for hba in self.fc_hbas if hba['host'] == host)
+        for wwpn, luns in sorted(self.fc_targets.items()):
+            index = self._rport_ids[wwpn]
+            if channel not in (None, 0) or target_id not in (None, index):
+                continue
+            for lun_id, wwn in sorted(luns.items()):
+                if lun not in (None, lun_id):
+                    continue
+                link = '/dev/disk/by-path/pci-%s-fc-0x%s-lun-%s' % (
+                    hba['pci'], wwpn, _by_path_lun(lun_id))
+                self.clock.call_later(self.device_arrival_delay,
+                                      self._add_device,
+                                      (host, 0, index, lun_id), wwn, [link],
+                                      self._get_rport(hba, wwpn))
+
+    def _systool(self, args):
+        out = ['Class = "fc_host"', '']
+        for hba in self.fc_hbas:
+            out.extend([
+                '  Class Device = "host%s"' % hba['host'],
+                '  Class Device path = "/sys/devices/pci0000:00/0000:00:03.0/'
+                '%s/host%s/fc_host/host%s"' % (hba['pci'], hba['host'],
+                                               hba['host']),
+                '    node_name           = "0x%s"' % hba['node_name'],
+                '    port_name           = "0x%s"' % hba['port_name'],
+                '    port_state          = "Online"',
+                '',
+                '',
+            ])
+        return '\n'.join(out) + '\n'
+
+    # SCSI devices and multipath
+
+    def _scsi_id(self, args):
+        device = self._find_device(args[-1])
+        if device is None:
+            return 1, '', ''
+        return device.wwn + '\n'
+
+    def _sg_scan(self, args):
+        device = self._find_device(args[-1])
+        if device is None:
+            return 1, '', ''
+        host, channel, target_id, lun = device.hctl
+        return ('%s: scsi%s channel=%s id=%s lun=%s [em]\n' %
+                (args[-1], host, channel, target_id, lun))
+
+    def _blockdev(self, args):
+        if '--getsize64' in args:
+            # The size the kernel knows, which only changes on a rescan or
+            # a resize of the multipath map.
+            name = posixpath.basename(self.fs.realpath(args[-1]))
+            sectors = self.fs.read('/sys/block/%s/size' % name)
+            if sectors is None:
+                return 1, '', 'blockdev: cannot open %s\n' % args[-1]
+            return '%d\n' % (int(sectors) * 512)
+        return ''
+
+    def _tee(self, args, process_input):
+        try:
+            self.fs.write(args[-1], process_input)
+        except IOError:
+            return 1, '', 'tee: %s: No such file or directory\n' % args[-1]
+        return process_input
+
+    def _format_map(self, wwn):
+        mpath = self.maps[wwn]
+        lines = ['%s %s LIO-ORG,IBLOCK' % (wwn, mpath['dm']),
+                 "size=%sG features='0' hwhandler='0' wp=rw" %
+                 self.volume_sizes[wwn]]
+        for name in mpath['paths']:
+            device = self.devices[name]
+            lines.append("`-+- policy='service-time 0' prio=1 "
+                         "status=active")
+            lines.append('  `- %s %s 8:0 active ready running' %
+                         (':'.join(map(str, device.hctl)), name))
+        return '\n'.join(lines) + '\n'
+
+    def _multipath(self, args):
+        if not self.multipath:
+            return 1, '', 'multipath: not running\n'
+        if args[0] in ('-ll', '-l'):
+            if len(args) > 1:
+                wwn = self._find_map(args[1])
+                return self._format_map(wwn) if wwn else ''
+            return ''.join(self._format_map(wwn)
+                           for wwn in sorted(self.maps))
+        if args[0] == '-f':
+            wwn = self._find_map(args[1])
+            if wwn is None:
+                return 1, '', '%s: map does not exist\n' % args[1]
+            self._remove_map(wwn)
+            return ''
+        if args[0] == '-F':
+            for wwn in list(self.maps):
+                self._remove_map(wwn)
+        return ''
+
+    def _multipathd(self, args):
+        if not self.multipath:
+            return 1, '', 'multipathd: not running\n'
+        if args[:2] == ['resize', 'map']:
+            wwn = self._find_map(args[2])
+            if wwn is None:
+                return 'fail\n'
+            self.fs.create_file('/sys/block/%s/size' % self.maps[wwn]['dm'],
+                                _sectors(self.volume_sizes[wwn]))
+        return 'ok\n'
+
+    def _lsblk(self, args):
+        lines = ['%s 0' % name for name in sorted(self.devices)]
+        lines.extend('%s (%s) 0' % (wwn, mpath['dm'])
+                     for wwn, mpath in sorted(self.maps.items()))
+        return '\n'.join(lines) + '\n'
+
+    # LVM
+
+    def _get_lv(self, spec):
+        vg_name, _sep, lv_name = spec.partition('/')
+        vg = self.volume_groups.get(vg_name)
+        if vg is None or lv_name not in vg['lvs']:
+            return None, None
+        return vg, lv_name
+
+    @staticmethod
+    def _lvm_args(args):
+        """Split the arguments of an LVM report into fields and names."""
+        fields = ''
+        names = []
+        args = iter(args)
+        for arg in args:
+            if arg == '-o':
+                fields = next(args)
+            elif arg == '--separator':
+                next(args)
+            elif not arg.startswith('-'):
+                names.append(arg)
+        return fields.split(','), names
+
+    def _vgs(self, args):
+        fields, names = self._lvm_args(args)
+        for name in names:
+            if name not in self.volume_groups:
+                return 5, '', '  Volume group "%s" not found\n' % name
+        out = ''
+        for name in names or sorted(self.volume_groups):
+            vg = self.volume_groups[name]
+            used = sum(vg['lvs'].values())
+            values = {'name': name, 'uuid': '%s-uuid' % name,
+                      'size': '%.2f' % vg['size'],
+                      'free': '%.2f' % (vg['size'] - used),
+                      'lv_count': str(len(vg['lvs']))}
+            out += '  %s\n' % ':'.join(values[field] for field in fields)
+        return out
+
+    def _pvs(self, args):
+        out = ''
+        for name, vg in sorted(self.volume_groups.items()):
+            used = sum(vg['lvs'].values())
+            out += '  %s|%s|%.2f|%.2f\n' % (name, vg['pv'], vg['size'],
+                                            vg['size'] - used)
+        return out
+
+    def _lvs(self, args):
+        _fields, names = self._lvm_args(args)
+        spec = names[0] if names else None
+        if spec and '/' in spec and self._get_lv(spec)[0] is None:
+            return 5, '', '  Failed to find logical volume "%s"\n' % spec
+        out = ''
+        for vg_name, vg in sorted(self.volume_groups.items()):
+            for lv_name, size in sorted(vg['lvs'].items()):
+                if spec in (None, vg_name, '%s/%s' % (vg_name, lv_name)):
+                    out += '  %s %s %.2f\n' % (vg_name, lv_name, size)
+        return out
+
+    def _lvcreate(self, args):
+        name = args[args.index('-n') + 1]
+        vg_name = next(arg for arg in args if arg in self.volume_groups)
+        size = _parse_size(args[args.index('-L') + 1])
+        vg = self.volume_groups[vg_name]
+        if name in vg['lvs']:
+            return 5, '', '  Logical volume "%s" already exists\n' % name
+        vg['lvs'][name] = size
+        self.fs.create_file('/dev/%s/%s' % (vg_name, name))
+        return '  Logical volume "%s" created.\n' % name
+
+    def _lvremove(self, args):
+        vg, lv_name = self._get_lv(args[-1])
+        if vg is None:
+            return 5, '', '  Failed to find logical volume "%s"\n' % args[-1]
+        del vg['lvs'][lv_name]
+        self.fs.remove('/dev/%s' % args[-1])
+        return '  Logical volume "%s" successfully removed\n' % lv_name
+
+    def _lvextend(self, args):
+        vg, lv_name = self._get_lv(args[-1])
+        if vg is None:
+            return 5, '', '  Failed to find logical volume "%s"\n' % args[-1]
+        vg['lvs'][lv_name] = _parse_size(args[args.index('-L') + 1])
+        return ''
+
+    def _lvdisplay(self, args):
+        vg, _lv_name = self._get_lv(args[-1])
+        if vg is None:
+            return 5, '', '  Failed to find logical volume "%s"\n' % args[-1]
+        return '  -wi-a-----\n'
+
+    # Commands
+
+    def _run(self, binary, args, process_input):
+        if binary == 'iscsiadm':
+            return self._iscsiadm(args)
+        if binary == 'tee':
+            return self._tee(args, process_input)
+        if binary in ('udevadm', 'lvchange', 'dd'):
+            return ''
+        if binary == 'grep':
+            # rescan_hosts looking for the FC targets, let it use wildcards
+            return ''
+        handler = getattr(self, '_' + binary.replace('-', '_'), None)
+        if handler is None:
+            self.unknown_commands.append(binary)
+            return 127, '', '%s: command not found\n' % binary
+        return handler(args)
+
+    def _get_random(self, cmd):
+        # Seeded with the command line and how many times it ran, not shared
+        # by all the commands, which the threads run in no given order.
+        cmdline = ' '.join(cmd)
+        runs = self._runs[cmdline] = self._runs.get(cmdline, 0) + 1
+        return random.Random('%s:%s:%s' % (self.seed, cmdline, runs))
+
+    def _get_latency(self, binary, subcommand, out, rand):
+        latency = self.latencies.get(
+            ('%s %s' % (binary, subcommand)).strip(),
+            self.latencies.get(binary, DEFAULT_LATENCY))
+        if isinstance(latency, tuple):
+            base, per_line = latency
+            latency = base + per_line * out.count('\n')
+        if self.jitter:
+            latency *= rand.uniform(1 - self.jitter, 1 + self.jitter)
+        return latency
+
+    def execute(self, *cmd, **kwargs):
+        """Run a command on the fake host, like processutils.execute."""
+        process_input = kwargs.pop('process_input', None)
+        check_exit_code = kwargs.pop('check_exit_code', [0])
+        attempts = kwargs.pop('attempts', 1)
+        delay_on_retry = kwargs.pop('delay_on_retry', True)
+        for key in ('run_as_root', 'root_helper', 'shell'):
+            kwargs.pop(key, None)
+        if kwargs:
+            raise putils.UnknownArgumentError(
+                'Got unknown keyword args: %r' % kwargs)
+
+        if len(cmd) == 1 and ' ' in cmd[0]:
+            # Commands given as a single string, ie: grep in linuxfc
+            cmd = tuple(cmd[0].split())
+        cmd = tuple(str(arg) for arg in cmd)
+        binary, subcommand = metrics.get_command_key(cmd)
+        args = list(cmd)
+        # LVM commands are run through env to set the locale
+        while args and (posixpath.basename(args[0]) == 'env' or
+                        '=' in args[0]):
+            args.pop(0)
+        args = args[1:]
+
+        ignore_exit_code = False
+        if isinstance(check_exit_code, bool):
+            ignore_exit_code = not check_exit_code
+            check_exit_code = [0]
+        elif isinstance(check_exit_code, int):
+            check_exit_code = [check_exit_code]
+
+        key = ('%s %s' % (binary, subcommand)).strip()
+        while True:
+            attempts -= 1
+            with self.clock.lock:
+                self.commands[key] = self.commands.get(key, 0) + 1
+                rand = self._get_random(cmd)
+                result = self._run(binary, args, process_input)
+                if not isinstance(result, tuple):
+                    result = (0, result, '')
+                exit_code, out, err = result
+                latency = self._get_latency(binary, subcommand, out, rand)
+            self.clock.sleep(latency)
+            if ignore_exit_code or exit_code in check_exit_code:
+                return out, err
+            if attempts <= 0:
+                raise putils.ProcessExecutionError(
+                    exit_code=exit_code, stdout=out, stderr=err,
+                    cmd=' '.join(cmd))
+            if delay_on_retry:
+                self.clock.sleep(rand.randint(20, 200) / 100.0)
+
+    # Patching
+
+    def _route(self, fake, real):
+        def _call(path, *args, **kwargs):
+            if self.fs.owns(path):
+                return fake(path)
+            return real(path, *args, **kwargs)
+        return _call
+
+    def _glob(self, pattern, *args, **kwargs):
+        if self.fs.owns(pattern):
+            return self.fs.glob(pattern)
+        return _real_glob(pattern, *args, **kwargs)
+
+    def _open(self, path, mode='r', *args, **kwargs):
+        if self.fs.owns(path):
+            return self.fs.open(path, mode)
+        return _real_open(path, mode, *args, **kwargs)
+
+    def _get_watcher(self, directories):
+        return _FakeDirectoryWatcher(self, directories)
+
+    def _get_uevent_watcher(self, groups=device_waiter.UEVENT_KERNEL_GROUP):
+        if groups & device_waiter.UEVENT_UDEV_GROUP:
+            # udev sends its events for the /dev links too
+            return _FakeWatcher(self, lambda path, entry: True)
+        return _FakeWatcher(self,
+                            lambda path, entry: path.startswith('/sys/'))
+
+    # Threads
+
+    def _thread_start(self, thread):
+        run = thread.run
+
+        def _run():
+            try:
+                run()
+            finally:
+                self.clock.remove_thread(thread)
+
+        thread.run = _run
+        self.clock.add_thread(thread)
+        try:
+            _real_thread_start(thread)
+        except Exception:
+            self.clock.remove_thread(thread)
+            raise
+
+    def _thread_join(self, thread, timeout=None):
+        if not thread.is_alive() or thread is threading.current_thread():
+            return _real_thread_join(thread, timeout)
+
+        def _join(real_timeout):
+            _real_thread_join(thread, real_timeout)
+            return not thread.is_alive()
+
+        self.clock.wait_external(_join, timeout, thread=thread)
+
+    def _condition_wait(self, condition, timeout=None):
+        if condition is self.clock._changed:
+            return _real_condition_wait(condition, timeout)
+        return self.clock.wait_external(
+            lambda real_timeout: _real_condition_wait(condition,
+                                                      real_timeout),
+            timeout, condition=condition)
+
+    def _condition_notify(self, condition, n=1):
+        self.clock.notified(condition,
+                            min(n, len(_get_condition_waiters(condition))))
+        _real_condition_notify(condition, n)
+
+    @contextlib.contextmanager
+    def patch(self):
+        """Make the connectors run on this host while in the context."""
+        patches = [
+            mock.patch('os.path.exists',
+                       self._route(self.fs.exists, _real_exists)),
+            mock.patch('os.path.isdir',
+                       self._route(self.fs.isdir, _real_isdir)),
+            mock.patch('os.path.islink',
+                       self._route(self.fs.islink, _real_islink)),
+            mock.patch('os.path.realpath',
+                       self._route(self.fs.realpath, _real_realpath)),
+            mock.patch('os.listdir',
+                       self._route(self.fs.listdir, _real_listdir)),
+            mock.patch('os.stat', self._route(self.fs.stat, _real_stat)),
+            mock.patch('os.walk', self._route(self.fs.walk, _real_walk)),
+            mock.patch('glob.glob', self._glob),
+            mock.patch('time.sleep', self.clock.sleep),
+            mock.patch('time.time', self.clock.time),
+            mock.patch.object(timeutils, 'now', self.clock.monotonic),
+            mock.patch.object(device_waiter, '_get_watcher',
+                              self._get_watcher),
+            mock.patch.object(device_waiter, 'get_uevent_watcher',
+                              self._get_uevent_watcher),
+            mock.patch.object(host_inventory, '_inventory', None),
+            mock.patch.object(sysfs, 'SYSFS_ROOT', SYSFS_ROOT),
+            mock.patch.object(sysfs, 'open', self._open, create=True),
+            # Functions, not bound methods, so they get the instance
+            mock.patch.object(threading.Thread, 'start',
+                              lambda thread: self._thread_start(thread)),
+            mock.patch.object(threading.Thread, 'join',
+                              lambda thread, timeout=None:
+                              self._thread_join(thread, timeout)),
+            mock.patch.object(_Condition, 'wait',
+                              lambda condition, timeout=None:
+                              self._condition_wait(condition, timeout)),
+            mock.patch.object(_Condition, 'notify',
+                              lambda condition, n=1:
+                              self._condition_notify(condition, n)),
+            mock.patch.object(priv_rootwrap, 'execute', self.execute),
+            mock.patch.object(iscsi, '_discovery_cache', utils.TTLCache()),
+            mock.patch.object(executor, '_command_cache', utils.TTLCache()),
+            mock.patch.object(executor, '_generations', {}),
+        ]
+        for patcher in patches:
+            patcher.start()
+        self.clock.add_thread(threading.current_thread())
+        try:
+            yield self
+        finally:
+            self.clock.remove_thread(threading.current_thread())
+            for patcher in reversed(patches):
+                patcher.stop()
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(-(-percent * len(values) // 100)), 1)
+    return values[min(rank, len(values)) - 1]
@@ -0,0 +1,282 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the connectors on a simulated host.
+
+Connects, extends and disconnects a number of volumes with each protocol on
+a FakeHost and reports the latency and throughput of every operation, in
+the virtual time of the fake host, along with the number of commands each
+operation ran.  Run it with:
+
+    python -m os_brick.tests.benchmarks.run --volumes 1,10,100
+"""
+
+from __future__ import print_function
+
+import abc
+import argparse
+import json
+import logging
+import sys
+import timeit
+
+import six
+
+from os_brick.initiator.connectors import fibre_channel
+from os_brick.initiator.connectors import iscsi
+from os_brick.local_dev import lvm
+from os_brick.tests.benchmarks import fake_host
+
+PROTOCOLS = ('iscsi', 'fc', 'lvm')
+OPERATIONS = ('connect', 'extend', 'disconnect')
+
+PORTALS = ('10.0.0.1:3260', '10.0.1.1:3260')
+TARGET_WWPNS = ('500a098280feeba5', '500a098290feeba5')
+HBA_WWPN = '10000090fa0d6754'
+HBA_WWNN = '20000090fa0d6754'
+VG_NAME = 'stack-volumes'
+
+
+def _wwn(index):
+    return '36001405%024x' % index
+
+
+@six.add_metaclass(abc.ABCMeta)
+class Scenario(object):
+    """Volumes of one protocol, and how to run the operations on them."""
+
+    def __init__(self, host, count, multipath=False):
+        self.host = host
+        self.count = count
+        self.multipath = multipath
+        self.device_info = {}
+
+    def setup(self):
+        pass
+
+    @abc.abstractmethod
+    def connect(self, index):
+        """Attach a volume, keeping its device info in device_info."""
+        pass
+
+    @abc.abstractmethod
+    def extend(self, index):
+        """Grow an attached volume on the backend and extend it."""
+        pass
+
+    @abc.abstractmethod
+    def disconnect(self, index):
+        """Detach a volume attached by connect."""
+        pass
+
+
+class ISCSIScenario(Scenario):
+    """One target per volume, with a path per portal when multipathing."""
+
+    def setup(self):
+        self.connector = iscsi.ISCSIConnector(
+            None, execute=self.host.execute, use_multipath=self.multipath)
+        portals = PORTALS if self.multipath else PORTALS[:1]
+        for index in range(self.count):
+            self.host.add_iscsi_lun(portals, self._iqn(index), 1,
+                                    _wwn(index))
+
+    @staticmethod
+    def _iqn(index):
+        return 'iqn.2010-10.org.openstack:volume-%05d' % index
+
+    def _properties(self, index):
+        properties = {'target_portal': PORTALS[0],
+                      'target_iqn': self._iqn(index),
+                      'target_lun': 1,
+                      'volume_id': 'volume-%05d' % index}
+        if self.multipath:
+            properties.update(target_portals=list(PORTALS),
+                              target_iqns=[self._iqn(index)] * len(PORTALS),
+                              target_luns=[1] * len(PORTALS))
+        return properties
+
+    def connect(self, index):
+        self.device_info[index] = self.connector.connect_volume(
+            self._properties(index))
+
+    def extend(self, index):
+        self.host.resize_volume(_wwn(index), 2)
+        self.connector.extend_volume(self._properties(index))
+
+    def disconnect(self, index):
+        self.connector.disconnect_volume(self._properties(index),
+                                         self.device_info.pop(index))
+
+
+class FibreChannelScenario(Scenario):
+    """One HBA seeing every volume through two target ports."""
+
+    def setup(self):
+        self.connector = fibre_channel.FibreChannelConnector(
+            None, execute=self.host.execute, use_multipath=self.multipath)
+        self.host.add_fc_hba(HBA_WWPN, HBA_WWNN)
+        for index in range(self.count):
+            self.host.add_fc_lun(TARGET_WWPNS, index + 1, _wwn(index))
+
+    def _properties(self, index):
+        return {'target_wwn': list(TARGET_WWPNS),
+                'target_lun': index + 1}
+
+    def connect(self, index):
+        self.device_info[index] = self.connector.connect_volume(
+            self._properties(index))
+
+    def extend(self, index):
+        self.host.resize_volume(_wwn(index), 2)
+        self.connector.extend_volume(self._properties(index))
+
+    def disconnect(self, index):
+        self.connector.disconnect_volume(self._properties(index),
+                                         self.device_info.pop(index))
+
+
+class LVMScenario(Scenario):
+    """Logical volumes of a local volume group.
+
+    There is nothing to attach for LVM, so creating, extending and deleting
+    the logical volumes stand in for the three operations.
+    """
+
+    def setup(self):
+        self.host.add_volume_group(VG_NAME)
+        self.vg = lvm.LVM(VG_NAME, None, executor=self.host.execute)
+
+    @staticmethod
+    def _name(index):
+        return 'volume-%05d' % index
+
+    def connect(self, index):
+        self.vg.create_volume(self._name(index), '1g')
+
+    def extend(self, index):
+        self.vg.extend_volume(self._name(index), '2g')
+
+    def disconnect(self, index):
+        self.vg.delete(self._name(index))
+
+
+SCENARIOS = {'iscsi': ISCSIScenario,
+             'fc': FibreChannelScenario,
+             'lvm': LVMScenario}
+
+
+def run_scenario(protocol, count, multipath=False, **host_options):
+    """Run the operations on count volumes of a protocol.
+
+    :param protocol: one of PROTOCOLS.
+    :param count: number of volumes.
+    :param multipath: whether to connect the volumes with multipathing.
+    :param host_options: arguments of the FakeHost.
+    :returns: list of dictionaries with the results of each operation.
+    """
+    host = fake_host.FakeHost(multipath=multipath, **host_options)
+    scenario = SCENARIOS[protocol](host, count, multipath=multipath)
+    results = []
+    with host.patch():
+        scenario.setup()
+        for operation in OPERATIONS:
+            run = getattr(scenario, operation)
+            latencies = []
+            commands = sum(host.commands.values())
+            start = host.clock.monotonic()
+            wall_start = timeit.default_timer()
+            for index in range(count):
+                op_start = host.clock.monotonic()
+                run(index)
+                latencies.append(host.clock.monotonic() - op_start)
+            total = host.clock.monotonic() - start
+            results.append({
+                'protocol': protocol,
+                'volumes': count,
+                'multipath': multipath,
+                'operation': operation,
+                'throughput': count / total if total else None,
+                'p50': fake_host.percentile(latencies, 50),
+                'p99': fake_host.percentile(latencies, 99),
+                'commands': (sum(host.commands.values()) - commands) /
+                float(count),
+                'wall_time': timeit.default_timer() - wall_start,
+            })
+    if host.unknown_commands:
+        raise RuntimeError('Commands not simulated by the fake host: %s' %
+                           ', '.join(sorted(set(host.unknown_commands))))
+    return results
+
+
+def _print_table(results, stream):
+    header = ('%-6s %7s %-10s %12s %10s %10s %9s %9s' %
+              ('proto', 'volumes', 'operation', 'ops/s', 'p50 (s)',
+               'p99 (s)', 'cmds/op', 'wall (s)'))
+    print(header, file=stream)
+    print('-' * len(header), file=stream)
+    for result in results:
+        print('%-6s %7d %-10s %12.2f %10.3f %10.3f %9.1f %9.2f' %
+              (result['protocol'], result['volumes'], result['operation'],
+               result['throughput'] or 0, result['p50'], result['p99'],
+               result['commands'], result['wall_time']), file=stream)
+
+
+def _list(cast):
+    def _parse(value):
+        return [cast(item) for item in value.split(',') if item]
+    return _parse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--protocols', type=_list(str),
+                        default=list(PROTOCOLS),
+                        help='Comma separated protocols to run, of %s.' %
+                        ', '.join(PROTOCOLS))
+    parser.add_argument('--volumes', type=_list(int),
+                        default=[1, 10, 100, 1000],
+                        help='Comma separated numbers of volumes.')
+    parser.add_argument('--multipath', action='store_true',
+                        help='Connect the iSCSI and FC volumes with '
+                        'multipathing.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the latency jitter.')
+    parser.add_argument('--jitter', type=float, default=0.2,
+                        help='Fraction the command latencies vary by.')
+    parser.add_argument('--device-arrival-delay', type=float, default=0.5,
+                        help='Seconds for devices to show up after a login '
+                        'or a scan.')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON.')
+    args = parser.parse_args(argv)
+
+    # The connectors log every retry, keep the output readable
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    for protocol in args.protocols:
+        for count in args.volumes:
+            results.extend(run_scenario(
+                protocol, count, multipath=args.multipath, seed=args.seed,
+                jitter=args.jitter,
+                device_arrival_delay=args.device_arrival_delay))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        _print_table(results, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
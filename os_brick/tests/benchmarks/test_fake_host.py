@@ -0,0 +1,307 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import threading
+import time
+
+import ddt
+import mock
+from oslo_concurrency import processutils as putils
+
+from os_brick.initiator import device_waiter
+from os_brick.initiator import multipath_topology
+from os_brick.initiator import sysfs
+from os_brick.tests import base
+from os_brick.tests.benchmarks import fake_host
+from os_brick.tests.benchmarks import run
+
+
+class VirtualClockTestCase(base.TestCase):
+
+    def test_sleep_runs_due_events(self):
+        clock = fake_host.VirtualClock()
+        calls = []
+        clock.call_later(2, calls.append, 'second')
+        clock.call_later(1, calls.append, 'first')
+        clock.call_later(5, calls.append, 'late')
+
+        clock.sleep(3)
+
+        self.assertEqual(['first', 'second'], calls)
+        self.assertEqual(3, clock.monotonic())
+        self.assertEqual(fake_host.EPOCH + 3, clock.time())
+
+    def test_sleep_always_advances(self):
+        clock = fake_host.VirtualClock()
+        clock.sleep(0)
+        self.assertGreater(clock.monotonic(), 0)
+
+    def test_threads_sleep_at_the_same_time(self):
+        host = fake_host.FakeHost()
+        ends = []
+
+        def _sleep(seconds):
+            time.sleep(seconds)
+            ends.append(host.clock.monotonic())
+
+        with host.patch():
+            threads = [threading.Thread(target=_sleep, args=(seconds,))
+                       for seconds in (2, 1, 2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(2, host.clock.monotonic())
+
+        self.assertEqual([1, 2, 2], ends)
+
+    def test_condition_wait(self):
+        host = fake_host.FakeHost()
+        event = threading.Event()
+
+        def _set():
+            time.sleep(3)
+            event.set()
+
+        with host.patch():
+            self.assertFalse(event.wait(1))
+            self.assertEqual(1, host.clock.monotonic())
+            thread = threading.Thread(target=_set)
+            thread.start()
+            self.assertTrue(event.wait(10))
+            self.assertEqual(4, host.clock.monotonic())
+            thread.join()
+
+
+class FakeFilesystemTestCase(base.TestCase):
+
+    def setUp(self):
+        super(FakeFilesystemTestCase, self).setUp()
+        self.fs = fake_host.FakeFilesystem(fake_host.VirtualClock())
+        self.fs.create_file('/dev/sdb')
+        self.fs.create_link('/dev/disk/by-id/scsi-1', '../../sdb')
+
+    def test_links(self):
+        self.assertTrue(self.fs.exists('/dev/disk/by-id/scsi-1'))
+        self.assertTrue(self.fs.islink('/dev/disk/by-id/scsi-1'))
+        self.assertEqual('/dev/sdb',
+                         self.fs.realpath('/dev/disk/by-id/scsi-1'))
+        self.assertEqual(['scsi-1'], self.fs.listdir('/dev/disk/by-id'))
+
+        self.fs.remove('/dev/sdb')
+
+        self.assertFalse(self.fs.exists('/dev/disk/by-id/scsi-1'))
+        self.assertTrue(self.fs.islink('/dev/disk/by-id/scsi-1'))
+
+    def test_glob(self):
+        self.fs.create_file('/dev/sdc')
+        self.assertEqual(['/dev/sdb', '/dev/sdc'],
+                         sorted(self.fs.glob('/dev/sd*')))
+        self.assertEqual(['/dev/disk/by-id/scsi-1'],
+                         self.fs.glob('/dev/*/by-id/*'))
+
+    def test_listdir_missing(self):
+        self.assertRaises(OSError, self.fs.listdir, '/dev/missing')
+
+    def test_links_in_path(self):
+        self.fs.create_file('/sys/devices/host1/session1/targetname', 'iqn')
+        self.fs.create_link('/sys/class/iscsi_session/session1',
+                            '../../devices/host1/session1')
+        path = '/sys/class/iscsi_session/session1/targetname'
+        self.assertEqual('/sys/devices/host1/session1/targetname',
+                         self.fs.realpath(path))
+        self.assertEqual('iqn', self.fs.read(path))
+        self.assertEqual(['targetname'],
+                         self.fs.listdir('/sys/class/iscsi_session/session1'))
+
+    def test_remove_tree(self):
+        watcher = mock.Mock()
+        self.fs.watchers.add(watcher)
+        self.fs.create_file('/sys/block/sdb/size', '2048')
+        self.fs.remove('/sys/block/sdb')
+        self.assertFalse(self.fs.exists('/sys/block/sdb/size'))
+        self.assertEqual([], self.fs.listdir('/sys/block'))
+        watcher.changed.assert_has_calls(
+            [mock.call('/sys/block/sdb/size', True),
+             mock.call('/sys/block/sdb', True)])
+
+    def test_write(self):
+        writer = mock.Mock()
+        self.fs.create_file('/sys/class/scsi_host/host1/scan', writer=writer)
+        self.fs.write('/sys/class/scsi_host/host1/scan', '- - -')
+        writer.assert_called_once_with('- - -')
+        self.assertRaises(IOError, self.fs.write, '/sys/missing', '1')
+
+
+@ddt.ddt
+class FakeHostTestCase(base.TestCase):
+
+    def setUp(self):
+        super(FakeHostTestCase, self).setUp()
+        self.host = fake_host.FakeHost(jitter=0)
+
+    def test_execute_takes_virtual_time(self):
+        self.host.add_volume_group('vg')
+        out, err = self.host.execute('env', 'LC_ALL=C', 'vgs', '--noheadings',
+                                     '-o', 'name', 'vg')
+        self.assertEqual('  vg\n', out)
+        self.assertEqual(fake_host.DEFAULT_LATENCIES['vgs'],
+                         self.host.clock.monotonic())
+        self.assertEqual({'vgs --noheadings': 1}, self.host.commands)
+
+    def test_execute_check_exit_code(self):
+        self.assertRaises(putils.ProcessExecutionError, self.host.execute,
+                          'iscsiadm', '-m', 'session')
+        out, err = self.host.execute('iscsiadm', '-m', 'session',
+                                     check_exit_code=[0, 21])
+        self.assertIn('No active sessions', err)
+
+    def test_execute_unknown(self):
+        self.assertRaises(putils.ProcessExecutionError, self.host.execute,
+                          'mkfs', '/dev/sdb')
+        self.assertEqual(['mkfs'], self.host.unknown_commands)
+
+    def test_iscsi_devices_arrive_after_login(self):
+        portal, iqn = '10.0.0.1:3260', 'iqn.2010-10.org.openstack:vol'
+        self.host.add_iscsi_lun([portal], iqn, 1, '3600')
+        link = '/dev/disk/by-path/ip-%s-iscsi-%s-lun-1' % (portal, iqn)
+        self.host.execute('iscsiadm', '-m', 'node', '-T', iqn, '-p', portal,
+                          '--op', 'new')
+        self.host.execute('iscsiadm', '-m', 'node', '-T', iqn, '-p', portal,
+                          '--login')
+        self.assertFalse(self.host.fs.exists(link))
+
+        self.host.clock.sleep(self.host.device_arrival_delay +
+                              self.host.udev_delay)
+
+        self.assertEqual('/dev/sda', self.host.fs.realpath(link))
+        self.assertEqual(('3600\n', ''),
+                         self.host.execute('/lib/udev/scsi_id', '--page',
+                                           '0x83', '--whitelisted', link))
+
+    def _login(self, portal, iqn):
+        self.host.execute('iscsiadm', '-m', 'node', '-T', iqn, '-p', portal,
+                          '--op', 'new')
+        self.host.execute('iscsiadm', '-m', 'node', '-T', iqn, '-p', portal,
+                          '--login')
+
+    def test_sysfs(self):
+        self.host.multipath = True
+        portal, iqn = '10.0.0.1:3260', 'iqn.2010-10.org.openstack:vol'
+        self.host.add_iscsi_lun([portal], iqn, 1, '3600', size=2)
+        with self.host.patch():
+            self._login(portal, iqn)
+            time.sleep(1)
+
+            sessions = sysfs.get_iscsi_sessions()
+            self.assertEqual(1, len(sessions))
+            self.assertEqual({'sid': 1, 'transport': 'tcp', 'portal': portal,
+                              'tpgt': 1, 'iqn': iqn, 'host': 10,
+                              'targets': [(0, 0)], 'luns': {1: 'sda'}},
+                             sessions[0])
+            self.assertEqual(('10', '0', '0', '1'),
+                             sysfs.get_block_device_hctl('sda'))
+            self.assertEqual('3600', sysfs.get_scsi_wwn('sda'))
+            self.assertEqual(2 * 1024 ** 3,
+                             sysfs.get_block_device_size('sda'))
+            self.assertFalse(sysfs.is_block_device_read_only('sda'))
+            mpaths = multipath_topology.get_multipath_devices()
+            self.assertEqual(['/dev/mapper/3600'],
+                             [mpath['device'] for mpath in mpaths])
+            self.assertEqual(['/dev/sda'],
+                             [path['device'] for path in mpaths[0]['devices']])
+
+            self.host.execute('iscsiadm', '-m', 'node', '-T', iqn, '-p',
+                              portal, '--logout')
+            self.assertEqual([], sysfs.get_iscsi_sessions())
+            self.assertIsNone(sysfs.get_block_device_hctl('sda'))
+
+    def test_sysfs_fc(self):
+        host = self.host.add_fc_hba('1000000000000001', '2000000000000001')
+        self.host.add_fc_lun(['500a098280feeba5'], 1, '3600')
+        with self.host.patch():
+            self.assertEqual([{'host': host, 'port_name': '500a098280feeba5',
+                               'node_name': '500a098280feeba5',
+                               'port_state': 'Online'}],
+                             sysfs.get_fc_remote_ports())
+            self.host.execute('tee', '-a',
+                              '/sys/class/scsi_host/host%s/scan' % host,
+                              process_input='- - 1')
+            time.sleep(1)
+            self.assertEqual((str(host), '0', '0', '1'),
+                             sysfs.get_block_device_hctl('sda'))
+
+    def test_device_wait_is_woken(self):
+        portal, iqn = '10.0.0.1:3260', 'iqn.2010-10.org.openstack:vol'
+        self.host.add_iscsi_lun([portal], iqn, 1, '3600')
+        link = '/dev/disk/by-path/ip-%s-iscsi-%s-lun-1' % (portal, iqn)
+        with self.host.patch():
+            self.host.execute('iscsiadm', '-m', 'node', '-T', iqn, '-p',
+                              portal, '--op', 'new')
+            start = self.host.clock.monotonic()
+            self.host.execute('iscsiadm', '-m', 'node', '-T', iqn, '-p',
+                              portal, '--login')
+            self.assertEqual(link, device_waiter.wait_for_any([link], 10))
+            # Right when udev adds the link, no polling interval later
+            self.assertAlmostEqual(self.host.device_arrival_delay +
+                                   self.host.udev_delay,
+                                   self.host.clock.monotonic() - start)
+
+    def test_patch(self):
+        with self.host.patch():
+            self.assertTrue(os.path.isdir('/dev'))
+            self.assertFalse(os.path.exists('/dev/sda'))
+            self.assertTrue(os.path.isdir(os.path.dirname(__file__)))
+            time.sleep(10)
+            self.assertEqual(10, self.host.clock.monotonic())
+        self.assertFalse(os.path.exists('/dev/disk/by-path/missing'))
+
+    @ddt.data(*run.PROTOCOLS)
+    def test_scenario(self, protocol):
+        results = run.run_scenario(protocol, 2, seed=1)
+        self.assertEqual(list(run.OPERATIONS),
+                         [result['operation'] for result in results])
+        for result in results:
+            self.assertGreater(result['throughput'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+
+    @ddt.data(*run.PROTOCOLS)
+    def test_scenario_multipath(self, protocol):
+        results = run.run_scenario(protocol, 2, multipath=True)
+        self.assertEqual(len(run.OPERATIONS), len(results))
+
+    def test_scenario_deterministic(self):
+        def _run():
+            results = run.run_scenario('iscsi', 3, seed=7)
+            for result in results:
+                del result['wall_time']
+            return results
+
+        self.assertEqual(_run(), _run())
+
+    def test_scenario_operations_required(self):
+        class IncompleteScenario(run.Scenario):
+            def connect(self, index):
+                pass
+
+        self.assertRaises(TypeError, IncompleteScenario, self.host, 1)
+
+
+class PercentileTestCase(base.TestCase):
+
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(50, fake_host.percentile(values, 50))
+        self.assertEqual(99, fake_host.percentile(values, 99))
+        self.assertEqual(100, fake_host.percentile(values, 100))
+        self.assertIsNone(fake_host.percentile([], 50))
@@ -14,36 +14,12 @@
 import mock
 import os
 
-from oslo_service import loopingcall
-
 from os_brick import exception
 from os_brick.initiator.connectors import aoe
+from os_brick.initiator import device_waiter
 from os_brick.tests.initiator import test_connector
 
 
-class FakeFixedIntervalLoopingCall(object):
-    def __init__(self, f=None, *args, **kw):
-        self.args = args
-        self.kw = kw
-        self.f = f
-        self._stop = False
-
-    def stop(self):
-        self._stop = True
-
-    def wait(self):
-        return self
-
-    def start(self, interval, initial_delay=None):
-        while not self._stop:
-            try:
-                self.f(*self.args, **self.kw)
-            except loopingcall.LoopingCallDone:
-                return self
-            except Exception:
-                raise
-
-
 class AoEConnectorTestCase(test_connector.ConnectorTestCase):
     """Test cases for AoE initiator class."""
 
@@ -52,8 +28,8 @@ class AoEConnectorTestCase(test_connector.ConnectorTestCase):
         self.connector = aoe.AoEConnector('sudo')
         self.connection_properties = {'target_shelf': 'fake_shelf',
                                       'target_lun': 'fake_lun'}
-        self.mock_object(loopingcall, 'FixedIntervalLoopingCall',
-                         FakeFixedIntervalLoopingCall)
+        self.mock_wait = self.mock_object(device_waiter, 'wait_for_any',
+                                          return_value=None)
 
     def test_get_search_path(self):
         expected = "/dev/etherd"
@@ -111,6 +87,9 @@ class AoEConnectorTestCase(test_connector.ConnectorTestCase):
             self.assertRaises(exception.VolumeDeviceNotFound,
                               self.connector.connect_volume,
                               self.connection_properties)
+        self.assertEqual(self.connector.device_scan_attempts,
+                         self.mock_wait.call_count)
+        self.mock_wait.assert_called_with([aoe_path], 2)
 
     @mock.patch.object(os.path, 'exists', return_value=True)
     def test_disconnect_volume(self, mock_exists):
@@ -15,9 +15,12 @@ import mock
 import os
 import six
 
+from oslo_concurrency import processutils as putils
+
 from os_brick import exception
 from os_brick.initiator.connectors import base
 from os_brick.initiator.connectors import fibre_channel
+from os_brick.initiator import device_waiter
 from os_brick.initiator import linuxfc
 from os_brick.initiator import linuxscsi
 from os_brick.tests.initiator import test_connector
@@ -93,6 +96,19 @@ class FibreChannelConnectorTestCase(test_connector.ConnectorTestCase):
         expected = "/dev/disk/by-path"
         self.assertEqual(expected, search_path)
 
+    def test_get_lock_names(self):
+        self.assertEqual(['fc-1234567890123456'],
+                         self.connector._get_lock_names(
+                             {'target_wwn': '1234567890123456',
+                              'target_lun': 1}))
+        self.assertEqual(
+            ['fc-1234567890123456', 'fc-1234567890abcdef',
+             'fc-1234567890123457'],
+            self.connector._get_batch_lock_names(
+                [{'target_wwn': ['1234567890123456', '1234567890ABCDEF'],
+                  'target_lun': 1},
+                 {'target_wwn': '1234567890123457', 'target_lun': 2}]))
+
     def test_get_pci_num(self):
         hba = {'device_path': "/sys/devices/pci0000:00/0000:00:03.0"
                               "/0000:05:00.3/host2/fc_host/host2"}
@@ -130,6 +146,119 @@ class FibreChannelConnectorTestCase(test_connector.ConnectorTestCase):
                     '-fc-0x1234567890123456-lun-1']
         self.assertEqual(expected, volume_paths)
 
+    @mock.patch.object(device_waiter, 'wait_for')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn',
+                       return_value=test_connector.FAKE_SCSI_WWN)
+    @mock.patch.object(os.path, 'realpath', side_effect=lambda path: path)
+    @mock.patch.object(linuxfc.LinuxFibreChannel, 'rescan_hosts')
+    @mock.patch.object(linuxfc.LinuxFibreChannel, 'get_fc_hbas')
+    @mock.patch.object(linuxfc.LinuxFibreChannel, 'get_fc_hbas_info')
+    def test_connect_volumes(self, get_fc_hbas_info_mock, get_fc_hbas_mock,
+                             rescan_mock, realpath_mock, wwn_mock, wait_mock):
+        get_fc_hbas_mock.side_effect = self.fake_get_fc_hbas
+        get_fc_hbas_info_mock.side_effect = self.fake_get_fc_hbas_info
+        self.connector.device_scan_attempts = 2
+        wwn = '1234567890123456'
+        dev = '/dev/disk/by-path/pci-0000:05:00.2-fc-0x%s-lun-%s'
+        present = set([dev % (wwn, 1)])
+        self.mock_object(os.path, 'exists',
+                         side_effect=lambda path: path in present)
+
+        def _rescan(hbas, lun):
+            if lun == 2:
+                present.add(dev % (wwn, 2))
+
+        rescan_mock.side_effect = _rescan
+        vol = {'id': 1, 'name': 'volume-00000001'}
+        props = []
+        for lun in (1, 2, 3):
+            connection_info = self.fibrechan_connection(vol, '10.0.2.15:3260',
+                                                        wwn)
+            connection_info['data']['target_lun'] = lun
+            props.append(connection_info['data'])
+
+        results = self.connector.connect_volumes(props)
+
+        self.assertEqual({'type': 'block', 'path': dev % (wwn, 1),
+                          'scsi_wwn': test_connector.FAKE_SCSI_WWN},
+                         results[0])
+        self.assertEqual({'type': 'block', 'path': dev % (wwn, 2),
+                          'scsi_wwn': test_connector.FAKE_SCSI_WWN},
+                         results[1])
+        self.assertIsInstance(results[2]['error'],
+                              exception.NoFibreChannelVolumeDeviceFound)
+        # The HBAs are looked up once and scanned once per missing LUN and
+        # try.
+        self.assertEqual(1, get_fc_hbas_info_mock.call_count)
+        rescan_mock.assert_has_calls([mock.call(mock.ANY, 2),
+                                      mock.call(mock.ANY, 3),
+                                      mock.call(mock.ANY, 3)])
+        self.assertEqual(3, rescan_mock.call_count)
+        self.assertEqual(2, wait_mock.call_count)
+
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_scsi_device')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'flush_multipath_device')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_device_info',
+                       side_effect=lambda device: {'device': device})
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn',
+                       side_effect=lambda path: 'wwn-%s' % path[-1])
+    @mock.patch.object(os.path, 'realpath',
+                       side_effect=lambda path: '/dev/sd%s' % path[-1])
+    @mock.patch.object(fibre_channel.FibreChannelConnector,
+                       'get_volume_paths')
+    def test_disconnect_volumes(self, paths_mock, realpath_mock, wwn_mock,
+                                device_info_mock, flush_mock, remove_mock):
+        self.connector.use_multipath = True
+        paths_mock.side_effect = lambda props: [
+            '/dev/disk/by-path/pci-0000:05:00.2-fc-0x%s-lun-%s' %
+            (wwn, props['target_lun']) for wwn in props['target_wwn']]
+        error = putils.ProcessExecutionError(exit_code=1)
+
+        def _remove(device, multipath_path=False):
+            if device == '/dev/sd3':
+                raise error
+
+        remove_mock.side_effect = _remove
+        props = [{'target_wwn': ['1234567890123456'], 'target_lun': lun}
+                 for lun in (1, 2, 3)]
+
+        results = self.connector.disconnect_volumes(props,
+                                                    [None, None, None])
+
+        self.assertEqual([None, None], results[:2])
+        self.assertIsInstance(results[2], exception.SCSIDevicesNotRemoved)
+        self.assertEqual({'/dev/sd3': error}, results[2].kwargs['errors'])
+        flush_mock.assert_has_calls([mock.call('wwn-1'), mock.call('wwn-2'),
+                                     mock.call('wwn-3')])
+        remove_mock.assert_has_calls(
+            [mock.call('/dev/sd%s' % lun, multipath_path=True)
+             for lun in (1, 2, 3)], any_order=True)
+
+    @mock.patch.object(device_waiter, 'wait_for_any', return_value=None)
+    @mock.patch.object(linuxfc.LinuxFibreChannel, 'rescan_hosts')
+    @mock.patch.object(os.path, 'exists', return_value=False)
+    @mock.patch.object(linuxfc.LinuxFibreChannel, 'get_fc_hbas')
+    @mock.patch.object(linuxfc.LinuxFibreChannel, 'get_fc_hbas_info')
+    def test_connect_volume_device_not_found(self, get_fc_hbas_info_mock,
+                                             get_fc_hbas_mock, exists_mock,
+                                             rescan_mock, wait_mock):
+        get_fc_hbas_mock.side_effect = self.fake_get_fc_hbas
+        get_fc_hbas_info_mock.side_effect = self.fake_get_fc_hbas_info
+        self.connector.device_scan_attempts = 2
+
+        vol = {'id': 1, 'name': 'volume-00000001'}
+        connection_info = self.fibrechan_connection(vol, '10.0.2.15:3260',
+                                                    '1234567890123456')
+        self.assertRaises(exception.NoFibreChannelVolumeDeviceFound,
+                          self.connector.connect_volume,
+                          connection_info['data'])
+
+        self.assertEqual(2, rescan_mock.call_count)
+        self.assertEqual(2, wait_mock.call_count)
+        wait_mock.assert_called_with(
+            ['/dev/disk/by-path/pci-0000:05:00.2'
+             '-fc-0x1234567890123456-lun-1'], 2)
+
     @mock.patch.object(linuxscsi.LinuxSCSI, 'wait_for_rw')
     @mock.patch.object(os.path, 'exists', return_value=True)
     @mock.patch.object(os.path, 'realpath', return_value='/dev/sdb')
@@ -193,6 +322,27 @@ class FibreChannelConnectorTestCase(test_connector.ConnectorTestCase):
                           self.connector.connect_volume,
                           connection_info['data'])
 
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(os.path, 'realpath', return_value='/dev/sdb')
+    @mock.patch.object(linuxfc.LinuxFibreChannel, 'get_fc_hbas_info')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn',
+                       return_value='1234567890')
+    def test_connect_volume_return_timings(self, get_scsi_wwn_mock,
+                                           get_fc_hbas_info_mock,
+                                           realpath_mock, exists_mock):
+        get_fc_hbas_info_mock.side_effect = self.fake_get_fc_hbas_info
+        connection_info = self.fibrechan_connection(
+            {'id': 1, 'name': 'volume-00000001'}, '10.0.2.15:3260',
+            '1234567890123456')
+
+        dev_info = self.connector.connect_volume(connection_info['data'])
+        self.assertNotIn('timings', dev_info)
+
+        self.connector.return_timings = True
+        dev_info = self.connector.connect_volume(connection_info['data'])
+        self.assertEqual({'discovery', 'device_wait', 'lock_wait'},
+                         set(dev_info['timings']))
+
     def _test_connect_volume_multipath(self, get_device_info_mock,
                                        get_scsi_wwn_mock,
                                        get_fc_hbas_info_mock,
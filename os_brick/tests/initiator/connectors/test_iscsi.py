@@ -14,18 +14,25 @@
 import glob
 import mock
 import os
+import shutil
+import tempfile
 import testtools
-import time
+import threading
 
 from oslo_concurrency import processutils as putils
 
 from os_brick import exception
 from os_brick.initiator.connectors import base
 from os_brick.initiator.connectors import iscsi
+from os_brick.initiator import device_waiter
 from os_brick.initiator import host_driver
 from os_brick.initiator import linuxscsi
+from os_brick.initiator import multipath_topology
+from os_brick.initiator import sysfs
 from os_brick.privileged import rootwrap as priv_rootwrap
 from os_brick.tests.initiator import test_connector
+from os_brick import tracing
+from os_brick import utils
 
 
 class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
@@ -39,6 +46,14 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
 
         self.mock_object(self.connector._linuxscsi, 'get_name_from_path',
                          return_value="/dev/sdb")
+        # Make the tests use iscsiadm and multipath instead of the host's
+        # sysfs
+        self.mock_sysfs_sessions = self.mock_object(
+            sysfs, 'get_iscsi_sessions', return_value=None)
+        self.mock_mpaths = self.mock_object(
+            multipath_topology, 'get_multipath_devices', return_value=None)
+        self.mock_object(iscsi, '_discovery_cache', utils.TTLCache())
+        self.mock_object(iscsi, '_background_logins', {})
         self._fake_iqn = 'iqn.1234-56.foo.bar:01:23456789abc'
 
     def generate_device(self, location, iqn, transport=None, lun=1):
@@ -236,12 +251,11 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
         self.assertEqual(expected_result, result)
 
     @mock.patch('time.sleep', mock.Mock())
+    @mock.patch.object(device_waiter, 'wait_for_any', mock.Mock())
     def _test_connect_volume(self, extra_props, additional_commands,
                              transport=None, disconnect_mock=None):
         # for making sure the /dev/disk/by-path is gone
-        exists_mock = mock.Mock()
-        exists_mock.return_value = True
-        os.path.exists = exists_mock
+        self.mock_object(os.path, 'exists', return_value=True)
 
         location = '10.0.2.15:3260'
         name = 'volume-00000001'
@@ -285,11 +299,10 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
                                                  device)
 
             expected_commands = [
-                ('iscsiadm -m node -T %s -p %s' % (iqn, location)),
-                ('iscsiadm -m session'),
-                ('iscsiadm -m node -T %s -p %s --login' % (iqn, location)),
                 ('iscsiadm -m node -T %s -p %s --op update'
                  ' -n node.startup -v automatic' % (iqn, location)),
+                ('iscsiadm -m session'),
+                ('iscsiadm -m node -T %s -p %s --login' % (iqn, location)),
                 ('/lib/udev/scsi_id --page 0x83 --whitelisted %s' % dev_str),
                 ('blockdev --flushbufs /dev/sdb'),
                 ('tee -a /sys/block/sdb/device/delete'),
@@ -386,20 +399,14 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
         mock_iscsiadm.assert_any_call(props, ('--login',),
                                       check_exit_code=[0, 255])
 
-        mock_iscsiadm.reset_mock()
+        self.cmds = []
         with mock.patch.object(os.path, 'exists',
                                return_value=False):
             self.connector.disconnect_volume(connection_info['data'], device)
-            props = connection_info['data'].copy()
-            for key in ('target_portals', 'target_iqns', 'target_luns'):
-                props.pop(key, None)
-            mock_iscsiadm.assert_any_call(props, ('--logout',),
-                                          check_exit_code=[0, 21, 255])
-            props['target_portal'] = location2
-            props['target_iqn'] = iqn2
-            props['target_lun'] = 2
-            mock_iscsiadm.assert_any_call(props, ('--logout',),
-                                          check_exit_code=[0, 21, 255])
+            self.assertIn('iscsiadm -m node -T %s -p %s --logout' %
+                          (iqn, location), self.cmds)
+            self.assertIn('iscsiadm -m node -T %s -p %s --logout' %
+                          (iqn2, location2), self.cmds)
 
     @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn')
     @mock.patch.object(iscsi.ISCSIConnector, '_run_iscsiadm_bare')
@@ -480,6 +487,42 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
             # Reset to run with a different transport type
             self.cmds = list()
 
+    @mock.patch.object(iscsi.ISCSIConnector, '_run_iscsiadm_bare')
+    def test_discover_iscsi_portals_cached(self, mock_iscsiadm):
+        iqn1 = 'iqn.2010-10.org.openstack:volume-00000001'
+        iqn2 = 'iqn.2010-10.org.openstack:volume-00000002'
+        mock_iscsiadm.return_value = (
+            '10.0.2.15:3260,1 %s\n10.0.3.15:3260,1 %s\n' % (iqn1, iqn1), '')
+        connector = iscsi.ISCSIConnector(
+            None, execute=self.fake_execute, use_multipath=True,
+            discovery_cache_ttl=60)
+        props1 = {'target_portal': '10.0.2.15:3260', 'target_iqn': iqn1,
+                  'target_lun': 1}
+        props2 = dict(props1, target_iqn=iqn2)
+        expected = [['10.0.2.15:3260,1', iqn1], ['10.0.3.15:3260,1', iqn1]]
+
+        self.assertEqual(expected, connector._discover_iscsi_portals(props1))
+        # Same portal, so the discovery is reused
+        self.assertEqual(expected, connector._discover_iscsi_portals(props2))
+        self.assertEqual(1, mock_iscsiadm.call_count)
+
+        # Not cached with the default ttl
+        self.connector_with_multipath._discover_iscsi_portals(props1)
+        self.assertEqual(2, mock_iscsiadm.call_count)
+
+        # Login failures drop the discoveries with the target
+        self.mock_object(connector, '_run_iscsiadm',
+                         side_effect=[('', ''),
+                                      putils.ProcessExecutionError(None, None,
+                                                                   8),
+                                      ('', '')])
+        self.mock_object(connector, '_get_iscsi_sessions_full',
+                         return_value=[])
+        self.assertFalse(connector._connect_to_iscsi_portal(
+            dict(props1, target_portal='10.0.3.15:3260,1')))
+        connector._discover_iscsi_portals(props1)
+        self.assertEqual(3, mock_iscsiadm.call_count)
+
     @mock.patch.object(iscsi.ISCSIConnector,
                        '_run_iscsiadm_update_discoverydb')
     @mock.patch.object(os.path, 'exists', return_value=True)
@@ -647,19 +690,14 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
         mock_iscsiadm.assert_any_call(props, ('--login',),
                                       check_exit_code=[0, 255])
 
-        mock_iscsiadm.reset_mock()
+        self.cmds = []
         self.connector_with_multipath.disconnect_volume(
             connection_properties['data'], result)
 
-        props = connection_properties['data'].copy()
-        props['target_portal'] = location1
-        props['target_iqn'] = iqn1
-        mock_iscsiadm.assert_any_call(props, ('--logout',),
-                                      check_exit_code=[0, 21, 255])
-        props['target_portal'] = location2
-        props['target_iqn'] = iqn2
-        mock_iscsiadm.assert_any_call(props, ('--logout',),
-                                      check_exit_code=[0, 21, 255])
+        self.assertIn('iscsiadm -m node -T %s -p %s --logout' %
+                      (iqn1, location1), self.cmds)
+        self.assertIn('iscsiadm -m node -T %s -p %s --logout' %
+                      (iqn2, location2), self.cmds)
 
     @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn')
     @mock.patch.object(os.path, 'exists', return_value=True)
@@ -741,6 +779,170 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
                           self.connector_with_multipath.connect_volume,
                           connection_properties['data'])
 
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_discover_iscsi_portals')
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal')
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_iscsi')
+    def test_get_potential_paths_parallel_logins(self, mock_rescan,
+                                                 mock_connect, mock_discover,
+                                                 mock_exists):
+        location1 = '10.0.2.15:3260'
+        location2 = '10.0.3.15:3260'
+        location3 = '10.0.4.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        connection_properties = {'target_portal': location1,
+                                 'target_iqn': iqn, 'target_lun': 1}
+        mock_discover.return_value = [[location1, iqn], [location2, iqn],
+                                      [location3, iqn]]
+
+        def fake_connect(props):
+            return props['target_portal'] != location2
+
+        mock_connect.side_effect = fake_connect
+        self.connector_with_multipath.parallel_logins = 4
+
+        devices, props = (
+            self.connector_with_multipath._get_potential_volume_paths(
+                connection_properties))
+
+        self.assertEqual(
+            ['/dev/disk/by-path/ip-%s-iscsi-%s-lun-1' % (location1, iqn)],
+            devices)
+        mock_rescan.assert_called_once_with(mock.ANY)
+        self.assertEqual([(location1, iqn, 1), (location2, iqn, 1),
+                          (location3, iqn, 1)],
+                         sorted(mock_rescan.call_args[0][0]))
+        self.assertTrue(mock_connect.called)
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_discover_iscsi_portals')
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal')
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_iscsi')
+    def test_get_potential_paths_parallel_logins_all_failed(
+            self, mock_rescan, mock_connect, mock_discover, mock_exists):
+        location1 = '10.0.2.15:3260'
+        location2 = '10.0.3.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        connection_properties = {'target_portal': location1,
+                                 'target_iqn': iqn, 'target_lun': 1}
+        mock_discover.return_value = [[location1, iqn], [location2, iqn]]
+        mock_connect.side_effect = [False, putils.ProcessExecutionError()]
+        self.connector_with_multipath.parallel_logins = 2
+
+        self.assertRaises(
+            exception.FailedISCSITargetPortalLogin,
+            self.connector_with_multipath._get_potential_volume_paths,
+            connection_properties)
+        self.assertEqual(2, mock_connect.call_count)
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal')
+    def test_connect_to_iscsi_portals_parallel_returns_early(
+            self, mock_connect, mock_exists):
+        location1 = '10.0.2.15:3260'
+        location2 = '10.0.3.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        connection_properties = {'target_portal': location1,
+                                 'target_iqn': iqn, 'target_lun': 1}
+        targets = [dict(connection_properties, target_portal=location)
+                   for location in (location1, location2)]
+        slow_login = threading.Event()
+
+        def fake_connect(props):
+            if props['target_portal'] == location2:
+                slow_login.wait(10)
+            return True
+
+        mock_connect.side_effect = fake_connect
+        self.connector_with_multipath.parallel_logins = 2
+        self.addCleanup(slow_login.set)
+
+        connector = self.connector_with_multipath
+        result = connector._connect_to_iscsi_portals_parallel(
+            connection_properties, targets)
+
+        self.assertTrue(result)
+        self.assertFalse(slow_login.is_set())
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal')
+    def test_connect_to_iscsi_portals_parallel_traced(self, mock_connect,
+                                                      mock_exists):
+        location1 = '10.0.2.15:3260'
+        location2 = '10.0.3.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        connection_properties = {'target_portal': location1,
+                                 'target_iqn': iqn, 'target_lun': 1}
+        targets = [dict(connection_properties, target_portal=location)
+                   for location in (location1, location2)]
+        spans = []
+
+        def fake_connect(props):
+            spans.append(tracing.current_span())
+            return False
+
+        mock_connect.side_effect = fake_connect
+        connector = self.connector_with_multipath
+        connector.parallel_logins = 2
+
+        with tracing.start_trace('connect_volume', force=True) as root:
+            self.assertFalse(connector._connect_to_iscsi_portals_parallel(
+                connection_properties, targets))
+
+        self.assertEqual(2, len(spans))
+        self.assertEqual(['login'], [span.name for span in root.children])
+        self.assertEqual([root.children[0]] * 2, spans)
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal')
+    def test_disconnect_volume_waits_for_background_logins(
+            self, mock_connect, mock_exists):
+        location1 = '10.0.2.15:3260'
+        location2 = '10.0.3.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        connection_properties = {'target_portal': location1,
+                                 'target_iqn': iqn, 'target_lun': 1}
+        targets = [dict(connection_properties, target_portal=location)
+                   for location in (location1, location2)]
+        login_started = threading.Event()
+        slow_login = threading.Event()
+        self.addCleanup(slow_login.set)
+        events = []
+
+        def fake_connect(props):
+            if props['target_portal'] == location2:
+                login_started.set()
+                slow_login.wait(10)
+                events.append('login')
+            return True
+
+        mock_connect.side_effect = fake_connect
+        connector = self.connector
+        connector.parallel_logins = 2
+        self.mock_object(connector, '_disconnect_volume_iscsi',
+                         side_effect=lambda *args: events.append('logout'))
+
+        logins = {}
+        self.assertTrue(connector._connect_to_iscsi_portals_parallel(
+            connection_properties, targets, logins))
+        self.assertTrue(login_started.wait(10))
+
+        disconnect = threading.Thread(target=connector.disconnect_volume,
+                                      args=(connection_properties, None))
+        disconnect.start()
+        disconnect.join(0.2)
+        self.assertTrue(disconnect.is_alive())
+        self.assertEqual([], events)
+
+        slow_login.set()
+        disconnect.join(10)
+
+        self.assertFalse(disconnect.is_alive())
+        self.assertEqual(['login', 'logout'], events)
+        self.assertEqual({(location1, iqn): True, (location2, iqn): True},
+                         logins)
+        self.assertEqual({}, iscsi._background_logins)
+
     @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal')
     def test_connect_volume_failed_iscsi_login(self, mock_connect):
         location1 = '10.0.2.15:3260'
@@ -754,10 +956,10 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
                           self.connector.connect_volume,
                           connection_properties['data'])
 
-    @mock.patch.object(time, 'sleep')
+    @mock.patch.object(device_waiter, 'wait_for_any', return_value=None)
     @mock.patch.object(os.path, 'exists', return_value=False)
     def test_connect_volume_with_not_found_device(self, exists_mock,
-                                                  sleep_mock):
+                                                  wait_mock):
         location = '10.0.2.15:3260'
         name = 'volume-00000001'
         iqn = 'iqn.2010-10.org.openstack:%s' % name
@@ -766,6 +968,530 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
         self.assertRaises(exception.VolumeDeviceNotFound,
                           self.connector.connect_volume,
                           connection_info['data'])
+        dev = ('/dev/disk/by-path/ip-%s-iscsi-%s-lun-1' % (location, iqn))
+        wait_mock.assert_has_calls([mock.call([dev], 1),
+                                    mock.call([dev], 4),
+                                    mock.call([dev], 9)])
+
+    def test_get_iscsi_sessions_full(self):
+        self.mock_sysfs_sessions.return_value = [
+            {'sid': 1, 'transport': 'tcp', 'portal': '10.0.2.15:3260',
+             'tpgt': 1, 'iqn': 'iqn.1', 'host': 3, 'luns': {1: 'sdb'}}]
+        sessions = self.connector._get_iscsi_sessions_full()
+        self.assertEqual(self.mock_sysfs_sessions.return_value, sessions)
+        self.assertEqual([], self.cmds)
+        self.assertEqual(['10.0.2.15:3260'],
+                         self.connector._get_iscsi_sessions())
+
+    @mock.patch.object(device_waiter, 'wait_for')
+    @mock.patch('os_brick.initiator.linuxscsi.LinuxSCSI.get_scsi_wwn',
+                return_value=test_connector.FAKE_SCSI_WWN)
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_iscsi')
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal')
+    def test_connect_volumes(self, mock_connect, mock_rescan, mock_wwn,
+                             mock_wait):
+        location1 = '10.0.2.15:3260'
+        location2 = '10.0.3.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        props1 = {'target_portal': location1, 'target_iqn': iqn,
+                  'target_lun': 1}
+        props2 = {'target_portal': location1, 'target_iqn': iqn,
+                  'target_lun': 2}
+        props3 = {'target_portal': location2, 'target_iqn': iqn,
+                  'target_lun': 3}
+        dev1 = self.generate_device(location1, iqn, lun=1)
+        dev2 = self.generate_device(location1, iqn, lun=2)
+        present = set([dev1])
+        self.mock_object(os.path, 'exists',
+                         side_effect=lambda path: path in present)
+        mock_connect.side_effect = (
+            lambda props: props['target_portal'] == location1)
+        mock_rescan.side_effect = lambda targets: present.add(dev2)
+
+        results = self.connector.connect_volumes([props1, props2, props3])
+
+        self.assertEqual(3, len(results))
+        wwn = test_connector.FAKE_SCSI_WWN
+        self.assertEqual({'type': 'block', 'scsi_wwn': wwn, 'path': dev1},
+                         results[0])
+        self.assertEqual({'type': 'block', 'scsi_wwn': wwn, 'path': dev2},
+                         results[1])
+        self.assertIsInstance(results[2]['error'],
+                              exception.FailedISCSITargetPortalLogin)
+        # Each portal is logged into once, and only the missing LUN is
+        # scanned.
+        self.assertEqual(2, mock_connect.call_count)
+        mock_rescan.assert_called_once_with([(location1, iqn, 2)])
+        self.assertEqual(1, mock_wait.call_count)
+
+    @mock.patch.object(device_waiter, 'wait_for')
+    @mock.patch.object(os.path, 'exists', return_value=False)
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_iscsi')
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal',
+                       return_value=True)
+    def test_connect_volumes_not_found(self, mock_connect, mock_rescan,
+                                       mock_exists, mock_wait):
+        location = '10.0.2.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        props = {'target_portal': location, 'target_iqn': iqn,
+                 'target_lun': 1}
+
+        results = self.connector.connect_volumes([props])
+
+        self.assertIsInstance(results[0]['error'],
+                              exception.VolumeDeviceNotFound)
+        self.assertEqual(self.connector.device_scan_attempts,
+                         mock_rescan.call_count)
+        self.assertEqual([1, 4, 9],
+                         [call[0][2] for call in mock_wait.call_args_list])
+
+    @mock.patch.object(iscsi.ISCSIConnector, '_is_target_in_use',
+                       return_value=False)
+    @mock.patch.object(iscsi.ISCSIConnector, '_disconnect_from_iscsi_portal')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'wait_for_volume_removal')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_scsi_device')
+    def test_disconnect_volumes(self, mock_remove, mock_wait,
+                                mock_disconnect, mock_in_use):
+        location1 = '10.0.2.15:3260'
+        location2 = '10.0.3.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        props1 = {'target_portal': location1, 'target_iqn': iqn,
+                  'target_lun': 1}
+        props2 = dict(props1, target_lun=2)
+        props3 = dict(props1, target_portal=location2, target_lun=3)
+        names = {self.generate_device(location1, iqn, lun=1): '/dev/sdb',
+                 self.generate_device(location1, iqn, lun=2): '/dev/sdc',
+                 self.generate_device(location2, iqn, lun=3): '/dev/sdd'}
+        self.connector._linuxscsi.get_name_from_path.side_effect = (
+            names.get)
+        error = putils.ProcessExecutionError(exit_code=1)
+
+        def _remove(device, multipath_path=False):
+            if device == '/dev/sdd':
+                raise error
+
+        mock_remove.side_effect = _remove
+
+        results = self.connector.disconnect_volumes(
+            [props1, props2, props3], [None, None, None])
+
+        self.assertEqual([None, None], results[:2])
+        self.assertIsInstance(results[2], exception.SCSIDevicesNotRemoved)
+        self.assertEqual({'/dev/sdd': error}, results[2].kwargs['errors'])
+        self.assertEqual(3, mock_remove.call_count)
+        mock_wait.assert_has_calls(
+            [mock.call(self.generate_device(location1, iqn, lun=1)),
+             mock.call(self.generate_device(location1, iqn, lun=2))])
+        # The target of the first two volumes is logged out of once, the
+        # one of the volume that couldn't be removed is kept.
+        mock_disconnect.assert_called_once_with(props1)
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_is_target_in_use',
+                       return_value=False)
+    @mock.patch.object(iscsi.ISCSIConnector, '_disconnect_from_iscsi_portal')
+    @mock.patch.object(iscsi.ISCSIConnector, '_discover_iscsi_portals')
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_multipath')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'find_multipath_device')
+    def test_disconnect_volumes_multipath_session_refs(
+            self, mock_find, mock_rescan, mock_discover, mock_disconnect,
+            mock_in_use, mock_exists):
+        connector = self._connector_with_state_file(use_multipath=True)
+        portal = '10.0.2.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        props1 = {'target_portal': portal, 'target_iqn': iqn,
+                  'target_lun': 1}
+        props2 = dict(props1, target_lun=2)
+        for props in (props1, props2):
+            connector._add_session_refs(
+                props, [(portal + ',1', iqn, props['target_lun'])])
+        mock_find.side_effect = lambda dev: {
+            'id': 'wwn-%s' % dev[-1],
+            'devices': [{'device': '/dev/sd%s' % dev[-1]}]}
+
+        results = connector.disconnect_volumes([props1, props2],
+                                               [None, None])
+
+        self.assertEqual([None, None], results)
+        self.assertEqual(
+            [mock.call('/dev/sd1', multipath_path=True),
+             mock.call('/dev/sd2', multipath_path=True)],
+            sorted(connector._linuxscsi.remove_scsi_device.call_args_list))
+        # Both volumes used the session, it is only unused once both are
+        # detached.
+        self.assertFalse(mock_discover.called)
+        mock_disconnect.assert_called_once_with(props1)
+        self.assertEqual(2, mock_rescan.call_count)
+        self.assertEqual(0,
+                         connector._session_refcount.get_count(portal, iqn))
+
+    def test_get_lock_names(self):
+        props = {'target_portals': ['10.0.2.15:3260', '10.0.3.15:3260'],
+                 'target_iqns': ['iqn.1', 'iqn.2'],
+                 'target_luns': [1, 1]}
+        self.assertEqual(['iscsi-iqn.1', 'iscsi-iqn.2'],
+                         self.connector._get_lock_names(props))
+        self.assertEqual(
+            ['iscsi-iqn.1', 'iscsi-iqn.2', 'iscsi-iqn.3'],
+            self.connector._get_batch_lock_names(
+                [props, {'target_portal': '10.0.2.15:3260',
+                         'target_iqn': 'iqn.3', 'target_lun': 2}]))
+
+    def _connector_with_state_file(self, use_multipath=False):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        connector = iscsi.ISCSIConnector(
+            None, execute=self.fake_execute, use_multipath=use_multipath,
+            session_state_file=os.path.join(tmpdir, 'sessions.json'))
+        self.mock_object(connector._linuxscsi, 'get_name_from_path',
+                         return_value='/dev/sdb')
+        self.mock_object(connector._linuxscsi, 'remove_scsi_device')
+        self.mock_object(connector._linuxscsi, 'wait_for_volume_removal')
+        return connector
+
+    @mock.patch.object(device_waiter, 'wait_for')
+    @mock.patch('os_brick.initiator.linuxscsi.LinuxSCSI.get_scsi_wwn',
+                return_value=test_connector.FAKE_SCSI_WWN)
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_is_target_in_use',
+                       return_value=False)
+    @mock.patch.object(iscsi.ISCSIConnector, '_disconnect_from_iscsi_portal')
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal',
+                       return_value=True)
+    def test_disconnect_volume_session_refs(self, mock_connect,
+                                            mock_disconnect, mock_in_use,
+                                            mock_exists, mock_wwn,
+                                            mock_wait):
+        connector = self._connector_with_state_file()
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        props1 = {'target_portal': '10.0.2.15:3260', 'target_iqn': iqn,
+                  'target_lun': 1}
+        props2 = dict(props1, target_lun=2)
+
+        connector.connect_volume(props1)
+        connector.connect_volumes([props2])
+
+        # The session is still used by the second volume
+        connector.disconnect_volume(props1, None)
+        self.assertFalse(mock_disconnect.called)
+        self.assertFalse(mock_in_use.called)
+
+        connector.disconnect_volume(props2, None)
+        mock_disconnect.assert_called_once_with(props2)
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_is_target_in_use',
+                       return_value=False)
+    @mock.patch.object(iscsi.ISCSIConnector, '_disconnect_from_iscsi_portal')
+    def test_disconnect_volume_session_refs_failed(self, mock_disconnect,
+                                                   mock_in_use, mock_exists):
+        connector = self._connector_with_state_file()
+        portal = '10.0.2.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        props = {'target_portal': portal, 'target_iqn': iqn,
+                 'target_lun': 1}
+        connector._add_session_refs(props, [(portal, iqn, 1)])
+        mock_remove = connector._linuxscsi.remove_scsi_device
+        mock_remove.side_effect = putils.ProcessExecutionError(exit_code=1)
+
+        self.assertRaises(putils.ProcessExecutionError,
+                          connector.disconnect_volume, props, None)
+
+        self.assertFalse(mock_disconnect.called)
+        self.assertEqual(
+            1, connector._session_refcount.get_count(portal, iqn))
+
+        mock_remove.side_effect = None
+        connector.disconnect_volume(props, None)
+
+        mock_disconnect.assert_called_once_with(props)
+        self.assertEqual(
+            0, connector._session_refcount.get_count(portal, iqn))
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_is_target_in_use')
+    @mock.patch.object(iscsi.ISCSIConnector, '_disconnect_from_iscsi_portal')
+    @mock.patch.object(iscsi.ISCSIConnector, '_discover_iscsi_portals')
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_multipath')
+    @mock.patch.object(base.BaseLinuxConnector, '_discover_mpath_device',
+                       return_value=('/dev/mapper/fake', 'fake'))
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_multipath_device')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn')
+    def test_disconnect_volume_multipath_session_refs(
+            self, mock_wwn, mock_remove, mock_discover_mpath, mock_rescan,
+            mock_discover, mock_disconnect, mock_in_use, mock_exists):
+        connector = self._connector_with_state_file(use_multipath=True)
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        portal1 = '10.0.2.15:3260'
+        portal2 = '10.0.3.15:3260'
+        props = {'target_portal': portal1, 'target_iqn': iqn,
+                 'target_lun': 1}
+        connector._add_session_refs(
+            props, [(portal1 + ',1', iqn, 1), (portal2 + ',1', iqn, 1)])
+        # A volume attached without the state file still uses portal2
+        mock_in_use.side_effect = (
+            lambda props: props['target_portal'] == portal2)
+
+        connector.disconnect_volume(props, None)
+
+        self.assertFalse(mock_discover.called)
+        mock_remove.assert_called_once_with('/dev/disk/by-path/ip-%s-iscsi-'
+                                            '%s-lun-1' % (portal1, iqn))
+        mock_disconnect.assert_called_once_with(
+            dict(props, target_portal=portal1))
+
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_disconnect_from_iscsi_portal')
+    @mock.patch.object(iscsi.ISCSIConnector, '_discover_iscsi_portals')
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_multipath')
+    @mock.patch.object(base.BaseLinuxConnector, '_discover_mpath_device',
+                       return_value=('/dev/mapper/fake', 'fake'))
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_scsi_device')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'find_multipath_device')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn')
+    def test_disconnect_volume_multipath_remove_failed(
+            self, mock_wwn, mock_find, mock_remove, mock_discover_mpath,
+            mock_rescan, mock_discover, mock_disconnect, mock_exists):
+        mock_find.return_value = {
+            'id': 'fake', 'devices': [{'device': '/dev/sdb'},
+                                      {'device': '/dev/sdc'}]}
+        error = putils.ProcessExecutionError(exit_code=1)
+        mock_remove.side_effect = [None, error]
+        props = {'target_portal': '10.0.2.15:3260',
+                 'target_iqn': 'iqn.2010-10.org.openstack:volume-00000001',
+                 'target_lun': 1}
+
+        exc = self.assertRaises(
+            exception.SCSIDevicesNotRemoved,
+            self.connector_with_multipath.disconnect_volume, props, None)
+
+        self.assertEqual([error], list(exc.kwargs['errors'].values()))
+        self.assertEqual(2, mock_remove.call_count)
+        # The sessions are kept, the device is still using them.  The only
+        # discovery is the one of the lock names.
+        mock_discover.assert_called_once_with(props)
+        self.assertFalse(mock_disconnect.called)
+
+    def test_scan_iscsi_luns(self):
+        self.mock_sysfs_sessions.return_value = [
+            {'sid': 1, 'transport': 'tcp', 'portal': '10.0.2.15:3260',
+             'tpgt': 1, 'iqn': 'iqn.1', 'host': 3, 'targets': [(0, 0)],
+             'luns': {1: 'sdb'}},
+            {'sid': 2, 'transport': 'tcp', 'portal': '10.0.3.15:3260',
+             'tpgt': 1, 'iqn': 'iqn.1', 'host': 4, 'targets': [],
+             'luns': {}}]
+
+        result = self.connector._scan_iscsi_luns(
+            [('10.0.2.15:3260', 'iqn.1', 1), ('10.0.2.15:3260', 'iqn.1', 2),
+             ('10.0.3.15:3260', 'iqn.1', 2)])
+
+        self.assertTrue(result)
+        # LUN 1 is already there, so it isn't scanned again
+        self.assertEqual(['tee -a /sys/class/scsi_host/host3/scan',
+                          'tee -a /sys/class/scsi_host/host4/scan'],
+                         self.cmds)
+
+    @mock.patch('os_brick.initiator.linuxscsi.LinuxSCSI.echo_scsi_commands')
+    def test_scan_iscsi_luns_content(self, mock_echo):
+        self.mock_sysfs_sessions.return_value = [
+            {'sid': 2, 'transport': 'tcp', 'portal': '10.0.3.15:3260',
+             'tpgt': 1, 'iqn': 'iqn.1', 'host': 4, 'targets': [(0, 1)],
+             'luns': {}}]
+
+        self.assertTrue(self.connector._scan_iscsi_luns(
+            [('10.0.3.15:3260', 'iqn.1', 2)]))
+
+        mock_echo.assert_called_once_with(
+            [('/sys/class/scsi_host/host4/scan', '0 1 2')])
+
+    @mock.patch.object(iscsi.ISCSIConnector, '_connect_to_iscsi_portal',
+                       return_value=True)
+    @mock.patch.object(iscsi.ISCSIConnector, '_run_iscsiadm_bare')
+    def test_scan_iscsi_luns_discovered_portals(self, mock_iscsiadm,
+                                                mock_connect):
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        mock_iscsiadm.return_value = (
+            '10.0.2.15:3260,1 %(iqn)s\n10.0.3.15:3260,2 %(iqn)s\n' %
+            {'iqn': iqn}, '')
+        self.mock_sysfs_sessions.return_value = [
+            {'sid': 1, 'transport': 'tcp', 'portal': '10.0.2.15:3260',
+             'tpgt': 1, 'iqn': iqn, 'host': 3, 'targets': [(0, 0)],
+             'luns': {}},
+            {'sid': 2, 'transport': 'tcp', 'portal': '10.0.3.15:3260',
+             'tpgt': 2, 'iqn': iqn, 'host': 4, 'targets': [(0, 0)],
+             'luns': {}}]
+        connector = self.connector_with_multipath
+        mock_echo = self.mock_object(connector._linuxscsi,
+                                     'echo_scsi_commands')
+
+        connector._get_potential_volume_paths(
+            {'target_portal': '10.0.2.15:3260', 'target_iqn': iqn,
+             'target_lun': 1})
+
+        mock_echo.assert_called_once_with(mock.ANY)
+        self.assertEqual([('/sys/class/scsi_host/host3/scan', '0 0 1'),
+                          ('/sys/class/scsi_host/host4/scan', '0 0 1')],
+                         sorted(mock_echo.call_args[0][0]))
+        # Only the discovery, no full rescan
+        mock_iscsiadm.assert_called_once_with(
+            ['-m', 'discovery', '-t', 'sendtargets', '-I', 'default',
+             '-p', '10.0.2.15:3260'], check_exit_code=[0, 255])
+
+    def test_scan_iscsi_luns_no_session(self):
+        self.mock_sysfs_sessions.return_value = [
+            {'sid': 1, 'transport': 'tcp', 'portal': '10.0.2.15:3260',
+             'tpgt': 1, 'iqn': 'iqn.1', 'host': 3, 'targets': [(0, 0)],
+             'luns': {}}]
+
+        self.assertFalse(self.connector._scan_iscsi_luns(
+            [('10.0.2.15:3260', 'iqn.1', 1), ('10.0.3.15:3260', 'iqn.1', 1)]))
+        self.assertEqual([], self.cmds)
+
+    def test_rescan_iscsi_no_sysfs(self):
+        self.connector._rescan_iscsi([('10.0.2.15:3260', 'iqn.1', 1)])
+        self.assertEqual(['iscsiadm -m node --rescan',
+                          'iscsiadm -m session --rescan'],
+                         self.cmds)
+
+    @mock.patch.object(iscsi.ISCSIConnector, '_scan_iscsi_luns',
+                       return_value=True)
+    def test_rescan_iscsi_targeted(self, mock_scan):
+        targets = [('10.0.2.15:3260', 'iqn.1', 1)]
+        self.connector._rescan_iscsi(targets)
+        mock_scan.assert_called_once_with(targets)
+        self.assertEqual([], self.cmds)
+
+    @mock.patch.object(host_driver.HostDriver, 'get_iscsi_target_devices')
+    def test_is_target_in_use(self, mock_devices):
+        mock_devices.side_effect = [
+            ['/dev/disk/by-path/ip-10.0.2.15:3260-iscsi-iqn.1-lun-2'], []]
+
+        self.assertTrue(self.connector._is_target_in_use(
+            {'target_portal': '10.0.2.15:3260,1', 'target_iqn': 'iqn.1'}))
+        self.assertFalse(self.connector._is_target_in_use(
+            {'target_portal': '10.0.3.15:3260', 'target_iqn': 'iqn.1'}))
+        mock_devices.assert_called_with('10.0.3.15:3260', 'iqn.1')
+        # The by-path entries are checked even if sysfs has the sessions
+        self.mock_sysfs_sessions.assert_not_called()
+
+    @mock.patch.object(iscsi.ISCSIConnector, '_run_iscsi_session')
+    def test_get_iscsi_sessions_full_iscsiadm(self, mock_session):
+        mock_session.return_value = (
+            'tcp: [1] 10.0.2.15:3260,1 iqn.1 (non-flash)\n'
+            'iser: [7] [2001:db8::1]:3260,2 iqn.2 (non-flash)\n', '')
+        sessions = self.connector._get_iscsi_sessions_full()
+        self.assertEqual([{'sid': 1, 'transport': 'tcp',
+                           'portal': '10.0.2.15:3260', 'tpgt': 1,
+                           'iqn': 'iqn.1'},
+                          {'sid': 7, 'transport': 'iser',
+                           'portal': '[2001:db8::1]:3260', 'tpgt': 2,
+                           'iqn': 'iqn.2'}],
+                         sessions)
+
+    @mock.patch.object(iscsi.ISCSIConnector, '_run_iscsi_session',
+                       return_value=('', 'iscsiadm: No active sessions.'))
+    def test_get_iscsi_sessions_full_iscsiadm_error(self, mock_session):
+        self.assertEqual([], self.connector._get_iscsi_sessions_full())
+
+    def test_connect_to_iscsi_portal_sysfs_session_exists(self):
+        location = '10.0.2.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        self.mock_sysfs_sessions.return_value = [
+            {'sid': 1, 'transport': 'tcp', 'portal': location, 'tpgt': 1,
+             'iqn': iqn, 'host': 3, 'luns': {}}]
+        connection_properties = {'target_portal': location,
+                                 'target_iqn': iqn, 'target_lun': 1}
+
+        self.assertTrue(self.connector._connect_to_iscsi_portal(
+            connection_properties))
+        # No session listing and no login since we are already logged in
+        self.assertEqual(['iscsiadm -m node -T %s -p %s --op update '
+                          '-n node.startup -v automatic' % (iqn, location)],
+                         self.cmds)
+
+    def test_connect_to_iscsi_portal_new_node(self):
+        location = '10.0.2.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        connection_properties = {'target_portal': location,
+                                 'target_iqn': iqn, 'target_lun': 1,
+                                 'auth_method': 'CHAP',
+                                 'auth_username': 'user',
+                                 'auth_password': 'secret'}
+        mock_iscsiadm = self.mock_object(
+            self.connector, '_run_iscsiadm',
+            side_effect=[putils.ProcessExecutionError(None, None, 21),
+                         ('', ''), ('', ''), ('', '')])
+
+        self.assertTrue(self.connector._connect_to_iscsi_portal(
+            connection_properties))
+
+        update = ('--op', 'update',
+                  '-n', 'node.startup', '-v', 'automatic',
+                  '-n', 'node.session.auth.authmethod', '-v', 'CHAP',
+                  '-n', 'node.session.auth.username', '-v', 'user',
+                  '-n', 'node.session.auth.password', '-v', 'secret')
+        mock_iscsiadm.assert_has_calls([
+            mock.call(connection_properties, update),
+            mock.call(connection_properties,
+                      ('--interface', 'default', '--op', 'new')),
+            mock.call(connection_properties, update),
+            mock.call(connection_properties, ('--login',),
+                      check_exit_code=[0, 255])])
+        self.assertEqual(4, mock_iscsiadm.call_count)
+
+    def test_connect_to_iscsi_portal_login_failed(self):
+        location = '10.0.2.15:3260'
+        iqn = 'iqn.2010-10.org.openstack:volume-00000001'
+        connection_properties = {'target_portal': location,
+                                 'target_iqn': iqn, 'target_lun': 1}
+        self.mock_object(self.connector, '_get_iscsi_sessions_full',
+                         return_value=[])
+        mock_iscsiadm = self.mock_object(
+            self.connector, '_run_iscsiadm',
+            side_effect=[('', ''), putils.ProcessExecutionError(None, None, 8),
+                         ('', '')])
+
+        self.assertFalse(self.connector._connect_to_iscsi_portal(
+            connection_properties))
+
+        mock_iscsiadm.assert_has_calls([
+            mock.call(connection_properties,
+                      ('--op', 'update', '-n', 'node.startup',
+                       '-v', 'automatic')),
+            mock.call(connection_properties, ('--login',),
+                      check_exit_code=[0, 255]),
+            mock.call(connection_properties,
+                      ('--op', 'update', '-n', 'node.startup',
+                       '-v', 'manual'), check_exit_code=[0, 21, 255])])
+
+    def test_disconnect_from_iscsi_portal(self):
+        props = {'target_portal': '10.0.2.15:3260', 'target_iqn': 'iqn.1'}
+        mock_batch = self.mock_object(
+            self.connector, '_execute_batch',
+            return_value=[('', ''), ('', ''), ('', '')])
+
+        self.connector._disconnect_from_iscsi_portal(props)
+
+        node = ('iscsiadm', '-m', 'node', '-T', 'iqn.1',
+                '-p', '10.0.2.15:3260')
+        mock_batch.assert_called_once_with(
+            [(node + ('--op', 'update', '-n', 'node.startup',
+                      '-v', 'manual'), {}),
+             (node + ('--logout',), {}),
+             (node + ('--op', 'delete'),
+              {'attempts': 5, 'delay_on_retry': True})],
+            run_as_root=True, root_helper=None,
+            check_exit_code=[0, 21, 255])
+
+    def test_disconnect_from_iscsi_portal_error(self):
+        error = putils.ProcessExecutionError(exit_code=1)
+        self.mock_object(self.connector, '_execute_batch',
+                         return_value=[('', ''), error, None])
+        exc = self.assertRaises(
+            putils.ProcessExecutionError,
+            self.connector._disconnect_from_iscsi_portal,
+            {'target_portal': '10.0.2.15:3260', 'target_iqn': 'iqn.1'})
+        self.assertIs(error, exc)
 
     def test_get_target_portals_from_iscsiadm_output(self):
         connector = self.connector
@@ -815,6 +1541,19 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
                     '/dev/sdb': '/dev/mapper/mpathb'}
         self.assertEqual(expected, self.connector._get_multipath_device_map())
 
+    def test_get_multipath_device_map_sysfs(self):
+        self.mock_mpaths.return_value = [
+            {'device': '/dev/mapper/mpathb', 'id': '36e00000000010001',
+             'name': 'mpathb', 'dm': 'dm-4',
+             'devices': [{'device': '/dev/sda', 'host': '2', 'channel': '0',
+                          'id': '0', 'lun': '1'},
+                         {'device': '/dev/sdb', 'host': '3', 'channel': '0',
+                          'id': '0', 'lun': '1'}]}]
+        expected = {'/dev/sda': '/dev/mapper/mpathb',
+                    '/dev/sdb': '/dev/mapper/mpathb'}
+        self.assertEqual(expected, self.connector._get_multipath_device_map())
+        self.assertEqual([], self.cmds)
+
     @mock.patch.object(iscsi.ISCSIConnector, '_get_multipath_device_map')
     @mock.patch.object(iscsi.ISCSIConnector,
                        '_get_target_portals_from_iscsiadm_output')
@@ -883,6 +1622,94 @@ class ISCSIConnectorTestCase(test_connector.ConnectorTestCase):
         # Only target-1 should be disconneced.
         disconnect_mock.assert_called_once_with(fake_property)
 
+    @mock.patch.object(iscsi.ISCSIConnector, '_get_multipath_device_map',
+                       return_value={})
+    @mock.patch.object(iscsi.ISCSIConnector, '_discover_iscsi_portals')
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_multipath')
+    @mock.patch.object(iscsi.ISCSIConnector, '_get_iscsi_devices',
+                       return_value=[])
+    @mock.patch.object(host_driver.HostDriver, 'get_all_block_devices',
+                       return_value=[])
+    @mock.patch.object(iscsi.ISCSIConnector,
+                       '_disconnect_from_iscsi_portal')
+    @mock.patch.object(base.BaseLinuxConnector, '_discover_mpath_device',
+                       return_value=('/dev/mapper/fake', 'fake'))
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_multipath_device')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn')
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    def test_disconnect_volume_multipath_iscsi_portal_iqns(
+            self, exists_mock, wwn_mock, remove_mock, discover_mpath_mock,
+            disconnect_mock, get_all_devices_mock, get_iscsi_devices_mock,
+            rescan_multipath_mock, discover_mock, get_multipath_map_mock):
+        # Each portal has its own IQN for the volume, connect logs into both
+        # targets so disconnect must lock and log out of both.
+        props = {'target_portal': '10.0.0.1:3260', 'target_iqn': 'iqn.a',
+                 'target_lun': 1}
+        discover_mock.return_value = [['10.0.0.1:3260,1', 'iqn.a'],
+                                      ['10.0.0.2:3260,1', 'iqn.b']]
+        connector = self.connector_with_multipath
+
+        self.assertEqual(['iscsi-iqn.a', 'iscsi-iqn.b'],
+                         connector._get_lock_names(props))
+        connector.disconnect_volume(props, None)
+
+        disconnect_mock.assert_has_calls(
+            [mock.call(dict(props, target_portal='10.0.0.1:3260,1')),
+             mock.call(dict(props, target_portal='10.0.0.2:3260,1',
+                            target_iqn='iqn.b'))],
+            any_order=True)
+        self.assertEqual(2, disconnect_mock.call_count)
+
+    @mock.patch.object(iscsi.ISCSIConnector, '_get_multipath_device_map',
+                       return_value={})
+    @mock.patch.object(iscsi.ISCSIConnector, '_discover_iscsi_portals')
+    @mock.patch.object(iscsi.ISCSIConnector, '_rescan_multipath')
+    @mock.patch.object(iscsi.ISCSIConnector, '_get_iscsi_devices',
+                       return_value=[])
+    @mock.patch.object(host_driver.HostDriver, 'get_all_block_devices',
+                       return_value=[])
+    @mock.patch.object(iscsi.ISCSIConnector,
+                       '_disconnect_from_iscsi_portal')
+    @mock.patch.object(base.BaseLinuxConnector, '_discover_mpath_device',
+                       return_value=('/dev/mapper/fake', 'fake'))
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_multipath_device')
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn')
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    def test_disconnect_volume_multipath_iscsi_target_connecting(
+            self, exists_mock, wwn_mock, remove_mock, discover_mpath_mock,
+            disconnect_mock, get_all_devices_mock, get_iscsi_devices_mock,
+            rescan_multipath_mock, discover_mock, get_multipath_map_mock):
+        portal = '10.0.0.1:3260'
+        iqn1 = 'iqn.2010-10.org.openstack:volume-00000001'
+        iqn2 = 'iqn.2010-10.org.openstack:volume-00000002'
+        props1 = {'target_portal': portal, 'target_iqn': iqn1,
+                  'target_lun': 1}
+        props2 = dict(props1, target_iqn=iqn2)
+        # The target of volume 2 has no device yet, it is being connected
+        discover_mock.return_value = [[portal + ',1', iqn1],
+                                      [portal + ',1', iqn2]]
+        connector = self.connector_with_multipath
+        locked = threading.Event()
+        connected = threading.Event()
+        self.addCleanup(connected.set)
+
+        def _connect():
+            with utils.resource_locks(connector._get_lock_names(props2)):
+                locked.set()
+                connected.wait(10)
+
+        connect = threading.Thread(target=_connect)
+        connect.start()
+        self.assertTrue(locked.wait(10))
+
+        connector.disconnect_volume(props1, None)
+
+        self.assertTrue(connect.is_alive())
+        disconnect_mock.assert_called_once_with(
+            dict(props1, target_portal=portal + ',1'))
+        connected.set()
+        connect.join(10)
+
     @mock.patch.object(iscsi.ISCSIConnector, '_get_multipath_device_map',
                        return_value={})
     @mock.patch.object(iscsi.ISCSIConnector,
@@ -21,6 +21,7 @@ from oslo_concurrency import processutils as putils
 
 from os_brick import exception
 from os_brick.initiator.connectors import scaleio
+from os_brick.initiator import device_waiter
 from os_brick.tests.initiator import test_connector
 
 
@@ -232,12 +233,15 @@ class ScaleIOConnectorTestCase(test_connector.ConnectorTestCase):
 
         self.assertRaises(exception.BrickException, self.test_connect_volume)
 
-    @mock.patch('time.sleep')
-    def test_error_path_not_found(self, sleep_mock):
+    @mock.patch.object(device_waiter, 'wait_for')
+    def test_error_path_not_found(self, wait_mock):
         """Timeout waiting for volume to map to local file system"""
+        wait_mock.side_effect = lambda check, dirs, timeout: check()
         self.mock_object(os, 'listdir', return_value=["emc-vol-no-volume"])
         self.assertRaises(exception.BrickException, self.test_connect_volume)
-        self.assertTrue(sleep_mock.called)
+        wait_mock.assert_called_once_with(
+            mock.ANY, [self.connector.get_search_path()],
+            self.connector.VOLUME_PATH_TIMEOUT)
 
     def test_map_volume_already_mapped(self):
         """Ignore REST API failure for volume already mapped"""
@@ -0,0 +1,111 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from oslo_concurrency import processutils as putils
+import testtools
+
+from os_brick.initiator.connectors import fake
+from os_brick.tests import base
+
+try:
+    import asyncio
+
+    from os_brick.initiator import aio
+except ImportError:
+    aio = None
+
+
+class FakeConnector(fake.FakeConnector):
+
+    def connect_volume(self, connection_properties):
+        out, _err = self._execute('echo', connection_properties['name'],
+                                  run_as_root=True,
+                                  root_helper=self._root_helper)
+        return {'type': 'fake', 'path': out.strip()}
+
+
+@testtools.skipIf(aio is None, 'Requires asyncio')
+class AsyncConnectorTestCase(base.TestCase):
+
+    def setUp(self):
+        super(AsyncConnectorTestCase, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.connector = aio.AsyncConnector(
+            FakeConnector('env LANG=C', execute=putils.execute))
+        self.addCleanup(self.connector.close)
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_connect_volume(self):
+        results = self.run_coroutine(asyncio.gather(*[
+            self.connector.connect_volume({'name': 'vol%d' % i})
+            for i in range(20)]))
+        self.assertEqual([{'type': 'fake', 'path': 'vol%d' % i}
+                          for i in range(20)], results)
+
+    def test_methods(self):
+        self.assertIsNone(self.run_coroutine(
+            self.connector.disconnect_volume({}, {})))
+        self.assertIsNone(self.run_coroutine(
+            self.connector.extend_volume({})))
+        self.assertEqual([FakeConnector.fake_path], self.run_coroutine(
+            self.connector.get_volume_paths({})))
+
+    def test_max_workers(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        connector = aio.AsyncConnector(
+            FakeConnector('env LANG=C', execute=putils.execute),
+            max_workers=2)
+        self.addCleanup(connector.close)
+        connect_volume = connector.connector.connect_volume
+
+        def _connect_volume(connection_properties):
+            with lock:
+                running.append(connection_properties)
+                max_running.append(len(running))
+            try:
+                return connect_volume(connection_properties)
+            finally:
+                with lock:
+                    running.remove(connection_properties)
+
+        self.mock_object(connector.connector, 'connect_volume',
+                         side_effect=_connect_volume)
+        results = self.run_coroutine(asyncio.gather(*[
+            connector.connect_volume({'name': 'vol%d' % i})
+            for i in range(5)]))
+        self.assertEqual([{'type': 'fake', 'path': 'vol%d' % i}
+                          for i in range(5)], results)
+        self.assertLessEqual(max(max_running), 2)
+
+    def test_error(self):
+        self.mock_object(self.connector.connector, 'extend_volume',
+                         side_effect=ValueError)
+        self.assertRaises(ValueError, self.run_coroutine,
+                          self.connector.extend_volume({}))
+
+    def test_get_connector(self):
+        connector = aio.get_connector('iscsi', 'sudo', max_workers=3)
+        self.addCleanup(connector.close)
+        self.assertEqual('sudo', connector.connector._root_helper)
+        self.assertEqual(3, connector._workers._max_workers)
+
+        self.assertRaises(ValueError, aio.get_connector, 'NFS', 'sudo')
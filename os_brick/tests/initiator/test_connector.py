@@ -146,6 +146,28 @@ class ConnectorTestCase(test_base.TestCase):
     def test_disconnect_volume(self):
         self.connector = fake.FakeConnector(None)
 
+    def test_connect_volumes(self):
+        self.connector = fake.FakeConnector(None)
+        error = ValueError()
+        with mock.patch.object(self.connector, 'connect_volume',
+                               side_effect=[{'path': '/dev/sdb'}, error]):
+            results = self.connector.connect_volumes(
+                [self.fake_connection(), self.fake_connection()])
+        self.assertEqual([{'path': '/dev/sdb'}, {'error': error}], results)
+
+    def test_disconnect_volumes(self):
+        self.connector = fake.FakeConnector(None)
+        error = ValueError()
+        with mock.patch.object(self.connector, 'disconnect_volume',
+                               side_effect=[None, error]) as mock_disconnect:
+            results = self.connector.disconnect_volumes(
+                [{'volume_id': 1}, {'volume_id': 2}],
+                [{'path': '/dev/sdb'}, {'path': '/dev/sdc'}])
+        self.assertEqual([None, error], results)
+        mock_disconnect.assert_has_calls(
+            [mock.call({'volume_id': 1}, {'path': '/dev/sdb'}),
+             mock.call({'volume_id': 2}, {'path': '/dev/sdc'})])
+
     def test_get_connector_properties(self):
         with mock.patch.object(priv_rootwrap, 'execute') as mock_exec:
             mock_exec.return_value = True
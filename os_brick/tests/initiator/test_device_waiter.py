@@ -0,0 +1,152 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import select
+import shutil
+import socket
+import tempfile
+import threading
+
+import mock
+
+from os_brick.initiator import device_waiter
+from os_brick.tests import base
+
+
+class DeviceWaiterTestCase(base.TestCase):
+
+    def setUp(self):
+        super(DeviceWaiterTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def _create_later(self, path, delay=0.1):
+        def _create():
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+        timer = threading.Timer(delay, _create)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_wait_for_any_already_there(self):
+        path = os.path.join(self.root, 'sdb')
+        open(path, 'w').close()
+
+        result = device_waiter.wait_for_any(
+            [os.path.join(self.root, 'sda'), path], 10)
+
+        self.assertEqual(path, result)
+
+    def test_wait_for_any_arrives(self):
+        path = os.path.join(self.root, 'sdb')
+        self._create_later(path)
+
+        with mock.patch('time.sleep') as sleep_mock:
+            result = device_waiter.wait_for_any([path], 10)
+
+        self.assertEqual(path, result)
+        if device_waiter._get_libc():
+            # Woken up by inotify, not by polling.
+            sleep_mock.assert_not_called()
+
+    def test_wait_for_any_missing_directory(self):
+        # The directory doesn't exist yet when we start waiting
+        path = os.path.join(self.root, 'by-path', 'sdb')
+        self._create_later(path)
+
+        result = device_waiter.wait_for_any([path], 10)
+
+        self.assertEqual(path, result)
+
+    def test_wait_for_any_removed(self):
+        path = os.path.join(self.root, 'sdb')
+        open(path, 'w').close()
+        threading.Timer(0.1, os.remove, [path]).start()
+
+        result = device_waiter.wait_for_any([path], 10, exist=False)
+
+        self.assertEqual(path, result)
+
+    def test_wait_for_any_timeout(self):
+        result = device_waiter.wait_for_any(
+            [os.path.join(self.root, 'sdb')], 0.2)
+
+        self.assertIsNone(result)
+
+    @mock.patch.object(device_waiter, '_get_libc', return_value=False)
+    def test_wait_for_any_polling(self, libc_mock):
+        path = os.path.join(self.root, 'sdb')
+        self._create_later(path)
+
+        with mock.patch.object(device_waiter, '_DirectoryWatcher') as watcher:
+            result = device_waiter.wait_for_any([path], 10)
+
+        self.assertEqual(path, result)
+        watcher.assert_not_called()
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(device_waiter, '_get_libc', return_value=False)
+    def test_wait_for_returns_check_result(self, libc_mock, sleep_mock):
+        check = mock.Mock(side_effect=[None, None, 'sdb'])
+
+        result = device_waiter.wait_for(check, [self.root], 10)
+
+        self.assertEqual('sdb', result)
+        self.assertEqual(3, check.call_count)
+        self.assertEqual(2, sleep_mock.call_count)
+
+    def test_wait_for_uevent(self):
+        watcher = mock.Mock()
+        self.mock_object(device_waiter, 'get_uevent_watcher',
+                         return_value=watcher)
+        check = mock.Mock(side_effect=[False, False, True])
+
+        self.assertTrue(device_waiter.wait_for_uevent(check, 10))
+
+        self.assertEqual(2, watcher.wait.call_count)
+        watcher.close.assert_called_once_with()
+
+    def test_uevent_watcher_get_events(self):
+        sock = mock.Mock()
+        sock.recv.side_effect = [
+            b'add@/devices/virtual/block/dm-3\0ACTION=add\0'
+            b'SUBSYSTEM=block\0DEVNAME=dm-3\0',
+            socket.error(errno.EAGAIN, 'Try again')]
+        self.mock_object(socket, 'socket', return_value=sock)
+        self.mock_object(select, 'select', return_value=([sock], [], []))
+        watcher = device_waiter._UeventWatcher(
+            device_waiter.UEVENT_KERNEL_GROUP)
+
+        self.assertEqual([{'ACTION': 'add', 'SUBSYSTEM': 'block',
+                           'DEVNAME': 'dm-3'}], watcher.get_events(0))
+
+        sock.recv.side_effect = socket.error(errno.ENOBUFS, 'No buffer')
+        self.assertIsNone(watcher.get_events(0))
+        self.assertTrue(watcher.wait(0))
+
+        select.select.return_value = ([], [], [])
+        self.assertEqual([], watcher.get_events(0))
+        self.assertFalse(watcher.wait(0))
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(device_waiter, 'get_uevent_watcher',
+                       return_value=None)
+    def test_wait_for_uevent_polling(self, watcher_mock, sleep_mock):
+        check = mock.Mock(side_effect=[False, True])
+
+        self.assertTrue(device_waiter.wait_for_uevent(check, 10))
+
+        self.assertEqual(1, sleep_mock.call_count)
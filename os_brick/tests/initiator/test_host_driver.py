@@ -13,6 +13,9 @@
 #    under the License.
 
 import errno
+import os
+import shutil
+import tempfile
 
 import mock
 
@@ -45,3 +48,87 @@ class HostDriverTestCase(base.TestCase):
         oserror = OSError(errno.ENOMEM, "")
         with mock.patch('os.listdir', side_effect=oserror):
             self.assertRaises(OSError, driver.get_all_block_devices)
+
+
+class HostDriverIndexTestCase(base.TestCase):
+
+    def setUp(self):
+        super(HostDriverIndexTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.by_path = os.path.join(self.root, 'by-path') + '/'
+        os.makedirs(self.by_path)
+        self.mock_object(host_driver, 'BY_PATH_DIR', self.by_path)
+        # The directory was changed a while ago
+        self.mock_object(host_driver, 'MTIME_RACE_WINDOW', -1)
+        self.driver = host_driver.HostDriver()
+
+    def add(self, name):
+        os.symlink(self.root, self.by_path + name)
+        return self.by_path + name
+
+    def test_get_iscsi_target_devices(self):
+        iqn = 'iqn.2010-10.org.openstack:volume-1'
+        lun1 = self.add('ip-10.0.2.15:3260-iscsi-%s-lun-1' % iqn)
+        lun2 = self.add('pci-0000:00:00.0-ip-10.0.2.15:3260-iscsi-%s-lun-2' %
+                        iqn)
+        ipv6 = self.add('ip-2001:db8::1:3260-iscsi-%s-lun-1' % iqn)
+        self.add('ip-10.0.3.15:3260-iscsi-%s-lun-1' % iqn)
+        self.add('virtio-pci-0000:00:04.0')
+        # Dangling links are not in use
+        os.symlink(os.path.join(self.root, 'sdz'),
+                   self.by_path + 'ip-10.0.4.15:3260-iscsi-%s-lun-1' % iqn)
+
+        self.assertEqual([lun1, lun2], self.driver.get_iscsi_target_devices(
+            '10.0.2.15:3260', iqn))
+        self.assertEqual([ipv6], self.driver.get_iscsi_target_devices(
+            '[2001:db8::1]:3260', iqn))
+        # Portals from discovery have the target portal group tag
+        self.assertEqual([lun1, lun2], self.driver.get_iscsi_target_devices(
+            '10.0.2.15:3260,1', iqn))
+        self.assertEqual([ipv6], self.driver.get_iscsi_target_devices(
+            '[2001:db8::1]:3260,1', iqn))
+        self.assertEqual([], self.driver.get_iscsi_target_devices(
+            '10.0.4.15:3260', iqn))
+        self.assertEqual([], self.driver.get_iscsi_target_devices(
+            '10.0.2.15:3260', 'iqn.2'))
+
+    def test_get_iscsi_target_devices_incremental(self):
+        lun1 = self.add('ip-10.0.2.15:3260-iscsi-iqn.1-lun-1')
+        self.assertEqual([lun1], self.driver.get_iscsi_target_devices(
+            '10.0.2.15:3260', 'iqn.1'))
+
+        # The directory is not read again if it hasn't changed
+        with mock.patch('os.listdir') as listdir_mock:
+            self.driver.get_iscsi_target_devices('10.0.2.15:3260', 'iqn.1')
+        listdir_mock.assert_not_called()
+
+        lun2 = self.add('ip-10.0.2.15:3260-iscsi-iqn.1-lun-2')
+        os.remove(lun1)
+        # Make sure the mtime changes even on coarse timestamps
+        os.utime(self.by_path, (0, 0))
+        with mock.patch.object(self.driver, '_index_entry',
+                               wraps=self.driver._index_entry) as index_mock:
+            self.assertEqual([lun2], self.driver.get_iscsi_target_devices(
+                '10.0.2.15:3260', 'iqn.1'))
+        # Only the changes are indexed
+        self.assertEqual(
+            [mock.call('ip-10.0.2.15:3260-iscsi-iqn.1-lun-1', add=False),
+             mock.call('ip-10.0.2.15:3260-iscsi-iqn.1-lun-2', add=True)],
+            index_mock.call_args_list)
+
+    def test_get_iscsi_target_devices_recent_mtime(self):
+        host_driver.MTIME_RACE_WINDOW = 3600
+        self.add('ip-10.0.2.15:3260-iscsi-iqn.1-lun-1')
+        self.driver.get_iscsi_target_devices('10.0.2.15:3260', 'iqn.1')
+
+        # A recent mtime could hide further changes, so we look again
+        with mock.patch('os.listdir', return_value=[]) as listdir_mock:
+            self.assertEqual([], self.driver.get_iscsi_target_devices(
+                '10.0.2.15:3260', 'iqn.1'))
+        listdir_mock.assert_called_once_with(self.by_path)
+
+    def test_get_iscsi_target_devices_no_directory(self):
+        shutil.rmtree(self.by_path)
+        self.assertEqual([], self.driver.get_iscsi_target_devices(
+            '10.0.2.15:3260', 'iqn.1'))
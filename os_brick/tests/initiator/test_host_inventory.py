@@ -0,0 +1,161 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from os_brick.initiator import device_waiter
+from os_brick.initiator import host_inventory
+from os_brick.initiator import multipath_topology
+from os_brick.initiator import sysfs
+from os_brick.tests import base
+
+WWN = '3600d0230000000000e13955cc3757803'
+SESSIONS = [
+    {'sid': 1, 'transport': 'tcp', 'portal': '10.0.2.15:3260', 'tpgt': 1,
+     'iqn': 'iqn.1', 'host': 3, 'targets': [(0, 0)],
+     'luns': {1: 'sdb', 2: 'sdc'}},
+    {'sid': 2, 'transport': 'tcp', 'portal': '10.0.3.15:3260', 'tpgt': 1,
+     'iqn': 'iqn.1', 'host': 4, 'targets': [], 'luns': {}}]
+MPATHS = [
+    {'device': '/dev/mapper/' + WWN, 'id': WWN, 'name': WWN, 'dm': 'dm-3',
+     'devices': [{'device': '/dev/sdb', 'host': '3', 'channel': '0',
+                  'id': '0', 'lun': '1'}]}]
+
+
+class HostInventoryTestCase(base.TestCase):
+
+    def setUp(self):
+        super(HostInventoryTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.mock_sessions = self.mock_object(
+            sysfs, 'get_iscsi_sessions', return_value=SESSIONS)
+        self.mock_object(multipath_topology, 'get_multipath_devices',
+                         return_value=MPATHS)
+        self.mock_object(sysfs, 'get_fc_remote_ports', return_value=[])
+        self.mock_object(sysfs, 'SYSFS_ROOT', self.root)
+        for name in ('sda', 'sdb', 'sdc'):
+            os.makedirs(os.path.join(self.root, 'block', name))
+        by_path = os.path.join(self.root, 'by-path')
+        os.makedirs(by_path)
+        self.link = os.path.join(by_path,
+                                 'ip-10.0.2.15:3260-iscsi-iqn.1-lun-1')
+        os.symlink(os.path.join(self.root, 'block', 'sdb'), self.link)
+        self.mock_object(host_inventory, 'DISK_BY_PATH', by_path)
+        self.mock_object(host_inventory, 'DISK_BY_ID',
+                         os.path.join(self.root, 'by-id'))
+
+        self.watcher = mock.Mock()
+        self.watcher.get_events.return_value = []
+        self.mock_object(device_waiter, 'get_uevent_watcher',
+                         return_value=self.watcher)
+        self.inventory = host_inventory.HostInventory()
+
+    def test_queries(self):
+        inventory = self.inventory
+
+        self.assertEqual({1: '/dev/sdb', 2: '/dev/sdc'},
+                         inventory.get_target_devices('10.0.2.15:3260,1',
+                                                      'iqn.1'))
+        self.assertTrue(inventory.is_target_in_use('10.0.2.15:3260',
+                                                   'iqn.1'))
+        self.assertFalse(inventory.is_target_in_use('10.0.3.15:3260',
+                                                    'iqn.1'))
+        self.assertFalse(inventory.is_target_in_use('10.0.4.15:3260',
+                                                    'iqn.1'))
+        self.assertEqual(MPATHS[0], inventory.get_multipath_device(WWN))
+        self.assertEqual({}, inventory.get_multipath_device('3601'))
+        self.assertEqual(['/dev/sdb'], inventory.get_multipath_paths(WWN))
+        self.assertEqual({'/dev/sdb': '/dev/mapper/' + WWN},
+                         inventory.get_multipath_device_map())
+        self.assertEqual(['sda', 'sdb', 'sdc'],
+                         inventory.get_block_devices())
+        self.assertEqual({self.link: os.path.join(self.root, 'block', 'sdb')},
+                         inventory.get_by_path_links())
+        self.assertEqual({}, inventory.get_by_id_links())
+        self.assertEqual([], inventory.get_fc_remote_ports())
+        # Everything was answered from a single read of the host
+        self.mock_sessions.assert_called_once_with()
+
+    def test_no_sysfs(self):
+        self.mock_sessions.return_value = None
+        multipath_topology.get_multipath_devices.return_value = None
+
+        self.assertIsNone(self.inventory.is_target_in_use('10.0.2.15:3260',
+                                                          'iqn.1'))
+        self.assertIsNone(self.inventory.get_multipath_paths(WWN))
+        self.assertIsNone(self.inventory.get_multipath_device_map())
+
+    def test_rebuilt_on_uevent(self):
+        self.inventory.get_iscsi_sessions()
+        self.inventory.get_iscsi_sessions()
+        self.assertEqual(1, self.mock_sessions.call_count)
+
+        self.watcher.get_events.return_value = [
+            {'ACTION': 'add', 'SUBSYSTEM': 'iscsi_session'}]
+        self.inventory.get_iscsi_sessions()
+        self.assertEqual(2, self.mock_sessions.call_count)
+        self.watcher.get_events.assert_called_with(0)
+
+    def test_uevent_drops_affected_indexes(self):
+        mock_mpaths = multipath_topology.get_multipath_devices
+        mock_rports = sysfs.get_fc_remote_ports
+
+        def _query(events):
+            # The events are received once, before the first query
+            self.watcher.get_events.side_effect = [events, [], []]
+            self.inventory.get_iscsi_sessions()
+            self.inventory.get_multipath_device(WWN)
+            self.inventory.get_fc_remote_ports()
+            return (self.mock_sessions.call_count, mock_mpaths.call_count,
+                    mock_rports.call_count)
+
+        self.assertEqual((1, 1, 1), _query([]))
+        # Indexes are only built again after the uevents of their devices
+        self.assertEqual((1, 1, 1), _query([
+            {'ACTION': 'add', 'SUBSYSTEM': 'net', 'DEVNAME': 'eth1'}]))
+        self.assertEqual((1, 2, 1), _query([
+            {'ACTION': 'change', 'SUBSYSTEM': 'block', 'DEVNAME': 'dm-3'}]))
+        self.assertEqual((2, 3, 1), _query([
+            {'ACTION': 'add', 'SUBSYSTEM': 'block', 'DEVNAME': 'sdd'}]))
+        self.assertEqual((2, 3, 2), _query([
+            {'ACTION': 'add', 'SUBSYSTEM': 'fc_remote_ports'}]))
+        # Lost uevents drop everything
+        self.assertEqual((3, 4, 3), _query(None))
+
+    def test_indexes_built_lazily(self):
+        self.inventory.get_block_devices()
+        self.mock_sessions.assert_not_called()
+        multipath_topology.get_multipath_devices.assert_not_called()
+
+    def test_refresh(self):
+        self.inventory.get_iscsi_sessions()
+        self.inventory.refresh()
+        self.inventory.get_iscsi_sessions()
+        self.assertEqual(2, self.mock_sessions.call_count)
+
+    def test_rebuilt_without_uevents(self):
+        device_waiter.get_uevent_watcher.return_value = None
+        inventory = host_inventory.HostInventory()
+
+        inventory.get_iscsi_sessions()
+        inventory.get_iscsi_sessions()
+
+        self.assertEqual(2, self.mock_sessions.call_count)
+
+    def test_get_inventory(self):
+        inventory = host_inventory.get_inventory()
+        self.assertIs(inventory, host_inventory.get_inventory())
@@ -39,29 +39,30 @@ class LinuxFCTestCase(base.TestCase):
             ('/sys/class/fc_transport/target10:2:3/node_name:'
              '0x5006016090203181\n/sys/class/fc_transport/target10:4:5/'
              'node_name:0x5006016090203181', ''),
-            None,
-            None,
             ('/sys/class/fc_transport/target11:6:7/node_name:'
              '0x5006016090203181\n/sys/class/fc_transport/target11:8:9/'
              'node_name:0x5006016090203181', ''),
             None,
+            None,
+            None,
             None)
         hbas = [{'host_device': 'host10', 'node_name': '5006016090203181'},
                 {'host_device': 'host11', 'node_name': '5006016090203181'}]
         with mock.patch.object(self.lfc, '_execute',
                                side_effect=execute_results) as execute_mock:
             self.lfc.rescan_hosts(hbas, 1)
+            # The targets of all the HBAs are found before scanning them
             expected_commands = [
                 mock.call('grep 5006016090203181 /sys/class/fc_transport/'
                           'target10:*/node_name'),
+                mock.call('grep 5006016090203181 /sys/class/fc_transport/'
+                          'target11:*/node_name'),
                 mock.call('tee', '-a', '/sys/class/scsi_host/host10/scan',
                           process_input='2 3 1',
                           root_helper=None, run_as_root=True),
                 mock.call('tee', '-a', '/sys/class/scsi_host/host10/scan',
                           process_input='4 5 1',
                           root_helper=None, run_as_root=True),
-                mock.call('grep 5006016090203181 /sys/class/fc_transport/'
-                          'target11:*/node_name'),
                 mock.call('tee', '-a', '/sys/class/scsi_host/host11/scan',
                           process_input='6 7 1',
                           root_helper=None, run_as_root=True),
@@ -108,11 +109,11 @@ class LinuxFCTestCase(base.TestCase):
             expected_commands = [
                 mock.call('grep 5006016090203181 /sys/class/fc_transport/'
                           'target10:*/node_name'),
+                mock.call('grep 5006016090203181 /sys/class/fc_transport/'
+                          'target11:*/node_name'),
                 mock.call('tee', '-a', '/sys/class/scsi_host/host10/scan',
                           process_input='- - 1',
                           root_helper=None, run_as_root=True),
-                mock.call('grep 5006016090203181 /sys/class/fc_transport/'
-                          'target11:*/node_name'),
                 mock.call('tee', '-a', '/sys/class/scsi_host/host11/scan',
                           process_input='- - 1',
                           root_helper=None, run_as_root=True)]
@@ -121,10 +122,12 @@ class LinuxFCTestCase(base.TestCase):
             self.assertEqual(len(expected_commands), execute_mock.call_count)
 
     def test_get_fc_hbas_fail(self):
-        def fake_exec1(a, b, c, d, run_as_root=True, root_helper='sudo'):
+        def fake_exec1(a, b, c, d, run_as_root=True, root_helper='sudo',
+                       read_only=False):
             raise OSError
 
-        def fake_exec2(a, b, c, d, run_as_root=True, root_helper='sudo'):
+        def fake_exec2(a, b, c, d, run_as_root=True, root_helper='sudo',
+                       read_only=False):
             return None, 'None found'
 
         self.lfc._execute = fake_exec1
@@ -135,7 +138,8 @@ class LinuxFCTestCase(base.TestCase):
         self.assertEqual(0, len(hbas))
 
     def test_get_fc_hbas(self):
-        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo'):
+        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo',
+                      read_only=False):
             return SYSTOOL_FC, None
         self.lfc._execute = fake_exec
         hbas = self.lfc.get_fc_hbas()
@@ -146,7 +150,8 @@ class LinuxFCTestCase(base.TestCase):
         self.assertEqual("host2", hba2["ClassDevice"])
 
     def test_get_fc_hbas_info(self):
-        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo'):
+        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo',
+                      read_only=False):
             return SYSTOOL_FC, None
         self.lfc._execute = fake_exec
         hbas_info = self.lfc.get_fc_hbas_info()
@@ -165,7 +170,8 @@ class LinuxFCTestCase(base.TestCase):
         self.assertEqual(expected_info, hbas_info)
 
     def test_get_fc_wwpns(self):
-        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo'):
+        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo',
+                      read_only=False):
             return SYSTOOL_FC, None
 
         self.lfc._execute = fake_exec
@@ -174,7 +180,8 @@ class LinuxFCTestCase(base.TestCase):
         self.assertEqual(expected_wwpns, wwpns)
 
     def test_get_fc_wwnns(self):
-        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo'):
+        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo',
+                      read_only=False):
             return SYSTOOL_FC, None
         self.lfc._execute = fake_exec
         wwnns = self.lfc.get_fc_wwpns()
@@ -258,7 +265,8 @@ class LinuxFCS390XTestCase(LinuxFCTestCase):
                                                   execute=self.fake_execute)
 
     def test_get_fc_hbas_info(self):
-        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo'):
+        def fake_exec(a, b, c, d, run_as_root=True, root_helper='sudo',
+                      read_only=False):
             return SYSTOOL_FC_S390X, None
         self.lfc._execute = fake_exec
         hbas_info = self.lfc.get_fc_hbas_info()
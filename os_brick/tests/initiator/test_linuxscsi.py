@@ -14,14 +14,24 @@
 
 import os
 import os.path
+import socket
 import textwrap
+import threading
 import time
 
 import mock
+from oslo_concurrency import processutils as putils
 from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from os_brick import exception
+from os_brick import executor
+from os_brick.initiator import device_waiter
 from os_brick.initiator import linuxscsi
+from os_brick.initiator import multipath_topology
+from os_brick.initiator import sysfs
+from os_brick.privileged import multipathd as priv_multipathd
+from os_brick.privileged import sysfs as priv_sysfs
 from os_brick.tests import base
 
 LOG = logging.getLogger(__name__)
@@ -33,6 +43,9 @@ class LinuxSCSITestCase(base.TestCase):
         self.cmds = []
         self.mock_object(os.path, 'realpath', return_value='/dev/sdc')
         self.mock_object(os, 'stat', returns=os.stat(__file__))
+        # Make the tests use multipath instead of the host's sysfs
+        self.mock_mpaths = self.mock_object(
+            multipath_topology, 'get_multipath_devices', return_value=None)
         self.linuxscsi = linuxscsi.LinuxSCSI(None, execute=self.fake_execute)
 
     def fake_execute(self, *cmd, **kwargs):
@@ -44,6 +57,42 @@ class LinuxSCSITestCase(base.TestCase):
         expected_commands = ['tee -a /some/path']
         self.assertEqual(expected_commands, self.cmds)
 
+    @mock.patch.object(priv_sysfs, 'write', return_value=[None, None])
+    @mock.patch.object(linuxscsi.LinuxSCSI, '_is_default_execute',
+                       return_value=True)
+    @mock.patch.object(executor, 'invalidate_command_cache')
+    def test_echo_scsi_commands_privileged(self, invalidate_mock,
+                                           default_mock, write_mock):
+        writes = [('/sys/class/scsi_host/host3/scan', '0 0 1'),
+                  ('/sys/class/scsi_host/host4/scan', '0 0 1')]
+
+        self.linuxscsi.echo_scsi_commands(writes)
+
+        write_mock.assert_called_once_with(writes)
+        invalidate_mock.assert_called_once_with()
+        self.assertEqual([], self.cmds)
+
+    @mock.patch.object(priv_sysfs, 'write',
+                       return_value=[None, (6, 'No such device')])
+    @mock.patch.object(linuxscsi.LinuxSCSI, '_is_default_execute',
+                       return_value=True)
+    def test_echo_scsi_commands_privileged_error(self, default_mock,
+                                                 write_mock):
+        exc = self.assertRaises(
+            putils.ProcessExecutionError,
+            self.linuxscsi.echo_scsi_commands,
+            [('/sys/block/sdb/device/delete', '1'),
+             ('/sys/block/sdc/device/delete', '1')])
+
+        self.assertEqual(6, exc.exit_code)
+        self.assertEqual('tee -a /sys/block/sdc/device/delete', exc.cmd)
+
+    def test_echo_scsi_commands(self):
+        self.linuxscsi.echo_scsi_commands([('/some/path', '1'),
+                                           ('/other/path', '2')])
+        self.assertEqual(['tee -a /some/path', 'tee -a /other/path'],
+                         self.cmds)
+
     @mock.patch.object(os.path, 'realpath')
     def test_get_name_from_path(self, realpath_mock):
         device_name = "/dev/sdc"
@@ -72,23 +121,30 @@ class LinuxSCSITestCase(base.TestCase):
             ('tee -a /sys/block/sdc/device/delete')]
         self.assertEqual(expected_commands, self.cmds)
 
-    @mock.patch('time.sleep')
-    def test_wait_for_volume_removal(self, sleep_mock):
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'multipath_del_path')
+    @mock.patch.object(os.path, 'exists', return_value=True)
+    def test_remove_scsi_device_multipath_path(self, exists_mock,
+                                               del_path_mock):
+        self.linuxscsi.remove_scsi_device("/dev/sdc")
+        self.assertFalse(del_path_mock.called)
+
+        self.linuxscsi.remove_scsi_device("/dev/sdc", multipath_path=True)
+        del_path_mock.assert_called_once_with("/dev/sdc")
+
+    @mock.patch.object(device_waiter, 'wait_for_any', return_value=None)
+    def test_wait_for_volume_removal(self, wait_mock):
         fake_path = '/dev/disk/by-path/fake-iscsi-iqn-lun-0'
-        exists_mock = mock.Mock()
-        exists_mock.return_value = True
-        os.path.exists = exists_mock
         self.assertRaises(exception.VolumePathNotRemoved,
                           self.linuxscsi.wait_for_volume_removal,
                           fake_path)
 
-        exists_mock = mock.Mock()
-        exists_mock.return_value = False
-        os.path.exists = exists_mock
+        wait_mock.return_value = fake_path
         self.linuxscsi.wait_for_volume_removal(fake_path)
         expected_commands = []
         self.assertEqual(expected_commands, self.cmds)
-        self.assertTrue(sleep_mock.called)
+        wait_mock.assert_called_with([fake_path],
+                                     linuxscsi.PATH_WAIT_TIMEOUT,
+                                     exist=False)
 
     def test_flush_multipath_device(self):
         self.linuxscsi.flush_multipath_device('/dev/dm-9')
@@ -100,7 +156,8 @@ class LinuxSCSITestCase(base.TestCase):
         expected_commands = [('multipath -F')]
         self.assertEqual(expected_commands, self.cmds)
 
-    def test_get_scsi_wwn(self):
+    @mock.patch.object(sysfs, 'get_scsi_wwn', return_value=None)
+    def test_get_scsi_wwn(self, sysfs_mock):
         fake_path = '/dev/disk/by-id/somepath'
         fake_wwn = '1234567890'
 
@@ -111,48 +168,66 @@ class LinuxSCSITestCase(base.TestCase):
         wwn = self.linuxscsi.get_scsi_wwn(fake_path)
         self.assertEqual(fake_wwn, wwn)
 
+    @mock.patch.object(sysfs, 'get_scsi_wwn', return_value='31234567890')
+    def test_get_scsi_wwn_sysfs(self, sysfs_mock):
+        wwn = self.linuxscsi.get_scsi_wwn('/dev/disk/by-id/somepath')
+
+        self.assertEqual('31234567890', wwn)
+        sysfs_mock.assert_called_once_with('sdc')
+        self.assertEqual([], self.cmds)
+
+    @mock.patch.object(device_waiter, '_get_watcher', return_value=None)
     @mock.patch.object(os.path, 'exists', return_value=True)
-    def test_find_multipath_device_path(self, exists_mock):
+    def test_find_multipath_device_path(self, exists_mock, watcher_mock):
         fake_wwn = '1234567890'
         found_path = self.linuxscsi.find_multipath_device_path(fake_wwn)
         expected_path = '/dev/disk/by-id/dm-uuid-mpath-%s' % fake_wwn
         self.assertEqual(expected_path, found_path)
 
-    @mock.patch('time.sleep')
-    @mock.patch.object(os.path, 'exists')
-    def test_find_multipath_device_path_mapper(self, exists_mock, sleep_mock):
-        # the wait loop tries 3 times before it gives up
-        # we want to test failing to find the
-        # /dev/disk/by-id/dm-uuid-mpath-<WWN> path
-        # but finding the
-        # /dev/mapper/<WWN> path
-        exists_mock.side_effect = [False, False, False, True]
+    @mock.patch.object(device_waiter, 'wait_for_any')
+    def test_find_multipath_device_path_mapper(self, wait_mock):
+        # Failing to find the /dev/disk/by-id/dm-uuid-mpath-<WWN> path but
+        # finding the /dev/mapper/<WWN> path. Both are waited for at the
+        # same time.
         fake_wwn = '1234567890'
-        found_path = self.linuxscsi.find_multipath_device_path(fake_wwn)
         expected_path = '/dev/mapper/%s' % fake_wwn
+        wait_mock.return_value = expected_path
+        found_path = self.linuxscsi.find_multipath_device_path(fake_wwn)
         self.assertEqual(expected_path, found_path)
-        self.assertTrue(sleep_mock.called)
+        wait_mock.assert_called_once_with(
+            ['/dev/disk/by-id/dm-uuid-mpath-%s' % fake_wwn, expected_path],
+            linuxscsi.PATH_WAIT_TIMEOUT)
 
-    @mock.patch.object(os.path, 'exists', return_value=False)
-    @mock.patch.object(time, 'sleep')
-    def test_find_multipath_device_path_fail(self, exists_mock, sleep_mock):
+    @mock.patch.object(device_waiter, 'wait_for_any', return_value=None)
+    def test_find_multipath_device_path_fail(self, wait_mock):
         fake_wwn = '1234567890'
         found_path = self.linuxscsi.find_multipath_device_path(fake_wwn)
         expected_path = None
         self.assertEqual(expected_path, found_path)
+        wait_mock.assert_called_once_with(mock.ANY,
+                                          linuxscsi.PATH_WAIT_TIMEOUT)
 
-    @mock.patch.object(os.path, 'exists', return_value=False)
-    @mock.patch.object(time, 'sleep')
-    def test_wait_for_path_not_found(self, exists_mock, sleep_mock):
+    @mock.patch.object(device_waiter, 'wait_for_any', return_value=None)
+    def test_wait_for_path_not_found(self, wait_mock):
         path = "/dev/disk/by-id/dm-uuid-mpath-%s" % '1234567890'
         self.assertRaisesRegexp(exception.VolumeDeviceNotFound,
                                 r'Volume device not found at %s' % path,
                                 self.linuxscsi.wait_for_path,
                                 path)
 
+    @mock.patch.object(device_waiter, 'wait_for_any',
+                       return_value='/dev/mapper/3600')
+    def test_wait_for_any_path(self, wait_mock):
+        paths = ['/dev/disk/by-id/dm-uuid-mpath-3600', '/dev/mapper/3600']
+        self.assertEqual('/dev/mapper/3600',
+                         self.linuxscsi.wait_for_any_path(paths))
+        wait_mock.assert_called_once_with(paths, linuxscsi.PATH_WAIT_TIMEOUT)
+
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'multipath_del_path')
     @mock.patch.object(linuxscsi.LinuxSCSI, 'find_multipath_device')
     @mock.patch.object(os.path, 'exists', return_value=True)
-    def test_remove_multipath_device(self, exists_mock, mock_multipath):
+    def test_remove_multipath_device(self, exists_mock, mock_multipath,
+                                     del_path_mock):
         def fake_find_multipath_device(device):
             devices = [{'device': '/dev/sde', 'host': 0,
                         'channel': 0, 'id': 0, 'lun': 1},
@@ -167,13 +242,49 @@ class LinuxSCSITestCase(base.TestCase):
         mock_multipath.side_effect = fake_find_multipath_device
 
         self.linuxscsi.remove_multipath_device('/dev/dm-3')
-        expected_commands = [
-            ('multipath -f 350002ac20398383d'),
-            ('blockdev --flushbufs /dev/sde'),
-            ('tee -a /sys/block/sde/device/delete'),
-            ('blockdev --flushbufs /dev/sdf'),
-            ('tee -a /sys/block/sdf/device/delete'), ]
-        self.assertEqual(expected_commands, self.cmds)
+
+        self.assertEqual('multipath -f 350002ac20398383d', self.cmds[0])
+        # The paths are removed concurrently, each one is flushed before
+        # being deleted.
+        for dev in ('sde', 'sdf'):
+            flush = self.cmds.index('blockdev --flushbufs /dev/%s' % dev)
+            delete = self.cmds.index('tee -a /sys/block/%s/device/delete' %
+                                     dev)
+            self.assertLess(flush, delete)
+        self.assertEqual(5, len(self.cmds))
+        del_path_mock.assert_has_calls([mock.call('/dev/sde'),
+                                        mock.call('/dev/sdf')],
+                                       any_order=True)
+
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_scsi_device')
+    def test_remove_scsi_devices(self, remove_mock):
+        error = putils.ProcessExecutionError(exit_code=1)
+        started = threading.Event()
+
+        def _remove(device, multipath_path):
+            if device == '/dev/sdb':
+                # Doesn't finish until the other path is being removed
+                if not started.wait(5):
+                    raise Exception('Paths removed one after another')
+                raise error
+            started.set()
+
+        remove_mock.side_effect = _remove
+
+        exc = self.assertRaises(exception.SCSIDevicesNotRemoved,
+                                self.linuxscsi.remove_scsi_devices,
+                                ['/dev/sdb', '/dev/sdc'])
+
+        self.assertEqual({'/dev/sdb': error}, exc.kwargs['errors'])
+        self.assertEqual(2, remove_mock.call_count)
+
+    @mock.patch.object(linuxscsi.LinuxSCSI, 'remove_scsi_device')
+    def test_remove_scsi_devices_one(self, remove_mock):
+        self.assertIsNone(self.linuxscsi.remove_scsi_devices(['/dev/sdb']))
+
+        remove_mock.side_effect = putils.ProcessExecutionError(exit_code=1)
+        self.assertRaises(exception.SCSIDevicesNotRemoved,
+                          self.linuxscsi.remove_scsi_devices, ['/dev/sdb'])
 
     def test_find_multipath_device_3par_ufn(self):
         def fake_execute(*cmd, **kwargs):
@@ -205,6 +316,23 @@ class LinuxSCSITestCase(base.TestCase):
         self.assertEqual("0", info['devices'][1]['channel'])
         self.assertEqual("1", info['devices'][1]['lun'])
 
+    def test_find_multipath_device_sysfs(self):
+        devices = [{'device': '/dev/sde', 'host': '6', 'channel': '0',
+                    'id': '2', 'lun': '0'}]
+        self.mock_mpaths.return_value = [
+            {'device': '/dev/mapper/mpathb', 'id': '36005076da00638089c',
+             'name': 'mpathb', 'dm': 'dm-2', 'devices': devices}]
+        self.mock_object(os.path, 'realpath', side_effect=lambda path: path)
+        self.mock_object(os.path, 'exists', return_value=True)
+
+        info = self.linuxscsi.find_multipath_device('/dev/sde')
+
+        self.assertEqual({'device': '/dev/mapper/mpathb',
+                          'id': '36005076da00638089c', 'name': 'mpathb',
+                          'devices': devices}, info)
+        self.assertIsNone(self.linuxscsi.find_multipath_device('/dev/sdf'))
+        self.assertEqual([], self.cmds)
+
     def test_find_multipath_device_svc(self):
         def fake_execute(*cmd, **kwargs):
             out = ("36005076da00638089c000000000004d5 dm-2 IBM,2145\n"
@@ -462,6 +590,99 @@ loop0                                     0"""
 
         self.assertEqual(4, mock_sleep.call_count)
 
+    def _mock_rw_topology(self, read_only, check_interval=0):
+        self.mock_mpaths.return_value = [
+            {'device': '/dev/mapper/mpatha', 'id': '3600', 'name': 'mpatha',
+             'dm': 'dm-3',
+             'devices': [{'device': '/dev/sdb', 'host': '3', 'channel': '0',
+                          'id': '0', 'lun': '1'},
+                         {'device': '/dev/sdc', 'host': '4', 'channel': '0',
+                          'id': '0', 'lun': '1'}]}]
+        self.mock_object(sysfs, 'is_block_device_read_only',
+                         side_effect=lambda name: read_only[name])
+
+        now = [0]
+        self.mock_object(timeutils, 'now', side_effect=lambda: now[0])
+
+        def _wait_for_uevent(check, timeout):
+            # Every check after the first one is done after an event, which
+            # comes check_interval seconds after the previous check.
+            for i in range(30):
+                result = check()
+                if result:
+                    break
+                now[0] += check_interval
+            return result
+
+        return self.mock_object(device_waiter, 'wait_for_uevent',
+                                side_effect=_wait_for_uevent)
+
+    def test_wait_for_rw_sysfs(self):
+        read_only = {'dm-3': False, 'sdb': False, 'sdc': False}
+        self._mock_rw_topology(read_only)
+
+        self.linuxscsi.wait_for_rw('3600', '/dev/mapper/mpatha')
+
+        self.assertEqual([], self.cmds)
+
+    def test_wait_for_rw_sysfs_reload(self):
+        read_only = {'dm-3': True, 'sdb': False, 'sdc': False}
+        self._mock_rw_topology(read_only)
+
+        def _execute(*cmd, **kwargs):
+            self.cmds.append(' '.join(cmd))
+            read_only['dm-3'] = False
+            return '', None
+        self.linuxscsi._execute = _execute
+
+        self.linuxscsi.wait_for_rw('3600', '/dev/mapper/mpatha')
+
+        # Only the map of the volume is reloaded
+        self.assertEqual(['multipath -r mpatha'], self.cmds)
+
+    def test_wait_for_rw_sysfs_reload_interval(self):
+        read_only = {'dm-3': True, 'sdb': False, 'sdc': False}
+        self._mock_rw_topology(read_only)
+
+        self.assertRaises(exception.BlockDeviceReadOnly,
+                          self.linuxscsi.wait_for_rw,
+                          '3600', '/dev/mapper/mpatha')
+
+        # The uevents of the reload itself don't reload the map again
+        self.assertEqual(['multipath -r mpatha'], self.cmds)
+
+    def test_wait_for_rw_sysfs_ro_path(self):
+        read_only = {'dm-3': True, 'sdb': False, 'sdc': True}
+        self._mock_rw_topology(read_only, check_interval=1)
+        checks = []
+
+        def _is_read_only(name):
+            checks.append(name)
+            if len(checks) > 6:
+                # The path became read-write after a rescan
+                read_only['sdc'] = False
+            return read_only[name]
+        sysfs.is_block_device_read_only.side_effect = _is_read_only
+
+        self.assertRaises(exception.BlockDeviceReadOnly,
+                          self.linuxscsi.wait_for_rw,
+                          '3600', '/dev/mapper/mpatha')
+
+        # The map is reloaded once all its paths are read-write, and no more
+        # than MAX_RW_RELOADS times.
+        self.assertEqual(['multipath -r mpatha'] * linuxscsi.MAX_RW_RELOADS,
+                         self.cmds)
+        self.assertEqual(['dm-3', 'sdb', 'sdc'] * 2,
+                         checks[:6])
+
+    def test_wait_for_rw_sysfs_no_multipath(self):
+        wait_mock = self._mock_rw_topology({})
+
+        self.linuxscsi.wait_for_rw('3601', '/dev/sdd')
+
+        wait_mock.assert_not_called()
+        self.assertEqual([], self.cmds)
+
     def test_find_multipath_device_with_action(self):
         def fake_execute(*cmd, **kwargs):
             out = textwrap.dedent("""
@@ -495,7 +716,34 @@ loop0                                     0"""
         self.assertEqual("0", info['devices'][1]['id'])
         self.assertEqual("3", info['devices'][1]['lun'])
 
-    def test_get_device_size(self):
+    @mock.patch.object(sysfs, 'get_block_device_hctl',
+                       return_value=('3', '0', '1', '2'))
+    def test_get_device_info(self, hctl_mock):
+        info = self.linuxscsi.get_device_info('/dev/disk/by-path/fake')
+
+        self.assertEqual({'device': '/dev/disk/by-path/fake', 'host': '3',
+                          'channel': '0', 'id': '1', 'lun': '2'}, info)
+        hctl_mock.assert_called_once_with('sdc')
+        self.assertEqual([], self.cmds)
+
+    @mock.patch.object(sysfs, 'get_block_device_hctl', return_value=None)
+    def test_get_device_info_sg_scan(self, hctl_mock):
+        out = '/dev/sdc: scsi3 channel=0 id=1 lun=2 [em]\n'
+        self.mock_object(self.linuxscsi, '_execute', return_value=(out, None))
+
+        info = self.linuxscsi.get_device_info('/dev/sdc')
+
+        self.assertEqual({'device': '/dev/sdc', 'host': '3', 'channel': '0',
+                          'id': '1', 'lun': '2'}, info)
+
+    @mock.patch.object(sysfs, 'get_block_device_size', return_value=2048)
+    def test_get_device_size_sysfs(self, size_mock):
+        self.assertEqual(2048, self.linuxscsi.get_device_size('/dev/fake'))
+        size_mock.assert_called_once_with('sdc')
+        self.assertEqual([], self.cmds)
+
+    @mock.patch.object(sysfs, 'get_block_device_size', return_value=None)
+    def test_get_device_size(self, size_mock):
         mock_execute = mock.Mock()
         self.linuxscsi._execute = mock_execute
         size = '1024'
@@ -526,6 +774,63 @@ loop0                                     0"""
         expected_commands = ['multipathd resize map %s' % wwn]
         self.assertEqual(expected_commands, self.cmds)
 
+    @mock.patch.object(priv_multipathd, 'execute', return_value='ok\n')
+    @mock.patch.object(linuxscsi.LinuxSCSI, '_is_default_execute',
+                       return_value=True)
+    @mock.patch.object(executor, 'invalidate_command_cache')
+    def test_multipath_resize_map_socket(self, invalidate_mock, default_mock,
+                                         mpathd_mock):
+        wwn = '1234567890123456'
+        self.assertEqual('ok\n', self.linuxscsi.multipath_resize_map(wwn))
+        mpathd_mock.assert_called_once_with('resize', 'map', wwn)
+        invalidate_mock.assert_called_once_with(['multipath'])
+        self.assertEqual([], self.cmds)
+
+    @mock.patch.object(priv_multipathd, 'execute',
+                       side_effect=socket.error('Connection refused'))
+    @mock.patch.object(linuxscsi.LinuxSCSI, '_is_default_execute',
+                       return_value=True)
+    def test_multipath_reconfigure_socket_error(self, default_mock,
+                                                mpathd_mock):
+        self.linuxscsi.multipath_reconfigure()
+        mpathd_mock.assert_called_once_with('reconfigure')
+        self.assertEqual(['multipathd reconfigure'], self.cmds)
+
+    @mock.patch.object(executor, 'invalidate_command_cache')
+    @mock.patch.object(priv_multipathd, 'execute', return_value='ok\n')
+    def test_multipath_del_path(self, mpathd_mock, invalidate_mock):
+        # Not done with a custom execute
+        self.assertFalse(self.linuxscsi.multipath_del_path('/dev/sdb'))
+        self.assertFalse(mpathd_mock.called)
+
+        with mock.patch.object(self.linuxscsi, '_is_default_execute',
+                               return_value=True):
+            self.assertTrue(self.linuxscsi.multipath_del_path('/dev/sdb'))
+            mpathd_mock.side_effect = socket.error
+            self.assertFalse(self.linuxscsi.multipath_del_path('/dev/sdc'))
+        mpathd_mock.assert_has_calls([mock.call('del', 'path', 'sdb'),
+                                      mock.call('del', 'path', 'sdc')])
+        invalidate_mock.assert_has_calls([mock.call(['multipath'])] * 2)
+        self.assertEqual([], self.cmds)
+
+    @mock.patch.object(priv_multipathd, 'execute')
+    def test_is_multipath_running_socket(self, mpathd_mock):
+        execute = mock.Mock()
+        with mock.patch.object(executor, 'is_default_execute',
+                               return_value=True):
+            self.assertTrue(linuxscsi.LinuxSCSI.is_multipath_running(
+                True, None, execute=execute))
+            mpathd_mock.assert_called_once_with('show', 'status')
+            self.assertFalse(execute.called)
+
+            # Use the command line tool if the socket is not there
+            mpathd_mock.side_effect = socket.error
+            self.assertTrue(linuxscsi.LinuxSCSI.is_multipath_running(
+                True, None, execute=execute))
+            execute.assert_called_once_with('multipathd', 'show', 'status',
+                                            run_as_root=True,
+                                            root_helper=None)
+
     @mock.patch.object(linuxscsi.LinuxSCSI, 'find_multipath_device_path')
     @mock.patch.object(linuxscsi.LinuxSCSI, 'get_scsi_wwn')
     @mock.patch.object(linuxscsi.LinuxSCSI, 'get_device_size')
@@ -587,8 +892,8 @@ loop0                                     0"""
         self.assertEqual(fourth_size, ret_size)
 
         # because we don't mock out the echo_scsi_command
+        # No reconfigure when the resize works
         expected_cmds = ['tee -a /sys/bus/scsi/drivers/sd/0:0:0:1/rescan',
-                         'multipathd reconfigure',
                          'multipathd resize map %s' % wwn]
         self.assertEqual(expected_cmds, self.cmds)
 
@@ -630,6 +935,8 @@ loop0                                     0"""
         expected_cmds = ['tee -a /sys/bus/scsi/drivers/sd/0:0:0:1/rescan',
                          'multipathd reconfigure']
         self.assertEqual(expected_cmds, self.cmds)
+        mock_mpath_resize_map.assert_has_calls([mock.call(wwn),
+                                                mock.call(wwn)])
 
     def test_process_lun_id_list(self):
         lun_list = [2, 255, 88, 370, 5, 256]
@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from os_brick.initiator import multipath_topology
+from os_brick.initiator import sysfs
+from os_brick.tests import base
+
+WWID = '3600d0230000000000e13955cc3757803'
+
+
+class MultipathTopologyTestCase(base.TestCase):
+    """Tests run against a fake sysfs tree built in a temporary directory."""
+
+    def setUp(self):
+        super(MultipathTopologyTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.mock_object(sysfs, 'SYSFS_ROOT', self.root)
+        os.makedirs(os.path.join(self.root, 'block'))
+
+    def write(self, path, content):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content + '\n')
+
+    def add_scsi_device(self, name, hctl):
+        device = os.path.join(self.root, 'devices', 'platform', hctl)
+        os.makedirs(device)
+        os.makedirs(os.path.join(self.root, 'block', name))
+        os.symlink(device, os.path.join(self.root, 'block', name, 'device'))
+
+    def add_dm_device(self, dm, uuid, name, slaves):
+        self.write('block/%s/dm/uuid' % dm, uuid)
+        self.write('block/%s/dm/name' % dm, name)
+        os.makedirs(os.path.join(self.root, 'block', dm, 'slaves'))
+        for slave in slaves:
+            os.symlink(os.path.join(self.root, 'block', slave),
+                       os.path.join(self.root, 'block', dm, 'slaves', slave))
+
+    def test_get_multipath_devices_no_sysfs(self):
+        self.mock_object(sysfs, 'SYSFS_ROOT', '/nonexistent-sysfs')
+        self.assertIsNone(multipath_topology.get_multipath_devices())
+
+    def test_get_multipath_devices(self):
+        self.add_scsi_device('sdb', '3:0:0:1')
+        self.add_scsi_device('sdc', '4:0:1:1')
+        self.add_dm_device('dm-3', 'mpath-' + WWID, 'mpatha', ['sdc', 'sdb'])
+        # Not multipath devices
+        self.add_dm_device('dm-0', 'LVM-abc', 'vg-root', [])
+        self.add_dm_device('dm-1', 'CRYPT-LUKS1-abc', 'crypt', [])
+
+        mpaths = multipath_topology.get_multipath_devices()
+
+        self.assertEqual(
+            [{'device': '/dev/mapper/mpatha', 'id': WWID, 'name': 'mpatha',
+              'dm': 'dm-3',
+              'devices': [{'device': '/dev/sdb', 'host': '3',
+                           'channel': '0', 'id': '0', 'lun': '1'},
+                          {'device': '/dev/sdc', 'host': '4',
+                           'channel': '0', 'id': '1', 'lun': '1'}]}],
+            mpaths)
+
+    def test_get_multipath_device_map(self):
+        self.add_scsi_device('sdb', '3:0:0:1')
+        self.add_scsi_device('sdc', '4:0:0:1')
+        self.add_scsi_device('sdd', '4:0:0:2')
+        self.add_dm_device('dm-3', 'mpath-' + WWID, WWID, ['sdb', 'sdc'])
+
+        mpaths = multipath_topology.get_multipath_devices()
+
+        self.assertEqual({'/dev/sdb': '/dev/mapper/' + WWID,
+                          '/dev/sdc': '/dev/mapper/' + WWID},
+                         multipath_topology.get_multipath_device_map(mpaths))
+
+    @mock.patch.object(os.path, 'realpath', side_effect=lambda path: path)
+    def test_find_multipath_device(self, realpath_mock):
+        mpaths = [{'device': '/dev/mapper/mpatha', 'id': WWID,
+                   'name': 'mpatha', 'dm': 'dm-3',
+                   'devices': [{'device': '/dev/sdb', 'host': '3',
+                                'channel': '0', 'id': '0', 'lun': '1'}]}]
+
+        for device in ('/dev/sdb', '/dev/dm-3', '/dev/mapper/mpatha',
+                       'mpatha', WWID):
+            self.assertEqual(
+                mpaths[0],
+                multipath_topology.find_multipath_device(device, mpaths))
+        self.assertIsNone(
+            multipath_topology.find_multipath_device('/dev/sdc', mpaths))
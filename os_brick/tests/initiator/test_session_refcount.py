@@ -0,0 +1,107 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import fcntl
+import os
+import shutil
+import tempfile
+
+from os_brick.initiator import session_refcount
+from os_brick.tests import base
+
+SESSION1 = ('10.0.2.15:3260', 'iqn.1')
+SESSION2 = ('10.0.3.15:3260', 'iqn.1')
+
+
+class SessionRefcountTestCase(base.TestCase):
+
+    def setUp(self):
+        super(SessionRefcountTestCase, self).setUp()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        self.path = os.path.join(tmpdir, 'state', 'iscsi-sessions.json')
+        self.refcount = session_refcount.SessionRefcount(self.path)
+
+    def test_get_attachment_id(self):
+        self.assertEqual(
+            '10.0.2.15:3260|iqn.1|1;10.0.3.15:3260|iqn.1|1',
+            session_refcount.get_attachment_id(
+                [('10.0.3.15:3260', 'iqn.1', 1),
+                 ('10.0.2.15:3260', 'iqn.1', 1)]))
+
+    def test_add_remove(self):
+        self.refcount.add('vol1', [SESSION1, SESSION2])
+        self.refcount.add('vol2', [SESSION1])
+
+        self.assertEqual(2, self.refcount.get_count(*SESSION1))
+        self.assertEqual(1, self.refcount.get_count(*SESSION2))
+
+        self.assertEqual([SESSION2], self.refcount.remove('vol1'))
+        self.assertEqual([SESSION1], self.refcount.remove('vol2'))
+        self.assertEqual(0, self.refcount.get_count(*SESSION1))
+
+    def test_add_twice(self):
+        self.refcount.add('vol1', [SESSION1, SESSION1])
+        self.refcount.add('vol1', [SESSION1])
+
+        self.assertEqual(1, self.refcount.get_count(*SESSION1))
+        self.assertEqual([SESSION1], self.refcount.remove('vol1'))
+
+    def test_get_unused(self):
+        self.refcount.add('vol1', [SESSION1, SESSION2])
+        self.refcount.add('vol2', [SESSION1])
+
+        self.assertEqual([SESSION2], self.refcount.get_unused('vol1'))
+        self.assertEqual([], self.refcount.get_unused('vol2'))
+        self.assertIsNone(self.refcount.get_unused('vol3'))
+        self.assertEqual([SESSION1, SESSION2],
+                         self.refcount.get_unused('vol1', ignore=['vol2']))
+        # The attachments are kept
+        self.assertEqual(2, self.refcount.get_count(*SESSION1))
+
+    def test_get_sessions(self):
+        self.refcount.add('vol1', [SESSION2, SESSION1])
+        self.assertEqual([SESSION1, SESSION2],
+                         self.refcount.get_sessions('vol1'))
+        self.assertIsNone(self.refcount.get_sessions('vol2'))
+
+    def test_queries_read_only(self):
+        self.refcount.add('vol1', [SESSION1])
+        mock_write = self.mock_object(self.refcount, '_write')
+        mock_flock = self.mock_object(fcntl, 'flock')
+
+        self.assertEqual([SESSION1], self.refcount.get_sessions('vol1'))
+        self.assertEqual([SESSION1], self.refcount.get_unused('vol1'))
+        self.assertEqual(1, self.refcount.get_count(*SESSION1))
+
+        mock_write.assert_not_called()
+        self.assertEqual([fcntl.LOCK_SH, fcntl.LOCK_UN] * 3,
+                         [call[0][1] for call in mock_flock.call_args_list])
+
+    def test_remove_unknown(self):
+        self.assertIsNone(self.refcount.remove('vol1'))
+
+    def test_persisted(self):
+        self.refcount.add('vol1', [SESSION1])
+
+        refcount = session_refcount.SessionRefcount(self.path)
+        self.assertEqual(1, refcount.get_count(*SESSION1))
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_corrupted(self):
+        self.refcount.add('vol1', [SESSION1])
+        with open(self.path, 'w') as f:
+            f.write('{"attachments": ')
+
+        self.assertIsNone(self.refcount.remove('vol1'))
+        self.refcount.add('vol2', [SESSION2])
+        self.assertEqual(1, self.refcount.get_count(*SESSION2))
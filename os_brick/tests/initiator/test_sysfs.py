@@ -0,0 +1,193 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import tempfile
+
+from os_brick.initiator import sysfs
+from os_brick.tests import base
+
+
+class SysfsTestCase(base.TestCase):
+    """Tests run against a fake sysfs tree built in a temporary directory."""
+
+    def setUp(self):
+        super(SysfsTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.mock_object(sysfs, 'SYSFS_ROOT', self.root)
+        os.makedirs(os.path.join(self.root, 'class'))
+
+    def write(self, path, content):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content + '\n')
+
+    def link(self, path, target):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        os.symlink(os.path.join(self.root, target), path)
+
+    def add_iscsi_session(self, sid, host, iqn, address, port, luns=None,
+                          proc_name='iscsi_tcp'):
+        session_dev = 'devices/platform/host%s/session%s' % (host, sid)
+        session = 'class/iscsi_session/session%s' % sid
+        conn = 'class/iscsi_connection/connection%s:0' % sid
+        os.makedirs(os.path.join(self.root, session_dev))
+        self.link(session + '/device', session_dev)
+        self.write(session + '/targetname', iqn)
+        self.write(session + '/tpgt', '1')
+        self.write(conn + '/persistent_address', address)
+        self.write(conn + '/persistent_port', str(port))
+        self.write('class/scsi_host/host%s/proc_name' % host, proc_name)
+        # The SCSI target shows up once the session has been scanned
+        target = os.path.join(self.root, session_dev, 'target%s:0:0' % host)
+        if luns is not None:
+            os.makedirs(target)
+        for lun, dev in (luns or {}).items():
+            os.makedirs(os.path.join(target, '%s:0:0:%s' % (host, lun),
+                                     'block', dev))
+
+    def test_read_attr(self):
+        self.write('block/sda/size', '2048')
+        self.assertEqual('2048', sysfs.read_attr(
+            os.path.join(self.root, 'block/sda/size')))
+        self.assertIsNone(sysfs.read_attr(
+            os.path.join(self.root, 'block/sdb/size')))
+        self.assertEqual('', sysfs.read_attr(
+            os.path.join(self.root, 'block/sdb/size'), ''))
+
+    def test_get_iscsi_sessions_no_sysfs(self):
+        self.mock_object(sysfs, 'SYSFS_ROOT', '/nonexistent-sysfs')
+        self.assertIsNone(sysfs.get_iscsi_sessions())
+
+    def test_get_iscsi_sessions_none(self):
+        self.assertEqual([], sysfs.get_iscsi_sessions())
+
+    def test_get_iscsi_sessions(self):
+        self.add_iscsi_session(2, 4, 'iqn.2', '2001:db8::1', 3260,
+                               proc_name='ib_iser')
+        self.add_iscsi_session(1, 3, 'iqn.1', '10.0.2.15', 3260,
+                               luns={1: 'sdb', 2: 'sdc'})
+
+        sessions = sysfs.get_iscsi_sessions()
+
+        self.assertEqual(
+            [{'sid': 1, 'transport': 'tcp', 'portal': '10.0.2.15:3260',
+              'tpgt': 1, 'iqn': 'iqn.1', 'host': 3, 'targets': [(0, 0)],
+              'luns': {1: 'sdb', 2: 'sdc'}},
+             {'sid': 2, 'transport': 'iser', 'portal': '[2001:db8::1]:3260',
+              'tpgt': 1, 'iqn': 'iqn.2', 'host': 4, 'targets': [],
+              'luns': {}}],
+            sessions)
+
+    def test_get_iscsi_sessions_skips_incomplete(self):
+        self.add_iscsi_session(1, 3, 'iqn.1', '10.0.2.15', 3260)
+        # Session being torn down, its connection is already gone
+        self.write('class/iscsi_session/session2/targetname', 'iqn.2')
+
+        sessions = sysfs.get_iscsi_sessions()
+
+        self.assertEqual([1], [session['sid'] for session in sessions])
+
+    def write_binary(self, path, content):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    @staticmethod
+    def vpd_page83(*descriptors):
+        # descriptors are (code set, designator type, identifier)
+        body = b''
+        for code_set, id_type, identifier in descriptors:
+            body += bytearray([code_set, id_type, 0, len(identifier)])
+            body += identifier
+        return bytes(bytearray([0, 0x83, len(body) >> 8, len(body) & 0xff]) +
+                     body)
+
+    def test_decode_vpd_page83(self):
+        page = self.vpd_page83(
+            (2, 0, b'vendor-id'),
+            (1, 2, b'\x00\x11\x22\x33\x44\x55\x66\x77'),
+            # Target port identifier, not about the LUN
+            (1, 0x13, b'\x60\x00\x00\x00\x00\x00\x00\x01'),
+            (1, 3, b'\x60\x0d\x02\x30\x00\x00\x00\x00'
+                   b'\x0e\x13\x95\x5c\xc3\x75\x78\x03'))
+
+        # NAA is preferred over EUI-64
+        self.assertEqual('3600d0230000000000e13955cc3757803',
+                         sysfs.decode_vpd_page83(page))
+
+    def test_decode_vpd_page83_fallbacks(self):
+        eui = self.vpd_page83((1, 2, b'\x00\x11\x22\x33\x44\x55\x66\x77'))
+        t10 = self.vpd_page83((2, 1, b'VENDOR  1234'))
+        vendor = self.vpd_page83((2, 0, b'vendor-id'))
+
+        self.assertEqual('20011223344556677', sysfs.decode_vpd_page83(eui))
+        self.assertEqual('1VENDOR  1234', sysfs.decode_vpd_page83(t10))
+        self.assertIsNone(sysfs.decode_vpd_page83(vendor))
+        self.assertIsNone(sysfs.decode_vpd_page83(b'\x00\x80\x00\x00'))
+        self.assertIsNone(sysfs.decode_vpd_page83(b''))
+
+    def test_get_scsi_wwn(self):
+        self.write_binary('block/sdb/device/vpd_pg83', self.vpd_page83(
+            (1, 3, b'\x60\x0d\x02\x30\x00\x00\x00\x00'
+                   b'\x0e\x13\x95\x5c\xc3\x75\x78\x03')))
+        self.write('block/sdc/device/wwid',
+                   'naa.600d0230000000000e13955cc3757804')
+
+        self.assertEqual('3600d0230000000000e13955cc3757803',
+                         sysfs.get_scsi_wwn('sdb'))
+        self.assertEqual('3600d0230000000000e13955cc3757804',
+                         sysfs.get_scsi_wwn('sdc'))
+        self.assertIsNone(sysfs.get_scsi_wwn('sdd'))
+
+    def test_get_block_device_size(self):
+        self.write('class/block/sdb/size', '2048')
+        self.write('class/block/sdc/size', '')
+
+        self.assertEqual(2048 * 512, sysfs.get_block_device_size('sdb'))
+        self.assertIsNone(sysfs.get_block_device_size('sdc'))
+        self.assertIsNone(sysfs.get_block_device_size('sdd'))
+
+    def test_get_block_device_hctl(self):
+        os.makedirs(os.path.join(self.root, 'devices/platform/3:0:1:2'))
+        self.link('block/sdb/device', 'devices/platform/3:0:1:2')
+
+        self.assertEqual(('3', '0', '1', '2'),
+                         sysfs.get_block_device_hctl('sdb'))
+        self.assertIsNone(sysfs.get_block_device_hctl('sdc'))
+
+    def test_is_block_device_read_only(self):
+        self.write('class/block/dm-3/ro', '1')
+        self.write('class/block/sdb/ro', '0')
+
+        self.assertTrue(sysfs.is_block_device_read_only('dm-3'))
+        self.assertFalse(sysfs.is_block_device_read_only('sdb'))
+        self.assertIsNone(sysfs.is_block_device_read_only('sdc'))
+
+    def test_get_fc_remote_ports(self):
+        self.write('class/fc_remote_ports/rport-5:0-1/port_name',
+                   '0x500601609020318a')
+        self.write('class/fc_remote_ports/rport-5:0-1/node_name',
+                   '0x5006016090203181')
+        self.write('class/fc_remote_ports/rport-5:0-1/port_state', 'Online')
+        self.write('class/fc_remote_ports/power/async', 'disabled')
+
+        self.assertEqual(
+            [{'host': 5, 'port_name': '500601609020318a',
+              'node_name': '5006016090203181', 'port_state': 'Online'}],
+            sysfs.get_fc_remote_ports())
@@ -207,6 +207,19 @@ class BrickLvmTestCase(base.TestCase):
                 lv_name='test-found-lv-name')
         )
 
+    def test_get_all_volume_groups_cached(self):
+        mock_execute = self.mock_object(priv_rootwrap, 'execute',
+                                        side_effect=self.fake_execute)
+
+        self.assertEqual(brick.LVM.get_all_volume_groups('sudo'),
+                         brick.LVM.get_all_volume_groups('sudo'))
+        self.assertEqual(1, mock_execute.call_count)
+
+        # Changes drop the cached output of the static methods too
+        self.vg.create_volume('fake-new-lv', '1G')
+        brick.LVM.get_all_volume_groups('sudo')
+        self.assertEqual(2, mock_execute.call_count)
+
     def test_get_lv_info_no_lv_name(self):
         lv_info = [{'name': 'fake-1', 'size': '1.00g', 'vg': 'fake-vg'},
                    {'name': 'fake-2', 'size': '1.00g', 'vg': 'fake-vg'}]
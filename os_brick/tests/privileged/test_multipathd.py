@@ -0,0 +1,145 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+
+from os_brick import privileged
+from os_brick.privileged import multipathd as priv_multipathd
+from os_brick.tests import base
+
+
+class FakeMultipathd(object):
+    """Fake multipathd answering on a unix socket like the real one."""
+
+    def __init__(self, path, replies):
+        self.path = path
+        self.replies = replies
+        self.commands = []
+        self.connections = 0
+        # Drop the connection instead of replying to the next command, like
+        # when multipathd is restarted.
+        self.drop_next = False
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(5)
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _recv(self, conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _serve(self):
+        length = struct.Struct('@N')
+        while True:
+            try:
+                conn, _addr = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            while True:
+                size = self._recv(conn, length.size)
+                if size is None:
+                    break
+                message = self._recv(conn, length.unpack(size)[0])
+                command = message.rstrip(b'\0').decode('utf-8')
+                self.commands.append(command)
+                if self.drop_next:
+                    self.drop_next = False
+                    break
+                reply = self.replies.get(command, 'fail\n').encode('utf-8')
+                reply += b'\0'
+                conn.sendall(length.pack(len(reply)) + reply)
+            conn.close()
+
+    def stop(self):
+        self.sock.close()
+
+
+class PrivMultipathdTestCase(base.TestCase):
+
+    def setUp(self):
+        super(PrivMultipathdTestCase, self).setUp()
+
+        # Bypass privsep and run these simple functions in-process
+        privileged.default.set_client_mode(False)
+        self.addCleanup(privileged.default.set_client_mode, True)
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        self.address = os.path.join(tmpdir, 'multipathd.sock')
+        self.client = priv_multipathd.MultipathdClient(self.address,
+                                                       timeout=5)
+        self.addCleanup(self.client.close)
+        self.mock_object(priv_multipathd, '_client', self.client)
+
+    def start_server(self, replies):
+        server = FakeMultipathd(self.address, replies)
+        self.addCleanup(server.stop)
+        return server
+
+    def test_execute(self):
+        server = self.start_server({'show status': 'path checker states:\n',
+                                    'resize map 3600': 'ok\n'})
+
+        self.assertEqual('path checker states:\n',
+                         priv_multipathd.execute('show', 'status'))
+        self.assertEqual('ok\n',
+                         priv_multipathd.execute('resize', 'map', '3600'))
+        self.assertEqual('fail\n',
+                         priv_multipathd.execute('del', 'path', 'sdb'))
+
+        self.assertEqual(['show status', 'resize map 3600', 'del path sdb'],
+                         server.commands)
+        # The connection is kept open between commands
+        self.assertEqual(1, server.connections)
+
+    def test_execute_not_allowed(self):
+        self.assertRaises(ValueError, priv_multipathd.execute,
+                          'remove', 'maps')
+        self.assertRaises(ValueError, priv_multipathd.execute, 'show')
+
+    def test_execute_not_running(self):
+        self.assertRaises(socket.error, priv_multipathd.execute,
+                          'show', 'status')
+
+    def test_execute_reconnect(self):
+        server = self.start_server({'show status': 'ok\n',
+                                    'reconfigure': 'ok\n'})
+        self.assertEqual('ok\n', priv_multipathd.execute('show', 'status'))
+
+        server.drop_next = True
+        self.assertEqual('ok\n', priv_multipathd.execute('reconfigure'))
+
+        self.assertEqual(['show status', 'reconfigure', 'reconfigure'],
+                         server.commands)
+        self.assertEqual(2, server.connections)
+
+    def test_execute_reconnect_once(self):
+        server = self.start_server({'show status': 'ok\n'})
+        server.drop_next = True
+
+        # A new connection is not retried
+        self.assertRaises(socket.error, priv_multipathd.execute,
+                          'show', 'status')
+        self.assertEqual(1, server.connections)
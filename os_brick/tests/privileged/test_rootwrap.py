@@ -14,6 +14,7 @@ import mock
 
 from oslo_concurrency import processutils as putils
 
+from os_brick import metrics
 from os_brick import privileged
 from os_brick.privileged import rootwrap as priv_rootwrap
 from os_brick.tests import base
@@ -57,3 +58,88 @@ class PrivRootwrapTestCase(base.TestCase):
     def test_oserror_raise(self, mock_putils_exec):
         self.assertRaises(putils.ProcessExecutionError,
                           priv_rootwrap.execute, 'foo')
+
+    @mock.patch('oslo_concurrency.processutils.execute')
+    def test_execute_batch(self, mock_putils_exec):
+        mock_putils_exec.side_effect = [
+            ('out1', 'err1'),
+            putils.ProcessExecutionError(exit_code=21, stdout='out2',
+                                         stderr='err2', cmd='cmd2'),
+            OSError(2, 'not found'),
+        ]
+
+        results = priv_rootwrap.execute_batch(
+            [(('cmd1', 'a'), {'check_exit_code': [0, 1]}),
+             (('cmd2',), {}),
+             (('cmd3',), {})],
+            stop_on_error=False, run_as_root=True, root_helper='sudo')
+
+        self.assertEqual(('out1', 'err1'), results[0])
+        self.assertIsInstance(results[1], putils.ProcessExecutionError)
+        self.assertEqual((21, 'out2', 'err2', 'cmd2'),
+                         (results[1].exit_code, results[1].stdout,
+                          results[1].stderr, results[1].cmd))
+        self.assertIsInstance(results[2], putils.ProcessExecutionError)
+        self.assertEqual('cmd3', results[2].cmd)
+        mock_putils_exec.assert_has_calls([
+            mock.call('cmd1', 'a', check_exit_code=[0, 1], shell=False,
+                      run_as_root=False),
+            mock.call('cmd2', shell=False, run_as_root=False),
+            mock.call('cmd3', shell=False, run_as_root=False)])
+
+    @mock.patch('os_brick.privileged.rootwrap.execute_batch_root')
+    @mock.patch('oslo_concurrency.processutils.execute')
+    def test_execute_batch_stop_on_error(self, mock_putils_exec,
+                                         mock_batch_root):
+        mock_putils_exec.side_effect = [
+            putils.ProcessExecutionError(exit_code=1), ('', '')]
+
+        results = priv_rootwrap.execute_batch(
+            [(('cmd1',), {}), (('cmd2',), {})])
+
+        self.assertIsInstance(results[0], putils.ProcessExecutionError)
+        self.assertIsNone(results[1])
+        self.assertEqual(1, mock_putils_exec.call_count)
+        self.assertFalse(mock_batch_root.called)
+
+    @mock.patch('oslo_concurrency.processutils.execute')
+    def test_execute_metrics(self, mock_putils_exec):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        mock_putils_exec.side_effect = [
+            ('', ''), putils.ProcessExecutionError(exit_code=1)]
+
+        priv_rootwrap.execute('multipath', '-f', '/dev/dm-0')
+        self.assertRaises(putils.ProcessExecutionError,
+                          priv_rootwrap.execute, 'multipath', '-f',
+                          '/dev/dm-1', run_as_root=True)
+
+        stats = metrics.get_snapshot()
+        self.assertEqual(1, len(stats))
+        self.assertEqual(('multipath', '-f', 2, 1),
+                         (stats[0]['binary'], stats[0]['subcommand'],
+                          stats[0]['count'], stats[0]['errors']))
+
+    @mock.patch('oslo_concurrency.processutils.execute')
+    def test_execute_batch_metrics(self, mock_putils_exec):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        mock_putils_exec.side_effect = [
+            ('', ''), putils.ProcessExecutionError(exit_code=1)]
+
+        priv_rootwrap.execute_batch(
+            [(('iscsiadm', '-m', 'node', '--logout'), {}),
+             (('iscsiadm', '-m', 'node', '--op', 'delete'), {}),
+             (('iscsiadm', '-m', 'node', '--op', 'delete'), {})],
+            run_as_root=True)
+
+        self.assertEqual(
+            [('iscsiadm', 'node --logout', 1, 0),
+             ('iscsiadm', 'node --op delete', 1, 1)],
+            [(stats['binary'], stats['subcommand'], stats['count'],
+              stats['errors']) for stats in metrics.get_snapshot()])
+
+    def test_execute_batch_root_not_allowed(self):
+        for key in ('shell', 'run_as_root', 'root_helper'):
+            self.assertRaises(TypeError, priv_rootwrap.execute_batch_root,
+                              [(('cmd1',), {key: True})], True)
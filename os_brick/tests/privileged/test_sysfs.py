@@ -0,0 +1,61 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import shutil
+import tempfile
+
+from os_brick import privileged
+from os_brick.privileged import sysfs as priv_sysfs
+from os_brick.tests import base
+
+
+class PrivSysfsTestCase(base.TestCase):
+
+    def setUp(self):
+        super(PrivSysfsTestCase, self).setUp()
+
+        # Bypass privsep and run these simple functions in-process
+        privileged.default.set_client_mode(False)
+        self.addCleanup(privileged.default.set_client_mode, True)
+
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.allowed = os.path.join(self.root, 'class', 'scsi_host') + '/'
+        os.makedirs(os.path.join(self.allowed, 'host3'))
+        self.mock_object(priv_sysfs, 'ALLOWED_PREFIXES', (self.allowed,))
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_write(self):
+        scan = os.path.join(self.allowed, 'host3', 'scan')
+        missing = os.path.join(self.allowed, 'host4', 'scan')
+
+        result = priv_sysfs.write([(scan, '0 0 1'), (missing, '0 0 1')])
+
+        self.assertEqual('0 0 1', self.read(scan))
+        self.assertIsNone(result[0])
+        self.assertEqual(errno.ENOENT, result[1][0])
+
+    def test_write_not_allowed(self):
+        scan = os.path.join(self.allowed, 'host3', 'scan')
+        for path in (os.path.join(self.root, 'block', 'sdb', 'delete'),
+                     os.path.join(self.allowed, '..', 'scsi_disk', 'rescan'),
+                     self.allowed + 'host3//scan',
+                     'class/scsi_host/host3/scan'):
+            # Nothing is written if any of the paths is not allowed
+            self.assertRaises(ValueError, priv_sysfs.write,
+                              [(scan, '0 0 1'), (path, '1')])
+        self.assertFalse(os.path.exists(scan))
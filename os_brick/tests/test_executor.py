@@ -15,14 +15,18 @@
 
 # import time
 
+import threading
+
 import mock
 from oslo_concurrency import processutils as putils
 import six
 import testtools
 
 from os_brick import executor as brick_executor
+from os_brick import metrics
 from os_brick.privileged import rootwrap
 from os_brick.tests import base
+from os_brick import utils
 
 
 class TestExecutor(base.TestCase):
@@ -40,6 +44,13 @@ class TestExecutor(base.TestCase):
                                            execute=mock_execute)
         self.assertEqual(mock_execute, executor._Executor__execute)
 
+    def test_is_default_execute(self):
+        executor = brick_executor.Executor(root_helper=None)
+        self.assertTrue(executor._is_default_execute())
+
+        executor.set_execute(mock.Mock())
+        self.assertFalse(executor._is_default_execute())
+
     @mock.patch('sys.stdin', encoding='UTF-8')
     @mock.patch('os_brick.executor.priv_rootwrap.execute')
     def test_execute_non_safe_str_exception(self, execute_mock, stdin_mock):
@@ -87,3 +98,243 @@ class TestExecutor(base.TestCase):
         stdout, stderr = executor._execute()
         self.assertEqual(u'Espa\xf1a', stdout)
         self.assertEqual(u'Z\xfcrich', stderr)
+
+    @mock.patch('os_brick.executor.priv_rootwrap.execute_batch')
+    def test_execute_batch(self, batch_mock):
+        error = putils.ProcessExecutionError(stdout=b'Espa\xc3\xb1a')
+        batch_mock.return_value = [(b'Z\xc3\xbcrich', ''), error, None]
+        commands = [(('cmd1',), {}), (('cmd2',), {'attempts': 5}),
+                    (('cmd3',), {})]
+
+        executor = brick_executor.Executor(root_helper=None)
+        results = executor._execute_batch(commands, run_as_root=True,
+                                          root_helper='sudo',
+                                          check_exit_code=[0, 1])
+
+        self.assertEqual([(u'Z\xfcrich', ''), error, None], results)
+        self.assertEqual(u'Espa\xf1a', error.stdout)
+        batch_mock.assert_called_once_with(
+            [(('cmd1',), {'check_exit_code': [0, 1]}),
+             (('cmd2',), {'check_exit_code': [0, 1], 'attempts': 5}),
+             (('cmd3',), {'check_exit_code': [0, 1]})],
+            stop_on_error=True, run_as_root=True, root_helper='sudo')
+
+    def test_execute_batch_custom_execute(self):
+        error = putils.ProcessExecutionError(exit_code=1)
+        mock_execute = mock.Mock(side_effect=[('out', 'err'), error])
+        executor = brick_executor.Executor(root_helper='sudo',
+                                           execute=mock_execute)
+
+        results = executor._execute_batch(
+            [(('cmd1',), {}), (('cmd2',), {}), (('cmd3',), {})],
+            run_as_root=True, root_helper='sudo')
+
+        self.assertEqual([('out', 'err'), error, None], results)
+        mock_execute.assert_has_calls([
+            mock.call('cmd1', run_as_root=True, root_helper='sudo'),
+            mock.call('cmd2', run_as_root=True, root_helper='sudo')])
+        self.assertEqual(2, mock_execute.call_count)
+
+    @mock.patch.object(metrics, 'record_command')
+    def test_execute_metrics_custom_execute(self, record_mock):
+        error = putils.ProcessExecutionError(exit_code=1)
+        mock_execute = mock.Mock(side_effect=[('', ''), error])
+        executor = brick_executor.Executor(root_helper='sudo',
+                                           execute=mock_execute)
+
+        executor._execute('multipath', '-f', '/dev/dm-0')
+        self.assertRaises(putils.ProcessExecutionError, executor._execute,
+                          'multipath', '-f', '/dev/dm-1')
+
+        record_mock.assert_has_calls([
+            mock.call(('multipath', '-f', '/dev/dm-0'), mock.ANY, False),
+            mock.call(('multipath', '-f', '/dev/dm-1'), mock.ANY, True)])
+
+    @mock.patch('oslo_concurrency.processutils.execute',
+                return_value=('', ''))
+    @mock.patch.object(metrics, 'record_command')
+    def test_execute_metrics_default_execute(self, record_mock, exec_mock):
+        executor = brick_executor.Executor(root_helper=None)
+
+        executor._execute('multipath', '-f', '/dev/dm-0')
+
+        # Recorded once, by rootwrap
+        record_mock.assert_called_once_with(('multipath', '-f', '/dev/dm-0'),
+                                            mock.ANY, False)
+
+
+class TestExecutorCommandCache(base.TestCase):
+    def setUp(self):
+        super(TestExecutorCommandCache, self).setUp()
+        self.mock_object(brick_executor, '_command_cache', utils.TTLCache())
+        self.mock_object(brick_executor, '_generations', {})
+        self.execute = mock.Mock(side_effect=lambda *cmd, **kwargs: (
+            ' '.join(cmd), ''))
+        self.executor = brick_executor.Executor(
+            root_helper=None, execute=self.execute, command_cache_ttl=60)
+
+    def test_read_only(self):
+        for i in range(2):
+            self.assertEqual(
+                ('multipath -ll', ''),
+                self.executor._execute('multipath', '-ll', run_as_root=True,
+                                       read_only=True))
+        self.executor._execute('multipath', '-ll', run_as_root=False,
+                               read_only=True)
+        self.executor._execute('multipath', '-l', run_as_root=True,
+                               read_only=True)
+
+        self.execute.assert_has_calls([
+            mock.call('multipath', '-ll', run_as_root=True),
+            mock.call('multipath', '-ll', run_as_root=False),
+            mock.call('multipath', '-l', run_as_root=True)])
+        self.assertEqual(3, self.execute.call_count)
+
+    def test_read_only_disabled(self):
+        executor = brick_executor.Executor(root_helper=None,
+                                           execute=self.execute)
+        for i in range(2):
+            executor._execute('multipath', '-ll', read_only=True)
+        self.execute.assert_has_calls([mock.call('multipath', '-ll')] * 2)
+
+    def test_read_only_error(self):
+        self.execute.side_effect = [putils.ProcessExecutionError,
+                                    ('out', '')]
+        self.assertRaises(putils.ProcessExecutionError,
+                          self.executor._execute, 'vgs', read_only=True)
+        self.assertEqual(('out', ''),
+                         self.executor._execute('vgs', read_only=True))
+        self.assertEqual(2, self.execute.call_count)
+
+    def _check_invalidated(self, cmd, invalidated, change=None):
+        reads = {'lvm': ('env', 'LC_ALL=C', 'lvs', 'vg'),
+                 'iscsi': ('iscsiadm', '-m', 'session'),
+                 'multipath': ('multipath', '-ll'),
+                 'fc': ('systool', '-c', 'fc_host', '-v')}
+        for subsystem in sorted(reads):
+            self.executor._execute(*reads[subsystem], read_only=True)
+        self.execute.reset_mock()
+
+        if change is None:
+            self.executor._execute(*cmd)
+        else:
+            change()
+        for subsystem in sorted(reads):
+            self.executor._execute(*reads[subsystem], read_only=True)
+
+        self.assertEqual(([mock.call(*cmd)] if change is None else []) +
+                         [mock.call(*reads[subsystem])
+                          for subsystem in sorted(invalidated)],
+                         self.execute.call_args_list)
+
+    def test_invalidate_lvm(self):
+        self._check_invalidated(('lvcreate', '-n', 'lv', 'vg'), ['lvm'])
+
+    def test_invalidate_multipath(self):
+        self._check_invalidated(('multipath', '-f', '/dev/dm-0'),
+                                ['multipath'])
+
+    def test_invalidate_iscsi(self):
+        self._check_invalidated(('iscsiadm', '-m', 'node', '--login'),
+                                ['iscsi', 'multipath'])
+
+    def test_invalidate_unknown(self):
+        self._check_invalidated(('tee', '-a', '/sys/block/sdb/device/delete'),
+                                ['fc', 'iscsi', 'lvm', 'multipath'])
+
+    def test_invalidate_command_cache(self):
+        self._check_invalidated(
+            (), ['iscsi', 'multipath'],
+            change=lambda: brick_executor.invalidate_command_cache(['iscsi']))
+
+    def test_invalidate_command_cache_all(self):
+        self._check_invalidated(
+            (), ['fc', 'iscsi', 'lvm', 'multipath'],
+            change=brick_executor.invalidate_command_cache)
+
+    def test_read_only_other_execute(self):
+        other = brick_executor.Executor(root_helper=None,
+                                        execute=mock.Mock(return_value=(
+                                            'other', '')),
+                                        command_cache_ttl=60)
+        other_helper = brick_executor.Executor(root_helper='sudo',
+                                               execute=self.execute,
+                                               command_cache_ttl=60)
+
+        self.assertEqual(('vgs', ''),
+                         self.executor._execute('vgs', read_only=True))
+        self.assertEqual(('other', ''),
+                         other._execute('vgs', read_only=True))
+        other_helper._execute('vgs', read_only=True)
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_invalidate_failed_command(self):
+        self.execute.side_effect = [('', ''), putils.ProcessExecutionError,
+                                    ('', '')]
+        self.executor._execute('multipath', '-ll', read_only=True)
+        self.assertRaises(putils.ProcessExecutionError,
+                          self.executor._execute, 'multipath', '-f', 'dm-0')
+        self.executor._execute('multipath', '-ll', read_only=True)
+        self.assertEqual(3, self.execute.call_count)
+
+    @mock.patch('os_brick.executor.priv_rootwrap.execute_batch',
+                return_value=[('', '')])
+    def test_invalidate_batch(self, batch_mock):
+        executor = brick_executor.Executor(root_helper=None,
+                                           command_cache_ttl=60)
+        executor._execute = self.executor._execute
+        self.executor._execute('iscsiadm', '-m', 'session', read_only=True)
+        executor._execute_batch([(('iscsiadm', '-m', 'node', '--logout'),
+                                  {})])
+        self.executor._execute('iscsiadm', '-m', 'session', read_only=True)
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_concurrent_reads(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def execute(*cmd, **kwargs):
+            started.set()
+            release.wait()
+            return 'out', ''
+
+        self.execute.side_effect = execute
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.executor._execute('lvs', read_only=True)))
+            for i in range(5)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([('out', '')] * 5, results)
+        self.assertEqual(1, self.execute.call_count)
+
+    def test_read_during_change(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def execute(*cmd, **kwargs):
+            if cmd[0] == 'lvs' and not started.is_set():
+                started.set()
+                release.wait()
+                return 'old', ''
+            return 'new', ''
+
+        self.execute.side_effect = execute
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            self.executor._execute('lvs', read_only=True)))
+        thread.start()
+        started.wait()
+        self.executor._execute('lvcreate', 'vg')
+        release.set()
+        thread.join()
+
+        # The read that started before the change is not reused
+        self.assertEqual([('old', '')], results)
+        self.assertEqual(('new', ''),
+                         self.executor._execute('lvs', read_only=True))
@@ -0,0 +1,111 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import ddt
+import mock
+
+from os_brick import metrics
+from os_brick.tests import base
+
+
+@ddt.ddt
+class MetricsTestCase(base.TestCase):
+
+    def setUp(self):
+        super(MetricsTestCase, self).setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    @ddt.data(
+        (('iscsiadm', '-m', 'node', '-T', 'iqn.1', '-p', '10.0.2.15:3260',
+          '--login'), ('iscsiadm', 'node --login')),
+        (('iscsiadm', '-m', 'node', '-T', 'iqn.1', '--op', 'update', '-n',
+          'node.startup', '-v', 'automatic'),
+         ('iscsiadm', 'node --op update')),
+        (('iscsiadm', '-m', 'session'), ('iscsiadm', 'session')),
+        (('/sbin/multipath', '-f', '/dev/dm-0'), ('multipath', '-f')),
+        (('lvs', '--noheadings', 'vg/lv'), ('lvs', '--noheadings')),
+        (('env', 'LC_ALL=C', 'LVM_SYSTEM_DIR=/etc/lvm', 'vgs', '--noheadings'),
+         ('vgs', '--noheadings')),
+        (('cryptsetup', 'luksOpen', '/dev/sdb', 'crypt'),
+         ('cryptsetup', 'luksOpen')),
+        (('tee', '-a', '/sys/class/scsi_host/host1/scan'), ('tee', '-a')),
+        (('tee', '/sys/block/sdb/device/delete'), ('tee', '')),
+        (('blockdev', '--getsize64', '/dev/sdb'),
+         ('blockdev', '--getsize64')),
+        ((), ('', '')),
+    )
+    @ddt.unpack
+    def test_get_command_key(self, cmd, expected):
+        self.assertEqual(expected, metrics.get_command_key(cmd))
+
+    def test_record_command(self):
+        metrics.record_command(('multipath', '-f', '/dev/dm-0'), 0.003)
+        metrics.record_command(('multipath', '-f', '/dev/dm-1'), 0.2, True)
+        metrics.record_command(('multipath', '-f', '/dev/dm-2'), 100)
+        metrics.record_command(('multipath', '-ll'), 0.01)
+
+        snapshot = metrics.get_snapshot()
+
+        self.assertEqual(2, len(snapshot))
+        stats = snapshot[0]
+        self.assertEqual(('multipath', '-f', 3, 1),
+                         (stats['binary'], stats['subcommand'],
+                          stats['count'], stats['errors']))
+        self.assertAlmostEqual(100.203, stats['total_time'])
+        buckets = dict(stats['buckets'])
+        self.assertEqual(len(metrics.BUCKETS) + 1, len(stats['buckets']))
+        self.assertEqual(1, buckets[0.005])
+        self.assertEqual(1, buckets[0.1])
+        self.assertEqual(2, buckets[0.25])
+        self.assertEqual(2, buckets[60])
+        self.assertEqual(3, buckets[None])
+        self.assertEqual(('multipath', '-ll', 1),
+                         (snapshot[1]['binary'], snapshot[1]['subcommand'],
+                          snapshot[1]['count']))
+
+    def test_reset(self):
+        metrics.record_command(('multipath', '-f'), 0.1)
+        metrics.reset()
+        self.assertEqual([], metrics.get_snapshot())
+
+    def test_hooks(self):
+        hook = mock.Mock()
+        failing_hook = mock.Mock(side_effect=ValueError)
+        metrics.register_hook(failing_hook)
+        self.addCleanup(metrics.unregister_hook, failing_hook)
+        metrics.register_hook(hook)
+
+        metrics.record_command(('iscsiadm', '-m', 'session'), 0.1, True)
+
+        failing_hook.assert_called_once_with('iscsiadm', 'session', 0.1,
+                                             True)
+        hook.assert_called_once_with('iscsiadm', 'session', 0.1, True)
+        self.assertEqual(1, metrics.get_snapshot()[0]['count'])
+
+        metrics.unregister_hook(hook)
+        metrics.record_command(('iscsiadm', '-m', 'session'), 0.1)
+        self.assertEqual(1, hook.call_count)
+
+    @mock.patch('oslo_utils.timeutils.now', side_effect=[10, 12.5])
+    def test_timed_command_error(self, mock_now):
+        def run():
+            with metrics.timed_command(('lvs', 'vg/lv')):
+                raise ValueError()
+
+        self.assertRaises(ValueError, run)
+
+        stats = metrics.get_snapshot()[0]
+        self.assertEqual(('lvs', '', 1, 1, 2.5),
+                         (stats['binary'], stats['subcommand'],
+                          stats['count'], stats['errors'],
+                          stats['total_time']))
@@ -0,0 +1,176 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+import mock
+
+from os_brick import tracing
+from os_brick.tests import base
+
+
+class TracingTestCase(base.TestCase):
+
+    def setUp(self):
+        super(TracingTestCase, self).setUp()
+        self.exported = []
+        tracing.register_exporter(self.exported.append)
+        self.addCleanup(tracing.unregister_exporter, self.exported.append)
+        self.addCleanup(tracing.set_sample_rate, tracing.get_sample_rate())
+        self.now = self.mock_object(tracing.timeutils, 'now',
+                                    side_effect=range(100))
+
+    def test_not_traced(self):
+        with tracing.start_trace('connect_volume') as root:
+            with tracing.span('login') as span:
+                span.set_attribute('portal', '10.0.0.1:3260')
+
+        self.assertIs(tracing._NOOP_SPAN, root)
+        self.assertIs(tracing._NOOP_SPAN, span)
+        self.assertIsNone(tracing.current_span())
+        self.assertEqual([], self.exported)
+        self.now.assert_not_called()
+
+    def test_forced(self):
+        with tracing.start_trace('connect_volume', force=True) as root:
+            self.assertIs(root, tracing.current_span())
+            with tracing.span('login', portal='10.0.0.1:3260'):
+                pass
+            with tracing.span('device_wait'):
+                with tracing.span('login'):
+                    pass
+
+        self.assertIsNone(tracing.current_span())
+        self.assertEqual([root], self.exported)
+        self.assertEqual(7, root.duration)
+        self.assertEqual({'login': 2, 'device_wait': 2}, root.get_timings())
+        self.assertEqual(
+            {'name': 'connect_volume', 'duration': 7, 'error': None,
+             'attributes': {},
+             'children': [
+                 {'name': 'login', 'duration': 1, 'error': None,
+                  'attributes': {'portal': '10.0.0.1:3260'},
+                  'children': []},
+                 {'name': 'device_wait', 'duration': 3, 'error': None,
+                  'attributes': {},
+                  'children': [{'name': 'login', 'duration': 1,
+                                'error': None, 'attributes': {},
+                                'children': []}]}]},
+            root.to_dict())
+        self.assertEqual('connect_volume: 7.000s\n'
+                         '  login: 1.000s\n'
+                         '  device_wait: 3.000s\n'
+                         '    login: 1.000s',
+                         tracing.format_span(root))
+
+    def test_timings_parallel(self):
+        root = tracing.Span('connect_volume')
+        root.start, root.duration = 0, 10
+        login = tracing.Span('login', root)
+        login.start, login.duration = 1, 5
+        root.children.append(login)
+        # Logins of two worker threads, from 2 to 5 and from 3 to 6
+        for start in (2, 3):
+            worker = tracing.Span('login', login)
+            worker.start, worker.duration = start, 3
+            login.children.append(worker)
+
+        self.assertEqual(1, login.get_self_time())
+        self.assertEqual({'login': 7}, root.get_timings())
+
+    def test_use_span(self):
+        spans = []
+
+        def _worker(parent):
+            with tracing.use_span(parent):
+                with tracing.span('login') as span:
+                    spans.append(span)
+            spans.append(tracing.current_span())
+
+        with tracing.start_trace('connect_volume', force=True) as root:
+            worker = threading.Thread(target=_worker, args=(root,))
+            worker.start()
+            worker.join()
+
+        self.assertEqual([root.children[0], None], spans)
+        self.assertEqual('login', root.children[0].name)
+        self.assertIsNone(tracing.current_span())
+
+    def test_span_after_parent_finished(self):
+        with tracing.start_trace('connect_volume', force=True) as root:
+            pass
+        with tracing.use_span(root):
+            with tracing.span('login'):
+                pass
+
+        self.assertEqual([], root.children)
+
+    @mock.patch.object(tracing.random, 'random', side_effect=[0.3, 0.7])
+    def test_sampled(self, mock_random):
+        tracing.set_sample_rate(0.5)
+
+        with tracing.start_trace('connect_volume') as sampled:
+            pass
+        with tracing.start_trace('connect_volume') as not_sampled:
+            pass
+
+        self.assertIsInstance(sampled, tracing.Span)
+        self.assertIs(tracing._NOOP_SPAN, not_sampled)
+        self.assertEqual([sampled], self.exported)
+
+    def test_set_sample_rate_invalid(self):
+        self.assertRaises(ValueError, tracing.set_sample_rate, 2)
+
+    def test_nested_trace(self):
+        with tracing.start_trace('connect_volumes', force=True) as root:
+            with tracing.start_trace('connect_volume') as span:
+                pass
+
+        self.assertIs(root, span.parent)
+        self.assertEqual([root], self.exported)
+
+    def test_error(self):
+        def _fail():
+            with tracing.start_trace('connect_volume', force=True):
+                with tracing.span('login'):
+                    raise ValueError()
+
+        self.assertRaises(ValueError, _fail)
+
+        root = self.exported[0]
+        self.assertEqual('ValueError', root.error)
+        self.assertEqual('ValueError', root.children[0].error)
+        self.assertIsNone(tracing.current_span())
+
+    def test_traced(self):
+        @tracing.traced('discovery')
+        def _discover(value):
+            return value
+
+        with tracing.start_trace('connect_volume', force=True) as root:
+            self.assertEqual(1, _discover(1))
+
+        self.assertEqual(['discovery'],
+                         [span.name for span in root.children])
+
+    @mock.patch.object(tracing, 'LOG')
+    def test_exporter_failure(self, mock_log):
+        failing = mock.Mock(side_effect=Exception)
+        tracing.register_exporter(failing)
+        self.addCleanup(tracing.unregister_exporter, failing)
+
+        with tracing.start_trace('connect_volume', force=True) as root:
+            pass
+
+        failing.assert_called_once_with(root)
+        self.assertEqual([root], self.exported)
+        self.assertEqual(1, mock_log.exception.call_count)
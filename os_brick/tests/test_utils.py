@@ -12,13 +12,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import functools
+import threading
 import time
 
 import mock
 
 from os_brick import exception
 from os_brick.tests import base
+from os_brick import tracing
 from os_brick import utils
 
 
@@ -109,6 +112,127 @@ class TestRetryDecorator(base.TestCase):
             self.assertFalse(mock_sleep.called)
 
 
+class TTLCacheTestCase(base.TestCase):
+
+    def test_get(self):
+        cache = utils.TTLCache(ttl=60)
+        create = mock.Mock(side_effect=[1, 2])
+
+        self.assertEqual(1, cache.get('key', create))
+        self.assertEqual(1, cache.get('key', create))
+        self.assertEqual(1, create.call_count)
+
+        # A shorter ttl than the age of the value computes it again
+        self.assertEqual(2, cache.get('key', create, ttl=0))
+        self.assertEqual(2, create.call_count)
+
+    def test_get_no_ttl(self):
+        cache = utils.TTLCache()
+        create = mock.Mock(side_effect=[1, 2])
+
+        self.assertEqual(1, cache.get('key', create))
+        self.assertEqual(2, cache.get('key', create))
+
+    def test_get_error(self):
+        cache = utils.TTLCache(ttl=60)
+        create = mock.Mock(side_effect=[ValueError, 1])
+
+        self.assertRaises(ValueError, cache.get, 'key', create)
+        self.assertEqual(1, cache.get('key', create))
+
+    def test_get_concurrent(self):
+        cache = utils.TTLCache(ttl=60)
+        started = threading.Event()
+        finish = threading.Event()
+        create = mock.Mock()
+
+        def _create():
+            started.set()
+            finish.wait()
+            return 'value'
+        create.side_effect = _create
+
+        results = []
+        first = threading.Thread(
+            target=lambda: results.append(cache.get('key', create)))
+        first.start()
+        started.wait()
+        second = threading.Thread(
+            target=lambda: results.append(cache.get('key', create)))
+        second.start()
+        finish.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(['value', 'value'], results)
+        self.assertEqual(1, create.call_count)
+
+    def test_invalidate(self):
+        cache = utils.TTLCache(ttl=60)
+        cache.get('key1', lambda: 1)
+        cache.get('key2', lambda: 2)
+
+        cache.invalidate(lambda key, value: value == 2)
+        self.assertEqual(1, cache.get('key1', lambda: 3))
+        self.assertEqual(4, cache.get('key2', lambda: 4))
+
+        cache.invalidate()
+        self.assertEqual(5, cache.get('key1', lambda: 5))
+
+
+class ResourceLocksTestCase(base.TestCase):
+
+    def test_resource_locks_order(self):
+        calls = []
+
+        @contextlib.contextmanager
+        def _lock(name, prefix):
+            calls.append(('acquire', name))
+            yield
+            calls.append(('release', name))
+        self.mock_object(utils.lockutils, 'lock', side_effect=_lock)
+
+        with utils.resource_locks(['b', 'a', 'b']):
+            calls.append('body')
+
+        self.assertEqual([('acquire', 'a'), ('acquire', 'b'), 'body',
+                          ('release', 'b'), ('release', 'a')], calls)
+
+    def test_resource_locks_independent(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def _hold():
+            with utils.resource_locks(['a']):
+                locked.set()
+                release.wait()
+
+        holder = threading.Thread(target=_hold)
+        holder.start()
+        self.addCleanup(holder.join)
+        self.addCleanup(release.set)
+        locked.wait()
+
+        # A different resource doesn't wait for the held lock
+        with utils.resource_locks(['b']):
+            self.assertFalse(release.is_set())
+
+    def test_synchronized_resources(self):
+
+        class Fake(object):
+            def _get_names(self, value):
+                return ['lock-%s' % value]
+
+            @utils.synchronized_resources('_get_names')
+            def method(self, value):
+                return value
+
+        mock_locks = self.mock_object(utils, 'resource_locks')
+
+        self.assertEqual(1, Fake().method(1))
+        mock_locks.assert_called_once_with(['lock-1'])
+
+
 class LogTracingTestCase(base.TestCase):
     """Test out the log tracing."""
 
@@ -220,7 +344,7 @@ class LogTracingTestCase(base.TestCase):
         mock_logging.getLogger = mock.Mock(return_value=mock_log)
 
         mock_time = mock.Mock(side_effect=[3.1, 6])
-        self.mock_object(time, 'time', mock_time)
+        self.mock_object(utils.timeutils, 'now', mock_time)
 
         @utils.trace
         def _trace_test_method(*args, **kwargs):
@@ -269,3 +393,75 @@ class LogTracingTestCase(base.TestCase):
         self.assertEqual(2, mock_log.debug.call_count)
         self.assertIn("'adminPass': '***'",
                       str(mock_log.debug.call_args_list[1]))
+
+    def test_utils_trace_method_with_password_args(self):
+        mock_logging = self.mock_object(utils, 'logging')
+        mock_log = mock.Mock()
+        mock_log.isEnabledFor = lambda x: True
+        mock_logging.getLogger = mock.Mock(return_value=mock_log)
+
+        @utils.trace
+        def _trace_test_method(*args, **kwargs):
+            return 'OK'
+
+        _trace_test_method(self, {'auth_password': 'Now you see me'},
+                           password='Now you see me')
+
+        call_log = str(mock_log.debug.call_args_list[0])
+        self.assertNotIn('Now you see me', call_log)
+        self.assertIn("'auth_password': '***'", call_log)
+
+    def test_utils_trace_method_with_password_args_keeps_others(self):
+        mock_logging = self.mock_object(utils, 'logging')
+        mock_log = mock.Mock()
+        mock_log.isEnabledFor = lambda x: True
+        mock_logging.getLogger = mock.Mock(return_value=mock_log)
+
+        @utils.trace
+        def _trace_test_method(*args, **kwargs):
+            return 'OK'
+
+        _trace_test_method(self, {'auth_password': 'Now you see me',
+                                  'target_portal': '10.0.0.1:3260'},
+                           ['/dev/sdb', 'password=secret'],
+                           'lun-1', device_info={'path': '/dev/sdb'})
+
+        call_log = str(mock_log.debug.call_args_list[0])
+        self.assertNotIn('Now you see me', call_log)
+        self.assertNotIn('secret', call_log)
+        self.assertIn("'auth_password': '***'", call_log)
+        self.assertIn("'target_portal': '10.0.0.1:3260'", call_log)
+        self.assertIn("['/dev/sdb', 'password=***'], 'lun-1')", call_log)
+        self.assertIn("'device_info': {'path': '/dev/sdb'}", call_log)
+
+    def test_utils_trace_method_span(self):
+        exported = []
+        tracing.register_exporter(exported.append)
+        self.addCleanup(tracing.unregister_exporter, exported.append)
+
+        class Fake(object):
+            return_timings = True
+
+            @utils.trace
+            def method(self):
+                with tracing.span('login'):
+                    return 'OK'
+
+        self.assertEqual('OK', Fake().method())
+
+        self.assertEqual(1, len(exported))
+        self.assertEqual('method', exported[0].name)
+        self.assertEqual(['login'],
+                         [span.name for span in exported[0].children])
+
+    def test_utils_trace_method_not_traced(self):
+        mock_start = self.mock_object(tracing, 'start_trace',
+                                      return_value=tracing._NOOP_SPAN)
+
+        @utils.trace
+        def _trace_test_method(*args, **kwargs):
+            return 'OK'
+
+        self.assertEqual('OK', _trace_test_method(mock.Mock()))
+        mock_start.assert_called_once_with('_trace_test_method',
+                                           force=False)
@@ -0,0 +1,248 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tracing of the operations of os-brick.
+
+Connector operations decorated with utils.trace start a trace, and the
+phases they go through (discovery, login, device wait, multipath, rw check)
+are recorded as nested spans with their duration.  Only a fraction of the
+operations is traced, set with set_sample_rate, and nothing is recorded by
+default, in which case a span costs a thread-local lookup.
+
+Finished traces are passed to the exporters registered with
+register_exporter, ie: to log the slow attachments::
+
+    def log_slow(span):
+        if span.duration > 30:
+            LOG.warning('Slow %s:\\n%s', span.name, tracing.format_span(span))
+
+    tracing.set_sample_rate(1)
+    tracing.register_exporter(log_slow)
+"""
+
+import contextlib
+import functools
+import random
+import threading
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from os_brick.i18n import _LE
+
+LOG = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_local = threading.local()
+_exporters = []
+_sample_rate = 0.0
+
+
+class Span(object):
+    """A timed operation, and the spans of the operations it ran."""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes or {}
+        self.children = []
+        self.start = None
+        self.duration = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start = timeutils.now()
+        _local.span = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = timeutils.now() - self.start
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _local.span = self.parent
+        if self.parent is None:
+            _export(self)
+        elif self.parent.duration is None:
+            # Spans of worker threads that outlive the operation, ie:
+            # background logins, are left out of its finished trace.
+            self.parent.children.append(self)
+
+    def get_self_time(self):
+        """Get the seconds spent in this span but in none of its children."""
+        covered = 0
+        end = None
+        for child in sorted(self.children, key=lambda child: child.start):
+            child_end = child.start + child.duration
+            if end is None or child.start >= end:
+                covered += child.duration
+                end = child_end
+            elif child_end > end:
+                # Children run by worker threads overlap
+                covered += child_end - end
+                end = child_end
+        return max(self.duration - covered, 0)
+
+    def get_timings(self):
+        """Get the seconds spent in each kind of nested span.
+
+        The time of a span doesn't include the time of the spans nested in
+        it, so the phases don't overlap: a login during a device wait only
+        counts as login.  Spans run in parallel by worker threads each count
+        in full.
+
+        :returns: dictionary mapping span names to the total time spent in
+                  the finished spans with that name under this one.
+        """
+        timings = {}
+        pending = list(self.children)
+        while pending:
+            span = pending.pop()
+            timings[span.name] = (timings.get(span.name, 0) +
+                                  span.get_self_time())
+            pending.extend(span.children)
+        return timings
+
+    def to_dict(self):
+        return {'name': self.name,
+                'duration': self.duration,
+                'error': self.error,
+                'attributes': dict(self.attributes),
+                'children': [child.to_dict() for child in self.children]}
+
+
+class _NoopSpan(object):
+    """Span given when nothing is being traced."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    """Get the span running in this thread, or None."""
+    return getattr(_local, 'span', None)
+
+
+@contextlib.contextmanager
+def use_span(parent):
+    """Record the spans of this thread under parent while in the context.
+
+    The current span is kept per thread, worker threads use this to add
+    their spans to the trace of the operation that started them.
+
+    :param parent: span returned by current_span in the thread of the
+                   operation, or None.
+    """
+    previous = getattr(_local, 'span', None)
+    _local.span = parent
+    try:
+        yield parent
+    finally:
+        _local.span = previous
+
+
+def span(name, **attributes):
+    """Get a context manager timing a phase of the current operation.
+
+    It doesn't record anything if the operation is not being traced.
+    """
+    parent = getattr(_local, 'span', None)
+    if parent is None:
+        return _NOOP_SPAN
+    return Span(name, parent, attributes)
+
+
+def traced(name):
+    """Decorator running a function in a span of its own."""
+    def _decorator(f):
+        @functools.wraps(f)
+        def _wrapper(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return _wrapper
+    return _decorator
+
+
+def start_trace(name, force=False, **attributes):
+    """Get a context manager tracing an operation.
+
+    Inside a trace this is the same as span, otherwise the operation is
+    traced if it is sampled or forced.
+
+    :param name: name of the operation, ie: connect_volume.
+    :param force: trace it regardless of the sample rate.
+    """
+    parent = getattr(_local, 'span', None)
+    if parent is not None:
+        return Span(name, parent, attributes)
+    if force or (_sample_rate and random.random() < _sample_rate):
+        return Span(name, None, attributes)
+    return _NOOP_SPAN
+
+
+def set_sample_rate(rate):
+    """Set the fraction of the operations that are traced, 0 to 1."""
+    global _sample_rate
+    if not 0 <= rate <= 1:
+        raise ValueError('Sample rate must be between 0 and 1, got %s' %
+                         rate)
+    _sample_rate = rate
+
+
+def get_sample_rate():
+    return _sample_rate
+
+
+def _export(span):
+    with _lock:
+        exporters = list(_exporters)
+    for exporter in exporters:
+        try:
+            exporter(span)
+        except Exception:
+            LOG.exception(_LE("Tracing exporter %s failed."), exporter)
+
+
+def register_exporter(exporter):
+    """Call a function with every finished trace.
+
+    :param exporter: function called with the root Span of the trace.  It
+                     runs in the thread that ran the operation, so it should
+                     be quick.
+    """
+    with _lock:
+        _exporters.append(exporter)
+
+
+def unregister_exporter(exporter):
+    with _lock:
+        _exporters.remove(exporter)
+
+
+def format_span(span, indent=0):
+    """Format a trace as one line per span, indented by nesting level."""
+    line = '%s%s: %.3fs' % ('  ' * indent, span.name, span.duration)
+    if span.error:
+        line += ' (%s)' % span.error
+    return '\n'.join([line] + [format_span(child, indent + 1)
+                               for child in span.children])
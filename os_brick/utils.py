@@ -12,18 +12,21 @@
 #
 """Utilities and helper functions."""
 
+import contextlib
 import functools
-import inspect
 import logging as py_logging
 import retrying
 import six
-import time
+import threading
 
+from oslo_concurrency import lockutils
 from oslo_log import log as logging
 from oslo_utils import encodeutils
 from oslo_utils import strutils
+from oslo_utils import timeutils
 
 from os_brick.i18n import _
+from os_brick import tracing
 
 
 LOG = logging.getLogger(__name__)
@@ -104,6 +107,30 @@ def merge_dict(dict1, dict2):
     return dict3
 
 
+class _MaskedRepr(object):
+    """Value logged with its passwords masked.
+
+    The masking is only done if the log record is emitted.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        if isinstance(self.value, dict):
+            return repr(strutils.mask_dict_password(self.value))
+        if isinstance(self.value, six.string_types):
+            return repr(strutils.mask_password(self.value))
+        if isinstance(self.value, (list, tuple)):
+            # Element by element, masking the repr of the whole sequence
+            # would also mask what comes after a password.
+            masked = [_MaskedRepr(item) for item in self.value]
+            if isinstance(self.value, tuple):
+                masked = tuple(masked)
+            return repr(masked)
+        return strutils.mask_password(repr(self.value))
+
+
 def trace(f):
     """Trace calls to the decorated function.
 
@@ -112,7 +139,9 @@ def trace(f):
     with other decorators.
 
     Using this decorator on a function will cause its execution to be logged at
-    `DEBUG` level with arguments, return values, and exceptions.
+    `DEBUG` level with arguments, return values, and exceptions, and recorded
+    as a span if it is being traced (see os_brick.tracing).  Calls are always
+    traced for connectors created with return_timings=True.
 
     :returns: a function decorator
     """
@@ -131,42 +160,177 @@ def trace(f):
         else:
             logger = LOG
 
+        force = getattr(maybe_self, 'return_timings', False) is True
+        span = tracing.start_trace(func_name, force=force)
+
         # NOTE(ameade): Don't bother going any further if DEBUG log level
         # is not enabled for the logger.
         if not logger.isEnabledFor(py_logging.DEBUG):
-            return f(*args, **kwargs)
+            with span:
+                return f(*args, **kwargs)
 
-        all_args = inspect.getcallargs(f, *args, **kwargs)
-        logger.debug('==> %(func)s: call %(all_args)r',
-                     {'func': func_name, 'all_args': all_args})
+        logger.debug('==> %(func)s: call %(args)r %(kwargs)r',
+                     {'func': func_name, 'args': _MaskedRepr(args),
+                      'kwargs': _MaskedRepr(kwargs)})
 
-        start_time = time.time() * 1000
+        start_time = timeutils.now()
         try:
-            result = f(*args, **kwargs)
+            with span:
+                result = f(*args, **kwargs)
         except Exception as exc:
-            total_time = int(round(time.time() * 1000)) - start_time
+            total_time = (timeutils.now() - start_time) * 1000
             logger.debug('<== %(func)s: exception (%(time)dms) %(exc)r',
                          {'func': func_name,
                           'time': total_time,
                           'exc': exc})
             raise
-        total_time = int(round(time.time() * 1000)) - start_time
-
-        if isinstance(result, dict):
-            mask_result = strutils.mask_dict_password(result)
-        elif isinstance(result, six.string_types):
-            mask_result = strutils.mask_password(result)
-        else:
-            mask_result = result
+        total_time = (timeutils.now() - start_time) * 1000
 
         logger.debug('<== %(func)s: return (%(time)dms) %(result)r',
                      {'func': func_name,
                       'time': total_time,
-                      'result': mask_result})
+                      'result': _MaskedRepr(result)})
         return result
     return trace_logging_wrapper
 
 
+@contextlib.contextmanager
+def resource_locks(names):
+    """Hold the locks of several resources.
+
+    The locks are taken in sorted order, so operations that lock overlapping
+    sets of resources can't deadlock, and the time spent waiting for them is
+    logged to show contention.
+
+    :param names: names of the resources, ie: iscsi-<target iqn>.
+    """
+    names = sorted(set(names))
+    watch = timeutils.StopWatch().start()
+    acquired = []
+    try:
+        with tracing.span('lock_wait'):
+            for name in names:
+                lock = lockutils.lock(name, 'os-brick-')
+                lock.__enter__()
+                acquired.append(lock)
+        LOG.debug("Waited %(wait).3fs for locks %(names)s",
+                  {'wait': watch.elapsed(), 'names': names})
+        yield
+    finally:
+        for lock in reversed(acquired):
+            lock.__exit__(None, None, None)
+
+
+def synchronized_resources(get_names):
+    """Run a method holding the locks of the resources it uses.
+
+    :param get_names: name of a method of the same object, called with the
+                      arguments of the decorated method, that returns the
+                      names of the resources to lock.
+    """
+
+    def _decorator(f):
+
+        @six.wraps(f)
+        def _wrapper(self, *args, **kwargs):
+            names = getattr(self, get_names)(*args, **kwargs)
+            with resource_locks(names):
+                return f(self, *args, **kwargs)
+
+        return _wrapper
+
+    return _decorator
+
+
+class _PendingValue(object):
+    """A value being computed by another thread."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.invalidated = False
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class TTLCache(object):
+    """Cache of values that are only used for a while.
+
+    Values are computed on demand by the function given to get.  When
+    several threads ask for a key that is not cached at the same time, only
+    one of them computes the value and the others wait for its result.
+    """
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (StopWatch started when the value was computed, value)
+        self._entries = {}
+        # key -> _PendingValue
+        self._pending = {}
+
+    def get(self, key, create, ttl=None):
+        """Get the value of a key, computing it if needed.
+
+        :param key: hashable key of the value.
+        :param create: function called without arguments to compute the
+                       value.
+        :param ttl: seconds a cached value is good for, instead of the
+                    cache's ttl.  With 0 values are never taken from the
+                    cache, but concurrent calls still share one computation.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0].elapsed() < ttl:
+                return entry[1]
+            pending = self._pending.get(key)
+            computing = pending is None
+            if computing:
+                pending = self._pending[key] = _PendingValue()
+
+        if not computing:
+            return pending.wait()
+
+        try:
+            value = create()
+        except Exception as exc:
+            with self._lock:
+                del self._pending[key]
+            pending.error = exc
+            pending.event.set()
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            if ttl > 0 and not pending.invalidated:
+                self._entries[key] = (timeutils.StopWatch().start(), value)
+        pending.value = value
+        pending.event.set()
+        return value
+
+    def invalidate(self, match=None):
+        """Drop cached values.
+
+        :param match: function called with the key and value of each cached
+                      entry, those it returns True for are dropped.  If not
+                      given all the values are dropped, including those
+                      being computed.
+        """
+        with self._lock:
+            for key, (_watch, value) in list(self._entries.items()):
+                if match is None or match(key, value):
+                    del self._entries[key]
+            if match is None:
+                for pending in self._pending.values():
+                    pending.invalidated = True
+
+
 def convert_str(text):
     """Convert to native string.
 